@@ -8,10 +8,20 @@
 # IMPORTACIONES NECESARIAS
 # ============================================================================
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.forms.models import BaseInlineFormSet
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .consultas_lentas import resumen_por_huella
 from .models import (
     Especialidad, Medico, Paciente, ConsultaMedica, 
-    Tratamiento, Medicamento, RecetaMedica
+    Tratamiento, Medicamento, RecetaMedica, HorarioMedico, LoteMedicamento, MovimientoInventario,
+    ConsultaLenta, PerfilSolicitud, MENSAJE_HORARIO_SUPERPUESTO
 )
+from .perfilador import ENCABEZADO, PARAMETRO, directorio, firmar
 
 # ============================================================================
 # CONFIGURACIÓN DE ADMINISTRACIÓN PARA ESPECIALIDADES MÉDICAS
@@ -30,6 +40,31 @@ class EspecialidadAdmin(admin.ModelAdmin):
 # ============================================================================
 # Gestión de médicos con búsqueda por datos personales y filtros por especialidad
 
+class HorarioMedicoFormSet(BaseInlineFormSet):
+    """Cada bloque se valida contra los guardados (HorarioMedico.clean); aquí
+    también se comparan entre sí los bloques del mismo envío"""
+
+    def clean(self):
+        super().clean()
+        campos = ('dia_semana', 'hora_inicio', 'hora_fin')
+        bloques = sorted(
+            tuple(form.cleaned_data[campo] for campo in campos)
+            for form in self.forms
+            if all(form.cleaned_data.get(campo) is not None for campo in campos)
+            and not form.cleaned_data.get('DELETE')
+        )
+        for (dia, _, fin), (otro_dia, inicio, _) in zip(bloques, bloques[1:]):
+            if dia == otro_dia and inicio < fin:
+                raise ValidationError(MENSAJE_HORARIO_SUPERPUESTO)
+
+
+class HorarioMedicoInline(admin.TabularInline):
+    """Plantilla semanal de atención editable desde la ficha del médico"""
+    model = HorarioMedico
+    formset = HorarioMedicoFormSet
+    extra = 0
+
+
 @admin.register(Medico)
 class MedicoAdmin(admin.ModelAdmin):
     """Configuración del admin para médicos con filtros por especialidad"""
@@ -37,6 +72,7 @@ class MedicoAdmin(admin.ModelAdmin):
     search_fields = ['rut', 'nombre', 'apellido']
     list_filter = ['especialidad', 'created_at']
     ordering = ['apellido', 'nombre']
+    inlines = [HorarioMedicoInline]
 
 # ============================================================================
 # CONFIGURACIÓN DE ADMINISTRACIÓN PARA PACIENTES
@@ -82,13 +118,58 @@ class TratamientoAdmin(admin.ModelAdmin):
 # ============================================================================
 # Gestión de inventario con alertas de stock bajo y vencimiento próximo
 
+class LoteMedicamentoInline(admin.TabularInline):
+    """Lotes del medicamento; las cantidades solo cambian con movimientos de inventario"""
+    model = LoteMedicamento
+    fields = ['codigo', 'fecha_vencimiento', 'cantidad', 'created_at']
+    readonly_fields = fields
+    ordering = ['fecha_vencimiento', 'id']
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Medicamento)
 class MedicamentoAdmin(admin.ModelAdmin):
     """Configuración del admin para medicamentos con alertas de inventario"""
-    list_display = ['nombre', 'stock', 'precio_unitario', 'fecha_vencimiento', 'stock_bajo', 'proximo_vencimiento']
+    list_display = ['nombre', 'stock', 'stock_vigente', 'precio_unitario', 'fecha_vencimiento', 'stock_bajo', 'proximo_vencimiento']
     search_fields = ['nombre']
     list_filter = ['fecha_vencimiento', 'created_at']
     ordering = ['nombre']
+    inlines = [LoteMedicamentoInline]
+
+    def get_queryset(self, request):
+        # Las alertas se calculan sobre los lotes no vencidos
+        return super().get_queryset(request).con_stock_vigente()
+
+    def get_readonly_fields(self, request, obj=None):
+        # Tras la creación stock y vencimiento son agregados de los lotes
+        if obj is not None:
+            return list(Medicamento.CAMPOS_DE_LOTES)
+        return []
+
+
+@admin.register(MovimientoInventario)
+class MovimientoInventarioAdmin(admin.ModelAdmin):
+    """Libro de inventario de solo lectura"""
+    list_display = ['creado_en', 'medicamento', 'lote', 'tipo', 'cantidad', 'stock_resultante', 'receta_id', 'observacion']
+    search_fields = ['medicamento__nombre', 'observacion']
+    list_filter = ['tipo', 'creado_en']
+    list_select_related = ['medicamento', 'lote__medicamento']
+    ordering = ['-creado_en', '-id']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
 
 # ============================================================================
 # CONFIGURACIÓN DE ADMINISTRACIÓN PARA RECETAS MÉDICAS
@@ -98,7 +179,98 @@ class MedicamentoAdmin(admin.ModelAdmin):
 @admin.register(RecetaMedica)
 class RecetaMedicaAdmin(admin.ModelAdmin):
     """Configuración del admin para recetas médicas con cálculo de costos"""
-    list_display = ['tratamiento', 'medicamento', 'cantidad', 'frecuencia', 'duracion', 'costo_total']
+    list_display = ['tratamiento', 'medicamento', 'cantidad', 'precio_unitario', 'costo_total', 'frecuencia', 'duracion']
     search_fields = ['tratamiento__consulta__paciente__nombre', 'medicamento__nombre']
     list_filter = ['frecuencia', 'created_at']
     ordering = ['-created_at']
+
+# ============================================================================
+# CONFIGURACIÓN DE ADMINISTRACIÓN PARA CONSULTAS LENTAS
+# ============================================================================
+# El listado agrupa las capturas por huella del SQL con sus percentiles y el
+# último plan; cada huella enlaza a sus capturas individuales
+
+@admin.register(ConsultaLenta)
+class ConsultaLentaAdmin(admin.ModelAdmin):
+    """Consultas SQL lentas capturadas por ConsultasLentasMiddleware, de solo lectura"""
+    list_display = ['registrada_en', 'vista', 'duracion_ms', 'huella']
+    list_filter = ['vista', 'registrada_en']
+    search_fields = ['sql', 'vista']
+    fields = ['registrada_en', 'vista', 'duracion_ms', 'huella', 'sql', 'parametros', 'plan']
+    readonly_fields = fields
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        # Con un filtro (p. ej. ?huella=...) se muestra el listado normal de capturas
+        if request.GET:
+            return super().changelist_view(request, extra_context)
+        return TemplateResponse(request, 'admin/salud_vital/consultalenta/resumen.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Consultas lentas por huella',
+            'grupos': resumen_por_huella(),
+            **(extra_context or {}),
+        })
+
+# ============================================================================
+# CONFIGURACIÓN DE ADMINISTRACIÓN PARA PERFILES DE SOLICITUD
+# ============================================================================
+# El listado muestra la firma con la que el usuario puede pedir un perfil y
+# permite descargar las pilas colapsadas de cada solicitud perfilada
+
+@admin.register(PerfilSolicitud)
+class PerfilSolicitudAdmin(admin.ModelAdmin):
+    """Perfiles de muestreo guardados por PerfiladorMiddleware"""
+    list_display = ['creado_en', 'metodo', 'ruta', 'estado', 'duracion_ms', 'muestras', 'usuario', 'descargar']
+    list_filter = ['vista', 'creado_en']
+    search_fields = ['ruta', 'vista']
+    list_select_related = ['usuario']
+    readonly_fields = ['creado_en', 'metodo', 'ruta', 'vista', 'estado', 'duracion_ms', 'muestras', 'archivo', 'usuario']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/descargar/', self.admin_site.admin_view(self.descargar_perfil),
+                 name='salud_vital_perfilsolicitud_descargar'),
+        ] + super().get_urls()
+
+    @admin.display(description='Perfil')
+    def descargar(self, obj):
+        url = reverse('admin:salud_vital_perfilsolicitud_descargar', args=[obj.pk])
+        return format_html('<a href="{}">Descargar</a>', url)
+
+    def descargar_perfil(self, request, pk):
+        perfil = get_object_or_404(PerfilSolicitud, pk=pk)
+        if not self.has_view_permission(request, perfil):
+            raise PermissionDenied
+        archivo = directorio() / perfil.archivo
+        if not archivo.is_file():
+            raise Http404('El archivo del perfil ya no existe.')
+        return FileResponse(archivo.open('rb'), as_attachment=True, filename=archivo.name, content_type='text/plain')
+
+    def changelist_view(self, request, extra_context=None):
+        return super().changelist_view(request, {
+            'firma': firmar(request.user),
+            'encabezado': ENCABEZADO,
+            'parametro': PARAMETRO,
+            **(extra_context or {}),
+        })
+
+    def delete_model(self, request, obj):
+        (directorio() / obj.archivo).unlink(missing_ok=True)
+        super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        for archivo in queryset.values_list('archivo', flat=True):
+            (directorio() / archivo).unlink(missing_ok=True)
+        super().delete_queryset(request, queryset)
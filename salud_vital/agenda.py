@@ -0,0 +1,110 @@
+# ============================================================================
+# AGENDA SEMANAL Y MENSUAL - SALUD VITAL
+# ============================================================================
+# Datos de las vistas de calendario de médicos y especialidades. En lugar de
+# cargar todas las citas del rango, se entrega:
+#   - el conteo por día y estado, calculado en una sola consulta agregada
+#     que recorre el índice (medico, fecha_hora_cita), y
+#   - el detalle de las citas del día visible únicamente.
+#
+# El ETag se arma con las versiones de agenda de los médicos (ver cache.py),
+# así que una revalidación sin cambios se responde sin consultar las citas.
+# Las versiones cambian con sus citas y horarios y también al editar los
+# pacientes, médicos o especialidades que muestran (ver signals.py).
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import calendar
+import hashlib
+from datetime import datetime, timedelta
+
+from django.db.models import Count, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .cache import versiones_disponibilidad
+from .models import CitaMedica
+
+
+VISTAS = ('semana', 'mes')
+
+# Alias de anotación (en minúsculas) para cada estado de cita
+ESTADOS = [(estado, estado.lower()) for estado, _ in CitaMedica.ESTADO_CHOICES]
+
+
+# ============================================================================
+# RANGO DE LA VISTA
+# ============================================================================
+
+def rango_de_vista(vista, fecha):
+    """Primer y último día (inclusive) de la semana (lunes a domingo) o del mes de `fecha`"""
+    if vista == 'mes':
+        ultimo = calendar.monthrange(fecha.year, fecha.month)[1]
+        return fecha.replace(day=1), fecha.replace(day=ultimo)
+    lunes = fecha - timedelta(days=fecha.weekday())
+    return lunes, lunes + timedelta(days=6)
+
+
+def inicio_del_dia(dia):
+    return timezone.make_aware(datetime.combine(dia, datetime.min.time()))
+
+
+# ============================================================================
+# ETAG
+# ============================================================================
+
+def etag_agenda(medico_ids, *partes):
+    """ETag de la agenda: versiones de los médicos más los parámetros de la vista"""
+    versiones = versiones_disponibilidad(medico_ids)
+    firma = ':'.join([*map(str, partes), *(f'{m}={versiones[m]}' for m in sorted(versiones))])
+    return '"%s"' % hashlib.md5(firma.encode(), usedforsecurity=False).hexdigest()
+
+
+# ============================================================================
+# CONTEO POR DÍA Y DETALLE DEL DÍA VISIBLE
+# ============================================================================
+
+def conteo_por_dia(medico_ids, desde, hasta):
+    """Citas por día y estado entre `desde` y `hasta`, con todos los días del rango"""
+    filas = (
+        CitaMedica.objects
+        .filter(
+            medico_id__in=medico_ids,
+            fecha_hora_cita__gte=inicio_del_dia(desde),
+            fecha_hora_cita__lt=inicio_del_dia(hasta + timedelta(days=1)),
+        )
+        .annotate(dia=TruncDate('fecha_hora_cita'))
+        .values('dia')
+        .annotate(total=Count('id'), **{
+            alias: Count('id', filter=Q(estado=estado)) for estado, alias in ESTADOS
+        })
+        .order_by('dia')
+    )
+    por_dia = {fila['dia']: fila for fila in filas}
+
+    dias = []
+    dia = desde
+    while dia <= hasta:
+        fila = por_dia.get(dia, {})
+        dias.append({
+            'fecha': dia,
+            'total': fila.get('total', 0),
+            'por_estado': {estado: fila.get(alias, 0) for estado, alias in ESTADOS},
+        })
+        dia += timedelta(days=1)
+    return dias
+
+
+def citas_del_dia(medico_ids, dia):
+    """Citas de los médicos en el día indicado, con paciente, médico y especialidad"""
+    return (
+        CitaMedica.objects
+        .filter(
+            medico_id__in=medico_ids,
+            fecha_hora_cita__gte=inicio_del_dia(dia),
+            fecha_hora_cita__lt=inicio_del_dia(dia + timedelta(days=1)),
+        )
+        .select_related('paciente', 'medico', 'medico__especialidad')
+        .order_by('fecha_hora_cita', 'medico_id')
+    )
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class SaludVitalConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'salud_vital'
+
+    def ready(self):
+        # Registrar los receptores de señales (invalidación de cachés)
+        from . import signals  # noqa: F401
@@ -0,0 +1,77 @@
+# ============================================================================
+# VISTAS ASÍNCRONAS DE SOLO LECTURA - SALUD VITAL
+# ============================================================================
+# Versiones async de los endpoints de lectura más consultados, pensadas para
+# servirse bajo ASGI (salud_vital_project/asgi.py, p. ej. con uvicorn o
+# daphne). Usan el ORM asíncrono de Django y no bloquean el event loop del
+# worker mientras esperan a PostgreSQL.
+#
+# Devuelven el mismo JSON que sus equivalentes síncronos de la API REST y
+# aceptan autenticación por sesión (AuthenticationMiddleware).
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+
+from . import dashboard as datos_dashboard
+from .dashboard import rango_del_dia
+from .models import ConsultaMedica, Medicamento
+from .serializers import ConsultaMedicaSerializer, MedicamentoSerializer
+
+
+# ============================================================================
+# UTILIDADES
+# ============================================================================
+
+async def usuario_autenticado(request):
+    """Resuelve request.user (carga perezosa desde la sesión) fuera del event loop"""
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+def no_autenticado():
+    return JsonResponse(
+        {'detail': 'Las credenciales de autenticación no se proveyeron.'}, status=403
+    )
+
+
+# ============================================================================
+# ENDPOINTS ASÍNCRONOS
+# ============================================================================
+
+@require_GET
+async def consultas_hoy(request):
+    """Versión async de ConsultaMedicaViewSet.hoy"""
+    if not await usuario_autenticado(request):
+        return no_autenticado()
+    inicio, fin = rango_del_dia(timezone.localdate())
+    consultas = [
+        consulta async for consulta in ConsultaMedica.objects.select_related(
+            'paciente', 'medico', 'medico__especialidad'
+        ).filter(fecha_consulta__gte=inicio, fecha_consulta__lt=fin).order_by('-fecha_consulta')
+    ]
+    # Las relaciones ya vienen por JOIN: serializar no genera consultas
+    return JsonResponse(ConsultaMedicaSerializer(consultas, many=True).data, safe=False)
+
+
+@require_GET
+async def medicamentos_stock_bajo(request):
+    """Versión async de MedicamentoViewSet.stock_bajo"""
+    if not await usuario_autenticado(request):
+        return no_autenticado()
+    medicamentos = [m async for m in Medicamento.objects.con_stock_vigente().filter(stock_vigente__lte=10).order_by('nombre')]
+    return JsonResponse(MedicamentoSerializer(medicamentos, many=True).data, safe=False)
+
+
+@require_GET
+async def dashboard(request):
+    """Versión async de DashboardViewSet: conteos en una consulta, más recientes y especialidades"""
+    if not await usuario_autenticado(request):
+        return no_autenticado()
+    conteos = await sync_to_async(datos_dashboard.totales)()
+    recientes = [consulta async for consulta in datos_dashboard.consultas_recientes()]
+    especialidades = [fila async for fila in datos_dashboard.especialidades_stats()]
+    return JsonResponse(datos_dashboard.datos(conteos, recientes, especialidades))
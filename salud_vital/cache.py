@@ -0,0 +1,115 @@
+# ============================================================================
+# CACHÉ DE RESPUESTAS - SALUD VITAL
+# ============================================================================
+# Claves y funciones de invalidación para las respuestas de la API que se
+# guardan en el caché de Django. Las señales de signals.py llaman a estas
+# funciones cuando cambian las filas de las que depende cada respuesta.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metricas import contar_cache
+
+
+# ============================================================================
+# FICHA COMPLETA DEL PACIENTE
+# ============================================================================
+# Tiempo de vida de la ficha en caché (segundos); la invalidación por señales
+# la mantiene al día, el TTL solo acota cambios indirectos (p. ej. precios)
+FICHA_CACHE_TIMEOUT = getattr(settings, 'FICHA_CACHE_TIMEOUT', 60 * 15)
+
+
+def ficha_cache_key(paciente_id):
+    """Clave de caché de la ficha serializada de un paciente"""
+    return f'salud_vital:ficha_paciente:{paciente_id}'
+
+
+def obtener_ficha(paciente_id):
+    """Devuelve la ficha serializada en caché o None si no existe"""
+    ficha = cache.get(ficha_cache_key(paciente_id))
+    contar_cache('ficha', ficha is not None, ficha is None)
+    return ficha
+
+
+def guardar_ficha(paciente_id, data):
+    """Guarda la ficha serializada del paciente en caché"""
+    cache.set(ficha_cache_key(paciente_id), data, FICHA_CACHE_TIMEOUT)
+
+
+def invalidar_ficha(paciente_id):
+    """Elimina la ficha en caché del paciente (si la hay)"""
+    if paciente_id is not None:
+        cache.delete(ficha_cache_key(paciente_id))
+
+
+def invalidar_fichas(paciente_ids):
+    """Elimina en una sola operación las fichas en caché de varios pacientes"""
+    cache.delete_many([ficha_cache_key(paciente_id) for paciente_id in paciente_ids if paciente_id is not None])
+
+
+# ============================================================================
+# DISPONIBILIDAD DE CUPOS POR MÉDICO
+# ============================================================================
+# Cada médico tiene una versión en caché que cambia con cualquier cita u horario
+# suyo; las entradas de disponibilidad la incluyen en su clave, así que cambiar
+# la versión invalida todos los rangos calculados para ese médico sin tener que
+# enumerarlos. La agenda usa la misma versión para su ETag
+DISPONIBILIDAD_CACHE_TIMEOUT = getattr(settings, 'DISPONIBILIDAD_CACHE_TIMEOUT', 60 * 60)
+
+
+def disponibilidad_version_key(medico_id):
+    return f'salud_vital:disponibilidad:version:{medico_id}'
+
+
+def versiones_disponibilidad(medico_ids):
+    """Versión vigente de la agenda de cada médico.
+
+    Si una versión no está en caché (primer uso o expulsada) se crea una nueva
+    en vez de suponer un valor fijo, para que nunca se repita una versión ya
+    entregada a un cliente en un ETag.
+    """
+    claves = {disponibilidad_version_key(medico_id): medico_id for medico_id in medico_ids}
+    encontradas = cache.get_many(list(claves))
+    contar_cache('version_disponibilidad', len(encontradas), len(claves) - len(encontradas))
+    for clave in claves.keys() - encontradas.keys():
+        cache.add(clave, time.time_ns(), None)
+        encontradas[clave] = cache.get(clave)
+    return {medico_id: encontradas[clave] for clave, medico_id in claves.items()}
+
+
+def disponibilidad_cache_key(medico_id, version, desde, hasta):
+    return f'salud_vital:disponibilidad:{medico_id}:{version}:{desde.isoformat()}:{hasta.isoformat()}'
+
+
+def obtener_disponibilidades(versiones, desde, hasta):
+    """Cupos en caché {medico_id: cupos} para las versiones {medico_id: version} dadas"""
+    claves = {
+        disponibilidad_cache_key(medico_id, version, desde, hasta): medico_id
+        for medico_id, version in versiones.items()
+    }
+    encontradas = cache.get_many(list(claves))
+    contar_cache('disponibilidad', len(encontradas), len(claves) - len(encontradas))
+    return {claves[clave]: cupos for clave, cupos in encontradas.items()}
+
+
+def guardar_disponibilidades(disponibilidades, versiones, desde, hasta):
+    """Guarda los cupos calculados {medico_id: cupos} bajo las versiones leídas antes de calcular.
+
+    Si una cita cambia mientras se calcula, la versión ya avanzó y esta entrada
+    queda huérfana en lugar de servir datos obsoletos.
+    """
+    cache.set_many({
+        disponibilidad_cache_key(medico_id, versiones[medico_id], desde, hasta): cupos
+        for medico_id, cupos in disponibilidades.items()
+    }, DISPONIBILIDAD_CACHE_TIMEOUT)
+
+
+def invalidar_disponibilidad(medico_id):
+    """Invalida todos los rangos de disponibilidad en caché del médico"""
+    if medico_id is not None:
+        cache.set(disponibilidad_version_key(medico_id), time.time_ns(), None)
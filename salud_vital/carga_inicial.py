@@ -0,0 +1,252 @@
+# ============================================================================
+# CARGA DE DATOS INICIALES - SALUD VITAL
+# ============================================================================
+# Carga los datos iniciales desde archivos versionados (datos_iniciales/vN/),
+# un CSV o JSON por modelo. Las referencias entre archivos usan la clave
+# natural de la fila referida (RUT, nombre) o la columna `clave`, y se
+# resuelven en memoria: los ids se asignan antes de insertar, así que cada
+# modelo se inserta con un solo bulk_create dentro de una única transacción
+# que empieza vaciando las tablas con TRUNCATE ... RESTART IDENTITY CASCADE.
+#
+# bulk_create no llama a save() ni emite señales: lo que harían (precio
+# congelado de la receta, primer lote y saldo inicial del medicamento,
+# dispensación de cada receta en el libro de inventario) se calcula aquí y se
+# inserta también en bloque.
+#
+# Las fechas pueden ser relativas al día de la carga (`hoy`, `hoy+30`,
+# `hoy-5 10:30`) para que vencimientos y tratamientos no queden en el pasado.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import csv
+import json
+import re
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from .cache import invalidar_fichas, invalidar_disponibilidad
+from .models import (
+    Especialidad, Medico, Paciente, ConsultaMedica, Tratamiento, Medicamento, RecetaMedica,
+    LoteMedicamento, MovimientoInventario, RegistroEliminado
+)
+
+
+DIRECTORIO_DATOS = Path(__file__).resolve().parent / 'datos_iniciales'
+
+FECHA_RELATIVA = re.compile(r'^hoy(?P<dias>[+-]\d+)?(?: (?P<hora>\d{1,2}:\d{2}))?$')
+
+
+class ErrorDeCarga(Exception):
+    """Los archivos de datos iniciales no se pueden cargar (referencia inexistente, clave repetida, etc.)"""
+
+
+@dataclass(frozen=True)
+class Archivo:
+    """Archivo de datos de un modelo: `clave` identifica sus filas para las
+    referencias de otros archivos y `referencias` indica a qué archivo apunta
+    cada clave foránea"""
+    nombre: str
+    modelo: type
+    clave: str = None
+    referencias: dict = field(default_factory=dict)
+
+
+# Archivos en orden de carga: cada uno solo referencia a los anteriores
+ARCHIVOS = (
+    Archivo('especialidades', Especialidad, clave='nombre'),
+    Archivo('medicos', Medico, clave='rut', referencias={'especialidad': 'especialidades'}),
+    Archivo('pacientes', Paciente, clave='rut'),
+    Archivo('medicamentos', Medicamento, clave='nombre'),
+    Archivo('consultas', ConsultaMedica, clave='clave', referencias={'paciente': 'pacientes', 'medico': 'medicos'}),
+    Archivo('tratamientos', Tratamiento, clave='clave', referencias={'consulta': 'consultas'}),
+    Archivo('recetas', RecetaMedica, referencias={'tratamiento': 'tratamientos', 'medicamento': 'medicamentos'}),
+)
+
+
+# ============================================================================
+# LECTURA DE ARCHIVOS
+# ============================================================================
+
+def versiones(directorio=DIRECTORIO_DATOS):
+    """Versiones disponibles (v1, v2, ...) de la más antigua a la más reciente"""
+    return sorted(
+        (ruta.name for ruta in Path(directorio).iterdir() if ruta.is_dir() and re.fullmatch(r'v\d+', ruta.name)),
+        key=lambda nombre: int(nombre[1:]),
+    )
+
+
+def leer_filas(directorio, nombre):
+    """Filas del archivo `nombre`.csv o `nombre`.json como diccionarios ([] si no existe)"""
+    ruta_csv, ruta_json = Path(directorio) / f'{nombre}.csv', Path(directorio) / f'{nombre}.json'
+    if ruta_csv.exists():
+        with open(ruta_csv, newline='', encoding='utf-8') as archivo:
+            return list(csv.DictReader(archivo))
+    if ruta_json.exists():
+        with open(ruta_json, encoding='utf-8') as archivo:
+            return json.load(archivo)
+    return []
+
+
+def convertir(campo, valor, hoy):
+    """Convierte el valor leído al tipo del campo, resolviendo las fechas relativas"""
+    if isinstance(campo, models.DateField) and isinstance(valor, str):
+        relativa = FECHA_RELATIVA.match(valor)
+        if relativa:
+            fecha = hoy + timedelta(days=int(relativa['dias'] or 0))
+            if not isinstance(campo, models.DateTimeField):
+                return fecha
+            valor = datetime.combine(fecha, time.fromisoformat(relativa['hora'] or '00:00'))
+    valor = campo.to_python(valor)
+    if isinstance(valor, datetime) and timezone.is_naive(valor):
+        valor = timezone.make_aware(valor)
+    return valor
+
+
+def construir(archivo, filas, ids, hoy):
+    """Instancias del modelo con ids asignados y claves foráneas resueltas.
+
+    Registra en ids[archivo.nombre] la clave de cada fila -> id asignado.
+    """
+    campos = {campo.name: campo for campo in archivo.modelo._meta.concrete_fields}
+    claves = ids[archivo.nombre] = {}
+    objetos = []
+    for numero, fila in enumerate(filas, start=1):
+        donde = f'{archivo.nombre}, fila {numero}'
+        valores = {'id': numero}
+        for nombre, valor in fila.items():
+            if nombre in archivo.referencias:
+                referidos = ids[archivo.referencias[nombre]]
+                if str(valor) not in referidos:
+                    raise ErrorDeCarga(f'{donde}: {nombre} "{valor}" no existe en {archivo.referencias[nombre]}.')
+                valores[f'{nombre}_id'] = referidos[str(valor)]
+            elif nombre in campos:
+                campo = campos[nombre]
+                if valor in (None, ''):
+                    # Vacío: el valor por omisión del campo, NULL o cadena vacía
+                    if not campo.has_default():
+                        valores[nombre] = None if campo.null or not campo.empty_strings_allowed else ''
+                    continue
+                try:
+                    valores[nombre] = convertir(campo, valor, hoy)
+                except ValidationError as error:
+                    raise ErrorDeCarga(f'{donde}: {nombre} "{valor}" no es válido ({error.messages[0]})')
+            elif nombre != archivo.clave:
+                raise ErrorDeCarga(f'{donde}: columna desconocida "{nombre}".')
+
+        if archivo.clave:
+            clave = str(fila.get(archivo.clave, ''))
+            if not clave or clave in claves:
+                raise ErrorDeCarga(f'{donde}: {archivo.clave} "{clave}" vacía o repetida.')
+            claves[clave] = numero
+        objetos.append(archivo.modelo(**valores))
+    return objetos
+
+
+# ============================================================================
+# INVENTARIO INICIAL
+# ============================================================================
+
+def inventario_inicial(medicamentos, recetas, hoy):
+    """Primer lote y saldo inicial de cada medicamento y la dispensación de cada receta.
+
+    Equivale a crear cada medicamento y luego cada receta con save(): fija el
+    precio congelado de las recetas y descuenta su cantidad del stock y del
+    lote del medicamento. Retorna (lotes, movimientos).
+    """
+    por_id = {medicamento.id: medicamento for medicamento in medicamentos}
+    lotes = {
+        medicamento.id: LoteMedicamento(
+            id=medicamento.id, medicamento_id=medicamento.id,
+            cantidad=medicamento.stock, fecha_vencimiento=medicamento.fecha_vencimiento,
+        )
+        for medicamento in medicamentos
+    }
+    movimientos = [
+        MovimientoInventario(
+            medicamento_id=medicamento.id, lote_id=medicamento.id, tipo='Ingreso', cantidad=medicamento.stock,
+            stock_resultante=medicamento.stock, observacion='Saldo inicial',
+        )
+        for medicamento in medicamentos
+    ]
+
+    for numero, receta in enumerate(recetas, start=1):
+        medicamento, lote = por_id[receta.medicamento_id], lotes[receta.medicamento_id]
+        if lote.fecha_vencimiento < hoy or lote.cantidad < receta.cantidad:
+            raise ErrorDeCarga(f'recetas, fila {numero}: no hay {receta.cantidad} unidades vigentes de {medicamento.nombre}.')
+        receta.precio_unitario = medicamento.precio_unitario
+        lote.cantidad -= receta.cantidad
+        medicamento.stock -= receta.cantidad
+        movimientos.append(MovimientoInventario(
+            medicamento_id=medicamento.id, lote_id=lote.id, tipo='Dispensación', cantidad=-receta.cantidad,
+            stock_resultante=medicamento.stock, receta_id=receta.id,
+        ))
+    return list(lotes.values()), movimientos
+
+
+# ============================================================================
+# CARGA
+# ============================================================================
+
+def vaciar_tablas(cursor):
+    """Vacía las tablas de los datos iniciales y las que dependen de ellas"""
+    tablas = [archivo.modelo._meta.db_table for archivo in ARCHIVOS] + [RegistroEliminado._meta.db_table]
+    # Verifica ahora las claves foráneas diferidas pendientes: TRUNCATE no se
+    # permite con verificaciones pendientes si la carga corre dentro de otra transacción
+    cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    cursor.execute(f'TRUNCATE {", ".join(map(connection.ops.quote_name, tablas))} RESTART IDENTITY CASCADE')
+    cursor.execute('SET CONSTRAINTS ALL DEFERRED')
+
+
+def cargar(version=None, directorio=DIRECTORIO_DATOS, hoy=None):
+    """Reemplaza los datos por los de la versión indicada (por omisión, la más reciente).
+
+    Lanza ErrorDeCarga sin modificar nada si los archivos no son válidos.
+    Retorna {archivo: filas insertadas}.
+    """
+    disponibles = versiones(directorio)
+    if not disponibles:
+        raise ErrorDeCarga(f'No hay versiones de datos en {directorio}.')
+    version = version or disponibles[-1]
+    if version not in disponibles:
+        raise ErrorDeCarga(f'La versión {version} no existe; disponibles: {", ".join(disponibles)}.')
+    hoy = hoy or date.today()
+
+    # Todo se construye y valida en memoria antes de tocar la base de datos
+    ids = {}
+    objetos = {
+        archivo.nombre: construir(archivo, leer_filas(Path(directorio) / version, archivo.nombre), ids, hoy)
+        for archivo in ARCHIVOS
+    }
+    lotes, movimientos = inventario_inicial(objetos['medicamentos'], objetos['recetas'], hoy)
+
+    with transaction.atomic():
+        # Las fichas y disponibilidades en caché de los ids anteriores dejan de ser válidas
+        pacientes = {*Paciente.objects.order_by().values_list('pk', flat=True), *ids['pacientes'].values()}
+        medicos = {*Medico.objects.order_by().values_list('pk', flat=True), *ids['medicos'].values()}
+
+        with connection.cursor() as cursor:
+            vaciar_tablas(cursor)
+            for archivo in ARCHIVOS:
+                archivo.modelo.objects.bulk_create(objetos[archivo.nombre])
+            LoteMedicamento.objects.bulk_create(lotes)
+            MovimientoInventario.objects.bulk_create(movimientos)
+
+            # Los ids se asignaron a mano: las secuencias siguen después del mayor
+            modelos = [archivo.modelo for archivo in ARCHIVOS] + [LoteMedicamento, MovimientoInventario]
+            for sentencia in connection.ops.sequence_reset_sql(no_style(), modelos):
+                cursor.execute(sentencia)
+
+        def invalidar_caches():
+            invalidar_fichas(pacientes)
+            for medico_id in medicos:
+                invalidar_disponibilidad(medico_id)
+        transaction.on_commit(invalidar_caches)
+
+    return {archivo.nombre: len(objetos[archivo.nombre]) for archivo in ARCHIVOS}
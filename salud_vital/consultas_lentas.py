@@ -0,0 +1,221 @@
+# ============================================================================
+# CAPTURA DE CONSULTAS LENTAS - SALUD VITAL
+# ============================================================================
+# ConsultasLentasMiddleware (middleware.py) anota las consultas SQL de cada
+# solicitud que superan CONSULTAS_LENTAS_UMBRAL_MS. Al terminar la respuesta
+# se entregan a un hilo en segundo plano que obtiene su plan con EXPLAIN
+# (ANALYZE, BUFFERS) por su propia conexión y las guarda en ConsultaLenta:
+# la solicitud no espera el plan.
+#
+# El SQL se normaliza (sin literales ni largo de listas) y su SHA-1 es la
+# huella que agrupa las ejecuciones de una misma consulta en el admin. De los
+# parámetros solo se guardan números, booleanos y nulos: textos y fechas
+# (nombres, RUT, fechas de nacimiento buscadas) se reemplazan por su tipo. El
+# plan y los errores de EXPLAIN muestran los valores de los parámetros, así
+# que sus literales también se reemplazan por `?` antes de guardarlos.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import hashlib
+import logging
+import queue
+import re
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import Aggregate, Count, FloatField, Max, OuterRef, Subquery
+
+from .models import ConsultaLenta
+from .sql import plantilla_sql
+
+
+logger = logging.getLogger('salud_vital.consultas_lentas')
+
+# Literales que quedan en SQL escrito a mano: textos entre comillas y números
+# sueltos (no los que forman parte de un identificador, como t1)
+TEXTO_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMERO_LITERAL = re.compile(r'(?<![\w"])-?\d+(?:\.\d+)?\b')
+ESPACIOS = re.compile(r'\s+')
+# Mensajes de error de PostgreSQL: citan los valores entre comillas dobles
+TEXTO_ENTRE_COMILLAS_DOBLES = re.compile(r'"(?:[^"]|"")*"')
+# Condiciones del plan (Filter, Index Cond, Hash Cond...), donde EXPLAIN
+# imprime los parámetros; no los contadores como `Rows Removed by Filter`
+CONDICION_DEL_PLAN = re.compile(r'^(\s*(?!\s|Rows Removed)[\w ]*(?:Filter|Cond)): (.*)$', re.MULTILINE)
+
+# Solo se ejecuta con ANALYZE lo que no modifica datos; el resto se explica sin ejecutar
+SOLO_LECTURA = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+
+# Consultas pendientes de plan; si el hilo no da abasto se descartan las nuevas
+PENDIENTES_MAXIMAS = 100
+
+# Tiempo máximo de cada EXPLAIN ANALYZE, que vuelve a ejecutar la consulta lenta
+TIEMPO_MAXIMO_PLAN_MS = 30000
+
+
+# ============================================================================
+# NORMALIZACIÓN Y DATOS PERSONALES
+# ============================================================================
+
+def normalizar_sql(sql):
+    """SQL sin literales ni largo de listas de parámetros, en una línea"""
+    sql = NUMERO_LITERAL.sub('?', TEXTO_LITERAL.sub('?', plantilla_sql(sql)))
+    return ESPACIOS.sub(' ', sql).strip()
+
+
+def ocultar_plan(plan):
+    """Plan sin los valores de los parámetros: textos en todo el plan y números en sus condiciones"""
+    plan = TEXTO_LITERAL.sub('?', plan)
+    return CONDICION_DEL_PLAN.sub(lambda condicion: f'{condicion[1]}: {NUMERO_LITERAL.sub("?", condicion[2])}', plan)
+
+
+def ocultar_error(error):
+    """Mensaje de error sin los valores citados ni números"""
+    texto = TEXTO_ENTRE_COMILLAS_DOBLES.sub('?', TEXTO_LITERAL.sub('?', str(error)))
+    return NUMERO_LITERAL.sub('?', texto)
+
+
+def huella(sql_normalizado):
+    return hashlib.sha1(sql_normalizado.encode()).hexdigest()
+
+
+def ocultar_parametros(params):
+    """Copia JSON de los parámetros con textos, fechas y otros valores reemplazados por su tipo"""
+    if isinstance(params, dict):
+        return {nombre: ocultar_parametros(valor) for nombre, valor in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [ocultar_parametros(valor) for valor in params]
+    if params is None or isinstance(params, (bool, int, float)):
+        return params
+    if isinstance(params, Decimal):
+        return float(params)
+    if isinstance(params, (datetime, date)):
+        return f'<{type(params).__name__}>'
+    if isinstance(params, str):
+        return f'<texto:{len(params)}>'
+    return f'<{type(params).__name__}>'
+
+
+# ============================================================================
+# CAPTURA DEL PLAN
+# ============================================================================
+
+def explicar(sql, params):
+    """Plan de la consulta en texto, con la conexión del hilo actual.
+
+    Todo ocurre en una transacción revertida. Si ANALYZE falla o supera
+    TIEMPO_MAXIMO_PLAN_MS se devuelve el plan estimado.
+    """
+    analizar = bool(SOLO_LECTURA.match(sql))
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(f'SET LOCAL statement_timeout = {TIEMPO_MAXIMO_PLAN_MS}')
+            if analizar:
+                try:
+                    with transaction.atomic():
+                        cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS) {sql}', params)
+                        filas = cursor.fetchall()
+                except DatabaseError:
+                    analizar = False
+            if not analizar:
+                cursor.execute(f'EXPLAIN {sql}', params)
+                filas = cursor.fetchall()
+        transaction.set_rollback(True)
+    return '\n'.join(fila[0] for fila in filas)
+
+
+def capturar(sql, params, vista, segundos):
+    """Guarda la consulta con su plan y recorta la tabla a CONSULTAS_LENTAS_MAXIMO filas"""
+    try:
+        plan = ocultar_plan(explicar(sql, params))
+    except DatabaseError as error:
+        plan = f'Sin plan: {ocultar_error(error)}'
+    normalizado = normalizar_sql(sql)
+    consulta = ConsultaLenta.objects.create(
+        huella=huella(normalizado),
+        sql=normalizado,
+        vista=vista[:200],
+        parametros=ocultar_parametros(params),
+        duracion_ms=segundos * 1000,
+        plan=plan,
+    )
+    maximo = getattr(settings, 'CONSULTAS_LENTAS_MAXIMO', 5000)
+    sobrante = ConsultaLenta.objects.order_by('-id').values_list('id', flat=True)[maximo:maximo + 1].first()
+    if sobrante is not None:
+        ConsultaLenta.objects.filter(id__lte=sobrante).delete()
+    return consulta
+
+
+# ============================================================================
+# HILO EN SEGUNDO PLANO
+# ============================================================================
+
+_pendientes = queue.Queue(maxsize=PENDIENTES_MAXIMAS)
+_hilo = None
+_candado = threading.Lock()
+
+
+def _procesar():
+    while True:
+        sql, params, vista, segundos = _pendientes.get()
+        try:
+            capturar(sql, params, vista, segundos)
+        except Exception:
+            logger.exception('No se pudo guardar la consulta lenta de %s', vista)
+        finally:
+            close_old_connections()
+            _pendientes.task_done()
+
+
+def enviar(sql, params, vista, segundos):
+    """Captura la consulta: en el hilo de fondo o, sin CONSULTAS_LENTAS_EN_SEGUNDO_PLANO, de inmediato"""
+    if not getattr(settings, 'CONSULTAS_LENTAS_EN_SEGUNDO_PLANO', True):
+        capturar(sql, params, vista, segundos)
+        return
+    global _hilo
+    with _candado:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_procesar, name='consultas-lentas', daemon=True)
+            _hilo.start()
+    try:
+        _pendientes.put_nowait((sql, params, vista, segundos))
+    except queue.Full:
+        logger.warning('Consulta lenta de %s descartada: %d pendientes de plan', vista, PENDIENTES_MAXIMAS)
+
+
+# ============================================================================
+# RESUMEN POR HUELLA
+# ============================================================================
+
+class Percentil(Aggregate):
+    """PERCENTILE_CONT de PostgreSQL: `fraccion` entre 0 y 1"""
+    function = 'PERCENTILE_CONT'
+    template = '%(function)s(%(fraccion)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraccion, **extra):
+        super().__init__(expression, fraccion=float(fraccion), **extra)
+
+
+def resumen_por_huella(consultas=None):
+    """Una fila por huella con ejecuciones, p50/p95/máximo (ms) y la última vista y plan"""
+    consultas = ConsultaLenta.objects.all() if consultas is None else consultas
+    ultima = ConsultaLenta.objects.filter(huella=OuterRef('huella')).order_by('-registrada_en', '-id')
+    return (
+        consultas.order_by()
+        .values('huella')
+        .annotate(
+            veces=Count('id'),
+            p50_ms=Percentil('duracion_ms', 0.5),
+            p95_ms=Percentil('duracion_ms', 0.95),
+            max_ms=Max('duracion_ms'),
+            ultima_vez=Max('registrada_en'),
+            sql=Max('sql'),
+            vista=Subquery(ultima.values('vista')[:1]),
+            plan=Subquery(ultima.values('plan')[:1]),
+        )
+        .order_by('-p95_ms')
+    )
@@ -0,0 +1,71 @@
+# ============================================================================
+# ESTADÍSTICAS DEL DASHBOARD - SALUD VITAL
+# ============================================================================
+# Datos del dashboard en JSON, compartidos por la versión síncrona de la API
+# (DashboardViewSet, GET /api/dashboard/) y la async (async_views.dashboard,
+# GET /api/async/dashboard/): ambas hacen exactamente el mismo trabajo, lo que
+# permite compararlas con `python manage.py benchmark_asgi`.
+#
+# Los cinco conteos van en una sola consulta con subconsultas escalares. El
+# ORM async de Django ejecuta las consultas de una solicitud una tras otra en
+# el mismo hilo (sync_to_async con thread_sensitive), así que lanzarlas por
+# separado con asyncio.gather no las haría concurrentes: combinarlas sí ahorra
+# los viajes a PostgreSQL.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+from datetime import datetime, time, timedelta
+
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import Especialidad, Medico, Paciente, ConsultaMedica
+from .serializers import ConsultaMedicaSerializer
+
+
+# Conteos del dashboard en un solo viaje; las consultas de hoy usan el índice de fecha
+SQL_TOTALES = f"""
+    SELECT
+        (SELECT COUNT(*) FROM {Paciente._meta.db_table}),
+        (SELECT COUNT(*) FROM {Medico._meta.db_table}),
+        (SELECT COUNT(*) FROM {Especialidad._meta.db_table}),
+        (SELECT COUNT(*) FROM {ConsultaMedica._meta.db_table}),
+        (SELECT COUNT(*) FROM {ConsultaMedica._meta.db_table} WHERE fecha_consulta >= %s AND fecha_consulta < %s)
+"""
+TOTALES = ('total_pacientes', 'total_medicos', 'total_especialidades', 'total_consultas', 'consultas_hoy')
+
+
+def rango_del_dia(dia):
+    """Inicio y fin (aware) de un día local, para filtrar con el índice de fecha"""
+    inicio = timezone.make_aware(datetime.combine(dia, time.min))
+    return inicio, inicio + timedelta(days=1)
+
+
+def totales():
+    """Los cinco conteos del dashboard {nombre: total} en una consulta"""
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_TOTALES, rango_del_dia(timezone.localdate()))
+        return dict(zip(TOTALES, cursor.fetchone()))
+
+
+def consultas_recientes():
+    return ConsultaMedica.objects.select_related(
+        'paciente', 'medico', 'medico__especialidad'
+    ).order_by('-fecha_consulta')[:5]
+
+
+def especialidades_stats():
+    return Especialidad.objects.annotate(
+        total_consultas=Count('medicos__consultas_realizadas')
+    ).order_by('-total_consultas').values('id', 'nombre', 'total_consultas')[:5]
+
+
+def datos(conteos, recientes, especialidades):
+    """Cuerpo JSON del dashboard a partir de los resultados ya leídos"""
+    return {
+        **conteos,
+        'consultas_recientes': ConsultaMedicaSerializer(recientes, many=True).data,
+        'especialidades_stats': list(especialidades),
+    }
@@ -0,0 +1,340 @@
+# ============================================================================
+# DATOS SINTÉTICOS PARA PRUEBAS DE CARGA - SALUD VITAL
+# ============================================================================
+# Generación reproducible de pacientes, historiales, consultas, tratamientos y
+# recetas a gran escala (ver el comando generate_data).
+#
+# Los pacientes se reparten en bloques de tamaño fijo. Cada bloque:
+#   - usa su propio generador aleatorio, sembrado con (semilla, bloque), así el
+#     resultado no depende de cuántos procesos trabajen ni en qué orden, y
+#   - es dueño de un rango de ids fijo en cada tabla, así los procesos insertan
+#     en paralelo sin coordinarse ni consultar secuencias.
+#
+# Distribuciones: RUT chilenos válidos (dígito verificador módulo 11), pirámide
+# de edades, frecuencia de consultas sobredispersa (gamma) que crece con la
+# edad y las enfermedades crónicas, peaks estacionales (invierno respiratorio)
+# y de días hábiles, médico de cabecera, y abanico de tratamientos y recetas
+# con medicamentos de popularidad tipo Zipf.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import bisect
+import itertools
+import random
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+
+# ============================================================================
+# CATÁLOGOS Y DISTRIBUCIONES
+# ============================================================================
+
+ESPECIALIDADES = [
+    'Medicina General', 'Pediatría', 'Cardiología', 'Neurología', 'Ginecología',
+    'Traumatología', 'Dermatología', 'Psiquiatría', 'Oftalmología',
+    'Otorrinolaringología', 'Endocrinología', 'Broncopulmonar', 'Gastroenterología',
+    'Urología', 'Geriatría',
+]
+
+# Peso relativo de cada especialidad al repartir los médicos
+PESO_ESPECIALIDAD = [30, 12, 6, 4, 7, 8, 4, 5, 4, 3, 4, 3, 3, 3, 4]
+
+NOMBRES = [
+    'Juan', 'José', 'Luis', 'Carlos', 'Jorge', 'Pedro', 'Diego', 'Matías', 'Benjamín', 'Vicente',
+    'Tomás', 'Agustín', 'Cristóbal', 'Felipe', 'Sebastián', 'Manuel', 'Francisco', 'Héctor',
+    'María', 'Ana', 'Carolina', 'Camila', 'Javiera', 'Valentina', 'Catalina', 'Francisca',
+    'Constanza', 'Fernanda', 'Isidora', 'Sofía', 'Antonia', 'Rosa', 'Patricia', 'Claudia',
+    'Daniela', 'Paula',
+]
+
+APELLIDOS = [
+    'González', 'Muñoz', 'Rojas', 'Díaz', 'Pérez', 'Soto', 'Contreras', 'Silva', 'Martínez',
+    'Sepúlveda', 'Morales', 'Rodríguez', 'López', 'Fuentes', 'Hernández', 'Torres', 'Araya',
+    'Flores', 'Espinoza', 'Valenzuela', 'Castillo', 'Tapia', 'Reyes', 'Gutiérrez', 'Castro',
+    'Pizarro', 'Álvarez', 'Vásquez', 'Sánchez', 'Fernández', 'Ramírez', 'Carrasco', 'Gómez',
+    'Cortés', 'Herrera', 'Núñez', 'Jara', 'Vergara', 'Rivera', 'Figueroa',
+]
+
+# Los apellidos más comunes concentran más personas
+PESO_APELLIDO = list(itertools.accumulate(1 / (i + 1) ** 0.6 for i in range(len(APELLIDOS))))
+
+COMUNAS = [
+    'Santiago', 'Puente Alto', 'Maipú', 'La Florida', 'Las Condes', 'Ñuñoa', 'Providencia',
+    'Valparaíso', 'Viña del Mar', 'Concepción', 'Temuco', 'Antofagasta', 'La Serena', 'Rancagua',
+]
+CALLES = ['Av. Libertador', 'Los Aromos', 'Pedro de Valdivia', 'Av. Matta', 'San Martín', 'Los Carrera', 'Colón', 'O\'Higgins']
+
+# (edad mínima, edad máxima, peso, factor de consultas)
+EDADES = [
+    (0, 4, 6, 1.3), (5, 14, 12, 0.8), (15, 29, 21, 0.6),
+    (30, 44, 22, 0.8), (45, 64, 25, 1.2), (65, 95, 14, 1.8),
+]
+PESO_EDAD = list(itertools.accumulate(peso for _, _, peso, _ in EDADES))
+
+GRUPOS_SANGUINEOS = ['O+', 'A+', 'B+', 'O-', 'A-', 'AB+', 'B-', 'AB-']
+PESO_GRUPO_SANGUINEO = list(itertools.accumulate([56, 27, 8, 4, 2, 1.5, 1, 0.5]))
+
+ENFERMEDADES_CRONICAS = ['Hipertensión arterial', 'Diabetes mellitus tipo 2', 'Asma', 'Hipotiroidismo', 'Dislipidemia', 'EPOC']
+ALERGIAS = ['Penicilina', 'Sulfas', 'AINEs', 'Mariscos', 'Polen', 'Látex']
+
+# Invierno austral (junio a agosto) con el peak de consultas respiratorias
+PESO_MES = {1: 0.80, 2: 0.70, 3: 0.95, 4: 1.00, 5: 1.20, 6: 1.45, 7: 1.55, 8: 1.40, 9: 1.05, 10: 1.00, 11: 0.95, 12: 0.85}
+PESO_DIA_SEMANA = [1.0, 1.0, 0.95, 0.95, 0.9, 0.3, 0.05]
+PESO_MAXIMO_FECHA = max(PESO_MES.values()) * max(PESO_DIA_SEMANA)
+
+HORAS = list(range(8, 20))
+PESO_HORA = list(itertools.accumulate([6, 9, 10, 10, 8, 4, 6, 8, 8, 7, 5, 3]))
+
+MOTIVOS_RESPIRATORIOS = [
+    ('Tos y fiebre', 'Infección respiratoria aguda'), ('Dolor de garganta', 'Faringitis aguda'),
+    ('Congestión nasal', 'Rinofaringitis'), ('Dificultad respiratoria', 'Bronquitis obstructiva'),
+    ('Fiebre y dolor muscular', 'Influenza'),
+]
+MOTIVOS_GENERALES = [
+    ('Control de salud', None), ('Dolor abdominal', 'Gastritis'), ('Dolor lumbar', 'Lumbago mecánico'),
+    ('Cefalea', 'Cefalea tensional'), ('Control de presión arterial', 'Hipertensión controlada'),
+    ('Control de glicemia', 'Diabetes compensada'), ('Lesión cutánea', 'Dermatitis de contacto'),
+    ('Dolor de rodilla', 'Esguince leve'), ('Ansiedad', 'Trastorno de ansiedad'), ('Mareos', None),
+]
+
+TRATAMIENTOS = [
+    'Reposo e hidratación', 'Analgesia oral', 'Antibioterapia', 'Kinesioterapia respiratoria',
+    'Tratamiento antihipertensivo', 'Control metabólico', 'Tratamiento tópico', 'Antiinflamatorio',
+]
+DURACIONES_DIAS = [3, 5, 7, 10, 14, 30, 90]
+PESO_DURACION = list(itertools.accumulate([10, 25, 30, 15, 10, 6, 4]))
+FRECUENCIAS = ['Cada 8 horas', 'Cada 12 horas', 'Cada 24 horas', 'Cada 6 horas', 'Según necesidad']
+PESO_FRECUENCIA = list(itertools.accumulate([35, 25, 25, 10, 5]))
+
+# Abanico: tratamientos por consulta y recetas por tratamiento (0, 1, 2, ...)
+PESO_TRATAMIENTOS = list(itertools.accumulate([35, 45, 15, 5]))
+PESO_RECETAS = list(itertools.accumulate([0, 50, 30, 15, 5]))
+PESO_CANTIDAD = list(itertools.accumulate([50, 30, 12, 5, 3]))
+
+# (principio activo, dosis, precio base)
+MEDICAMENTOS = [
+    ('Paracetamol', ['500 mg', '1 g'], 1200), ('Ibuprofeno', ['400 mg', '600 mg'], 1800),
+    ('Amoxicilina', ['500 mg', '875 mg'], 3500), ('Losartán', ['50 mg', '100 mg'], 2500),
+    ('Metformina', ['850 mg', '1 g'], 2200), ('Atorvastatina', ['20 mg', '40 mg'], 4200),
+    ('Omeprazol', ['20 mg'], 1900), ('Salbutamol', ['100 mcg inhalador'], 5200),
+    ('Levotiroxina', ['50 mcg', '100 mcg'], 3100), ('Loratadina', ['10 mg'], 1500),
+    ('Sertralina', ['50 mg'], 6400), ('Clonazepam', ['0,5 mg', '2 mg'], 2900),
+    ('Naproxeno', ['550 mg'], 2100), ('Azitromicina', ['500 mg'], 6900),
+    ('Enalapril', ['10 mg'], 1700), ('Prednisona', ['20 mg'], 2600),
+    ('Ketoprofeno', ['100 mg'], 2300), ('Cetirizina', ['10 mg'], 1600),
+    ('Budesonida', ['200 mcg inhalador'], 8900), ('Clotrimazol', ['1% crema'], 2700),
+]
+
+# Límites por bloque que definen el tamaño de los rangos de ids
+MAX_CONSULTAS_POR_PACIENTE = 150
+MAX_TRATAMIENTOS_POR_CONSULTA = len(PESO_TRATAMIENTOS) - 1
+MAX_RECETAS_POR_TRATAMIENTO = len(PESO_RECETAS) - 1
+
+# Los RUT se derivan del id con una permutación del rango, así son únicos sin
+# consultar la base de datos (el multiplicador es coprimo con el rango)
+RANGO_RUT_PACIENTES = (7_000_000, 20_000_000)
+RANGO_RUT_MEDICOS = (3_000_000, 4_000_000)
+MULTIPLICADOR_RUT = 7_919_993
+
+
+# ============================================================================
+# RUT CHILENO
+# ============================================================================
+
+def digito_verificador(numero):
+    """Dígito verificador del RUT (módulo 11)"""
+    suma = sum(int(digito) * factor for digito, factor in zip(reversed(str(numero)), itertools.cycle(range(2, 8))))
+    resto = 11 - suma % 11
+    return {11: '0', 10: 'K'}.get(resto, str(resto))
+
+
+def rut_desde_id(indice, rango):
+    """RUT único y válido para el id `indice` dentro de `rango` (base, tamaño)"""
+    base, tamano = rango
+    if indice >= tamano:
+        raise ValueError(f'El id {indice} excede el rango de RUT disponible ({tamano}).')
+    numero = base + (indice * MULTIPLICADOR_RUT) % tamano
+    return f'{numero}-{digito_verificador(numero)}'
+
+
+# ============================================================================
+# PARÁMETROS Y RANGOS DE IDS DE CADA BLOQUE
+# ============================================================================
+
+@dataclass(frozen=True)
+class Parametros:
+    """Parámetros compartidos por todos los bloques de una generación"""
+    semilla: int
+    total_pacientes: int
+    tamano_bloque: int
+    consultas_por_paciente: float
+    desde: date
+    hasta: date
+    zona_horaria: object
+    # Primer id libre de cada tabla al iniciar la generación
+    base_paciente: int
+    base_historial: int
+    base_consulta: int
+    base_tratamiento: int
+    base_receta: int
+    # Médicos [(id, peso acumulado)] y medicamentos [(id, precio, peso acumulado)]
+    medicos: tuple
+    medicamentos: tuple
+
+    @property
+    def bloques(self):
+        return -(-self.total_pacientes // self.tamano_bloque)
+
+    def rangos(self, bloque):
+        """Primer id de cada tabla que le corresponde al bloque"""
+        consultas = self.tamano_bloque * MAX_CONSULTAS_POR_PACIENTE
+        tratamientos = consultas * MAX_TRATAMIENTOS_POR_CONSULTA
+        return {
+            'paciente': self.base_paciente + bloque * self.tamano_bloque,
+            'historial': self.base_historial + bloque * self.tamano_bloque,
+            'consulta': self.base_consulta + bloque * consultas,
+            'tratamiento': self.base_tratamiento + bloque * tratamientos,
+            'receta': self.base_receta + bloque * tratamientos * MAX_RECETAS_POR_TRATAMIENTO,
+        }
+
+
+def elegir(rng, opciones, acumulados):
+    return opciones[bisect.bisect(acumulados, rng.random() * acumulados[-1])]
+
+
+def pesos_zipf(cantidad, exponente=1.1):
+    return list(itertools.accumulate(1 / (rango + 1) ** exponente for rango in range(cantidad)))
+
+
+# ============================================================================
+# GENERACIÓN DE UN BLOQUE
+# ============================================================================
+
+def fecha_estacional(rng, parametros):
+    """Día y hora de consulta con peaks de invierno y de días hábiles"""
+    dias = (parametros.hasta - parametros.desde).days
+    while True:
+        dia = parametros.desde + timedelta(days=rng.randrange(dias))
+        if rng.random() * PESO_MAXIMO_FECHA <= PESO_MES[dia.month] * PESO_DIA_SEMANA[dia.weekday()]:
+            break
+    hora = time(elegir(rng, HORAS, PESO_HORA), rng.choice((0, 15, 30, 45)))
+    return datetime.combine(dia, hora, tzinfo=parametros.zona_horaria)
+
+
+def generar_bloque(bloque, parametros):
+    """Filas de cada tabla para el bloque de pacientes `bloque` {tabla: [tupla, ...]}.
+
+    Las columnas de cada tabla están en COLUMNAS. El resultado depende solo de
+    la semilla, el bloque y los parámetros.
+    """
+    rng = random.Random(f'{parametros.semilla}:{bloque}')
+    ids = parametros.rangos(bloque)
+    filas = {tabla: [] for tabla in COLUMNAS}
+    medico_ids = [medico_id for medico_id, _ in parametros.medicos]
+    peso_medicos = [peso for _, peso in parametros.medicos]
+    peso_medicamentos = [peso for *_, peso in parametros.medicamentos]
+
+    primero = bloque * parametros.tamano_bloque
+    ultimo = min(primero + parametros.tamano_bloque, parametros.total_pacientes)
+    for indice in range(ultimo - primero):
+        paciente_id = ids['paciente'] + indice
+        edad_minima, edad_maxima, _, factor_edad = elegir(rng, EDADES, PESO_EDAD)
+        nacimiento = parametros.hasta - timedelta(days=rng.randint(edad_minima * 365, edad_maxima * 365 + 364))
+        nombre = rng.choice(NOMBRES)
+        apellido = f'{elegir(rng, APELLIDOS, PESO_APELLIDO)} {elegir(rng, APELLIDOS, PESO_APELLIDO)}'
+        alta = fecha_estacional(rng, parametros)
+        filas['paciente'].append((
+            paciente_id, rut_desde_id(paciente_id, RANGO_RUT_PACIENTES), nombre, apellido, nacimiento,
+            f'+569{rng.randrange(10_000_000, 100_000_000)}' if rng.random() < 0.85 else None,
+            f'{nombre.lower()}.{paciente_id}@correo.cl' if rng.random() < 0.6 else None,
+            f'{rng.choice(CALLES)} {rng.randint(1, 9999)}, {rng.choice(COMUNAS)}' if rng.random() < 0.7 else None,
+            alta, alta,
+        ))
+
+        cronico = rng.random() < (0.45 if edad_minima >= 45 else 0.12)
+        if rng.random() < 0.6:
+            filas['historial'].append((
+                ids['historial'] + indice, paciente_id, elegir(rng, GRUPOS_SANGUINEOS, PESO_GRUPO_SANGUINEO),
+                rng.choice(ALERGIAS) if rng.random() < 0.15 else None,
+                rng.choice(ENFERMEDADES_CRONICAS) if cronico else None,
+                alta, alta,
+            ))
+
+        # Frecuencia de consultas sobredispersa (gamma) según edad y cronicidad
+        media = parametros.consultas_por_paciente * factor_edad * (1.6 if cronico else 0.85)
+        consultas = min(MAX_CONSULTAS_POR_PACIENTE, int(rng.gammavariate(1.5, media / 1.5) + 0.5))
+        cabecera = elegir(rng, medico_ids, peso_medicos)
+        for _ in range(consultas):
+            fecha = fecha_estacional(rng, parametros)
+            medico_id = cabecera if rng.random() < 0.7 else elegir(rng, medico_ids, peso_medicos)
+            invierno = fecha.month in (6, 7, 8)
+            motivo, diagnostico = rng.choice(MOTIVOS_RESPIRATORIOS if rng.random() < (0.45 if invierno else 0.15) else MOTIVOS_GENERALES)
+            consulta_id = ids['consulta']
+            ids['consulta'] += 1
+            filas['consulta'].append((consulta_id, paciente_id, medico_id, None, fecha, motivo, diagnostico, fecha, fecha))
+
+            for _ in range(elegir(rng, range(len(PESO_TRATAMIENTOS)), PESO_TRATAMIENTOS)):
+                dias = elegir(rng, DURACIONES_DIAS, PESO_DURACION)
+                tratamiento_id = ids['tratamiento']
+                ids['tratamiento'] += 1
+                filas['tratamiento'].append((
+                    tratamiento_id, consulta_id, rng.choice(TRATAMIENTOS),
+                    fecha.date(), fecha.date() + timedelta(days=dias), fecha, fecha,
+                ))
+                for _ in range(elegir(rng, range(len(PESO_RECETAS)), PESO_RECETAS)):
+                    medicamento_id, precio, _ = elegir(rng, parametros.medicamentos, peso_medicamentos)
+                    filas['receta'].append((
+                        ids['receta'], tratamiento_id, medicamento_id,
+                        elegir(rng, range(1, len(PESO_CANTIDAD) + 1), PESO_CANTIDAD), precio,
+                        elegir(rng, FRECUENCIAS, PESO_FRECUENCIA), f'{dias} días', fecha, fecha,
+                    ))
+                    ids['receta'] += 1
+    return filas
+
+
+# Columnas (attname) de las filas de cada tabla, en el orden de las tuplas
+COLUMNAS = {
+    'paciente': ('id', 'rut', 'nombre', 'apellido', 'fecha_nacimiento', 'telefono', 'email', 'direccion', 'created_at', 'updated_at'),
+    'historial': ('id', 'paciente_id', 'grupo_sanguineo', 'alergias_conocidas', 'enfermedades_cronicas', 'created_at', 'updated_at'),
+    'consulta': ('id', 'paciente_id', 'medico_id', 'cita_id', 'fecha_consulta', 'motivo', 'diagnostico', 'created_at', 'updated_at'),
+    'tratamiento': ('id', 'consulta_id', 'descripcion', 'fecha_inicio', 'fecha_fin', 'created_at', 'updated_at'),
+    'receta': ('id', 'tratamiento_id', 'medicamento_id', 'cantidad', 'precio_unitario', 'frecuencia', 'duracion', 'created_at', 'updated_at'),
+}
+
+
+# ============================================================================
+# CATÁLOGO (MÉDICOS Y MEDICAMENTOS)
+# ============================================================================
+
+def medicos_sinteticos(rng, cantidad, base_id, especialidades):
+    """Datos de `cantidad` médicos con RUT derivado del id que tendrán"""
+    peso_especialidad = list(itertools.accumulate(PESO_ESPECIALIDAD[:len(especialidades)]))
+    medicos = []
+    for indice in range(cantidad):
+        nombre = rng.choice(NOMBRES)
+        medicos.append({
+            'rut': rut_desde_id(base_id + indice, RANGO_RUT_MEDICOS),
+            'nombre': nombre,
+            'apellido': f'{elegir(rng, APELLIDOS, PESO_APELLIDO)} {elegir(rng, APELLIDOS, PESO_APELLIDO)}',
+            'email': f'{nombre.lower()}.{base_id + indice}@saludvital.cl',
+            'telefono': f'+569{rng.randrange(10_000_000, 100_000_000)}',
+            'especialidad': elegir(rng, especialidades, peso_especialidad),
+        })
+    return medicos
+
+
+def medicamentos_sinteticos(rng, hasta):
+    """Catálogo fijo de medicamentos con stock y vencimiento aleatorios"""
+    return [
+        {
+            'nombre': f'{nombre} {dosis}',
+            'precio_unitario': Decimal(round(precio * (1 + 0.4 * posicion), -1)),
+            'stock': rng.randint(50, 5000),
+            'fecha_vencimiento': hasta + timedelta(days=rng.randint(180, 720)),
+        }
+        for nombre, dosis_disponibles, precio in MEDICAMENTOS
+        for posicion, dosis in enumerate(dosis_disponibles)
+    ]
+
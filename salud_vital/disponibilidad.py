@@ -0,0 +1,143 @@
+# ============================================================================
+# MOTOR DE DISPONIBILIDAD DE CUPOS - SALUD VITAL
+# ============================================================================
+# Calcula los cupos libres de uno o varios médicos en un rango de fechas a
+# partir de su plantilla semanal (HorarioMedico) y de sus citas existentes.
+#
+# Se hacen solo dos consultas (horarios y citas de todos los médicos pedidos);
+# luego, por médico, las citas ordenadas se fusionan en intervalos ocupados y
+# se recorren en un barrido junto a los cupos candidatos, sin consultar la
+# base de datos por cupo. Los resultados quedan en caché por médico y rango
+# hasta que cambia una cita o un horario de ese médico (ver signals.py).
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+
+from .cache import versiones_disponibilidad, obtener_disponibilidades, guardar_disponibilidades
+from .models import CitaMedica, HorarioMedico
+
+
+# Rango máximo (en días) que se puede consultar de una vez
+MAX_DIAS_DISPONIBILIDAD = 31
+
+# ============================================================================
+# BARRIDO DE INTERVALOS
+# ============================================================================
+
+def fusionar_intervalos(intervalos):
+    """Fusiona intervalos (inicio, fin) ordenados por inicio en bloques disjuntos"""
+    fusionados = []
+    for inicio, fin in intervalos:
+        if fusionados and inicio < fusionados[-1][1]:
+            if fin > fusionados[-1][1]:
+                fusionados[-1] = (fusionados[-1][0], fin)
+        else:
+            fusionados.append((inicio, fin))
+    return fusionados
+
+
+def cupos_libres(ventanas, ocupados):
+    """Cupos libres de las ventanas de atención, en un solo barrido.
+
+    `ventanas` es una lista ordenada de (inicio, fin, duracion) y `ocupados` la
+    lista de intervalos disjuntos y ordenados de fusionar_intervalos().
+    """
+    libres = []
+    j = 0
+    fin_anterior = None
+    for inicio_ventana, fin_ventana, duracion in ventanas:
+        # Ventanas que se cruzan (bloques guardados antes de validarlos) siguen
+        # desde el último cupo: el barrido nunca retrocede ni repite cupos
+        inicio = max(inicio_ventana, fin_anterior) if fin_anterior else inicio_ventana
+        while inicio + duracion <= fin_ventana:
+            fin = inicio + duracion
+            # Descartar los bloques ocupados que terminaron antes de este cupo
+            while j < len(ocupados) and ocupados[j][1] <= inicio:
+                j += 1
+            if j == len(ocupados) or ocupados[j][0] >= fin:
+                libres.append((inicio, fin))
+            inicio = fin_anterior = fin
+    return libres
+
+
+def ventanas_de_atencion(horarios, desde, hasta):
+    """Expande la plantilla semanal a ventanas concretas (aware) entre dos fechas"""
+    por_dia = defaultdict(list)
+    for horario in horarios:
+        por_dia[horario.dia_semana].append(horario)
+
+    ventanas = []
+    dia = desde
+    while dia <= hasta:
+        for horario in por_dia.get(dia.weekday(), []):
+            ventanas.append((
+                timezone.make_aware(datetime.combine(dia, horario.hora_inicio)),
+                timezone.make_aware(datetime.combine(dia, horario.hora_fin)),
+                timedelta(minutes=horario.duracion_cupo_minutos),
+            ))
+        dia += timedelta(days=1)
+    ventanas.sort()
+    return ventanas
+
+
+# ============================================================================
+# CÁLCULO PARA VARIOS MÉDICOS
+# ============================================================================
+
+def calcular_disponibilidad(medico_ids, desde, hasta):
+    """Cupos libres {medico_id: [(inicio, fin), ...]} entre las fechas `desde` y `hasta`"""
+    medico_ids = list(medico_ids)
+    if not medico_ids:
+        return {}
+    inicio_rango = timezone.make_aware(datetime.combine(desde, datetime.min.time()))
+    fin_rango = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+
+    horarios = defaultdict(list)
+    for horario in HorarioMedico.objects.filter(medico_id__in=medico_ids).order_by('dia_semana', 'hora_inicio'):
+        horarios[horario.medico_id].append(horario)
+
+    ocupados = defaultdict(list)
+    citas = CitaMedica.objects.filter(
+        medico_id__in=medico_ids,
+        fecha_hora_cita__lt=fin_rango,
+        fecha_hora_fin__gt=inicio_rango,
+    ).exclude(estado='Cancelada').order_by('medico_id', 'fecha_hora_cita').values_list(
+        'medico_id', 'fecha_hora_cita', 'fecha_hora_fin'
+    )
+    for medico_id, inicio, fin in citas:
+        ocupados[medico_id].append((inicio, fin))
+
+    return {
+        medico_id: cupos_libres(
+            ventanas_de_atencion(horarios[medico_id], desde, hasta),
+            fusionar_intervalos(ocupados[medico_id]),
+        )
+        for medico_id in medico_ids
+    }
+
+
+def disponibilidad_en_cache(medico_ids, desde, hasta):
+    """Como calcular_disponibilidad(), pero reutilizando los resultados en caché.
+
+    Solo se calculan (en un único lote) los médicos sin entrada vigente, y se
+    omiten los cupos que ya pasaron.
+    """
+    medico_ids = list(medico_ids)
+    versiones = versiones_disponibilidad(medico_ids)
+    resultado = obtener_disponibilidades(versiones, desde, hasta)
+    faltantes = [medico_id for medico_id in medico_ids if medico_id not in resultado]
+    if faltantes:
+        calculados = calcular_disponibilidad(faltantes, desde, hasta)
+        guardar_disponibilidades(calculados, versiones, desde, hasta)
+        resultado.update(calculados)
+
+    ahora = timezone.now()
+    return {
+        medico_id: [cupo for cupo in resultado[medico_id] if cupo[0] >= ahora]
+        for medico_id in medico_ids
+    }
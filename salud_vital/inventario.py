@@ -0,0 +1,236 @@
+# ============================================================================
+# INVENTARIO DE MEDICAMENTOS - SALUD VITAL
+# ============================================================================
+# Movimientos de stock sin condiciones de carrera, lotes FEFO y libro de
+# inventario.
+#
+# El stock nunca se lee, modifica y vuelve a escribir desde Python: cada
+# movimiento empieza con un UPDATE con F('stock') que, en las salidas, solo
+# afecta la fila si `stock >= cantidad`. La fila del medicamento queda
+# bloqueada hasta el fin de la transacción, lo que serializa los movimientos
+# del mismo medicamento; luego se mueven los lotes y se recalcula el próximo
+# vencimiento. Se registra un MovimientoInventario por lote afectado, con el
+# stock resultante del medicamento.
+#
+# Las salidas sin lote indicado (dispensaciones) toman primero los lotes
+# vigentes que vencen antes (FEFO) en una sola consulta con FOR UPDATE sobre
+# el índice parcial de lotes con existencias. Su condición es el stock en lotes
+# no vencidos (stock_vigente), no el stock total, que incluye los vencidos.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+from datetime import date, datetime, timedelta
+
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Medicamento, LoteMedicamento, MovimientoInventario
+
+
+class StockInsuficiente(Exception):
+    """No hay stock suficiente del medicamento para la salida solicitada"""
+
+
+# ============================================================================
+# LOTES
+# ============================================================================
+
+# Reparte `%(cantidad)s` entre los lotes vigentes con existencias en orden de
+# vencimiento: cada lote entrega lo que falta tras los lotes anteriores, hasta
+# su cantidad. Los lotes se bloquean en la misma consulta que los descuenta
+SQL_DISPENSAR_FEFO = f"""
+    WITH disponibles AS (
+        SELECT id, cantidad, fecha_vencimiento
+        FROM {LoteMedicamento._meta.db_table}
+        WHERE medicamento_id = %(medicamento)s AND cantidad > 0 AND fecha_vencimiento >= %(hoy)s
+        ORDER BY fecha_vencimiento, id
+        FOR UPDATE
+    ), asignados AS (
+        SELECT id, fecha_vencimiento, LEAST(
+            cantidad,
+            %(cantidad)s - (SUM(cantidad) OVER (ORDER BY fecha_vencimiento, id) - cantidad)
+        ) AS tomado
+        FROM disponibles
+    )
+    UPDATE {LoteMedicamento._meta.db_table} lote
+    SET cantidad = lote.cantidad - asignados.tomado
+    FROM asignados
+    WHERE lote.id = asignados.id AND asignados.tomado > 0
+    RETURNING lote.id, asignados.tomado, asignados.fecha_vencimiento
+"""
+
+# Recalcula el próximo vencimiento con el índice parcial y devuelve el stock
+SQL_ACTUALIZAR_VENCIMIENTO = f"""
+    UPDATE {Medicamento._meta.db_table}
+    SET fecha_vencimiento = COALESCE((
+        SELECT MIN(fecha_vencimiento) FROM {LoteMedicamento._meta.db_table}
+        WHERE medicamento_id = %(medicamento)s AND cantidad > 0
+    ), fecha_vencimiento)
+    WHERE id = %(medicamento)s
+    RETURNING stock
+"""
+
+
+def dispensar_fefo(medicamento_id, cantidad):
+    """Descuenta `cantidad` de los lotes vigentes por orden de vencimiento.
+
+    Retorna [(lote_id, -tomado), ...] en orden FEFO; lanza StockInsuficiente si
+    los lotes vigentes no alcanzan (otra transacción los tomó tras verificar
+    stock_vigente).
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_DISPENSAR_FEFO, {'medicamento': medicamento_id, 'cantidad': cantidad, 'hoy': date.today()})
+        filas = sorted(cursor.fetchall(), key=lambda fila: (fila[2], fila[0]))
+    if sum(tomado for _, tomado, _ in filas) < cantidad:
+        raise StockInsuficiente(f'No hay {cantidad} unidades en lotes vigentes.')
+    return [(lote_id, -tomado) for lote_id, tomado, _ in filas]
+
+
+def mover_lote(lote_id, cantidad):
+    """Aplica la variación a un lote concreto; las salidas no lo dejan negativo"""
+    lotes = LoteMedicamento.objects.filter(pk=lote_id)
+    if cantidad < 0:
+        lotes = lotes.filter(cantidad__gte=-cantidad)
+    if not lotes.update(cantidad=F('cantidad') + cantidad):
+        raise StockInsuficiente(f'El lote no tiene {-cantidad} unidades.')
+    return [(lote_id, cantidad)]
+
+
+def repartir_devolucion(medicamento_id, cantidad, receta=None):
+    """Devuelve `cantidad` a los lotes de los que salió la receta.
+
+    Se devuelve primero a los lotes que vencen más tarde. Lo que no tenga lote
+    de origen conocido (recetas anteriores a los lotes) va al lote de
+    vencimiento más lejano del medicamento.
+    """
+    origenes = []
+    if receta is not None:
+        origenes = list(
+            MovimientoInventario.objects
+            .filter(receta_id=receta.pk, medicamento_id=medicamento_id, lote__isnull=False)
+            .values('lote').annotate(neto=Sum('cantidad')).filter(neto__lt=0)
+            .order_by('-lote__fecha_vencimiento', '-lote').values_list('lote', 'neto')
+        )
+
+    partidas = []
+    pendiente = cantidad
+    for lote_id, neto in origenes:
+        devuelto = min(pendiente, -neto)
+        partidas += mover_lote(lote_id, devuelto)
+        pendiente -= devuelto
+        if not pendiente:
+            break
+    if pendiente:
+        lote = LoteMedicamento.objects.filter(medicamento_id=medicamento_id).order_by('-fecha_vencimiento', '-id').first()
+        if lote is None:
+            medicamento = Medicamento.objects.only('fecha_vencimiento').get(pk=medicamento_id)
+            lote = LoteMedicamento.objects.create(medicamento_id=medicamento_id, fecha_vencimiento=medicamento.fecha_vencimiento)
+        partidas += mover_lote(lote.pk, pendiente)
+    return partidas
+
+
+# ============================================================================
+# MOVIMIENTOS DE STOCK
+# ============================================================================
+
+def registrar_movimiento(medicamento_id, cantidad, tipo, lote=None, receta=None, observacion=''):
+    """Aplica la variación `cantidad` al stock y a los lotes y la registra en el libro.
+
+    Con `lote` la variación se aplica a ese lote; si no, las salidas se toman
+    por FEFO y las entradas se devuelven a los lotes de la receta. Las salidas
+    solo se aplican si hay stock suficiente; si no, se lanza StockInsuficiente
+    sin modificar nada; las que se toman por FEFO, si no alcanzan los lotes no
+    vencidos. Retorna los movimientos creados (uno por lote).
+    """
+    with transaction.atomic():
+        medicamentos = Medicamento.objects.filter(pk=medicamento_id)
+        if cantidad < 0:
+            medicamentos = medicamentos.filter(stock__gte=-cantidad)
+            if lote is None:
+                medicamentos = medicamentos.con_stock_vigente().filter(stock_vigente__gte=-cantidad)
+        if not medicamentos.update(stock=F('stock') + cantidad, updated_at=timezone.now()):
+            raise StockInsuficiente(f'Stock insuficiente para entregar {-cantidad} unidades.')
+
+        if lote is not None:
+            partidas = mover_lote(getattr(lote, 'pk', lote), cantidad)
+        elif cantidad < 0:
+            partidas = dispensar_fefo(medicamento_id, -cantidad)
+        else:
+            partidas = repartir_devolucion(medicamento_id, cantidad, receta)
+
+        with connection.cursor() as cursor:
+            cursor.execute(SQL_ACTUALIZAR_VENCIMIENTO, {'medicamento': medicamento_id})
+            stock = cursor.fetchone()[0]
+
+        # Stock resultante tras cada partida, reconstruido hacia atrás desde el final
+        movimientos = []
+        for lote_id, variacion in reversed(partidas):
+            movimientos.append(MovimientoInventario(
+                medicamento_id=medicamento_id,
+                lote_id=lote_id,
+                tipo=tipo,
+                cantidad=variacion,
+                stock_resultante=stock,
+                receta=receta,
+                observacion=observacion,
+            ))
+            stock -= variacion
+        return MovimientoInventario.objects.bulk_create(movimientos[::-1])
+
+
+def recibir_lote(medicamento_id, cantidad, fecha_vencimiento, codigo='', observacion=''):
+    """Crea un lote nuevo y registra su ingreso"""
+    with transaction.atomic():
+        lote = LoteMedicamento.objects.create(
+            medicamento_id=medicamento_id, codigo=codigo, fecha_vencimiento=fecha_vencimiento
+        )
+        registrar_movimiento(medicamento_id, cantidad, 'Ingreso', lote=lote, observacion=observacion)
+    lote.cantidad = cantidad
+    return lote
+
+
+def ajustar_stock_por_receta(receta, anterior=None):
+    """Mueve el stock según la receta recién guardada.
+
+    `anterior` es {'medicamento_id', 'cantidad'} de la receta antes de editarla
+    (None al crearla): se entrega solo la diferencia, o se devuelve todo al
+    medicamento anterior si cambió.
+    """
+    entregado = 0
+    if anterior is not None:
+        if anterior['medicamento_id'] == receta.medicamento_id:
+            entregado = anterior['cantidad']
+        else:
+            registrar_movimiento(anterior['medicamento_id'], anterior['cantidad'], 'Devolución', receta=receta)
+    diferencia = receta.cantidad - entregado
+    if diferencia > 0:
+        registrar_movimiento(receta.medicamento_id, -diferencia, 'Dispensación', receta=receta)
+    elif diferencia < 0:
+        registrar_movimiento(receta.medicamento_id, -diferencia, 'Devolución', receta=receta)
+
+
+# ============================================================================
+# STOCK EN UNA FECHA
+# ============================================================================
+
+def fin_del_dia(fecha):
+    return timezone.make_aware(datetime.combine(fecha + timedelta(days=1), datetime.min.time()))
+
+
+def stock_en_fecha(fecha, medicamentos=None):
+    """Stock de cada medicamento al cierre de `fecha` {medicamento_id: stock}.
+
+    Una sola consulta DISTINCT ON que toma, por medicamento, el último
+    movimiento anterior al corte usando el índice (medicamento, creado_en).
+    Los medicamentos sin movimientos hasta esa fecha no aparecen (stock 0).
+    """
+    movimientos = MovimientoInventario.objects.filter(creado_en__lt=fin_del_dia(fecha))
+    if medicamentos is not None:
+        movimientos = movimientos.filter(medicamento__in=medicamentos)
+    return dict(
+        movimientos.order_by('medicamento_id', '-creado_en', '-id')
+        .distinct('medicamento_id')
+        .values_list('medicamento_id', 'stock_resultante')
+    )
@@ -0,0 +1,174 @@
+import json
+import os
+import subprocess
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+
+from salud_vital.models import ConsultaMedica, Paciente
+from salud_vital.rendimiento import comparar, ejecutar, filas_de_muestra, resumir, sembrar, solicitudes
+from salud_vital.sql import ContadorSQL
+
+
+# Escala de generate_data de cada tamaño de base de datos (1.0 = 1.000.000 de pacientes)
+ESCALAS = {
+    'pequena': 0.001,
+    'mediana': 0.01,
+    'grande': 0.1,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide latencia (percentiles), cantidad y tiempo de consultas SQL de cada ruta de '
+        'salud_vital/urls.py sobre bases de datos desechables sembradas a varias escalas, '
+        'guarda los resultados en JSON y opcionalmente los compara con una base anterior'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escalas', nargs='+', choices=list(ESCALAS), default=list(ESCALAS))
+        parser.add_argument('--repeticiones', type=int, default=20, help='Solicitudes medidas por ruta')
+        parser.add_argument('--calentamiento', type=int, default=2, help='Solicitudes previas no medidas por ruta')
+        parser.add_argument('--tiempo-maximo', type=float, default=10.0,
+                            help='Segundos por ruta tras los que se dejan de repetir sus solicitudes (mínimo una medida)')
+        parser.add_argument('--rutas', nargs='+', help='Medir solo las rutas cuyo nombre contenga alguno de estos textos')
+        parser.add_argument('--salida', default='benchmark.json', help='Archivo JSON de resultados')
+        parser.add_argument('--comparar', help='Resultado JSON anterior con el que comparar')
+        parser.add_argument('--umbral', type=float, default=0.2, help='Aumento tolerado del p95 (0.2 = 20 %%)')
+        parser.add_argument('--minimo-ms', type=float, default=1.0, help='Aumento del p95 que se ignora como ruido')
+        parser.add_argument('--semilla', type=int, default=42)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Procesos para sembrar los datos')
+        parser.add_argument('--mantener-bd', action='store_true',
+                            help='Conservar las bases sembradas y reutilizarlas en la próxima ejecución')
+
+    def handle(self, *args, **options):
+        if options['repeticiones'] < 1:
+            raise CommandError('Debe medir al menos una repetición.')
+        base = None
+        if options['comparar']:
+            with open(options['comparar'], encoding='utf-8') as archivo:
+                base = json.load(archivo)
+
+        resultados = {
+            'version': 1,
+            'fecha': timezone.now().isoformat(),
+            'commit': self.commit_actual(),
+            'repeticiones': options['repeticiones'],
+            'escalas': {},
+        }
+        for escala in options['escalas']:
+            resultados['escalas'][escala] = self.medir_escala(escala, options)
+
+        with open(options['salida'], 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f'Resultados guardados en {options["salida"]}'))
+
+        if base is not None:
+            regresiones = comparar(base, resultados, options['umbral'], options['minimo_ms'])
+            for escala, ruta, detalle in regresiones:
+                self.stdout.write(self.style.ERROR(f'  {escala:<8} {ruta:<40} {detalle}'))
+            if regresiones:
+                raise CommandError(f'{len(regresiones)} regresiones respecto de {options["comparar"]}.')
+            self.stdout.write(self.style.SUCCESS(f'Sin regresiones respecto de {options["comparar"]}.'))
+
+    def commit_actual(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    # ========================================================================
+    # BASE DE DATOS DE CADA ESCALA
+    # ========================================================================
+
+    def medir_escala(self, escala, options):
+        """Crea (o reutiliza) la base de la escala, la siembra si está vacía y mide todas las rutas"""
+        nombre_original = connection.settings_dict['NAME']
+        prueba_original = connection.settings_dict.get('TEST', {})
+        connection.settings_dict['TEST'] = {**prueba_original, 'NAME': f'{nombre_original}_benchmark_{escala}'}
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'Escala {escala} ({ESCALAS[escala]})'))
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['mantener_bd'], serialize=False)
+            if not Paciente.objects.exists():
+                sembrar(ESCALAS[escala], options['semilla'], options['workers'], stdout=self.stdout)
+            return {
+                'pacientes': Paciente.objects.count(),
+                'consultas': ConsultaMedica.objects.count(),
+                **self.medir_rutas(options),
+            }
+        finally:
+            connection.creation.destroy_test_db(nombre_original, verbosity=0, keepdb=options['mantener_bd'])
+            connection.settings_dict['TEST'] = prueba_original
+
+    # ========================================================================
+    # MEDICIÓN
+    # ========================================================================
+
+    def medir_rutas(self, options):
+        usuario, _ = User.objects.get_or_create(username='benchmark', defaults={'is_staff': True, 'is_superuser': True})
+        # Las excepciones de una vista se registran como respuesta 500 sin detener la medición
+        cliente = Client(raise_request_exception=False)
+        cliente.force_login(usuario)
+
+        lista, omitidas = solicitudes(filas_de_muestra())
+        if options['rutas']:
+            lista = [s for s in lista if any(texto in s.nombre for texto in options['rutas'])]
+        for nombre, motivo in omitidas.items():
+            self.stdout.write(self.style.WARNING(f'  omitida {nombre}: {motivo}'))
+
+        self.stdout.write(f'  {"ruta":<40}{"estado":>7}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"SQL":>6}{"SQL ms":>9}')
+        rutas = {}
+        for solicitud in lista:
+            medida = rutas[solicitud.nombre] = self.medir(
+                cliente, solicitud, options['repeticiones'], options['calentamiento'], options['tiempo_maximo']
+            )
+            self.stdout.write(
+                f'  {solicitud.nombre:<40}{medida["estado"]:>7}{medida["p50_ms"]:>9.1f}{medida["p95_ms"]:>9.1f}'
+                f'{medida["p99_ms"]:>9.1f}{medida["consultas"]:>6}{medida["sql_ms"]:>9.1f}'
+            )
+        return {'rutas': rutas, 'omitidas': omitidas}
+
+    def medir(self, cliente, solicitud, repeticiones, calentamiento, tiempo_maximo):
+        """Repite la solicitud y resume latencias, consultas SQL y código de estado más frecuente.
+
+        Las rutas lentas se miden menos veces: se deja de repetir (calentamiento
+        incluido) al superar `tiempo_maximo` segundos, con al menos una medida.
+        """
+        latencias, consultas, tiempos_sql, estados = [], [], [], Counter()
+        limite = time.perf_counter() + tiempo_maximo
+        for repeticion in range(calentamiento + repeticiones):
+            medida = repeticion >= calentamiento or time.perf_counter() > limite
+            contador = ContadorSQL()
+            # Las acciones que modifican datos se revierten para que todas las
+            # repeticiones midan lo mismo
+            with transaction.atomic() if solicitud.modifica else nullcontext():
+                with connection.execute_wrapper(contador):
+                    inicio = time.perf_counter()
+                    respuesta = ejecutar(cliente, solicitud)
+                    duracion = time.perf_counter() - inicio
+                if solicitud.modifica:
+                    transaction.set_rollback(True)
+            if medida:
+                latencias.append(duracion)
+                consultas.append(len(contador))
+                tiempos_sql.append(contador.segundos)
+                estados[respuesta.status_code] += 1
+                if time.perf_counter() > limite:
+                    break
+        return {
+            'metodo': solicitud.metodo,
+            'url': solicitud.url,
+            'estado': estados.most_common(1)[0][0],
+            'repeticiones': len(latencias),
+            **resumir(latencias, consultas, tiempos_sql),
+        }
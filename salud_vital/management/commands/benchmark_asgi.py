@@ -0,0 +1,216 @@
+import asyncio
+import os
+import shlex
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager, nullcontext
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils.module_loading import import_string
+
+from salud_vital.trafico import FALLAS_DE_CONEXION, ClienteHTTP, Estadisticas
+
+
+# Pares (endpoint síncrono, endpoint async) que hacen el mismo trabajo: las
+# mismas consultas SQL y el mismo cuerpo JSON
+ENDPOINTS = [
+    ('/api/consultas/hoy/', '/api/async/consultas/hoy/'),
+    ('/api/medicamentos/stock_bajo/', '/api/async/medicamentos/stock_bajo/'),
+    ('/api/dashboard/', '/api/async/dashboard/'),
+]
+
+# Servidores por omisión: el mismo gestor de procesos (gunicorn) con la misma
+# cantidad de workers; bajo ASGI cada worker es un event loop de uvicorn
+COMANDO_WSGI = 'gunicorn salud_vital_project.wsgi:application --bind 127.0.0.1:{puerto} --workers {workers}'
+COMANDO_ASGI = (
+    'gunicorn salud_vital_project.asgi:application --bind 127.0.0.1:{puerto} --workers {workers} '
+    '--worker-class uvicorn.workers.UvicornWorker'
+)
+
+# Ajustes de ambos servidores: sin los middleware de diagnóstico, para medir las
+# vistas y no la instrumentación (`--con-diagnostico` deja la configuración actual)
+SIN_DIAGNOSTICO = {
+    'METRICAS': False,
+    'PERFILADOR': False,
+    'PERFIL_SQL': False,
+    'TRAZAS': False,
+    'CONSULTAS_LENTAS_UMBRAL_MS': 0,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el rendimiento de los endpoints de lectura síncronos bajo un servidor WSGI y '
+        'de sus versiones async bajo un servidor ASGI con la misma cantidad de workers. Levanta '
+        'cada servidor (por omisión gunicorn, y gunicorn con workers de uvicorn) y le envía '
+        'solicitudes HTTP reales con la misma concurrencia'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solicitudes', type=int, default=200, help='Solicitudes medidas por endpoint')
+        parser.add_argument('--concurrencia', type=int, default=8, help='Conexiones simultáneas por endpoint')
+        parser.add_argument('--workers', type=int, default=2, help='Workers de cada servidor')
+        parser.add_argument('--calentamiento', type=int, default=20, help='Solicitudes no medidas por endpoint')
+        parser.add_argument('--puerto', type=int, default=8765, help='Puerto de los servidores (uno a la vez)')
+        parser.add_argument('--comando-wsgi', default=COMANDO_WSGI, help='Servidor WSGI; admite {puerto} y {workers}')
+        parser.add_argument('--comando-asgi', default=COMANDO_ASGI, help='Servidor ASGI; admite {puerto} y {workers}')
+        parser.add_argument('--espera', type=float, default=30.0, help='Segundos para que cada servidor responda')
+        parser.add_argument('--usuario', help='Usuario para la sesión (por defecto el primer superusuario)')
+        parser.add_argument(
+            '--con-diagnostico', action='store_true',
+            help='No desactivar métricas, perfilador, perfil SQL, trazas ni consultas lentas en los servidores',
+        )
+
+    def handle(self, *args, **options):
+        sesion = self.crear_sesion(options['usuario'])
+        url = f'http://127.0.0.1:{options["puerto"]}'
+        ajustes = {} if options['con_diagnostico'] else SIN_DIAGNOSTICO
+        entorno = {**os.environ, **{nombre: str(valor) for nombre, valor in ajustes.items()}}
+        middlewares = self.middlewares_activos(ajustes)
+
+        resultados = {}
+        for modo, comando, rutas in (
+            ('WSGI', options['comando_wsgi'], [sincrona for sincrona, _ in ENDPOINTS]),
+            ('ASGI', options['comando_asgi'], [asincrona for _, asincrona in ENDPOINTS]),
+        ):
+            comando = comando.format(puerto=options['puerto'], workers=options['workers'])
+            self.stdout.write(f'{modo}: {comando}')
+            with self.servidor(comando, entorno, url, rutas[0], sesion, options['espera']):
+                for ruta in rutas:
+                    asyncio.run(self.medir(url, ruta, sesion, options['calentamiento'], options['concurrencia']))
+                    resultados[ruta] = asyncio.run(
+                        self.medir(url, ruta, sesion, options['solicitudes'], options['concurrencia'])
+                    )
+
+        self.stdout.write(
+            f'\n{options["solicitudes"]} solicitudes por endpoint, concurrencia {options["concurrencia"]}, '
+            f'{options["workers"]} workers por servidor\n'
+        )
+        self.stdout.write('Middleware activos (* solo síncrono: bajo ASGI pasa la solicitud a un hilo):')
+        for ruta, admite_async in middlewares:
+            self.stdout.write(f'  {ruta}{"" if admite_async else " *"}')
+        self.stdout.write('')
+        self.stdout.write(f'{"endpoint":<42}{"modo":<6}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"errores":>9}')
+        for rutas in ENDPOINTS:
+            for modo, ruta in zip(('WSGI', 'ASGI'), rutas):
+                resultado = resultados[ruta]
+                estilo = self.style.ERROR if resultado['errores'] else str
+                self.stdout.write(estilo(
+                    f'{ruta:<42}{modo:<6}{resultado["por_segundo"]:>10.1f}'
+                    f'{resultado["p50_ms"]:>10.1f}{resultado["p95_ms"]:>10.1f}{resultado["errores"]:>9}'
+                ))
+
+    def middlewares_activos(self, ajustes):
+        """(ruta, admite async) de cada middleware que cargan los servidores con estos ajustes"""
+        activos = []
+        with override_settings(**ajustes) if ajustes else nullcontext():
+            for ruta in settings.MIDDLEWARE:
+                clase = import_string(ruta)
+                try:
+                    clase(lambda request: None)
+                except MiddlewareNotUsed:
+                    continue
+                activos.append((ruta, getattr(clase, 'async_capable', False)))
+        return activos
+
+    def crear_sesion(self, username):
+        """Crea una sesión autenticada en la base de datos que comparten los servidores"""
+        usuarios = User.objects.filter(username=username) if username else User.objects.filter(is_superuser=True)
+        usuario = usuarios.order_by('pk').first()
+        if usuario is None:
+            raise CommandError('No hay usuario para autenticar el benchmark (use --usuario).')
+        store = import_module(settings.SESSION_ENGINE).SessionStore()
+        store[SESSION_KEY] = str(usuario.pk)
+        store[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        store[HASH_SESSION_KEY] = usuario.get_session_auth_hash()
+        store.create()
+        return store.session_key
+
+    def cliente(self, url, sesion):
+        cliente = ClienteHTTP(url)
+        cliente.cookies[settings.SESSION_COOKIE_NAME] = sesion
+        return cliente
+
+    @contextmanager
+    def servidor(self, comando, entorno, url, ruta, sesion, espera):
+        """Arranca el servidor, espera a que `ruta` responda 200 y lo detiene al salir"""
+        if self.puerto_ocupado(url):
+            raise CommandError(f'El puerto de {url} ya está en uso; use --puerto.')
+        with tempfile.TemporaryFile() as registro:
+            try:
+                proceso = subprocess.Popen(
+                    shlex.split(comando), cwd=settings.BASE_DIR, env=entorno,
+                    stdout=subprocess.DEVNULL, stderr=registro,
+                )
+            except FileNotFoundError as error:
+                raise CommandError(
+                    f'No se encontró {error.filename}; instale gunicorn y uvicorn o use --comando-wsgi/--comando-asgi.'
+                )
+            try:
+                asyncio.run(self.esperar(proceso, registro, url, ruta, sesion, espera))
+                yield
+            finally:
+                proceso.terminate()
+                try:
+                    proceso.wait(timeout=15)
+                except subprocess.TimeoutExpired:
+                    proceso.kill()
+                    proceso.wait()
+
+    def puerto_ocupado(self, url):
+        partes = urlsplit(url)
+        with socket.socket() as prueba:
+            return prueba.connect_ex((partes.hostname, partes.port)) == 0
+
+    async def esperar(self, proceso, registro, url, ruta, sesion, espera):
+        limite = time.monotonic() + espera
+        cliente = self.cliente(url, sesion)
+        try:
+            while time.monotonic() < limite:
+                if proceso.poll() is not None:
+                    registro.seek(0)
+                    error = registro.read().decode(errors='replace').strip().splitlines()
+                    raise CommandError(f'El servidor terminó al arrancar: {error[-1] if error else proceso.returncode}')
+                try:
+                    respuesta = await cliente.solicitar('GET', ruta)
+                except FALLAS_DE_CONEXION:
+                    await asyncio.sleep(0.2)
+                    continue
+                if respuesta.estado != 200:
+                    raise CommandError(f'{ruta} respondió {respuesta.estado} al arrancar el servidor.')
+                return
+            raise CommandError(f'El servidor no respondió en {espera:g} s.')
+        finally:
+            await cliente.cerrar()
+
+    async def medir(self, url, ruta, sesion, total, concurrencia):
+        """Envía `total` GET a `ruta` por `concurrencia` conexiones persistentes y resume las latencias"""
+        clientes = [self.cliente(url, sesion) for _ in range(concurrencia)]
+        pendientes = iter(range(total))
+        estadisticas = Estadisticas()
+
+        async def trabajar(cliente):
+            for _ in pendientes:
+                inicio = time.perf_counter()
+                try:
+                    respuesta = await cliente.solicitar('GET', ruta, encabezados={'Accept': 'application/json'})
+                except FALLAS_DE_CONEXION:
+                    estadisticas.registrar(ruta, time.perf_counter() - inicio)
+                    continue
+                estadisticas.registrar(ruta, time.perf_counter() - inicio, respuesta.estado, 200)
+
+        try:
+            await asyncio.gather(*(trabajar(cliente) for cliente in clientes))
+        finally:
+            estadisticas.fin = time.perf_counter()
+            await asyncio.gather(*(cliente.cerrar() for cliente in clientes))
+        return estadisticas.resumen().get(ruta, {'por_segundo': 0, 'p50_ms': 0, 'p95_ms': 0, 'errores': 0})
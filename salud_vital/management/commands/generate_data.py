@@ -0,0 +1,260 @@
+import csv
+import itertools
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, time as hora, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from salud_vital.datos_sinteticos import (
+    COLUMNAS, ESPECIALIDADES, RANGO_RUT_PACIENTES, Parametros,
+    generar_bloque, medicamentos_sinteticos, medicos_sinteticos, pesos_zipf,
+)
+from salud_vital.models import (
+    ConsultaMedica, Especialidad, HistorialClinico, HorarioMedico, LoteMedicamento, Medicamento,
+    Medico, MovimientoInventario, Paciente, RecetaMedica, Tratamiento,
+)
+
+
+# Modelo de cada tabla generada por bloque
+MODELOS = {
+    'paciente': Paciente,
+    'historial': HistorialClinico,
+    'consulta': ConsultaMedica,
+    'tratamiento': Tratamiento,
+    'receta': RecetaMedica,
+}
+
+# Pacientes por médico generado
+PACIENTES_POR_MEDICO = 500
+
+# Una dispensación por receta generada, desde el lote de reposición de su
+# medicamento y en el orden de las recetas: el stock resultante es el saldo
+# después de la reposición menos lo dispensado hasta esa receta
+DISPENSACIONES = f'''
+    INSERT INTO {MovimientoInventario._meta.db_table}
+        (medicamento_id, lote_id, tipo, cantidad, stock_resultante, receta_id, observacion, creado_en)
+    SELECT receta.medicamento_id, reposicion.lote_id, 'Dispensación', -receta.cantidad,
+        reposicion.saldo - SUM(receta.cantidad) OVER (
+            PARTITION BY receta.medicamento_id ORDER BY receta.created_at, receta.id
+        ),
+        receta.id, '', %s
+    FROM {RecetaMedica._meta.db_table} AS receta
+    JOIN UNNEST(%s::integer[], %s::integer[], %s::integer[]) AS reposicion (medicamento_id, lote_id, saldo)
+        ON reposicion.medicamento_id = receta.medicamento_id
+    WHERE receta.id >= %s
+    ORDER BY receta.created_at, receta.id
+'''
+
+
+def sentencia_copy(tabla):
+    modelo = MODELOS[tabla]
+    columnas = ', '.join(modelo._meta.get_field(campo).column for campo in COLUMNAS[tabla])
+    return f'COPY {modelo._meta.db_table} ({columnas}) FROM STDIN'
+
+
+def cargar_bloque(bloque, parametros, salida=None):
+    """Genera un bloque y lo carga con COPY en una transacción (o lo escribe como CSV).
+
+    Retorna las filas por tabla y lo que dispensan sus recetas {medicamento_id: cantidad}.
+    """
+    filas = generar_bloque(bloque, parametros)
+    consumo = Counter()
+    for _, _, medicamento_id, cantidad, *_ in filas['receta']:
+        consumo[medicamento_id] += cantidad
+    if salida:
+        for tabla, tuplas in filas.items():
+            with open(os.path.join(salida, f'{MODELOS[tabla]._meta.db_table}.{bloque:06d}.csv'), 'w', newline='') as archivo:
+                csv.writer(archivo).writerows(tuplas)
+    else:
+        with transaction.atomic(), connection.cursor() as cursor:
+            for tabla in MODELOS:
+                with cursor.copy(sentencia_copy(tabla)) as copia:
+                    for fila in filas[tabla]:
+                        copia.write_row(fila)
+    return {tabla: len(tuplas) for tabla, tuplas in filas.items()}, consumo
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera datos sintéticos reproducibles a gran escala (pacientes, historiales, '
+        'consultas, tratamientos y recetas, con su dispensación en el libro de inventario) '
+        'para pruebas de carga, en procesos paralelos '
+        'que cargan bloques de pacientes con COPY'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escala', '--scale', type=float, default=0.01,
+                            help='1.0 = 1.000.000 de pacientes y ~20.000.000 de consultas')
+        parser.add_argument('--semilla', '--seed', type=int, default=42, help='Semilla para reproducir los datos')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Procesos en paralelo (0 = en este proceso)')
+        parser.add_argument('--bloque', type=int, default=1000, help='Pacientes por bloque')
+        parser.add_argument('--consultas-por-paciente', type=float, default=20, help='Media de consultas por paciente')
+        parser.add_argument('--anios', type=int, default=3, help='Años de historia hacia atrás')
+        parser.add_argument('--hasta', type=date.fromisoformat, default=None,
+                            help='Último día de la historia (AAAA-MM-DD, por defecto hoy); fíjelo para reproducir exactamente')
+        parser.add_argument('--salida', help='Directorio donde escribir CSV (un archivo por tabla y bloque) en vez de cargar')
+
+    def handle(self, *args, **options):
+        total_pacientes = round(1_000_000 * options['escala'])
+        if total_pacientes < 1:
+            raise CommandError('La escala no alcanza para generar pacientes.')
+        if options['bloque'] < 1:
+            raise CommandError('El bloque debe tener al menos un paciente.')
+        if options['salida']:
+            os.makedirs(options['salida'], exist_ok=True)
+
+        hasta = options['hasta'] or date.today()
+        rng = random.Random(options['semilla'])
+        inicio = time.perf_counter()
+        parametros = self.preparar_catalogo(rng, options, total_pacientes, hasta)
+        if parametros.base_paciente + total_pacientes > RANGO_RUT_PACIENTES[1]:
+            raise CommandError('No quedan RUT sintéticos para tantos pacientes.')
+
+        self.stdout.write(
+            f'Generando {total_pacientes} pacientes en {parametros.bloques} bloques con '
+            f'{options["workers"] or "un"} proceso(s), semilla {options["semilla"]}'
+        )
+        totales, consumo = dict.fromkeys(MODELOS, 0), Counter()
+        for conteo, consumo_del_bloque in self.ejecutar(parametros, options['workers'], options['salida']):
+            for tabla, cantidad in conteo.items():
+                totales[tabla] += cantidad
+            consumo.update(consumo_del_bloque)
+
+        if not options['salida']:
+            totales['movimiento'] = self.registrar_dispensaciones(parametros, consumo)
+            self.reiniciar_secuencias()
+        duracion = time.perf_counter() - inicio
+        filas = sum(totales.values())
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{cantidad} {tabla}' for tabla, cantidad in totales.items())
+            + f' en {duracion:.1f} s ({filas / duracion:,.0f} filas/s)'
+        ))
+
+    def preparar_catalogo(self, rng, options, total_pacientes, hasta):
+        """Especialidades, médicos (con horario) y medicamentos, y los parámetros de los bloques"""
+        with transaction.atomic():
+            especialidades = [
+                Especialidad.objects.get_or_create(nombre=nombre)[0] for nombre in ESPECIALIDADES
+            ]
+
+            base_medico = (Medico.objects.aggregate(maximo=Max('id'))['maximo'] or 0) + 1
+            medicos = Medico.objects.bulk_create([
+                Medico(**datos) for datos in medicos_sinteticos(
+                    rng, max(5, total_pacientes // PACIENTES_POR_MEDICO), base_medico, especialidades
+                )
+            ])
+            HorarioMedico.objects.bulk_create([
+                HorarioMedico(medico=medico, dia_semana=dia, hora_inicio=inicio, hora_fin=fin)
+                for medico in medicos
+                for inicio, fin in [rng.choice([(hora(8, 30), hora(13)), (hora(14), hora(18, 30)), (hora(9), hora(17))])]
+                for dia in range(5)
+            ])
+
+            # Catálogo fijo de medicamentos: se reutilizan los que ya existan por nombre
+            medicamentos = []
+            for datos in medicamentos_sinteticos(rng, hasta):
+                medicamento = Medicamento.objects.filter(nombre=datos['nombre']).first()
+                medicamentos.append(medicamento or Medicamento.objects.create(**datos))
+
+        # Popularidad de médicos (lognormal) y medicamentos (Zipf, en orden aleatorio)
+        peso_medicos = list(itertools.accumulate(rng.lognormvariate(0, 0.5) for _ in medicos))
+        rng.shuffle(medicamentos)
+        return Parametros(
+            semilla=options['semilla'],
+            total_pacientes=total_pacientes,
+            tamano_bloque=options['bloque'],
+            consultas_por_paciente=options['consultas_por_paciente'],
+            desde=hasta - timedelta(days=365 * options['anios']),
+            hasta=hasta,
+            zona_horaria=timezone.get_current_timezone(),
+            base_paciente=self.siguiente_id(Paciente),
+            base_historial=self.siguiente_id(HistorialClinico),
+            base_consulta=self.siguiente_id(ConsultaMedica),
+            base_tratamiento=self.siguiente_id(Tratamiento),
+            base_receta=self.siguiente_id(RecetaMedica),
+            medicos=tuple(zip((medico.pk for medico in medicos), peso_medicos)),
+            medicamentos=tuple(
+                (medicamento.pk, medicamento.precio_unitario, peso)
+                for medicamento, peso in zip(medicamentos, pesos_zipf(len(medicamentos)))
+            ),
+        )
+
+    def registrar_dispensaciones(self, parametros, consumo):
+        """Lleva al libro de inventario las recetas cargadas; retorna los movimientos creados.
+
+        Como inventario_inicial (carga_inicial.py), el inventario se calcula en
+        memoria con lo que dispensa cada bloque: cada medicamento recetado recibe
+        un lote de reposición con esa cantidad, así el stock nunca queda negativo
+        y termina donde estaba. El libro solo admite inserciones y los bloques se
+        cargan en paralelo, por lo que las dispensaciones se insertan al final,
+        una vez, con su stock resultante.
+        """
+        with transaction.atomic():
+            # Bloquea los medicamentos como registrar_movimiento (inventario.py)
+            stock = dict(
+                Medicamento.objects.select_for_update().filter(pk__in=consumo).values_list('id', 'stock')
+            )
+            lotes = LoteMedicamento.objects.bulk_create([
+                LoteMedicamento(
+                    medicamento_id=medicamento_id, codigo='REPOSICION', cantidad=0, fecha_vencimiento=parametros.hasta,
+                )
+                for medicamento_id in consumo
+            ])
+            saldos = [stock[lote.medicamento_id] + consumo[lote.medicamento_id] for lote in lotes]
+            MovimientoInventario.objects.bulk_create([
+                MovimientoInventario(
+                    medicamento_id=lote.medicamento_id, lote=lote, tipo='Ingreso', cantidad=consumo[lote.medicamento_id],
+                    stock_resultante=saldo, observacion='Reposición de datos sintéticos',
+                )
+                for lote, saldo in zip(lotes, saldos)
+            ])
+            with connection.cursor() as cursor:
+                cursor.execute(DISPENSACIONES, [
+                    timezone.now(), [lote.medicamento_id for lote in lotes], [lote.pk for lote in lotes],
+                    saldos, parametros.base_receta,
+                ])
+                return len(lotes) + cursor.rowcount
+
+    def siguiente_id(self, modelo):
+        return (modelo.objects.aggregate(maximo=Max('id'))['maximo'] or 0) + 1
+
+    def ejecutar(self, parametros, workers, salida):
+        """Carga los bloques (en procesos hijos si hay workers) e informa el avance"""
+        bloques = range(parametros.bloques)
+        aviso = max(1, parametros.bloques // 20)
+        if not workers:
+            for bloque in bloques:
+                yield cargar_bloque(bloque, parametros, salida)
+                self.informar(bloque + 1, parametros.bloques, aviso)
+            return
+
+        # Los procesos hijos abren su propia conexión a la base de datos
+        connections.close_all()
+        contexto = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=contexto) as pool:
+            futuros = [pool.submit(cargar_bloque, bloque, parametros, salida) for bloque in bloques]
+            for listos, futuro in enumerate(as_completed(futuros), start=1):
+                yield futuro.result()
+                self.informar(listos, parametros.bloques, aviso)
+
+    def informar(self, listos, total, aviso):
+        if listos % aviso == 0 or listos == total:
+            self.stdout.write(f'  {listos}/{total} bloques')
+
+    def reiniciar_secuencias(self):
+        """Deja las secuencias de ids después de los ids asignados por bloque"""
+        with connection.cursor() as cursor:
+            for sentencia in connection.ops.sequence_reset_sql(no_style(), list(MODELOS.values())):
+                cursor.execute(sentencia)
+            for modelo in [*MODELOS.values(), LoteMedicamento, MovimientoInventario]:
+                cursor.execute(f'ANALYZE {modelo._meta.db_table}')
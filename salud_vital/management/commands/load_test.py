@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from salud_vital.trafico import ESCENARIOS, PESOS, ErrorDeTrafico, simular
+
+
+def peso(valor):
+    """Argumento escenario=peso"""
+    nombre, separador, cantidad = valor.partition('=')
+    if not separador or nombre not in ESCENARIOS:
+        raise ValueError(valor)
+    return nombre, float(cantidad)
+
+
+class Command(BaseCommand):
+    help = (
+        'Simula el tráfico habitual de la clínica contra un servidor en ejecución (runserver o '
+        'cualquier servidor WSGI/ASGI) con usuarios virtuales asyncio que inician sesión y repiten '
+        'escenarios ponderados; informa rendimiento, tasa de errores e histograma de latencias por ruta'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='URL base del servidor')
+        parser.add_argument('--usuario', default='admin', help='Usuario del personal (is_staff) para iniciar sesión')
+        parser.add_argument('--clave', default='admin123')
+        parser.add_argument('--usuarios', type=int, default=10, help='Usuarios virtuales simultáneos')
+        parser.add_argument('--duracion', type=float, default=60.0, help='Segundos de simulación')
+        parser.add_argument('--iteraciones', type=int, help='Escenarios por usuario (por defecto, hasta agotar la duración)')
+        parser.add_argument('--rampa', type=float, default=0.0, help='Segundos en que arrancan todos los usuarios')
+        parser.add_argument('--pausa', type=float, default=1.0, help='Espera media (s) entre pasos de un usuario')
+        parser.add_argument('--peso', type=peso, action='append', default=[], metavar='ESCENARIO=PESO',
+                            help=f'Cambia el peso de un escenario ({", ".join(f"{n}={p}" for n, p in PESOS.items())}); 0 lo desactiva')
+        parser.add_argument('--tiempo-maximo', type=float, default=30.0, help='Segundos de espera por respuesta')
+        parser.add_argument('--semilla', type=int, help='Semilla para reproducir la secuencia de escenarios')
+        parser.add_argument('--salida', help='Archivo JSON donde guardar el resumen')
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{options["usuarios"]} usuarios virtuales contra {options["url"]} '
+            f'({"%d escenarios por usuario" % options["iteraciones"] if options["iteraciones"] else "%g s" % options["duracion"]})'
+        )
+        try:
+            estadisticas = asyncio.run(simular(
+                options['url'], options['usuario'], options['clave'],
+                usuarios=options['usuarios'], duracion=options['duracion'], iteraciones=options['iteraciones'],
+                pesos=dict(options['peso']), pausa=options['pausa'], rampa=options['rampa'],
+                semilla=options['semilla'], tiempo_maximo=options['tiempo_maximo'],
+            ))
+        except ErrorDeTrafico as error:
+            raise CommandError(str(error))
+
+        resumen = estadisticas.resumen()
+        self.imprimir(resumen, estadisticas.duracion)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump({
+                    'fecha': timezone.now().isoformat(),
+                    'url': options['url'],
+                    'usuarios': options['usuarios'],
+                    'duracion_s': round(estadisticas.duracion, 2),
+                    'rutas': resumen,
+                }, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(self.style.SUCCESS(f'Resumen guardado en {options["salida"]}'))
+
+    def imprimir(self, resumen, duracion):
+        total = sum(ruta['solicitudes'] for ruta in resumen.values())
+        errores = sum(ruta['errores'] for ruta in resumen.values())
+        self.stdout.write(
+            f'\n{"ruta":<24}{"solic.":>8}{"req/s":>9}{"error %":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}{"max ms":>9}'
+        )
+        for nombre, ruta in resumen.items():
+            estilo = self.style.ERROR if ruta['errores'] else str
+            self.stdout.write(estilo(
+                f'{nombre:<24}{ruta["solicitudes"]:>8}{ruta["por_segundo"]:>9.1f}{ruta["tasa_error"] * 100:>9.1f}'
+                f'{ruta["p50_ms"]:>9.1f}{ruta["p95_ms"]:>9.1f}{ruta["p99_ms"]:>9.1f}{ruta["max_ms"]:>9.1f}'
+            ))
+            intervalos = '  '.join(f'{intervalo}:{cantidad}' for intervalo, cantidad in ruta['histograma'].items() if cantidad)
+            self.stdout.write(f'  ms {intervalos}   estados {ruta["estados"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'\n{total} solicitudes en {duracion:.1f} s ({total / duracion:.1f} req/s), '
+            f'{errores} errores ({errores / max(total, 1) * 100:.1f} %)'
+        ))
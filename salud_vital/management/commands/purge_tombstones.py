@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from salud_vital.sync import SYNC_RETENCION, purgar_eliminados
+
+
+class Command(BaseCommand):
+    help = (
+        'Elimina los registros de eliminación (tombstones) de /api/sync/ más antiguos que '
+        'SYNC_RETENCION_DIAS; los tokens de esa antigüedad ya se rechazan como inválidos'
+    )
+
+    def handle(self, *args, **options):
+        eliminados = purgar_eliminados()
+        self.stdout.write(self.style.SUCCESS(
+            f'{eliminados} tombstones anteriores a {SYNC_RETENCION.days} días eliminados.'
+        ))
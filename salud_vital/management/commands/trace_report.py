@@ -0,0 +1,52 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from salud_vital.trazas import leer
+
+
+class Command(BaseCommand):
+    help = (
+        'Resume las trazas exportadas en TRAZAS_ARCHIVO: por cada nombre de tramo, cantidad, '
+        'tiempo total y tiempo propio (sin sus tramos hijos), de mayor a menor tiempo propio'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--archivo', default=None, help='Archivo JSONL (por defecto TRAZAS_ARCHIVO)')
+        parser.add_argument('--ruta', help='Solo las trazas cuyo tramo raíz contenga este texto (p. ej. recetamedica-list)')
+        parser.add_argument('--limite', type=int, default=20, help='Tramos a mostrar')
+
+    def handle(self, *args, **options):
+        archivo = options['archivo'] or settings.TRAZAS_ARCHIVO
+        try:
+            tramos = list(leer(archivo))
+        except FileNotFoundError:
+            raise CommandError(f'No existe {archivo}; active TRAZAS y haga algunas solicitudes.')
+
+        raices = {traza: nombre for traza, _, padre, nombre, *_ in tramos if padre is None}
+        if options['ruta']:
+            raices = {traza: nombre for traza, nombre in raices.items() if options['ruta'] in nombre}
+        tramos = [tramo for tramo in tramos if tramo[0] in raices]
+        if not tramos:
+            raise CommandError('No hay trazas que coincidan.')
+
+        # Tiempo propio: duración del tramo menos la de sus hijos directos
+        hijos = defaultdict(int)
+        for _, _, padre, _, inicio, fin, _ in tramos:
+            if padre:
+                hijos[padre] += fin - inicio
+        resumen = defaultdict(lambda: [0, 0, 0])
+        for _, tramo_id, _, nombre, inicio, fin, _ in tramos:
+            fila = resumen[nombre]
+            fila[0] += 1
+            fila[1] += fin - inicio
+            fila[2] += fin - inicio - hijos[tramo_id]
+
+        self.stdout.write(f'{len(raices)} trazas\n')
+        self.stdout.write(f'{"tramo":<60}{"veces":>8}{"total ms":>12}{"propio ms":>12}{"ms/traza":>10}')
+        filas = sorted(resumen.items(), key=lambda item: item[1][2], reverse=True)[:options['limite']]
+        for nombre, (veces, total, propio) in filas:
+            self.stdout.write(
+                f'{nombre[:59]:<60}{veces:>8}{total / 1e6:>12.1f}{propio / 1e6:>12.1f}{propio / 1e6 / len(raices):>10.2f}'
+            )
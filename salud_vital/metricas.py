@@ -0,0 +1,119 @@
+# ============================================================================
+# MÉTRICAS PROMETHEUS - SALUD VITAL
+# ============================================================================
+# Métricas de la aplicación en el formato de texto de Prometheus, servidas en
+# /metrics:
+#   - latencia, consultas SQL y tiempo SQL por ruta y método (histogramas que
+#     alimenta MetricasMiddleware en middleware.py)
+#   - aciertos y fallos del caché por recurso (contadores de cache.py)
+#   - consultas de hoy y medicamentos con stock bajo, leídos de la base de
+#     datos en cada lectura de /metrics
+#
+# Con varios workers (gunicorn) cada proceso solo ve sus propias solicitudes.
+# Si PROMETHEUS_MULTIPROC_DIR apunta a un directorio vacío al arrancar, cada
+# worker escribe sus valores en archivos de ese directorio y /metrics suma
+# los de todos (modo multiproceso de prometheus_client).
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import os
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+from .models import ConsultaMedica, Medicamento
+
+
+# Métodos HTTP que se distinguen en las etiquetas; el resto se agrupa para no
+# crear series nuevas por cada método inventado
+METODOS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+# Etiqueta de las solicitudes que no coinciden con ninguna ruta (404)
+SIN_RUTA = '<sin_ruta>'
+
+
+# ============================================================================
+# MÉTRICAS POR SOLICITUD
+# ============================================================================
+
+LATENCIA = Histogram(
+    'salud_vital_solicitud_segundos', 'Duración de la solicitud por ruta y método',
+    ['vista', 'metodo'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+CONSULTAS_SQL = Histogram(
+    'salud_vital_solicitud_consultas_sql', 'Consultas SQL ejecutadas por solicitud',
+    ['vista', 'metodo'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200),
+)
+TIEMPO_SQL = Histogram(
+    'salud_vital_solicitud_sql_segundos', 'Tiempo en la base de datos por solicitud',
+    ['vista', 'metodo'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+CACHE = Counter(
+    'salud_vital_cache', 'Lecturas del caché por recurso y resultado (acierto o fallo)',
+    ['recurso', 'resultado'],
+)
+
+
+def etiquetas(request):
+    """(vista, metodo) de la solicitud con cardinalidad acotada"""
+    match = request.resolver_match
+    metodo = request.method if request.method in METODOS else 'OTRO'
+    return (match.view_name if match else SIN_RUTA), metodo
+
+
+def observar(request, segundos, consultas, segundos_sql):
+    vista, metodo = etiquetas(request)
+    LATENCIA.labels(vista, metodo).observe(segundos)
+    CONSULTAS_SQL.labels(vista, metodo).observe(consultas)
+    TIEMPO_SQL.labels(vista, metodo).observe(segundos_sql)
+
+
+def contar_cache(recurso, aciertos, fallos):
+    if aciertos:
+        CACHE.labels(recurso, 'acierto').inc(aciertos)
+    if fallos:
+        CACHE.labels(recurso, 'fallo').inc(fallos)
+
+
+# ============================================================================
+# MÉTRICAS DEL DOMINIO
+# ============================================================================
+
+class ColectorClinica:
+    """Indicadores leídos de la base de datos al momento de exponer las métricas"""
+
+    def collect(self):
+        inicio = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+        consultas = GaugeMetricFamily('salud_vital_consultas_hoy', 'Consultas médicas registradas para hoy')
+        consultas.add_metric([], ConsultaMedica.objects.filter(
+            fecha_consulta__gte=inicio, fecha_consulta__lt=inicio + timedelta(days=1)
+        ).count())
+        yield consultas
+        stock_bajo = GaugeMetricFamily(
+            'salud_vital_medicamentos_stock_bajo', 'Medicamentos con 10 unidades o menos en lotes no vencidos'
+        )
+        stock_bajo.add_metric([], Medicamento.objects.con_stock_vigente().filter(stock_vigente__lte=10).count())
+        yield stock_bajo
+
+
+# ============================================================================
+# EXPOSICIÓN
+# ============================================================================
+
+def exponer():
+    """(contenido, content type) con todas las métricas en formato de texto Prometheus"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        procesos = CollectorRegistry()
+        MultiProcessCollector(procesos)
+    else:
+        procesos = REGISTRY
+    dominio = CollectorRegistry()
+    dominio.register(ColectorClinica())
+    return generate_latest(procesos) + generate_latest(dominio), CONTENT_TYPE_LATEST
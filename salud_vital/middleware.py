@@ -0,0 +1,330 @@
+# ============================================================================
+# MIDDLEWARE DE DIAGNÓSTICO - SALUD VITAL
+# ============================================================================
+# Perfil SQL por solicitud (opcional, PERFIL_SQL=True): cantidad de consultas,
+# tiempo en la base de datos, consultas duplicadas y plantillas repetidas que
+# delatan un N+1 (p. ej. `paciente.consultas.count` por cada fila de una
+# lista). Se informa en el encabezado Server-Timing, visible en la pestaña de
+# red del navegador, y en una línea JSON del logger `salud_vital.perfil_sql`.
+#
+# Captura de consultas lentas (opcional, CONSULTAS_LENTAS_UMBRAL_MS > 0): las
+# consultas que superan el umbral se guardan con su plan de ejecución; ver
+# consultas_lentas.py.
+#
+# Métricas Prometheus (METRICAS=True, por omisión): latencia, consultas y
+# tiempo SQL de cada solicitud por ruta y método; ver metricas.py. Admite
+# solicitudes async, para no obligar a la cadena a un hilo bajo ASGI.
+#
+# Perfilador bajo demanda (PERFILADOR=True, por omisión): perfila por muestreo
+# las solicitudes del personal que traen una firma válida; ver perfilador.py.
+# También admite solicitudes async.
+#
+# Trazas (opcional, TRAZAS=True): tramos anidados de middleware, vista,
+# serializadores, plantillas y SQL exportados a un archivo; ver trazas.py.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import json
+import logging
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from .consultas_lentas import enviar
+from .metricas import observar
+from .models import PerfilSolicitud
+from .perfilador import Muestreador, firma_de, firma_valida, guardar
+from .sql import ContadorSQL
+from .trazas import instrumentar, muestrear, registrar_sql, traza, tramo
+
+
+logger = logging.getLogger('salud_vital.perfil_sql')
+
+# Largo máximo de la plantilla SQL de un sospechoso de N+1 en el log
+LARGO_PLANTILLA = 300
+
+
+# ============================================================================
+# REGISTRO DE CONSULTAS
+# ============================================================================
+
+class PerfilSQL(ContadorSQL):
+    """ContadorSQL que además cuenta las consultas repetidas con los mismos parámetros"""
+
+    def __init__(self):
+        super().__init__()
+        self.repeticiones = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # En executemany los parámetros pueden ser un iterador de un solo uso
+        if not many:
+            self.repeticiones[sql, repr(params)] += 1
+        return super().__call__(execute, sql, params, many, context)
+
+    @property
+    def duplicadas(self):
+        """Ejecuciones que repiten una consulta idéntica ya hecha en la solicitud"""
+        return sum(veces - 1 for veces in self.repeticiones.values())
+
+    def sospechas_n_mas_1(self, umbral):
+        """Plantillas SQL ejecutadas al menos `umbral` veces, de la más a la menos repetida"""
+        return [(plantilla, veces) for plantilla, veces in self.por_plantilla() if veces >= umbral]
+
+
+@asynccontextmanager
+async def envolver_sql(envoltorio):
+    """connection.execute_wrapper para código async.
+
+    Las conexiones son por hilo y el ORM async corre en el hilo de
+    sync_to_async de la solicitud: el envoltorio se instala y se quita ahí.
+    """
+    await sync_to_async(lambda: connection.execute_wrappers.append(envoltorio))()
+    try:
+        yield envoltorio
+    finally:
+        await sync_to_async(lambda: connection.execute_wrappers.remove(envoltorio))()
+
+
+# ============================================================================
+# MIDDLEWARE
+# ============================================================================
+
+class PerfilSQLMiddleware:
+    """Mide las consultas SQL de cada solicitud y las informa en Server-Timing y en el log.
+
+    Desactivado (PERFIL_SQL=False) lanza MiddlewareNotUsed y Django lo quita
+    de la cadena al arrancar: no agrega ningún costo por solicitud.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFIL_SQL', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.umbral = getattr(settings, 'PERFIL_SQL_UMBRAL_N1', 5)
+
+    def __call__(self, request):
+        perfil = PerfilSQL()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(perfil):
+            response = self.get_response(request)
+        total = time.perf_counter() - inicio
+
+        sospechas = perfil.sospechas_n_mas_1(self.umbral)
+        response['Server-Timing'] = self.server_timing(perfil, total, sospechas)
+        self.registrar(request, response, perfil, total, sospechas)
+        return response
+
+    def server_timing(self, perfil, total, sospechas):
+        """Métricas db (tiempo SQL), app (resto: Python y plantillas) y total, en ms"""
+        metricas = [
+            f'db;dur={perfil.segundos * 1000:.2f};desc="{len(perfil)} consultas"',
+            f'app;dur={max(total - perfil.segundos, 0) * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ]
+        if perfil.duplicadas:
+            metricas.append(f'sql-dup;desc="{perfil.duplicadas} duplicadas"')
+        if sospechas:
+            metricas.append(f'sql-n1;desc="{len(sospechas)} plantillas, max {sospechas[0][1]} veces"')
+        return ', '.join(metricas)
+
+    def registrar(self, request, response, perfil, total, sospechas):
+        """Una línea JSON por solicitud; WARNING si hay sospechas de N+1"""
+        match = request.resolver_match
+        datos = {
+            'metodo': request.method,
+            'ruta': request.path,
+            'vista': match.view_name if match else None,
+            'estado': response.status_code,
+            'consultas': len(perfil),
+            'db_ms': round(perfil.segundos * 1000, 2),
+            'total_ms': round(total * 1000, 2),
+            'duplicadas': perfil.duplicadas,
+            'n_mas_1': [
+                {'plantilla': plantilla[:LARGO_PLANTILLA], 'veces': veces} for plantilla, veces in sospechas
+            ],
+        }
+        nivel = logging.WARNING if sospechas else logging.INFO
+        logger.log(nivel, json.dumps(datos, ensure_ascii=False), extra={'perfil_sql': datos})
+
+
+class ConsultasLentasMiddleware:
+    """Anota las consultas que superan CONSULTAS_LENTAS_UMBRAL_MS y, terminada la
+    respuesta, las entrega a consultas_lentas.enviar junto con la vista.
+
+    Con umbral 0 (por omisión) Django lo quita de la cadena al arrancar.
+    """
+
+    def __init__(self, get_response):
+        umbral_ms = getattr(settings, 'CONSULTAS_LENTAS_UMBRAL_MS', 0)
+        if not umbral_ms:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.umbral = umbral_ms / 1000
+
+    def __call__(self, request):
+        lentas = []
+
+        def medir(execute, sql, params, many, context):
+            inicio = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                segundos = time.perf_counter() - inicio
+                # Las inserciones masivas (executemany) no tienen un plan único
+                if segundos >= self.umbral and not many:
+                    lentas.append((sql, params, segundos))
+
+        with connection.execute_wrapper(medir):
+            response = self.get_response(request)
+
+        if lentas:
+            match = request.resolver_match
+            vista = match.view_name if match else request.path
+            for sql, params, segundos in lentas:
+                enviar(sql, params, vista, segundos)
+        return response
+
+
+class MetricasMiddleware:
+    """Alimenta los histogramas de metricas.py con cada solicitud; con METRICAS=False no se carga.
+
+    Síncrono y async: bajo ASGI no obliga a Django a pasar la cadena a un hilo.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICAS', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        contador = ContadorSQL()
+        inicio = time.perf_counter()
+        with connection.execute_wrapper(contador):
+            response = self.get_response(request)
+        observar(request, time.perf_counter() - inicio, len(contador), contador.segundos)
+        return response
+
+    async def __acall__(self, request):
+        inicio = time.perf_counter()
+        async with envolver_sql(ContadorSQL()) as contador:
+            response = await self.get_response(request)
+        observar(request, time.perf_counter() - inicio, len(contador), contador.segundos)
+        return response
+
+
+class PerfiladorMiddleware:
+    """Perfila la vista y el render de las solicitudes con firma del perfilador.
+
+    Va después de AuthenticationMiddleware: la firma debe ser del usuario
+    del personal que hace la solicitud. Sin firma solo lee un encabezado.
+    Síncrono y async; bajo ASGI se muestrea el hilo del event loop, así que el
+    código que corre en hilos de sync_to_async (el ORM) no aparece en el perfil.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFILADOR', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.intervalo = getattr(settings, 'PERFILADOR_INTERVALO_MS', 1) / 1000
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        firma = firma_de(request)
+        if not firma or not firma_valida(request, firma):
+            return self.get_response(request)
+
+        inicio = time.perf_counter()
+        # Solo se registran los marcos que cuelgan de este método
+        with Muestreador(PerfiladorMiddleware.__call__.__code__, self.intervalo) as muestreador:
+            response = self.get_response(request)
+        return self.registrar(request, response, muestreador, time.perf_counter() - inicio)
+
+    async def __acall__(self, request):
+        firma = firma_de(request)
+        if not firma or not await sync_to_async(firma_valida)(request, firma):
+            return await self.get_response(request)
+
+        inicio = time.perf_counter()
+        with Muestreador(PerfiladorMiddleware.__acall__.__code__, self.intervalo) as muestreador:
+            response = await self.get_response(request)
+        return await sync_to_async(self.registrar)(request, response, muestreador, time.perf_counter() - inicio)
+
+    def registrar(self, request, response, muestreador, duracion):
+        """Guarda el perfil y su archivo de pilas y lo indica en X-Perfil"""
+        match = request.resolver_match
+        vista = match.view_name if match else ''
+        perfil = PerfilSolicitud.objects.create(
+            metodo=request.method,
+            ruta=request.get_full_path()[:500],
+            vista=vista,
+            estado=response.status_code,
+            duracion_ms=duracion * 1000,
+            muestras=muestreador.muestras,
+            archivo=guardar(muestreador, vista or 'sin-ruta'),
+            usuario=request.user,
+        )
+        response['X-Perfil'] = str(perfil.pk)
+        return response
+
+
+class TrazasMiddleware:
+    """Primero de la lista: abre la traza de la solicitud y un tramo por consulta SQL.
+
+    Con TRAZAS=False (por omisión) no se carga; con TRAZAS_MUESTREO < 1 solo
+    se traza esa fracción de las solicitudes.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRAZAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrumentar()
+
+    def __call__(self, request):
+        if not muestrear():
+            return self.get_response(request)
+        with traza(f'{request.method} {request.path}', **{
+            'http.method': request.method, 'http.target': request.path,
+        }) as raiz:
+            with connection.execute_wrapper(registrar_sql):
+                response = self.get_response(request)
+            match = request.resolver_match
+            if match:
+                # Nombre por ruta (no por URL) para agrupar las solicitudes de una misma vista
+                raiz.nombre = f'{request.method} {match.view_name}'
+                raiz.atributos['http.route'] = match.route
+            raiz.atributos['http.status_code'] = response.status_code
+        return response
+
+
+class TramoVistaMiddleware:
+    """Último de la lista: tramo de la vista, que incluye el render de TemplateResponse"""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'TRAZAS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with tramo('vista') as actual:
+            response = self.get_response(request)
+            if actual is not None and request.resolver_match:
+                actual.nombre = f'vista {request.resolver_match.view_name}'
+        return response
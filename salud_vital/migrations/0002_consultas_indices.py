@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salud_vital', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='consultamedica',
+            index=models.Index(fields=['medico', '-fecha_consulta'], name='consulta_medico_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultamedica',
+            index=models.Index(fields=['paciente', '-fecha_consulta'], name='consulta_paciente_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salud_vital', '0002_consultas_indices'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroEliminado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(help_text='Colección sincronizada (db_table del modelo)', max_length=50)),
+                ('objeto_id', models.BigIntegerField()),
+                ('eliminado_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Registro Eliminado',
+                'verbose_name_plural': 'Registros Eliminados',
+                'db_table': 'registros_eliminados',
+                'ordering': ['eliminado_en', 'id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='citamedica',
+            index=models.Index(fields=['updated_at', 'id'], name='citas_medicas_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultamedica',
+            index=models.Index(fields=['updated_at', 'id'], name='consultas_medicas_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='especialidad',
+            index=models.Index(fields=['updated_at', 'id'], name='especialidades_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialclinico',
+            index=models.Index(fields=['updated_at', 'id'], name='historiales_clinicos_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medicamento',
+            index=models.Index(fields=['updated_at', 'id'], name='medicamentos_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='medico',
+            index=models.Index(fields=['updated_at', 'id'], name='medicos_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paciente',
+            index=models.Index(fields=['updated_at', 'id'], name='pacientes_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recetamedica',
+            index=models.Index(fields=['updated_at', 'id'], name='recetas_medicas_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tratamiento',
+            index=models.Index(fields=['updated_at', 'id'], name='tratamientos_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroeliminado',
+            index=models.Index(fields=['eliminado_en', 'id'], name='registros_eliminados_sync_idx'),
+        ),
+    ]
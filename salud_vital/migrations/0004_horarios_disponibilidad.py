@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salud_vital', '0003_sincronizacion_incremental'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HorarioMedico',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('hora_inicio', models.TimeField()),
+                ('hora_fin', models.TimeField()),
+                ('duracion_cupo_minutos', models.PositiveIntegerField(default=30, help_text='Duración de cada cupo en minutos')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Horario Médico',
+                'verbose_name_plural': 'Horarios Médicos',
+                'db_table': 'horarios_medicos',
+                'ordering': ['medico', 'dia_semana', 'hora_inicio'],
+            },
+        ),
+        migrations.AddField(
+            model_name='citamedica',
+            name='duracion_minutos',
+            field=models.PositiveIntegerField(default=30, help_text='Duración de la cita en minutos'),
+        ),
+        migrations.AddIndex(
+            model_name='citamedica',
+            index=models.Index(fields=['medico', 'fecha_hora_cita'], name='cita_medico_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='horariomedico',
+            name='medico',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='horarios', to='salud_vital.medico'),
+        ),
+        migrations.AddConstraint(
+            model_name='horariomedico',
+            constraint=models.CheckConstraint(condition=models.Q(('hora_fin__gt', models.F('hora_inicio'))), name='horario_fin_posterior_inicio'),
+        ),
+    ]
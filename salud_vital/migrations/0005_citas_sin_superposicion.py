@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:07
+
+import django.contrib.postgres.constraints
+import django.core.validators
+import django.contrib.postgres.fields.ranges
+import salud_vital.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salud_vital', '0004_horarios_disponibilidad'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='citamedica',
+            name='fecha_hora_fin',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        # Completar el término de las citas existentes antes de exigirlo
+        migrations.RunSQL(
+            "UPDATE citas_medicas SET fecha_hora_fin = fecha_hora_cita + duracion_minutos * INTERVAL '1 minute'",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='citamedica',
+            name='fecha_hora_fin',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='citamedica',
+            name='duracion_minutos',
+            field=models.PositiveIntegerField(default=30, help_text='Duración de la cita en minutos', validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+        migrations.AddConstraint(
+            model_name='citamedica',
+            constraint=models.CheckConstraint(condition=models.Q(('fecha_hora_fin__gt', models.F('fecha_hora_cita'))), name='cita_fin_posterior_inicio'),
+        ),
+        migrations.AddConstraint(
+            model_name='citamedica',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(condition=models.Q(('estado', 'Cancelada'), _negated=True), expressions=[(salud_vital.models.Int8Range('medico', 'medico', django.contrib.postgres.fields.ranges.RangeBoundary(inclusive_upper=True)), '&&'), (salud_vital.models.TsTzRange('fecha_hora_cita', 'fecha_hora_fin', django.contrib.postgres.fields.ranges.RangeBoundary()), '&&')], name='cita_sin_superposicion_medico', violation_error_message='El médico ya tiene otra cita en ese horario.'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:11
+
+import django.contrib.postgres.fields
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salud_vital', '0005_citas_sin_superposicion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerieCitas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dias_semana', django.contrib.postgres.fields.ArrayField(base_field=models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')]), help_text='Días de la semana de la serie (0 = lunes)', size=None)),
+                ('intervalo_semanas', models.PositiveSmallIntegerField(default=1, help_text='1 = todas las semanas, 2 = cada dos semanas', validators=[django.core.validators.MinValueValidator(1)])),
+                ('hora', models.TimeField()),
+                ('duracion_minutos', models.PositiveIntegerField(default=30, validators=[django.core.validators.MinValueValidator(1)])),
+                ('fecha_inicio', models.DateField()),
+                ('fecha_fin', models.DateField()),
+                ('motivo', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('medico', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='series_citas', to='salud_vital.medico')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='series_citas', to='salud_vital.paciente')),
+            ],
+            options={
+                'verbose_name': 'Serie de Citas',
+                'verbose_name_plural': 'Series de Citas',
+                'db_table': 'series_citas',
+                'ordering': ['-fecha_inicio'],
+            },
+        ),
+        migrations.AddField(
+            model_name='citamedica',
+            name='serie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='citas', to='salud_vital.seriecitas'),
+        ),
+        migrations.AddIndex(
+            model_name='seriecitas',
+            index=models.Index(fields=['updated_at', 'id'], name='series_citas_sync_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='seriecitas',
+            constraint=models.CheckConstraint(condition=models.Q(('fecha_fin__gte', models.F('fecha_inicio'))), name='serie_fin_posterior_inicio'),
+        ),
+    ]
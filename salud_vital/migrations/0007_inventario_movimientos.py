@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salud_vital', '0006_series_citas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovimientoInventario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('Ingreso', 'Ingreso'), ('Dispensación', 'Dispensación'), ('Devolución', 'Devolución'), ('Ajuste', 'Ajuste')], max_length=20)),
+                ('cantidad', models.IntegerField(help_text='Variación del stock (negativa en salidas)')),
+                ('stock_resultante', models.PositiveIntegerField()),
+                ('observacion', models.CharField(blank=True, max_length=200)),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('medicamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movimientos', to='salud_vital.medicamento')),
+                ('receta', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='salud_vital.recetamedica')),
+            ],
+            options={
+                'verbose_name': 'Movimiento de Inventario',
+                'verbose_name_plural': 'Movimientos de Inventario',
+                'db_table': 'movimientos_inventario',
+                'ordering': ['-creado_en', '-id'],
+                'indexes': [models.Index(fields=['medicamento', '-creado_en', '-id'], name='movimiento_medicamento_idx')],
+            },
+        ),
+        # Libro de solo inserción: la base de datos rechaza cualquier UPDATE
+        migrations.RunSQL(
+            """
+            CREATE FUNCTION movimientos_inventario_solo_insercion() RETURNS trigger AS $$
+            BEGIN
+                RAISE EXCEPTION 'movimientos_inventario es de solo inserción';
+            END;
+            $$ LANGUAGE plpgsql;
+
+            CREATE TRIGGER movimientos_inventario_sin_update
+                BEFORE UPDATE ON movimientos_inventario
+                FOR EACH ROW EXECUTE FUNCTION movimientos_inventario_solo_insercion();
+            """,
+            """
+            DROP TRIGGER movimientos_inventario_sin_update ON movimientos_inventario;
+            DROP FUNCTION movimientos_inventario_solo_insercion();
+            """,
+        ),
+        # Saldo inicial de cada medicamento existente
+        migrations.RunSQL(
+            """
+            INSERT INTO movimientos_inventario (medicamento_id, tipo, cantidad, stock_resultante, observacion, creado_en)
+            SELECT id, 'Ingreso', stock, stock, 'Saldo inicial', NOW() FROM medicamentos
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salud_vital', '0007_inventario_movimientos'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='medicamento',
+            name='fecha_vencimiento',
+            field=models.DateField(help_text='Vencimiento del próximo lote con existencias'),
+        ),
+        migrations.CreateModel(
+            name='LoteMedicamento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(blank=True, max_length=50)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('fecha_vencimiento', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('medicamento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lotes', to='salud_vital.medicamento')),
+            ],
+            options={
+                'verbose_name': 'Lote de Medicamento',
+                'verbose_name_plural': 'Lotes de Medicamento',
+                'db_table': 'lotes_medicamento',
+                'ordering': ['fecha_vencimiento', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movimientoinventario',
+            name='lote',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.RESTRICT, related_name='movimientos', to='salud_vital.lotemedicamento'),
+        ),
+        migrations.AddIndex(
+            model_name='lotemedicamento',
+            index=models.Index(condition=models.Q(('cantidad__gt', 0)), fields=['medicamento', 'fecha_vencimiento'], include=('cantidad',), name='lote_fefo_idx'),
+        ),
+        # Un lote inicial por medicamento con su stock y vencimiento actuales; los
+        # movimientos existentes se asignan a ese lote (el libro no admite UPDATE,
+        # así que el trigger se desactiva solo durante la asignación)
+        migrations.RunSQL(
+            """
+            INSERT INTO lotes_medicamento (medicamento_id, codigo, cantidad, fecha_vencimiento, created_at)
+            SELECT id, '', stock, fecha_vencimiento, NOW() FROM medicamentos;
+
+            ALTER TABLE movimientos_inventario DISABLE TRIGGER movimientos_inventario_sin_update;
+            UPDATE movimientos_inventario movimiento SET lote_id = lote.id
+            FROM lotes_medicamento lote WHERE lote.medicamento_id = movimiento.medicamento_id;
+            ALTER TABLE movimientos_inventario ENABLE TRIGGER movimientos_inventario_sin_update;
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:23
+
+import django.db.models.expressions
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salud_vital', '0008_lotes_medicamento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recetamedica',
+            name='precio_unitario',
+            field=models.DecimalField(decimal_places=2, editable=False, help_text='Precio del medicamento al prescribir; no cambia si después cambia el precio', max_digits=10, null=True),
+        ),
+        # Las recetas existentes toman el precio actual de su medicamento
+        migrations.RunSQL(
+            """
+            UPDATE recetas_medicas receta SET precio_unitario = medicamento.precio_unitario
+            FROM medicamentos medicamento WHERE medicamento.id = receta.medicamento_id
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='recetamedica',
+            name='precio_unitario',
+            field=models.DecimalField(decimal_places=2, editable=False, help_text='Precio del medicamento al prescribir; no cambia si después cambia el precio', max_digits=10),
+        ),
+        migrations.AddIndex(
+            model_name='recetamedica',
+            index=models.Index(fields=['created_at'], name='recetas_medicas_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='recetamedica',
+            name='costo_total',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.F('cantidad'), '*', models.F('precio_unitario')), output_field=models.DecimalField(decimal_places=2, max_digits=14)),
+        ),
+    ]
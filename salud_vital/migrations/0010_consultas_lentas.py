@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salud_vital', '0009_costo_recetas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaLenta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('huella', models.CharField(help_text='SHA-1 del SQL normalizado', max_length=40)),
+                ('sql', models.TextField(help_text='SQL normalizado, sin valores literales')),
+                ('vista', models.CharField(blank=True, help_text='Nombre de la ruta que ejecutó la consulta', max_length=200)),
+                ('parametros', models.JSONField(blank=True, default=list, help_text='Parámetros con los datos personales ocultos')),
+                ('duracion_ms', models.FloatField()),
+                ('plan', models.TextField(blank=True, help_text='EXPLAIN (ANALYZE, BUFFERS) o EXPLAIN si la consulta modifica datos')),
+                ('registrada_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Consulta Lenta',
+                'verbose_name_plural': 'Consultas Lentas',
+                'db_table': 'consultas_lentas',
+                'ordering': ['-registrada_en', '-id'],
+                'indexes': [models.Index(fields=['huella', '-registrada_en'], name='consultas_lentas_huella_idx')],
+            },
+        ),
+    ]
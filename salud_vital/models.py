@@ -3,7 +3,15 @@
 # ============================================================================
 # Importación del módulo de modelos de Django para definir las entidades de la base de datos
 # Importación de date y timedelta para manejo de fechas y cálculos temporales
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.core.validators import MinValueValidator
+from django.db import models, transaction
+from django.db.models import F, Func, IntegerField, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.fields import BigIntegerRangeField, DateTimeRangeField, RangeBoundary, RangeOperators
 from datetime import date, timedelta
 
 
@@ -23,6 +31,10 @@ class Especialidad(models.Model):
         verbose_name = 'Especialidad'
         verbose_name_plural = 'Especialidades'
         ordering = ['nombre']
+        # Índice para la sincronización incremental por (updated_at, id)
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='especialidades_sync_idx'),
+        ]
 
     def __str__(self):
         return self.nombre
@@ -49,6 +61,10 @@ class Medico(models.Model):
         verbose_name = 'Médico'
         verbose_name_plural = 'Médicos'
         ordering = ['apellido', 'nombre']
+        # Índice para la sincronización incremental por (updated_at, id)
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='medicos_sync_idx'),
+        ]
 
     def __str__(self):
         return f"Dr. {self.nombre} {self.apellido}"
@@ -79,6 +95,10 @@ class Paciente(models.Model):
         verbose_name = 'Paciente'
         verbose_name_plural = 'Pacientes'
         ordering = ['apellido', 'nombre']
+        # Índice para la sincronización incremental por (updated_at, id)
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='pacientes_sync_idx'),
+        ]
 
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
@@ -121,6 +141,10 @@ class HistorialClinico(models.Model):
         db_table = 'historiales_clinicos'
         verbose_name = 'Historial Clínico'
         verbose_name_plural = 'Historiales Clínicos'
+        # Índice para la sincronización incremental por (updated_at, id)
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='historiales_clinicos_sync_idx'),
+        ]
 
     def __str__(self):
         return f"Historial de {self.paciente.nombre_completo}"
@@ -131,6 +155,29 @@ class HistorialClinico(models.Model):
 # ============================================================================
 # Gestiona las citas programadas entre pacientes y médicos
 # Incluye estados de seguimiento y información adicional sobre la cita
+class TsTzRange(Func):
+    """Rango tstzrange(inicio, fin, límites) para restricciones de exclusión"""
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
+
+class Int8Range(Func):
+    """Rango int8range(inicio, fin, límites) para restricciones de exclusión"""
+    function = 'INT8RANGE'
+    output_field = BigIntegerRangeField()
+
+
+# Nombre de la restricción que impide citas superpuestas de un mismo médico
+CITA_SIN_SUPERPOSICION = 'cita_sin_superposicion_medico'
+MENSAJE_CITA_SUPERPUESTA = 'El médico ya tiene otra cita en ese horario.'
+
+
+def es_cita_superpuesta(error):
+    """Indica si un IntegrityError proviene de la restricción de citas superpuestas"""
+    diag = getattr(error.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None) == CITA_SIN_SUPERPOSICION
+
+
 class CitaMedica(models.Model):
     ESTADO_CHOICES = [
         ('Programada', 'Programada'),
@@ -141,7 +188,14 @@ class CitaMedica(models.Model):
     
     paciente = models.ForeignKey(Paciente, on_delete=models.PROTECT, related_name='citas')
     medico = models.ForeignKey(Medico, on_delete=models.PROTECT, related_name='citas')
+    serie = models.ForeignKey('SerieCitas', on_delete=models.SET_NULL, null=True, blank=True, related_name='citas')
     fecha_hora_cita = models.DateTimeField()
+    duracion_minutos = models.PositiveIntegerField(
+        default=30, validators=[MinValueValidator(1)], help_text="Duración de la cita en minutos"
+    )
+    # Término de la cita, derivado de la duración; se guarda para que la base de
+    # datos pueda impedir citas superpuestas (ver Meta.constraints)
+    fecha_hora_fin = models.DateTimeField(editable=False)
     estado = models.CharField(max_length=20, choices=ESTADO_CHOICES, default='Programada')
     motivo = models.TextField(blank=True, null=True, help_text="Motivo de la cita médica")
     observaciones = models.TextField(blank=True, null=True, help_text="Observaciones adicionales")
@@ -153,10 +207,143 @@ class CitaMedica(models.Model):
         verbose_name = 'Cita Médica'
         verbose_name_plural = 'Citas Médicas'
         ordering = ['-fecha_hora_cita']
+        # Índices para la sincronización incremental y para la agenda por médico
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='citas_medicas_sync_idx'),
+            models.Index(fields=['medico', 'fecha_hora_cita'], name='cita_medico_fecha_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(fecha_hora_fin__gt=models.F('fecha_hora_cita')),
+                name='cita_fin_posterior_inicio',
+            ),
+            # Un médico no puede tener dos citas vigentes que se solapen. El médico
+            # se expresa como rango de un solo punto (int8range) para que la
+            # restricción use solo las clases de operadores GiST nativas de
+            # PostgreSQL, sin depender de la extensión btree_gist
+            ExclusionConstraint(
+                name=CITA_SIN_SUPERPOSICION,
+                expressions=[
+                    (Int8Range('medico', 'medico', RangeBoundary(inclusive_upper=True)), RangeOperators.OVERLAPS),
+                    (TsTzRange('fecha_hora_cita', 'fecha_hora_fin', RangeBoundary()), RangeOperators.OVERLAPS),
+                ],
+                condition=~Q(estado='Cancelada'),
+                violation_error_message=MENSAJE_CITA_SUPERPUESTA,
+            ),
+        ]
 
     def __str__(self):
         return f"Cita {self.paciente.nombre_completo} - {self.fecha_hora_cita.strftime('%d/%m/%Y %H:%M')}"
 
+    def calcular_fecha_hora_fin(self):
+        """Recalcula el término de la cita a partir del inicio y la duración"""
+        if self.fecha_hora_cita is not None and self.duracion_minutos is not None:
+            self.fecha_hora_fin = self.fecha_hora_cita + timedelta(minutes=self.duracion_minutos)
+
+    def clean(self):
+        self.calcular_fecha_hora_fin()
+
+    def save(self, *args, **kwargs):
+        self.calcular_fecha_hora_fin()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'fecha_hora_cita', 'duracion_minutos'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'fecha_hora_fin'}
+        super().save(*args, **kwargs)
+
+
+# ============================================================================
+# MODELO HORARIO MÉDICO
+# ============================================================================
+# Plantilla semanal de atención de cada médico: bloques por día de la semana
+# con la duración de cada cupo. Es la base del cálculo de disponibilidad
+class HorarioMedico(models.Model):
+    DIA_SEMANA_CHOICES = [
+        (0, 'Lunes'),
+        (1, 'Martes'),
+        (2, 'Miércoles'),
+        (3, 'Jueves'),
+        (4, 'Viernes'),
+        (5, 'Sábado'),
+        (6, 'Domingo'),
+    ]
+
+    medico = models.ForeignKey(Medico, on_delete=models.CASCADE, related_name='horarios')
+    dia_semana = models.PositiveSmallIntegerField(choices=DIA_SEMANA_CHOICES)
+    hora_inicio = models.TimeField()
+    hora_fin = models.TimeField()
+    duracion_cupo_minutos = models.PositiveIntegerField(default=30, help_text="Duración de cada cupo en minutos")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'horarios_medicos'
+        verbose_name = 'Horario Médico'
+        verbose_name_plural = 'Horarios Médicos'
+        ordering = ['medico', 'dia_semana', 'hora_inicio']
+        constraints = [
+            models.CheckConstraint(condition=models.Q(hora_fin__gt=models.F('hora_inicio')), name='horario_fin_posterior_inicio'),
+        ]
+
+    def __str__(self):
+        return f"{self.medico} - {self.get_dia_semana_display()} {self.hora_inicio:%H:%M}-{self.hora_fin:%H:%M}"
+
+    def clean(self):
+        if self.hora_inicio and self.hora_fin and self.hora_fin <= self.hora_inicio:
+            raise ValidationError({'hora_fin': 'La hora de término debe ser posterior a la de inicio.'})
+        if self.medico_id is not None and self.dia_semana is not None and self.hora_inicio and self.hora_fin:
+            if horarios_superpuestos(self.medico_id, self.dia_semana, self.hora_inicio, self.hora_fin, self.pk).exists():
+                raise ValidationError(MENSAJE_HORARIO_SUPERPUESTO)
+
+
+MENSAJE_HORARIO_SUPERPUESTO = 'El médico ya tiene otro bloque de atención que se cruza con ese horario.'
+
+
+def horarios_superpuestos(medico_id, dia_semana, hora_inicio, hora_fin, excluir_pk=None):
+    """Bloques del médico en el mismo día que se cruzan con [hora_inicio, hora_fin)"""
+    return HorarioMedico.objects.filter(
+        medico_id=medico_id, dia_semana=dia_semana, hora_inicio__lt=hora_fin, hora_fin__gt=hora_inicio
+    ).exclude(pk=excluir_pk)
+
+
+# ============================================================================
+# MODELO SERIE DE CITAS
+# ============================================================================
+# Regla de recurrencia para pacientes crónicos (diálisis, kinesiología): días
+# de la semana, cada cuántas semanas, hora y rango de fechas. Las citas de la
+# serie se generan de una vez (ver series.py) y quedan enlazadas por `serie`
+class SerieCitas(models.Model):
+    paciente = models.ForeignKey(Paciente, on_delete=models.PROTECT, related_name='series_citas')
+    medico = models.ForeignKey(Medico, on_delete=models.PROTECT, related_name='series_citas')
+    dias_semana = ArrayField(
+        models.PositiveSmallIntegerField(choices=HorarioMedico.DIA_SEMANA_CHOICES),
+        help_text="Días de la semana de la serie (0 = lunes)"
+    )
+    intervalo_semanas = models.PositiveSmallIntegerField(
+        default=1, validators=[MinValueValidator(1)], help_text="1 = todas las semanas, 2 = cada dos semanas"
+    )
+    hora = models.TimeField()
+    duracion_minutos = models.PositiveIntegerField(default=30, validators=[MinValueValidator(1)])
+    fecha_inicio = models.DateField()
+    fecha_fin = models.DateField()
+    motivo = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'series_citas'
+        verbose_name = 'Serie de Citas'
+        verbose_name_plural = 'Series de Citas'
+        ordering = ['-fecha_inicio']
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='series_citas_sync_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=Q(fecha_fin__gte=models.F('fecha_inicio')), name='serie_fin_posterior_inicio'),
+        ]
+
+    def __str__(self):
+        return f"Serie {self.paciente.nombre_completo} - {self.medico.nombre_completo}"
+
 
 # ============================================================================
 # MODELO CONSULTA MÉDICA
@@ -178,6 +365,13 @@ class ConsultaMedica(models.Model):
         verbose_name = 'Consulta Médica'
         verbose_name_plural = 'Consultas Médicas'
         ordering = ['-fecha_consulta']
+        # Índices compuestos para las consultas anidadas por médico y paciente,
+        # que filtran por la clave foránea y ordenan por fecha descendente
+        indexes = [
+            models.Index(fields=['medico', '-fecha_consulta'], name='consulta_medico_fecha_idx'),
+            models.Index(fields=['paciente', '-fecha_consulta'], name='consulta_paciente_fecha_idx'),
+            models.Index(fields=['updated_at', 'id'], name='consultas_medicas_sync_idx'),
+        ]
 
     def __str__(self):
         return f"Consulta {self.paciente.nombre_completo} - {self.fecha_consulta.strftime('%d/%m/%Y')}"
@@ -201,6 +395,10 @@ class Tratamiento(models.Model):
         verbose_name = 'Tratamiento'
         verbose_name_plural = 'Tratamientos'
         ordering = ['-fecha_inicio']
+        # Índice para la sincronización incremental por (updated_at, id)
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='tratamientos_sync_idx'),
+        ]
 
     def __str__(self):
         return f"Tratamiento {self.consulta.paciente.nombre_completo} - {self.fecha_inicio}"
@@ -219,12 +417,35 @@ class Tratamiento(models.Model):
 # ============================================================================
 # Catálogo de medicamentos disponibles en el sistema
 # Incluye control de stock, precios y fechas de vencimiento con alertas automáticas
+class MedicamentoQuerySet(models.QuerySet):
+
+    def con_stock_vigente(self):
+        """Anota stock_vigente (unidades en lotes no vencidos) y vencimiento_vigente
+        (el primero de esos lotes), con subconsultas que solo leen el índice lote_fefo_idx"""
+        lotes = (
+            LoteMedicamento.objects
+            .filter(medicamento=OuterRef('pk'), cantidad__gt=0, fecha_vencimiento__gte=date.today())
+            .order_by().values('medicamento')
+        )
+        return self.annotate(
+            stock_vigente=Coalesce(
+                Subquery(lotes.annotate(total=Sum('cantidad')).values('total')), Value(0),
+                output_field=IntegerField(),
+            ),
+            vencimiento_vigente=Subquery(lotes.annotate(primero=Min('fecha_vencimiento')).values('primero')),
+        )
+
+
 class Medicamento(models.Model):
     nombre = models.CharField(max_length=100)
     descripcion = models.TextField(blank=True, null=True)
+    # Stock y vencimiento son agregados de los lotes (ver LoteMedicamento), mantenidos
+    # en la misma transacción que cada movimiento; al crear, definen el primer lote.
+    # `stock` cuenta también los lotes vencidos aún no dados de baja: lo que se
+    # puede dispensar es stock_vigente (ver MedicamentoQuerySet.con_stock_vigente)
     stock = models.PositiveIntegerField(default=0)
     precio_unitario = models.DecimalField(max_digits=10, decimal_places=2)
-    fecha_vencimiento = models.DateField()
+    fecha_vencimiento = models.DateField(help_text="Vencimiento del próximo lote con existencias")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -233,28 +454,105 @@ class Medicamento(models.Model):
         verbose_name = 'Medicamento'
         verbose_name_plural = 'Medicamentos'
         ordering = ['nombre']
+        # Índice para la sincronización incremental por (updated_at, id)
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='medicamentos_sync_idx'),
+        ]
+
+    objects = MedicamentoQuerySet.as_manager()
 
     def __str__(self):
         return self.nombre
 
+    CAMPOS_DE_LOTES = ('stock', 'fecha_vencimiento')
+
+    def save(self, *args, **kwargs):
+        # Tras la creación, stock y vencimiento solo cambian con UPDATE atómicos
+        # registrados en el libro de inventario (ver inventario.py): guardar el
+        # formulario o el admin no debe sobrescribirlos con valores leídos antes
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.CAMPOS_DE_LOTES
+            ]
+        super().save(*args, **kwargs)
+
+    # Sin con_stock_vigente() se calculan con una consulta a los lotes
+    @cached_property
+    def stock_vigente(self):
+        return self.lotes.filter(cantidad__gt=0, fecha_vencimiento__gte=date.today()).aggregate(
+            total=Sum('cantidad')
+        )['total'] or 0
+
+    @cached_property
+    def vencimiento_vigente(self):
+        return self.lotes.filter(cantidad__gt=0, fecha_vencimiento__gte=date.today()).aggregate(
+            primero=Min('fecha_vencimiento')
+        )['primero']
+
     @property
     def stock_bajo(self):
-        return self.stock <= 10
+        return self.stock_vigente <= 10
 
     @property
     def proximo_vencimiento(self):
-        return self.fecha_vencimiento <= date.today() + timedelta(days=30)
+        return self.vencimiento_vigente is not None and self.vencimiento_vigente <= date.today() + timedelta(days=30)
+
+
+# ============================================================================
+# MODELO LOTE DE MEDICAMENTO
+# ============================================================================
+# Existencias de un medicamento por lote y fecha de vencimiento. Las salidas se
+# toman del lote que vence primero (FEFO) y los lotes agotados quedan fuera del
+# índice parcial, que solo contiene los lotes con existencias
+class LoteMedicamento(models.Model):
+    medicamento = models.ForeignKey(Medicamento, on_delete=models.CASCADE, related_name='lotes')
+    codigo = models.CharField(max_length=50, blank=True)
+    cantidad = models.PositiveIntegerField(default=0)
+    fecha_vencimiento = models.DateField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'lotes_medicamento'
+        verbose_name = 'Lote de Medicamento'
+        verbose_name_plural = 'Lotes de Medicamento'
+        ordering = ['fecha_vencimiento', 'id']
+        indexes = [
+            # Orden FEFO de los lotes con existencias; incluye la cantidad para
+            # calcular stock y alertas de vencimiento sin leer la tabla
+            models.Index(
+                fields=['medicamento', 'fecha_vencimiento'], include=['cantidad'],
+                condition=Q(cantidad__gt=0), name='lote_fefo_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.medicamento.nombre} {self.codigo or self.pk} ({self.fecha_vencimiento})"
+
+    @property
+    def vencido(self):
+        return self.fecha_vencimiento < date.today()
 
 
 # ============================================================================
 # MODELO RECETA MÉDICA
 # ============================================================================
 # Relaciona los tratamientos con los medicamentos prescritos
-# Incluye cantidad, frecuencia, duración y cálculo automático del costo total
+# Incluye cantidad, frecuencia, duración y el costo total, calculado por la base
+# de datos con el precio unitario vigente al momento de prescribir
 class RecetaMedica(models.Model):
     tratamiento = models.ForeignKey(Tratamiento, on_delete=models.CASCADE, related_name='recetas')
     medicamento = models.ForeignKey(Medicamento, on_delete=models.PROTECT, related_name='recetas')
     cantidad = models.PositiveIntegerField()
+    precio_unitario = models.DecimalField(
+        max_digits=10, decimal_places=2, editable=False,
+        help_text="Precio del medicamento al prescribir; no cambia si después cambia el precio",
+    )
+    costo_total = models.GeneratedField(
+        expression=F('cantidad') * F('precio_unitario'),
+        output_field=models.DecimalField(max_digits=14, decimal_places=2),
+        db_persist=True,
+    )
     frecuencia = models.CharField(max_length=50)
     duracion = models.CharField(max_length=50)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -265,10 +563,154 @@ class RecetaMedica(models.Model):
         verbose_name = 'Receta Médica'
         verbose_name_plural = 'Recetas Médicas'
         ordering = ['-created_at']
+        # Índice para la sincronización incremental por (updated_at, id)
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='recetas_medicas_sync_idx'),
+            # Rango de fechas de los reportes de costos
+            models.Index(fields=['created_at'], name='recetas_medicas_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"Receta {self.medicamento.nombre} - {self.tratamiento.consulta.paciente.nombre_completo}"
 
-    @property
-    def costo_total(self):
-        return self.cantidad * self.medicamento.precio_unitario
+    def save(self, *args, **kwargs):
+        # Guardar la receta y mover el stock del medicamento en la misma transacción;
+        # si no hay stock suficiente se lanza StockInsuficiente y no se guarda nada
+        from .inventario import ajustar_stock_por_receta
+        with transaction.atomic():
+            anterior = None
+            if not self._state.adding:
+                anterior = RecetaMedica.objects.select_for_update().filter(pk=self.pk).values(
+                    'medicamento_id', 'cantidad'
+                ).first()
+            # El precio se congela al prescribir y solo se renueva si cambia el medicamento
+            if anterior is None or anterior['medicamento_id'] != self.medicamento_id:
+                self.precio_unitario = self.medicamento.precio_unitario
+                if kwargs.get('update_fields') is not None:
+                    kwargs['update_fields'] = {*kwargs['update_fields'], 'precio_unitario'}
+            super().save(*args, **kwargs)
+            ajustar_stock_por_receta(self, anterior)
+
+
+# ============================================================================
+# MODELO MOVIMIENTO DE INVENTARIO
+# ============================================================================
+# Libro de solo inserción con cada cambio de stock de un medicamento. Cada
+# movimiento guarda el stock resultante, que funciona como instantánea: el
+# stock en una fecha es el del último movimiento anterior, una sola lectura
+# por el índice (medicamento, creado_en) sin recorrer el libro completo
+class MovimientoInventario(models.Model):
+    TIPO_CHOICES = [
+        ('Ingreso', 'Ingreso'),
+        ('Dispensación', 'Dispensación'),
+        ('Devolución', 'Devolución'),
+        ('Ajuste', 'Ajuste'),
+    ]
+
+    medicamento = models.ForeignKey(Medicamento, on_delete=models.CASCADE, related_name='movimientos')
+    tipo = models.CharField(max_length=20, choices=TIPO_CHOICES)
+    cantidad = models.IntegerField(help_text="Variación del stock (negativa en salidas)")
+    stock_resultante = models.PositiveIntegerField()
+    # Un movimiento por lote afectado; el lote no se puede eliminar si tiene movimientos
+    lote = models.ForeignKey(LoteMedicamento, on_delete=models.RESTRICT, null=True, blank=True, related_name='movimientos')
+    # Sin restricción de clave foránea: el movimiento se conserva si la receta se elimina
+    receta = models.ForeignKey(
+        RecetaMedica, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    observacion = models.CharField(max_length=200, blank=True)
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'movimientos_inventario'
+        verbose_name = 'Movimiento de Inventario'
+        verbose_name_plural = 'Movimientos de Inventario'
+        ordering = ['-creado_en', '-id']
+        indexes = [
+            models.Index(fields=['medicamento', '-creado_en', '-id'], name='movimiento_medicamento_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo} {self.cantidad:+d} {self.medicamento.nombre}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Los movimientos de inventario no se pueden modificar.')
+        super().save(*args, **kwargs)
+
+
+# ============================================================================
+# MODELO REGISTRO ELIMINADO (TOMBSTONE)
+# ============================================================================
+# Marca las filas eliminadas para que la sincronización incremental pueda
+# informarlas a los clientes sin conexión. Se llena desde señales post_delete
+class RegistroEliminado(models.Model):
+    modelo = models.CharField(max_length=50, help_text="Colección sincronizada (db_table del modelo)")
+    objeto_id = models.BigIntegerField()
+    eliminado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'registros_eliminados'
+        verbose_name = 'Registro Eliminado'
+        verbose_name_plural = 'Registros Eliminados'
+        ordering = ['eliminado_en', 'id']
+        indexes = [
+            models.Index(fields=['eliminado_en', 'id'], name='registros_eliminados_sync_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.modelo} #{self.objeto_id} eliminado"
+
+
+# ============================================================================
+# MODELO CONSULTA LENTA
+# ============================================================================
+# Consultas SQL de una solicitud que superaron CONSULTAS_LENTAS_UMBRAL_MS, con
+# su plan de ejecución. Tabla acotada a las últimas CONSULTAS_LENTAS_MAXIMO
+# filas; se llena desde consultas_lentas.py y se revisa en el admin
+class ConsultaLenta(models.Model):
+    huella = models.CharField(max_length=40, help_text="SHA-1 del SQL normalizado")
+    sql = models.TextField(help_text="SQL normalizado, sin valores literales")
+    vista = models.CharField(max_length=200, blank=True, help_text="Nombre de la ruta que ejecutó la consulta")
+    parametros = models.JSONField(default=list, blank=True, help_text="Parámetros con los datos personales ocultos")
+    duracion_ms = models.FloatField()
+    plan = models.TextField(blank=True, help_text="EXPLAIN (ANALYZE, BUFFERS) o EXPLAIN si la consulta modifica datos")
+    registrada_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'consultas_lentas'
+        verbose_name = 'Consulta Lenta'
+        verbose_name_plural = 'Consultas Lentas'
+        ordering = ['-registrada_en', '-id']
+        indexes = [
+            models.Index(fields=['huella', '-registrada_en'], name='consultas_lentas_huella_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.vista or 'sin vista'} {self.duracion_ms:.0f} ms"
+
+
+# ============================================================================
+# MODELO PERFIL DE SOLICITUD
+# ============================================================================
+# Perfil de muestreo de una solicitud pedida con la firma del perfilador
+# (ver perfilador.py). Las pilas se guardan en un archivo de
+# PERFILADOR_DIRECTORIO; la fila registra qué se perfiló y cuánto demoró
+class PerfilSolicitud(models.Model):
+    metodo = models.CharField(max_length=10)
+    ruta = models.CharField(max_length=500)
+    vista = models.CharField(max_length=200, blank=True)
+    estado = models.PositiveSmallIntegerField()
+    duracion_ms = models.FloatField()
+    muestras = models.PositiveIntegerField()
+    archivo = models.CharField(max_length=200, help_text="Pilas colapsadas en PERFILADOR_DIRECTORIO")
+    usuario = models.ForeignKey('auth.User', on_delete=models.SET_NULL, null=True, related_name='+')
+    creado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'perfiles_solicitud'
+        verbose_name = 'Perfil de Solicitud'
+        verbose_name_plural = 'Perfiles de Solicitud'
+        ordering = ['-creado_en', '-id']
+
+    def __str__(self):
+        return f"{self.metodo} {self.ruta} {self.duracion_ms:.0f} ms"
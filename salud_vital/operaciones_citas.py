@@ -0,0 +1,151 @@
+# ============================================================================
+# OPERACIONES MASIVAS SOBRE CITAS - SALUD VITAL
+# ============================================================================
+# Confirmación, cancelación y reasignación de muchas citas a la vez. Cada
+# operación bloquea las filas afectadas, valida en consultas de conjunto (sin
+# recorrer cita por cita) y aplica un único UPDATE dentro de una transacción.
+# La restricción de citas superpuestas sigue protegiendo contra carreras.
+#
+# update() no emite señales: aquí se fija updated_at para la sincronización y
+# se invalidan los cachés de los médicos y pacientes afectados.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+from django.db import transaction, IntegrityError
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import ExtractIsoWeekDay, TruncTime
+from django.utils import timezone
+
+from .cache import invalidar_fichas, invalidar_disponibilidad
+from .models import CitaMedica, HorarioMedico, es_cita_superpuesta
+from .series import CitasEnConflicto, ESTADOS_CERRADOS
+
+
+# Estados de origen desde los que se puede pasar a cada estado
+TRANSICIONES = {
+    'Programada': ('Confirmada', 'Cancelada'),
+    'Confirmada': ('Programada',),
+    'Cancelada': ('Programada', 'Confirmada'),
+    'Realizada': ('Programada', 'Confirmada'),
+}
+
+
+class CitasFueraDeHorario(Exception):
+    """Citas que quedarían fuera de la plantilla semanal del médico de destino"""
+
+    def __init__(self, fechas):
+        super().__init__('Hay citas fuera del horario del médico.')
+        self.fechas = fechas
+
+
+def invalidar_caches(filas):
+    """Invalida disponibilidad y fichas a partir de filas (medico_id, paciente_id)"""
+    for medico_id in {medico_id for medico_id, _ in filas}:
+        invalidar_disponibilidad(medico_id)
+    invalidar_fichas({paciente_id for _, paciente_id in filas})
+
+
+# ============================================================================
+# CAMBIO DE ESTADO
+# ============================================================================
+
+def cambiar_estado(citas, estado):
+    """Pasa a `estado` las citas del queryset que admiten la transición.
+
+    Retorna (actualizadas, omitidas): las omitidas coinciden con el filtro pero
+    su estado actual no permite el cambio (p. ej. confirmar una cancelada).
+    Reactivar citas canceladas cuyo horario ya se ocupó lanza CitasEnConflicto.
+    """
+    with transaction.atomic():
+        filas = list(
+            citas.order_by().select_for_update(of=('self',))
+            .values_list('id', 'estado', 'medico_id', 'paciente_id')
+        )
+        afectadas = [fila for fila in filas if fila[1] in TRANSICIONES[estado]]
+        try:
+            actualizadas = CitaMedica.objects.filter(id__in=[fila[0] for fila in afectadas]).update(
+                estado=estado, updated_at=timezone.now()
+            )
+        except IntegrityError as error:
+            if not es_cita_superpuesta(error):
+                raise
+            raise CitasEnConflicto([])
+
+    invalidar_caches([(medico_id, paciente_id) for _, _, medico_id, paciente_id in afectadas])
+    return actualizadas, len(filas) - len(afectadas)
+
+
+# ============================================================================
+# REASIGNACIÓN DE MÉDICO
+# ============================================================================
+
+def choques_con_medico(citas, medico):
+    """Citas del queryset que se solapan con citas vigentes de `medico`"""
+    solapadas = CitaMedica.objects.filter(
+        medico=medico,
+        fecha_hora_cita__lt=OuterRef('fecha_hora_fin'),
+        fecha_hora_fin__gt=OuterRef('fecha_hora_cita'),
+    ).exclude(estado='Cancelada')
+    return citas.filter(Exists(solapadas))
+
+
+def fuera_de_horario(citas, medico):
+    """Citas del queryset que no caben en ningún bloque horario de `medico` (hora local)"""
+    en_horario = HorarioMedico.objects.filter(
+        medico=medico,
+        dia_semana=OuterRef('dia_semana_local'),
+        hora_inicio__lte=OuterRef('hora_inicio_local'),
+        hora_fin__gte=OuterRef('hora_fin_local'),
+    )
+    return citas.annotate(
+        dia_semana_local=ExtractIsoWeekDay('fecha_hora_cita') - 1,
+        hora_inicio_local=TruncTime('fecha_hora_cita'),
+        hora_fin_local=TruncTime('fecha_hora_fin'),
+    ).filter(~Exists(en_horario))
+
+
+def reasignar(medico_origen, medico_destino, desde, hasta=None, ignorar_horario=False):
+    """Mueve las citas abiertas de `medico_origen` desde `desde` a `medico_destino`.
+
+    Se rechaza completa (sin modificar nada) si alguna cita choca con la agenda
+    del destino (CitasEnConflicto) o, salvo `ignorar_horario`, si alguna queda
+    fuera de su plantilla semanal (CitasFueraDeHorario). Retorna cuántas movió.
+    """
+    citas = CitaMedica.objects.filter(medico=medico_origen, fecha_hora_cita__gte=desde).exclude(
+        estado__in=ESTADOS_CERRADOS
+    )
+    if hasta is not None:
+        citas = citas.filter(fecha_hora_cita__lt=hasta)
+
+    with transaction.atomic():
+        filas = list(citas.order_by().select_for_update().values_list('id', 'paciente_id'))
+        ids = [pk for pk, _ in filas]
+        a_mover = CitaMedica.objects.filter(id__in=ids)
+
+        choques = list(
+            choques_con_medico(a_mover, medico_destino)
+            .order_by('fecha_hora_cita').values_list('fecha_hora_cita', flat=True)
+        )
+        if choques:
+            raise CitasEnConflicto(choques)
+        if not ignorar_horario:
+            fuera = list(
+                fuera_de_horario(a_mover, medico_destino)
+                .order_by('fecha_hora_cita').values_list('fecha_hora_cita', flat=True)
+            )
+            if fuera:
+                raise CitasFueraDeHorario(fuera)
+
+        try:
+            reasignadas = a_mover.update(medico=medico_destino, updated_at=timezone.now())
+        except IntegrityError as error:
+            if not es_cita_superpuesta(error):
+                raise
+            raise CitasEnConflicto([])
+
+    invalidar_caches(
+        [(medico_origen.pk, paciente_id) for _, paciente_id in filas]
+        + [(medico_destino.pk, paciente_id) for _, paciente_id in filas]
+    )
+    return reasignadas
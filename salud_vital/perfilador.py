@@ -0,0 +1,131 @@
+# ============================================================================
+# PERFILADOR DE SOLICITUDES BAJO DEMANDA - SALUD VITAL
+# ============================================================================
+# Perfila una solicitud concreta en producción, con los datos reales que la
+# hacen lenta. Un usuario del personal obtiene su firma en el admin (Perfiles
+# de Solicitud) y la envía en el encabezado X-Perfilar o en el parámetro
+# ?perfilar=. PerfiladorMiddleware (middleware.py) muestrea entonces la pila
+# del hilo que atiende la solicitud (vista y render de la plantilla) y guarda
+# un archivo en formato de pilas colapsadas ("a;b;c 12" por línea), que abren
+# speedscope (https://www.speedscope.app) y flamegraph.pl.
+#
+# El muestreo no instrumenta cada llamada: el costo sobre la solicitud es el
+# de un hilo que despierta cada PERFILADOR_INTERVALO_MS, y solo en las
+# solicitudes perfiladas.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+
+# Salt de la firma: un token de otra parte del sistema no sirve para perfilar
+FIRMA_SALT = 'salud_vital.perfilador'
+
+# Encabezado y parámetro que activan el perfil
+ENCABEZADO = 'X-Perfilar'
+PARAMETRO = 'perfilar'
+
+# Caracteres de la vista que no se usan en el nombre del archivo
+CARACTERES_NO_VALIDOS = re.compile(r'[^\w.-]')
+
+
+def directorio():
+    return Path(getattr(settings, 'PERFILADOR_DIRECTORIO', settings.BASE_DIR / 'perfiles'))
+
+
+# ============================================================================
+# FIRMA
+# ============================================================================
+
+def firmar(usuario):
+    """Firma con fecha que habilita a `usuario` a perfilar durante PERFILADOR_VIGENCIA segundos"""
+    return signing.TimestampSigner(salt=FIRMA_SALT).sign(str(usuario.pk))
+
+
+def firma_valida(request, firma):
+    """La firma es vigente y pertenece al usuario del personal autenticado en la solicitud"""
+    usuario = request.user
+    if not (usuario.is_authenticated and usuario.is_staff):
+        return False
+    try:
+        valor = signing.TimestampSigner(salt=FIRMA_SALT).unsign(
+            firma, max_age=getattr(settings, 'PERFILADOR_VIGENCIA', 60 * 60)
+        )
+    except signing.BadSignature:
+        return False
+    return valor == str(usuario.pk)
+
+
+def firma_de(request):
+    return request.headers.get(ENCABEZADO) or request.GET.get(PARAMETRO)
+
+
+# ============================================================================
+# MUESTREO DE PILAS
+# ============================================================================
+
+def marco(frame):
+    """Nombre de un marco de la pila: función (archivo:línea de su definición)"""
+    codigo = frame.f_code
+    return f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})'
+
+
+class Muestreador:
+    """Cuenta las pilas de un hilo tomadas cada `intervalo` segundos desde otro hilo.
+
+    Solo registra los marcos internos al de `raiz` (el código que se quiere
+    perfilar), no los del servidor que lo llama.
+    """
+
+    def __init__(self, raiz, intervalo):
+        self.raiz = raiz
+        self.intervalo = intervalo
+        self.hilo_id = threading.get_ident()
+        self.pilas = Counter()
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, name='perfilador', daemon=True)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._detener.set()
+        self._hilo.join()
+
+    @property
+    def muestras(self):
+        return sum(self.pilas.values())
+
+    def _muestrear(self):
+        while not self._detener.wait(self.intervalo):
+            frame = sys._current_frames().get(self.hilo_id)
+            pila = []
+            while frame is not None and frame.f_code is not self.raiz:
+                pila.append(marco(frame))
+                frame = frame.f_back
+            if pila:
+                self.pilas[';'.join(reversed(pila))] += 1
+
+    def colapsado(self):
+        """Pilas en formato colapsado, de la más a la menos frecuente"""
+        return ''.join(f'{pila} {veces}\n' for pila, veces in self.pilas.most_common())
+
+
+def guardar(muestreador, vista):
+    """Escribe el perfil en PERFILADOR_DIRECTORIO y devuelve el nombre del archivo"""
+    carpeta = directorio()
+    carpeta.mkdir(parents=True, exist_ok=True)
+    nombre = f'{timezone.now():%Y%m%d-%H%M%S-%f}-{CARACTERES_NO_VALIDOS.sub("-", vista)[:80]}.txt'
+    (carpeta / nombre).write_text(muestreador.colapsado(), encoding='utf-8')
+    return nombre
@@ -0,0 +1,243 @@
+# ============================================================================
+# MEDICIÓN DE RENDIMIENTO DE LAS RUTAS - SALUD VITAL
+# ============================================================================
+# Catálogo de solicitudes representativas para cada ruta con nombre de
+# salud_vital/urls.py (vistas HTML, viewsets con sus acciones y vistas async),
+# armado recorriendo el URLconf: una ruta nueva queda incluida sin tocar este
+# archivo, salvo que sea una acción POST, que necesita un cuerpo de ejemplo.
+#
+# También siembra datos sintéticos para medir, resume las latencias en
+# percentiles y compara dos resultados del benchmark para detectar regresiones
+# entre commits.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import json
+import math
+import statistics
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+from django.core.management import call_command
+from django.urls import URLPattern, get_resolver, reverse
+
+from .models import (
+    Especialidad, Medico, Paciente, HistorialClinico, CitaMedica, ConsultaMedica,
+    Tratamiento, Medicamento, RecetaMedica, HorarioMedico
+)
+from .series import crear_serie
+
+
+# Modelo de las vistas HTML de detalle, edición y eliminación según el prefijo del nombre
+MODELOS_HTML = {
+    'especialidades': Especialidad,
+    'pacientes': Paciente,
+    'medicos': Medico,
+    'consultas': ConsultaMedica,
+    'tratamientos': Tratamiento,
+    'medicamentos': Medicamento,
+    'recetas': RecetaMedica,
+    'citas': CitaMedica,
+    'historiales': HistorialClinico,
+}
+
+# Query string necesaria para las rutas GET que la exigen
+PARAMETROS = {
+    'medicamento-stock-en-fecha': lambda muestras, hoy: {'fecha': hoy.isoformat()},
+    'recetamedica-costos': lambda muestras, hoy: {'por': 'medico'},
+    'citamedica-cambiar-estado': lambda muestras, hoy: {'medico': muestras[Medico][0]},
+}
+
+# Cuerpo de ejemplo de las acciones que solo admiten POST (las `*-lote` se arman aparte)
+CUERPOS = {
+    'citamedica-cambiar-estado': lambda muestras, hoy: {'estado': 'Confirmada'},
+    'citamedica-reasignar': lambda muestras, hoy: {
+        'medico_origen': muestras[Medico][0], 'medico_destino': muestras[Medico][-1], 'ignorar_horario': True,
+    },
+    'seriecitas-cancelar': lambda muestras, hoy: {'desde': hoy.isoformat()},
+    'seriecitas-reprogramar': lambda muestras, hoy: {'desde': hoy.isoformat(), 'duracion_minutos': 20},
+    'batch-list': lambda muestras, hoy: {'solicitudes': [
+        {'id': 'hoy', 'url': '/api/consultas/hoy/'},
+        {'id': 'stock_bajo', 'url': '/api/medicamentos/stock_bajo/'},
+        {'id': 'paciente', 'url': f'/api/pacientes/{muestras[Paciente][0]}/'},
+    ]},
+}
+
+# Acciones POST que solo leen; el resto se ejecuta dentro de una transacción revertida
+POST_DE_LECTURA = ('batch-list',)
+
+
+@dataclass(frozen=True)
+class Solicitud:
+    """Solicitud representativa de una ruta"""
+    nombre: str
+    metodo: str
+    url: str
+    parametros: dict = field(default_factory=dict)
+    cuerpo: dict = None
+    # Modifica datos: quien la ejecute debe revertir la transacción
+    modifica: bool = False
+
+
+# ============================================================================
+# DATOS DE MEDICIÓN
+# ============================================================================
+
+def sembrar(escala, semilla=42, workers=0, semanas=8, stdout=None, **opciones):
+    """Datos sintéticos de generate_data y una serie de citas por médico.
+
+    Las citas son los lunes y jueves a la hora de inicio del horario de cada
+    médico durante las próximas `semanas`; `opciones` se pasan a generate_data.
+    """
+    hoy = date.today()
+    call_command('generate_data', escala=escala, semilla=semilla, workers=workers, hasta=hoy, stdout=stdout, **opciones)
+    horarios = list(HorarioMedico.objects.filter(dia_semana=0).values_list('medico_id', 'hora_inicio'))
+    pacientes = Paciente.objects.order_by('-pk').values_list('pk', flat=True)[:len(horarios)]
+    for (medico_id, hora), paciente_id in zip(horarios, pacientes):
+        crear_serie({
+            'paciente_id': paciente_id, 'medico_id': medico_id, 'dias_semana': [0, 3], 'hora': hora,
+            'fecha_inicio': hoy, 'fecha_fin': hoy + timedelta(weeks=semanas), 'motivo': 'Control',
+        }, omitir_conflictos=True)
+
+
+# ============================================================================
+# CATÁLOGO DE SOLICITUDES
+# ============================================================================
+
+def rutas(urlconf='salud_vital.urls'):
+    """Patrones con nombre del URLconf {nombre: patrón}, sin las variantes con sufijo de formato"""
+    encontradas = {}
+
+    def recorrer(patrones):
+        for patron in patrones:
+            if not isinstance(patron, URLPattern):
+                recorrer(patron.url_patterns)
+            elif patron.name and patron.name not in encontradas:
+                encontradas[patron.name] = patron
+
+    recorrer(get_resolver(urlconf).url_patterns)
+    return encontradas
+
+
+def modelo_de_la_ruta(nombre, patron):
+    viewset = getattr(patron.callback, 'cls', None)
+    if getattr(viewset, 'queryset', None) is not None:
+        return viewset.queryset.model
+    return MODELOS_HTML.get(nombre.split('_')[0])
+
+
+def filas_de_muestra(modelos=None, cantidad=2):
+    """Ids de las filas más recientes de cada modelo {modelo: [id, ...]} (lista vacía si no hay)"""
+    modelos = modelos or [*MODELOS_HTML.values(), *(
+        patron.callback.cls.queryset.model for patron in rutas().values()
+        if getattr(getattr(patron.callback, 'cls', None), 'queryset', None) is not None
+    )]
+    return {
+        modelo: list(modelo.objects.order_by('-pk').values_list('pk', flat=True)[:cantidad])
+        for modelo in dict.fromkeys(modelos)
+    }
+
+
+def solicitudes(muestras, hoy=None):
+    """Una solicitud por ruta con nombre: GET si la ruta lo admite y si no POST con cuerpo de ejemplo.
+
+    Retorna (solicitudes, omitidas) donde omitidas es {nombre: motivo} para las
+    rutas sin filas de muestra o sin cuerpo de ejemplo.
+    """
+    hoy = hoy or date.today()
+    resultado, omitidas = [], {}
+    for nombre, patron in rutas().items():
+        metodos = set(getattr(patron.callback, 'actions', None) or ['get'])
+        kwargs = {}
+        if 'pk' in patron.pattern.regex.groupindex:
+            modelo = modelo_de_la_ruta(nombre, patron)
+            if not muestras.get(modelo):
+                omitidas[nombre] = f'sin filas de {modelo._meta.verbose_name_plural}'
+                continue
+            kwargs['pk'] = muestras[modelo][0]
+        url = reverse(nombre, kwargs=kwargs)
+        try:
+            parametros = PARAMETROS[nombre](muestras, hoy) if nombre in PARAMETROS else {}
+        except (KeyError, IndexError):
+            omitidas[nombre] = 'faltan filas de muestra para la query string'
+            continue
+
+        if nombre.endswith('_delete'):
+            # Las vistas HTML de eliminación solo borran con POST (GET responde 405)
+            resultado.append(Solicitud(nombre, 'POST', url, parametros, {}, modifica=True))
+        elif 'get' in metodos:
+            resultado.append(Solicitud(nombre, 'GET', url, parametros))
+        elif nombre.endswith('-lote'):
+            ids = muestras.get(modelo_de_la_ruta(nombre, patron), [])
+            resultado.append(Solicitud(nombre, 'POST', url, parametros, {'ids': ids}))
+        elif nombre in CUERPOS:
+            try:
+                cuerpo = CUERPOS[nombre](muestras, hoy)
+            except (KeyError, IndexError):
+                omitidas[nombre] = 'faltan filas de muestra para el cuerpo'
+                continue
+            resultado.append(Solicitud(
+                nombre, 'POST', url, parametros, cuerpo, modifica=nombre not in POST_DE_LECTURA,
+            ))
+        else:
+            omitidas[nombre] = 'acción POST sin cuerpo de ejemplo en rendimiento.CUERPOS'
+    return resultado, omitidas
+
+
+def ejecutar(cliente, solicitud):
+    """Envía la solicitud con un cliente de pruebas de Django (o de DRF) ya autenticado"""
+    if solicitud.metodo == 'GET':
+        return cliente.get(solicitud.url, solicitud.parametros)
+    if solicitud.nombre.endswith('_delete'):
+        return cliente.post(solicitud.url)
+    url = f'{solicitud.url}?{urlencode(solicitud.parametros)}' if solicitud.parametros else solicitud.url
+    return cliente.generic(solicitud.metodo, url, json.dumps(solicitud.cuerpo), content_type='application/json')
+
+
+# ============================================================================
+# RESUMEN Y COMPARACIÓN DE RESULTADOS
+# ============================================================================
+
+def percentil(valores, p):
+    """Percentil `p` (0-100) por el método del rango más cercano"""
+    ordenados = sorted(valores)
+    return ordenados[max(0, math.ceil(len(ordenados) * p / 100) - 1)]
+
+
+def resumir(latencias, consultas, tiempos_sql):
+    """Percentiles de latencia (ms), consultas SQL y tiempo SQL (mediana, ms) de las repeticiones"""
+    latencias = [segundos * 1000 for segundos in latencias]
+    return {
+        'p50_ms': round(percentil(latencias, 50), 3),
+        'p90_ms': round(percentil(latencias, 90), 3),
+        'p95_ms': round(percentil(latencias, 95), 3),
+        'p99_ms': round(percentil(latencias, 99), 3),
+        'max_ms': round(max(latencias), 3),
+        'consultas': max(consultas),
+        'sql_ms': round(statistics.median(tiempos_sql) * 1000, 3),
+    }
+
+
+def comparar(base, actual, umbral=0.2, minimo_ms=1.0):
+    """Regresiones de `actual` respecto de `base` (resultados JSON del benchmark).
+
+    Una ruta empeora si su p95 supera al de la base en más del `umbral`
+    (fracción) y en más de `minimo_ms` (para ignorar el ruido de las rutas muy
+    rápidas), o si ejecuta más consultas SQL. Retorna una lista de
+    (escala, ruta, descripción).
+    """
+    regresiones = []
+    for escala, resultado in actual.get('escalas', {}).items():
+        rutas_base = base.get('escalas', {}).get(escala, {}).get('rutas', {})
+        for nombre, medida in resultado['rutas'].items():
+            anterior = rutas_base.get(nombre)
+            if anterior is None:
+                continue
+            limite = anterior['p95_ms'] * (1 + umbral)
+            if medida['p95_ms'] > limite and medida['p95_ms'] - anterior['p95_ms'] > minimo_ms:
+                regresiones.append((escala, nombre, f'p95 {anterior["p95_ms"]:.1f} -> {medida["p95_ms"]:.1f} ms'))
+            if medida['consultas'] > anterior['consultas']:
+                regresiones.append((escala, nombre, f'consultas {anterior["consultas"]} -> {medida["consultas"]}'))
+    return regresiones
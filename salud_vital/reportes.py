@@ -0,0 +1,65 @@
+# ============================================================================
+# REPORTES DE COSTOS DE RECETAS - SALUD VITAL
+# ============================================================================
+# Totales de costo de las recetas por tratamiento, paciente, médico o mes.
+#
+# Cada receta guarda su costo total (cantidad por el precio congelado al
+# prescribir, calculado por la base de datos), así que un reporte es un único
+# GROUP BY con SUM: no se cargan las recetas ni se hacen cálculos en Python,
+# y los totales no cambian si después cambia el precio del medicamento.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+from datetime import timedelta
+
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .agenda import inicio_del_dia
+from .models import RecetaMedica
+
+
+# Columnas que identifican cada grupo del reporte: campos propios de la receta
+# y expresiones sobre las tablas relacionadas
+AGRUPACIONES = {
+    'tratamiento': (['tratamiento'], {
+        'descripcion': F('tratamiento__descripcion'),
+        'consulta': F('tratamiento__consulta_id'),
+    }),
+    'paciente': ([], {
+        'paciente': F('tratamiento__consulta__paciente_id'),
+        'rut': F('tratamiento__consulta__paciente__rut'),
+        'nombre': F('tratamiento__consulta__paciente__nombre'),
+        'apellido': F('tratamiento__consulta__paciente__apellido'),
+    }),
+    'medico': ([], {
+        'medico': F('tratamiento__consulta__medico_id'),
+        'nombre': F('tratamiento__consulta__medico__nombre'),
+        'apellido': F('tratamiento__consulta__medico__apellido'),
+    }),
+    'mes': ([], {
+        'mes': TruncMonth('created_at'),
+    }),
+}
+
+
+def costos_por(agrupacion, desde=None, hasta=None):
+    """Recetas, unidades y costo total por grupo, para recetas emitidas entre `desde` y `hasta`.
+
+    El mes se ordena cronológicamente; el resto, de mayor a menor costo.
+    """
+    recetas = RecetaMedica.objects.all()
+    if desde is not None:
+        recetas = recetas.filter(created_at__gte=inicio_del_dia(desde))
+    if hasta is not None:
+        recetas = recetas.filter(created_at__lt=inicio_del_dia(hasta + timedelta(days=1)))
+
+    campos, expresiones = AGRUPACIONES[agrupacion]
+    orden = ['mes'] if agrupacion == 'mes' else ['-costo', agrupacion]
+    return (
+        recetas
+        .values(*campos, **expresiones)
+        .annotate(recetas=Count('id'), unidades=Sum('cantidad'), costo=Sum('costo_total'))
+        .order_by(*orden)
+    )
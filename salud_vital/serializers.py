@@ -7,11 +7,20 @@
 # ============================================================================
 # IMPORTACIONES NECESARIAS
 # ============================================================================
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import transaction, IntegrityError
+from django.utils import timezone
 from rest_framework import serializers
 from .models import (
     Especialidad, Medico, Paciente, ConsultaMedica, 
-    Tratamiento, Medicamento, RecetaMedica
+    Tratamiento, Medicamento, RecetaMedica, CitaMedica, HistorialClinico,
+    HorarioMedico, SerieCitas, LoteMedicamento, MovimientoInventario, es_cita_superpuesta, MENSAJE_CITA_SUPERPUESTA,
+    horarios_superpuestos, MENSAJE_HORARIO_SUPERPUESTO
 )
+from .inventario import StockInsuficiente
+from .series import crear_serie, CitasEnConflicto, MAX_DIAS_SERIE
 
 # ============================================================================
 # SERIALIZADORES BÁSICOS PARA MODELOS PRINCIPALES
@@ -85,6 +94,9 @@ class TratamientoSerializer(serializers.ModelSerializer):
 
 class MedicamentoSerializer(serializers.ModelSerializer):
     """Serializador para medicamentos con alertas de stock y vencimiento, incluye validaciones"""
+    # Unidades y próximo vencimiento de los lotes no vencidos (Medicamento.objects.con_stock_vigente())
+    stock_vigente = serializers.IntegerField(read_only=True)
+    vencimiento_vigente = serializers.DateField(read_only=True)
     stock_bajo = serializers.BooleanField(read_only=True)
     proximo_vencimiento = serializers.BooleanField(read_only=True)
     
@@ -105,12 +117,59 @@ class MedicamentoSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("El precio debe ser mayor a 0")
         return value
 
+    def get_extra_kwargs(self):
+        # Stock y vencimiento definen el primer lote al crear; después son
+        # agregados de los lotes y solo cambian con movimientos de inventario
+        extra_kwargs = super().get_extra_kwargs()
+        if self.instance is not None:
+            for campo in Medicamento.CAMPOS_DE_LOTES:
+                extra_kwargs.setdefault(campo, {})['read_only'] = True
+        return extra_kwargs
+
+
+class LoteMedicamentoSerializer(serializers.ModelSerializer):
+    """Serializador de lotes; al crearlo se registra el ingreso de su cantidad"""
+    vencido = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = LoteMedicamento
+        fields = '__all__'
+        read_only_fields = ('medicamento', 'created_at')
+
+    def validate_cantidad(self, value):
+        """Validación de la cantidad recibida"""
+        if value <= 0:
+            raise serializers.ValidationError("La cantidad debe ser mayor a 0")
+        return value
+
+
+class MovimientoInventarioSerializer(serializers.ModelSerializer):
+    """Serializador del libro de inventario; solo se registran ingresos y ajustes manuales"""
+    TIPOS_MANUALES = ('Ingreso', 'Ajuste')
+
+    class Meta:
+        model = MovimientoInventario
+        fields = '__all__'
+        read_only_fields = ('medicamento', 'stock_resultante', 'receta', 'creado_en')
+
+    def validate(self, attrs):
+        """Validación del tipo, el lote y el signo de la variación"""
+        medicamento = self.context.get('medicamento')
+        lote = attrs.get('lote')
+        if lote is None or (medicamento is not None and lote.medicamento_id != medicamento.pk):
+            raise serializers.ValidationError({'lote': "Debe indicar un lote del medicamento"})
+        if attrs['tipo'] not in self.TIPOS_MANUALES:
+            raise serializers.ValidationError({'tipo': "Solo se pueden registrar ingresos y ajustes"})
+        if attrs['cantidad'] == 0 or (attrs['tipo'] == 'Ingreso' and attrs['cantidad'] < 0):
+            raise serializers.ValidationError({'cantidad': "Un ingreso debe ser positivo y un ajuste distinto de 0"})
+        return attrs
+
 
 class RecetaMedicaSerializer(serializers.ModelSerializer):
-    """Serializador para recetas médicas con cálculo de costo total y validaciones"""
+    """Serializador para recetas médicas con precio congelado, costo total y validaciones"""
     paciente_nombre = serializers.CharField(source='tratamiento.consulta.paciente.nombre_completo', read_only=True)
     medicamento_nombre = serializers.CharField(source='medicamento.nombre', read_only=True)
-    costo_total = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    costo_total = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
     
     class Meta:
         model = RecetaMedica
@@ -123,28 +182,200 @@ class RecetaMedicaSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("La cantidad debe ser mayor a 0")
         return value
 
+    def create(self, validated_data):
+        try:
+            return super().create(validated_data)
+        except StockInsuficiente as error:
+            raise serializers.ValidationError({'cantidad': [str(error)]})
+
+    def update(self, instance, validated_data):
+        try:
+            return super().update(instance, validated_data)
+        except StockInsuficiente as error:
+            raise serializers.ValidationError({'cantidad': [str(error)]})
+
+
+@contextmanager
+def citas_sin_superposicion():
+    """Traduce la violación de la restricción de citas superpuestas a un error de validación"""
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as error:
+        if not es_cita_superpuesta(error):
+            raise
+        raise serializers.ValidationError({'fecha_hora_cita': [MENSAJE_CITA_SUPERPUESTA]})
+
+
+class CitaMedicaSerializer(serializers.ModelSerializer):
+    """Serializador para citas médicas con nombres de paciente, médico y especialidad"""
+    paciente_nombre = serializers.CharField(source='paciente.nombre_completo', read_only=True)
+    medico_nombre = serializers.CharField(source='medico.nombre_completo', read_only=True)
+    especialidad_nombre = serializers.CharField(source='medico.especialidad.nombre', read_only=True)
+
+    class Meta:
+        model = CitaMedica
+        fields = '__all__'
+        read_only_fields = ('fecha_hora_fin', 'created_at', 'updated_at')
+
+    def create(self, validated_data):
+        with citas_sin_superposicion():
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with citas_sin_superposicion():
+            return super().update(instance, validated_data)
+
+
+class HorarioMedicoSerializer(serializers.ModelSerializer):
+    """Serializador para los bloques semanales de atención de un médico"""
+    dia_semana_nombre = serializers.CharField(source='get_dia_semana_display', read_only=True)
+
+    class Meta:
+        model = HorarioMedico
+        fields = '__all__'
+        read_only_fields = ('created_at', 'updated_at')
+
+    def validate(self, attrs):
+        """Validación del rango horario y de bloques superpuestos del mismo médico y día"""
+        hora_inicio = attrs.get('hora_inicio', getattr(self.instance, 'hora_inicio', None))
+        hora_fin = attrs.get('hora_fin', getattr(self.instance, 'hora_fin', None))
+        if hora_inicio and hora_fin and hora_fin <= hora_inicio:
+            raise serializers.ValidationError("La hora de término debe ser posterior a la de inicio")
+        medico = attrs.get('medico', getattr(self.instance, 'medico', None))
+        dia_semana = attrs.get('dia_semana', getattr(self.instance, 'dia_semana', None))
+        if medico and dia_semana is not None and hora_inicio and hora_fin and horarios_superpuestos(
+            medico.pk, dia_semana, hora_inicio, hora_fin, getattr(self.instance, 'pk', None)
+        ).exists():
+            raise serializers.ValidationError(MENSAJE_HORARIO_SUPERPUESTO)
+        return attrs
+
+
+class SerieCitasSerializer(serializers.ModelSerializer):
+    """Serializador de series de citas recurrentes; al crear genera todas sus citas"""
+    paciente_nombre = serializers.CharField(source='paciente.nombre_completo', read_only=True)
+    medico_nombre = serializers.CharField(source='medico.nombre_completo', read_only=True)
+    citas_vigentes = serializers.IntegerField(read_only=True)
+    omitir_conflictos = serializers.BooleanField(
+        write_only=True, default=False, help_text="Saltar las ocurrencias que chocan con otras citas"
+    )
+    conflictos_omitidos = serializers.ListField(child=serializers.DateTimeField(), read_only=True)
+
+    class Meta:
+        model = SerieCitas
+        fields = '__all__'
+        read_only_fields = ('created_at', 'updated_at')
+
+    def validate_dias_semana(self, value):
+        """Validación de días de la semana sin repetir"""
+        if not value:
+            raise serializers.ValidationError("Debe indicar al menos un día de la semana")
+        return sorted(set(value))
+
+    def validate(self, attrs):
+        """Validación del rango de fechas de la serie"""
+        if attrs['fecha_fin'] < attrs['fecha_inicio']:
+            raise serializers.ValidationError("La fecha de término debe ser igual o posterior a la de inicio")
+        if (attrs['fecha_fin'] - attrs['fecha_inicio']).days >= MAX_DIAS_SERIE:
+            raise serializers.ValidationError(f"La serie no puede superar {MAX_DIAS_SERIE} días")
+        return attrs
+
+    def create(self, validated_data):
+        omitir_conflictos = validated_data.pop('omitir_conflictos')
+        try:
+            with citas_sin_superposicion():
+                serie, citas, omitidos = crear_serie(validated_data, omitir_conflictos)
+        except CitasEnConflicto as error:
+            raise serializers.ValidationError({
+                'conflictos': [serializers.DateTimeField().to_representation(f) for f in error.fechas]
+            })
+        serie.citas_vigentes = len(citas)
+        serie.conflictos_omitidos = omitidos
+        return serie
+
+
+class SerieDesdeSerializer(serializers.Serializer):
+    """Parámetros de "esta y las siguientes": fecha de la primera cita afectada"""
+    desde = serializers.DateField()
+
+
+class ReprogramarSerieSerializer(SerieDesdeSerializer):
+    """Nuevos valores para esta y las siguientes citas de la serie"""
+    hora = serializers.TimeField(required=False)
+    duracion_minutos = serializers.IntegerField(required=False, min_value=1)
+    medico = serializers.PrimaryKeyRelatedField(queryset=Medico.objects.filter(activo=True), required=False)
+
+    def validate(self, attrs):
+        if not {'hora', 'duracion_minutos', 'medico'} & attrs.keys():
+            raise serializers.ValidationError("Debe indicar hora, duracion_minutos o medico")
+        return attrs
+
+
+class CambiarEstadoCitasSerializer(serializers.Serializer):
+    """Nuevo estado para todas las citas que coinciden con el filtro"""
+    estado = serializers.ChoiceField(choices=CitaMedica.ESTADO_CHOICES)
+
+
+class ReasignarCitasSerializer(serializers.Serializer):
+    """Reasignación de las citas futuras de un médico a otro"""
+    medico_origen = serializers.PrimaryKeyRelatedField(queryset=Medico.objects.all())
+    medico_destino = serializers.PrimaryKeyRelatedField(queryset=Medico.objects.filter(activo=True))
+    desde = serializers.DateTimeField(required=False)
+    hasta = serializers.DateTimeField(required=False)
+    ignorar_horario = serializers.BooleanField(
+        default=False, help_text="Permitir citas fuera de la plantilla semanal del médico de destino"
+    )
+
+    def validate(self, attrs):
+        if attrs['medico_origen'] == attrs['medico_destino']:
+            raise serializers.ValidationError("El médico de destino debe ser distinto del de origen")
+        attrs.setdefault('desde', timezone.now())
+        if attrs.get('hasta') and attrs['hasta'] <= attrs['desde']:
+            raise serializers.ValidationError("La fecha hasta debe ser posterior a desde")
+        return attrs
+
+
+class HistorialClinicoSerializer(serializers.ModelSerializer):
+    """Serializador para el historial clínico de un paciente"""
+    class Meta:
+        model = HistorialClinico
+        fields = '__all__'
+        read_only_fields = ('created_at', 'updated_at')
+
 # ============================================================================
 # SERIALIZADORES DETALLADOS PARA VISTAS ESPECÍFICAS
 # ============================================================================
 # Serializadores extendidos que incluyen información relacionada para vistas
 # de detalle que requieren datos anidados
 
-class ConsultaMedicaDetalleSerializer(ConsultaMedicaSerializer):
-    """Serializador detallado para consultas que incluye tratamientos asociados"""
-    tratamientos = TratamientoSerializer(source='tratamiento_set', many=True, read_only=True)
-    
-    class Meta(ConsultaMedicaSerializer.Meta):
+class RecetaMedicaDetalleSerializer(RecetaMedicaSerializer):
+    """Serializador detallado para recetas que incluye el medicamento completo"""
+    medicamento_detalle = MedicamentoSerializer(source='medicamento', read_only=True)
+
+    class Meta(RecetaMedicaSerializer.Meta):
         pass
 
 
 class TratamientoDetalleSerializer(TratamientoSerializer):
     """Serializador detallado para tratamientos que incluye recetas asociadas"""
-    recetas = RecetaMedicaSerializer(source='recetamedica_set', many=True, read_only=True)
+    recetas = RecetaMedicaDetalleSerializer(many=True, read_only=True)
     
     class Meta(TratamientoSerializer.Meta):
         pass
 
 
+class ConsultaMedicaDetalleSerializer(ConsultaMedicaSerializer):
+    """Serializador detallado para consultas con el árbol tratamientos → recetas → medicamento.
+
+    Espera un queryset preparado con views.prefetch_arbol_consulta() para resolver
+    el árbol completo en un número fijo de consultas SQL.
+    """
+    tratamientos = TratamientoDetalleSerializer(many=True, read_only=True)
+    
+    class Meta(ConsultaMedicaSerializer.Meta):
+        pass
+
+
 class MedicoDetalleSerializer(MedicoSerializer):
     """Serializador detallado para médicos que incluye consultas recientes"""
     consultas_recientes = serializers.SerializerMethodField()
@@ -154,9 +385,8 @@ class MedicoDetalleSerializer(MedicoSerializer):
     
     def get_consultas_recientes(self, obj):
         """Obtiene las últimas 5 consultas del médico en los últimos 30 días"""
-        from datetime import datetime, timedelta
-        fecha_limite = datetime.now() - timedelta(days=30)
-        consultas = obj.consultas_realizadas.filter(fecha_consulta__gte=fecha_limite)[:5]
+        fecha_limite = timezone.now() - timedelta(days=30)
+        consultas = obj.consultas_realizadas.filter(fecha_consulta__gte=fecha_limite).select_related('paciente')[:5]
         return ConsultaMedicaSerializer(consultas, many=True).data
 
 
@@ -169,5 +399,31 @@ class PacienteDetalleSerializer(PacienteSerializer):
     
     def get_consultas_recientes(self, obj):
         """Obtiene las últimas 5 consultas del paciente"""
-        consultas = obj.consultas.all()[:5]
-        return ConsultaMedicaSerializer(consultas, many=True).data
\ No newline at end of file
+        consultas = obj.consultas.select_related('medico__especialidad')[:5]
+        return ConsultaMedicaSerializer(consultas, many=True).data
+
+
+class FichaPacienteSerializer(PacienteSerializer):
+    """Serializador de la ficha completa del paciente.
+
+    Lee los atributos que deja views.ficha_paciente_queryset() mediante Prefetch
+    (`citas_proximas`, `citas_pasadas`, `consultas_recientes`) y los tratamientos
+    activos que recibe en el contexto, sin consultas adicionales por fila.
+    """
+    historial_clinico = serializers.SerializerMethodField()
+    citas_proximas = CitaMedicaSerializer(many=True, read_only=True)
+    citas_pasadas = CitaMedicaSerializer(many=True, read_only=True)
+    consultas_recientes = ConsultaMedicaSerializer(many=True, read_only=True)
+    tratamientos_activos = serializers.SerializerMethodField()
+
+    class Meta(PacienteSerializer.Meta):
+        pass
+
+    def get_historial_clinico(self, obj):
+        """Historial del paciente, o None si aún no se ha registrado"""
+        historial = getattr(obj, 'historial_clinico', None)
+        return HistorialClinicoSerializer(historial).data if historial else None
+
+    def get_tratamientos_activos(self, obj):
+        """Tratamientos vigentes con sus recetas, precargados por la vista"""
+        return TratamientoDetalleSerializer(self.context.get('tratamientos_activos', []), many=True).data
@@ -0,0 +1,191 @@
+# ============================================================================
+# SERIES DE CITAS RECURRENTES - SALUD VITAL
+# ============================================================================
+# Generación y modificación masiva de las citas de una SerieCitas.
+#
+# - Al crear una serie, todas sus ocurrencias se contrastan con las citas
+#   existentes del médico en una sola consulta (unnest de los intervalos contra
+#   el índice GiST de la restricción de citas superpuestas) y se insertan con
+#   un único bulk_create dentro de la misma transacción.
+# - "Esta y las siguientes" (cancelar o reprogramar) se ejecuta como un solo
+#   UPDATE sobre las citas de la serie desde la fecha indicada.
+#
+# bulk_create y update() no emiten señales, así que aquí se invalidan los
+# cachés de ficha y disponibilidad y se fija updated_at para la sincronización.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+from datetime import date, datetime, timedelta
+
+from django.db import connection, transaction, IntegrityError
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import invalidar_ficha, invalidar_disponibilidad
+from .models import CitaMedica, SerieCitas, es_cita_superpuesta
+
+
+# Rango máximo de una serie (en días) para acotar el número de ocurrencias
+MAX_DIAS_SERIE = 366
+
+# Estados que una modificación masiva de la serie no toca
+ESTADOS_CERRADOS = ('Cancelada', 'Realizada')
+
+
+class CitasEnConflicto(Exception):
+    """Ocurrencias de la serie que se solapan con citas vigentes del médico"""
+
+    def __init__(self, fechas):
+        super().__init__('Hay citas en conflicto con la serie.')
+        self.fechas = fechas
+
+
+# ============================================================================
+# OCURRENCIAS Y CONFLICTOS
+# ============================================================================
+
+def ocurrencias(serie):
+    """Inicios (aware) de todas las citas de la serie, en orden"""
+    inicio_semana = serie.fecha_inicio - timedelta(days=serie.fecha_inicio.weekday())
+    dias_semana = set(serie.dias_semana)
+    inicios = []
+    dia = serie.fecha_inicio
+    while dia <= serie.fecha_fin:
+        semana = (dia - inicio_semana).days // 7
+        if dia.weekday() in dias_semana and semana % serie.intervalo_semanas == 0:
+            inicios.append(timezone.make_aware(datetime.combine(dia, serie.hora)))
+        dia += timedelta(days=1)
+    return inicios
+
+
+# Intervalos propuestos que se solapan con alguna cita vigente del médico. Las
+# expresiones coinciden con las de la restricción cita_sin_superposicion_medico
+# para que PostgreSQL use su índice GiST en cada intervalo
+SQL_CONFLICTOS = f"""
+    SELECT propuesta.inicio
+    FROM unnest(%s::timestamptz[], %s::timestamptz[]) AS propuesta(inicio, fin)
+    WHERE EXISTS (
+        SELECT 1 FROM {CitaMedica._meta.db_table} cita
+        WHERE INT8RANGE(cita.medico_id, cita.medico_id, '[]') && INT8RANGE(%s, %s, '[]')
+          AND TSTZRANGE(cita.fecha_hora_cita, cita.fecha_hora_fin, '[)')
+              && TSTZRANGE(propuesta.inicio, propuesta.fin, '[)')
+          AND NOT (cita.estado = 'Cancelada')
+    )
+    ORDER BY propuesta.inicio
+"""
+
+
+def buscar_conflictos(medico_id, inicios, duracion_minutos):
+    """Inicios propuestos que chocan con citas existentes del médico (una sola consulta)"""
+    if not inicios:
+        return []
+    duracion = timedelta(minutes=duracion_minutos)
+    with connection.cursor() as cursor:
+        cursor.execute(SQL_CONFLICTOS, [inicios, [inicio + duracion for inicio in inicios], medico_id, medico_id])
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+# ============================================================================
+# CREACIÓN DE LA SERIE
+# ============================================================================
+
+def crear_serie(datos, omitir_conflictos=False):
+    """Crea la serie y sus citas en una transacción.
+
+    Si hay ocurrencias en conflicto se lanza CitasEnConflicto, salvo con
+    `omitir_conflictos`, en cuyo caso se saltan y se devuelven. Retorna
+    (serie, citas creadas, inicios omitidos). Una reserva concurrente que gane
+    la carrera hace fallar el INSERT por la restricción de exclusión.
+    """
+    with transaction.atomic():
+        serie = SerieCitas.objects.create(**datos)
+        inicios = ocurrencias(serie)
+        conflictos = buscar_conflictos(serie.medico_id, inicios, serie.duracion_minutos)
+        if conflictos and not omitir_conflictos:
+            raise CitasEnConflicto(conflictos)
+
+        omitidos = set(conflictos)
+        duracion = timedelta(minutes=serie.duracion_minutos)
+        citas = CitaMedica.objects.bulk_create([
+            CitaMedica(
+                paciente_id=serie.paciente_id,
+                medico_id=serie.medico_id,
+                serie=serie,
+                fecha_hora_cita=inicio,
+                duracion_minutos=serie.duracion_minutos,
+                fecha_hora_fin=inicio + duracion,
+                motivo=serie.motivo,
+            )
+            for inicio in inicios if inicio not in omitidos
+        ])
+
+    invalidar_disponibilidad(serie.medico_id)
+    invalidar_ficha(serie.paciente_id)
+    return serie, citas, conflictos
+
+
+# ============================================================================
+# ESTA Y LAS SIGUIENTES
+# ============================================================================
+
+def citas_desde(serie, desde):
+    """Citas abiertas de la serie desde el inicio del día `desde` (incluido)"""
+    inicio = timezone.make_aware(datetime.combine(desde, datetime.min.time()))
+    return serie.citas.filter(fecha_hora_cita__gte=inicio).exclude(estado__in=ESTADOS_CERRADOS)
+
+
+def cancelar_desde(serie, desde):
+    """Cancela esta y las siguientes citas abiertas de la serie; devuelve cuántas"""
+    canceladas = citas_desde(serie, desde).update(estado='Cancelada', updated_at=timezone.now())
+    invalidar_disponibilidad(serie.medico_id)
+    invalidar_ficha(serie.paciente_id)
+    return canceladas
+
+
+def reprogramar_desde(serie, desde, hora=None, duracion_minutos=None, medico=None):
+    """Cambia hora, duración y/o médico de esta y las siguientes citas abiertas.
+
+    La hora se aplica como desplazamiento respecto de la hora de la serie, así
+    se conservan los ajustes hechos a citas individuales. La serie guarda los
+    nuevos valores en la misma transacción, de modo que una reprogramación
+    posterior parte del horario vigente. Si el nuevo horario choca con otra
+    cita se lanza CitasEnConflicto y no se modifica nada.
+    """
+    cambios = {'updated_at': timezone.now()}
+    cambios_serie = {}
+    inicio = F('fecha_hora_cita')
+    if hora is not None:
+        cambios_serie['hora'] = hora
+        desplazamiento = datetime.combine(date.min, hora) - datetime.combine(date.min, serie.hora)
+        inicio = F('fecha_hora_cita') + desplazamiento
+        cambios['fecha_hora_cita'] = inicio
+        cambios['fecha_hora_fin'] = F('fecha_hora_fin') + desplazamiento
+    if duracion_minutos is not None:
+        cambios_serie['duracion_minutos'] = duracion_minutos
+        cambios['duracion_minutos'] = duracion_minutos
+        cambios['fecha_hora_fin'] = inicio + timedelta(minutes=duracion_minutos)
+    if medico is not None:
+        cambios_serie['medico'] = medico
+        cambios['medico'] = medico
+
+    medicos_afectados = {serie.medico_id}
+    try:
+        with transaction.atomic():
+            citas = citas_desde(serie, desde)
+            medicos_afectados.update(citas.order_by().values_list('medico_id', flat=True).distinct())
+            actualizadas = citas.update(**cambios)
+            for campo, valor in cambios_serie.items():
+                setattr(serie, campo, valor)
+            serie.save(update_fields=[*cambios_serie, 'updated_at'])
+    except IntegrityError as error:
+        if not es_cita_superpuesta(error):
+            raise
+        raise CitasEnConflicto([])
+
+    if medico is not None:
+        medicos_afectados.add(medico.pk)
+    for medico_id in medicos_afectados:
+        invalidar_disponibilidad(medico_id)
+    invalidar_ficha(serie.paciente_id)
+    return actualizadas
@@ -0,0 +1,145 @@
+# ============================================================================
+# SEÑALES DEL MODELO - SALUD VITAL
+# ============================================================================
+# Receptores post_save/post_delete que mantienen coherentes los datos derivados
+# (cachés de respuestas) cuando cambian las filas de origen. Se conectan en
+# SaludVitalConfig.ready().
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import invalidar_ficha, invalidar_disponibilidad
+from .inventario import registrar_movimiento
+from .models import (
+    Especialidad, Medico, Paciente, HistorialClinico, CitaMedica, ConsultaMedica,
+    Tratamiento, Medicamento, RecetaMedica, RegistroEliminado, HorarioMedico, SerieCitas,
+    LoteMedicamento, MovimientoInventario
+)
+
+
+# ============================================================================
+# INVALIDACIÓN DE LA FICHA DEL PACIENTE
+# ============================================================================
+
+@receiver([post_save, post_delete], sender=Paciente)
+def invalidar_ficha_paciente(sender, instance, **kwargs):
+    invalidar_ficha(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=HistorialClinico)
+@receiver([post_save, post_delete], sender=CitaMedica)
+@receiver([post_save, post_delete], sender=ConsultaMedica)
+def invalidar_ficha_por_registro(sender, instance, **kwargs):
+    invalidar_ficha(instance.paciente_id)
+
+
+@receiver([post_save, post_delete], sender=Tratamiento)
+def invalidar_ficha_por_tratamiento(sender, instance, **kwargs):
+    paciente_id = (
+        ConsultaMedica.objects.filter(pk=instance.consulta_id)
+        .values_list('paciente_id', flat=True).first()
+    )
+    invalidar_ficha(paciente_id)
+
+
+@receiver([post_save, post_delete], sender=RecetaMedica)
+def invalidar_ficha_por_receta(sender, instance, **kwargs):
+    paciente_id = (
+        Tratamiento.objects.filter(pk=instance.tratamiento_id)
+        .values_list('consulta__paciente_id', flat=True).first()
+    )
+    invalidar_ficha(paciente_id)
+
+
+# ============================================================================
+# INVALIDACIÓN DE LA DISPONIBILIDAD DE CUPOS
+# ============================================================================
+
+@receiver(pre_save, sender=CitaMedica)
+def invalidar_disponibilidad_medico_anterior(sender, instance, **kwargs):
+    # Si la cita se reasigna a otro médico, el anterior también recupera el cupo
+    if instance.pk is not None:
+        medico_anterior = (
+            CitaMedica.objects.filter(pk=instance.pk).values_list('medico_id', flat=True).first()
+        )
+        if medico_anterior != instance.medico_id:
+            invalidar_disponibilidad(medico_anterior)
+
+
+@receiver([post_save, post_delete], sender=CitaMedica)
+@receiver([post_save, post_delete], sender=HorarioMedico)
+def invalidar_disponibilidad_medico(sender, instance, **kwargs):
+    invalidar_disponibilidad(instance.medico_id)
+
+
+# La misma versión arma el ETag de la agenda, cuyas citas muestran los nombres
+# del paciente, del médico y de la especialidad: cambiarlos también la invalida
+
+@receiver(post_save, sender=Paciente)
+def invalidar_agenda_por_paciente(sender, instance, raw=False, **kwargs):
+    if not raw:
+        medico_ids = CitaMedica.objects.filter(paciente=instance).values_list('medico_id', flat=True).distinct()
+        for medico_id in medico_ids:
+            invalidar_disponibilidad(medico_id)
+
+
+@receiver(post_save, sender=Medico)
+def invalidar_agenda_por_medico(sender, instance, raw=False, **kwargs):
+    if not raw:
+        invalidar_disponibilidad(instance.pk)
+
+
+@receiver(post_save, sender=Especialidad)
+def invalidar_agenda_por_especialidad(sender, instance, raw=False, **kwargs):
+    if not raw:
+        for medico_id in Medico.objects.filter(especialidad=instance).values_list('id', flat=True):
+            invalidar_disponibilidad(medico_id)
+
+
+# ============================================================================
+# LIBRO DE INVENTARIO
+# ============================================================================
+
+@receiver(post_save, sender=Medicamento)
+def registrar_saldo_inicial(sender, instance, created, raw=False, **kwargs):
+    # El stock y vencimiento con que se crea el medicamento son su primer lote y movimiento
+    if created and not raw:
+        lote = LoteMedicamento.objects.create(
+            medicamento=instance, cantidad=instance.stock, fecha_vencimiento=instance.fecha_vencimiento,
+        )
+        MovimientoInventario.objects.create(
+            medicamento=instance, lote=lote, tipo='Ingreso', cantidad=instance.stock,
+            stock_resultante=instance.stock, observacion='Saldo inicial',
+        )
+
+
+@receiver(post_delete, sender=RecetaMedica)
+def devolver_stock_receta(sender, instance, **kwargs):
+    # Eliminar una receta (también en cascada) devuelve lo entregado al inventario
+    registrar_movimiento(
+        instance.medicamento_id, instance.cantidad, 'Devolución',
+        receta=instance, observacion='Receta eliminada',
+    )
+
+
+# ============================================================================
+# TOMBSTONES PARA LA SINCRONIZACIÓN INCREMENTAL
+# ============================================================================
+# Cada eliminación (incluidas las en cascada) deja un RegistroEliminado que
+# /api/sync/ entrega a los clientes sin conexión
+
+@receiver(post_delete, sender=Especialidad)
+@receiver(post_delete, sender=Medico)
+@receiver(post_delete, sender=Paciente)
+@receiver(post_delete, sender=HistorialClinico)
+@receiver(post_delete, sender=SerieCitas)
+@receiver(post_delete, sender=CitaMedica)
+@receiver(post_delete, sender=ConsultaMedica)
+@receiver(post_delete, sender=Tratamiento)
+@receiver(post_delete, sender=Medicamento)
+@receiver(post_delete, sender=RecetaMedica)
+def registrar_eliminacion(sender, instance, **kwargs):
+    RegistroEliminado.objects.create(modelo=sender._meta.db_table, objeto_id=instance.pk)
@@ -0,0 +1,54 @@
+# ============================================================================
+# REGISTRO DE CONSULTAS SQL - SALUD VITAL
+# ============================================================================
+# Contador de consultas SQL por solicitud y plantillas SQL sin el largo de sus
+# listas de parámetros. Lo usan los middleware de diagnóstico, la captura de
+# consultas lentas, el benchmark y las pruebas de presupuesto de consultas, por
+# eso no importa nada del resto de la aplicación.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import re
+import time
+from collections import Counter
+
+
+# Listas de parámetros de largo variable: `IN (%s, %s, ...)` o `VALUES (%s, ...), (%s, ...)`
+LISTA_DE_PARAMETROS = re.compile(r'%s(?:, %s)+')
+FILAS_DE_VALORES = re.compile(r'\(%s\.\.\.\)(?:, \(%s\.\.\.\))+')
+
+
+class ContadorSQL:
+    """Registra cada consulta SQL y su duración: `with connection.execute_wrapper(contador)`.
+
+    A diferencia de CaptureQueriesContext no depende del registro de consultas
+    de DEBUG, que se trunca a 9000 por conexión.
+    """
+
+    def __init__(self):
+        self.consultas = []
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas.append((sql, time.perf_counter() - inicio))
+
+    def __len__(self):
+        return len(self.consultas)
+
+    @property
+    def segundos(self):
+        return sum(duracion for _, duracion in self.consultas)
+
+    def por_plantilla(self):
+        """Cantidad de ejecuciones de cada plantilla SQL, de la más a la menos repetida"""
+        return Counter(plantilla_sql(sql) for sql, _ in self.consultas).most_common()
+
+
+def plantilla_sql(sql):
+    """SQL sin el largo de sus listas de parámetros: las consultas que solo
+    difieren en la cantidad de ids o filas insertadas comparten plantilla"""
+    return FILAS_DE_VALORES.sub('(%s...), ...', LISTA_DE_PARAMETROS.sub('%s...', sql))
@@ -0,0 +1,184 @@
+# ============================================================================
+# SINCRONIZACIÓN INCREMENTAL - SALUD VITAL
+# ============================================================================
+# Lógica del endpoint /api/sync/ para clientes sin conexión estable (clínicas
+# en terreno). Cada colección se recorre con paginación por cursor sobre
+# (updated_at, id) usando los índices *_sync_idx, y las eliminaciones se leen
+# de la tabla de tombstones RegistroEliminado.
+#
+# El token es un diccionario firmado con el último (updated_at, id) entregado
+# por colección; el cliente lo reenvía hasta que `hay_mas` sea falso.
+#
+# Los tombstones se conservan SYNC_RETENCION_DIAS (`manage.py purge_tombstones`
+# elimina los anteriores). Un token emitido antes de esa ventana podría no ver
+# eliminaciones ya purgadas, así que se rechaza como inválido y el cliente
+# vuelve a sincronizar desde cero.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import (
+    Especialidad, Medico, Paciente, HistorialClinico, CitaMedica,
+    ConsultaMedica, Tratamiento, Medicamento, RecetaMedica, SerieCitas, RegistroEliminado
+)
+from .serializers import (
+    EspecialidadSerializer, MedicoSerializer, PacienteSerializer,
+    HistorialClinicoSerializer, CitaMedicaSerializer, ConsultaMedicaSerializer,
+    TratamientoSerializer, MedicamentoSerializer, RecetaMedicaSerializer, SerieCitasSerializer
+)
+
+
+# ============================================================================
+# CONFIGURACIÓN
+# ============================================================================
+# Salt de firma del token de sincronización
+TOKEN_SALT = 'salud_vital.sync'
+
+# Filas más recientes que este margen se posponen al siguiente lote, para no
+# saltarse transacciones que aún no confirman con un updated_at anterior
+SYNC_MARGEN = timedelta(seconds=getattr(settings, 'SYNC_MARGEN_SEGUNDOS', 2))
+
+# Vigencia de los tombstones y, con ella, de los tokens
+SYNC_RETENCION = timedelta(days=getattr(settings, 'SYNC_RETENCION_DIAS', 30))
+
+LIMITE_POR_DEFECTO = 500
+LIMITE_MAXIMO = 2000
+
+
+def colecciones():
+    """Colecciones sincronizadas: nombre (db_table), queryset con JOIN y serializador"""
+    return [
+        (Especialidad._meta.db_table, Especialidad.objects.all(), EspecialidadSerializer),
+        (Medico._meta.db_table, Medico.objects.select_related('especialidad'), MedicoSerializer),
+        (Paciente._meta.db_table, Paciente.objects.all(), PacienteSerializer),
+        (HistorialClinico._meta.db_table, HistorialClinico.objects.all(), HistorialClinicoSerializer),
+        (
+            SerieCitas._meta.db_table,
+            SerieCitas.objects.select_related('paciente', 'medico'),
+            SerieCitasSerializer,
+        ),
+        (
+            CitaMedica._meta.db_table,
+            CitaMedica.objects.select_related('paciente', 'medico', 'medico__especialidad'),
+            CitaMedicaSerializer,
+        ),
+        (
+            ConsultaMedica._meta.db_table,
+            ConsultaMedica.objects.select_related('paciente', 'medico', 'medico__especialidad'),
+            ConsultaMedicaSerializer,
+        ),
+        (
+            Tratamiento._meta.db_table,
+            Tratamiento.objects.select_related('consulta__paciente', 'consulta__medico'),
+            TratamientoSerializer,
+        ),
+        (Medicamento._meta.db_table, Medicamento.objects.con_stock_vigente(), MedicamentoSerializer),
+        (
+            RecetaMedica._meta.db_table,
+            RecetaMedica.objects.select_related('tratamiento__consulta__paciente', 'medicamento'),
+            RecetaMedicaSerializer,
+        ),
+    ]
+
+
+class TokenInvalido(Exception):
+    """El token de sincronización no tiene firma válida, está mal formado o vencido"""
+
+
+# ============================================================================
+# TOKEN DE SINCRONIZACIÓN
+# ============================================================================
+
+def leer_token(token):
+    """Decodifica el token firmado en {coleccion: (updated_at, id)}"""
+    if not token:
+        return {}
+    try:
+        datos = signing.loads(token, salt=TOKEN_SALT, max_age=SYNC_RETENCION)
+        return {
+            nombre: (parse_datetime(marca), int(pk))
+            for nombre, (marca, pk) in datos.items()
+        }
+    except signing.SignatureExpired:
+        raise TokenInvalido('Token de sincronización vencido; sincronice de nuevo sin token.')
+    except (signing.BadSignature, TypeError, ValueError, AttributeError):
+        raise TokenInvalido('Token de sincronización inválido.')
+
+
+def crear_token(cursores):
+    """Firma los cursores {coleccion: (updated_at, id)} en un token opaco"""
+    return signing.dumps(
+        {nombre: (marca.isoformat(), pk) for nombre, (marca, pk) in cursores.items()},
+        salt=TOKEN_SALT,
+    )
+
+
+def despues_de(queryset, campo, cursor):
+    """Filtra las filas posteriores al cursor (campo, id) en orden de índice"""
+    if cursor is None:
+        return queryset
+    marca, pk = cursor
+    return queryset.filter(Q(**{f'{campo}__gt': marca}) | Q(**{campo: marca, 'id__gt': pk}))
+
+
+def purgar_eliminados():
+    """Elimina los tombstones más antiguos que SYNC_RETENCION; devuelve cuántos"""
+    return RegistroEliminado.objects.filter(eliminado_en__lt=timezone.now() - SYNC_RETENCION).delete()[0]
+
+
+# ============================================================================
+# CÁLCULO DEL LOTE DE CAMBIOS
+# ============================================================================
+
+def obtener_cambios(token=None, limite=LIMITE_POR_DEFECTO):
+    """Devuelve el siguiente lote de cambios y eliminaciones desde el token.
+
+    Cada colección aporta como máximo `limite` filas ordenadas por (updated_at, id);
+    `hay_mas` indica que alguna colección quedó con filas pendientes y el cliente
+    debe volver a llamar con el nuevo token.
+    """
+    cursores = leer_token(token)
+    hasta = timezone.now() - SYNC_MARGEN
+    cambios = {}
+    hay_mas = False
+
+    for nombre, queryset, serializer_class in colecciones():
+        filas = list(
+            despues_de(queryset.filter(updated_at__lte=hasta), 'updated_at', cursores.get(nombre))
+            .order_by('updated_at', 'id')[:limite + 1]
+        )
+        if len(filas) > limite:
+            hay_mas = True
+            filas = filas[:limite]
+        if filas:
+            cursores[nombre] = (filas[-1].updated_at, filas[-1].pk)
+        cambios[nombre] = serializer_class(filas, many=True).data
+
+    eliminados = list(
+        despues_de(RegistroEliminado.objects.filter(eliminado_en__lte=hasta), 'eliminado_en',
+                   cursores.get(RegistroEliminado._meta.db_table))
+        .order_by('eliminado_en', 'id')[:limite + 1]
+    )
+    if len(eliminados) > limite:
+        hay_mas = True
+        eliminados = eliminados[:limite]
+    if eliminados:
+        cursores[RegistroEliminado._meta.db_table] = (eliminados[-1].eliminado_en, eliminados[-1].pk)
+
+    return {
+        'cambios': cambios,
+        'eliminados': [
+            {'modelo': e.modelo, 'id': e.objeto_id, 'eliminado_en': e.eliminado_en}
+            for e in eliminados
+        ],
+        'token': crear_token(cursores),
+        'hay_mas': hay_mas,
+    }
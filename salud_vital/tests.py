@@ -1,3 +1,2001 @@
-from django.test import TestCase
+# ============================================================================
+# PRUEBAS AUTOMATIZADAS - SALUD VITAL
+# ============================================================================
+# Pruebas de la API REST y de las vistas del sistema. Se ejecutan con:
+#     python manage.py test salud_vital
 
-# Create your tests here.
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import asyncio
+import calendar
+import shutil
+import tempfile
+import threading
+from io import StringIO
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from prometheus_client import REGISTRY
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.db import connection, transaction, IntegrityError
+from django.db.models import Sum
+from django.test import Client, LiveServerTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import BasePermission
+from rest_framework.test import APIClient
+
+from .models import (
+    Especialidad, Medico, Paciente, ConsultaMedica,
+    Tratamiento, Medicamento, RecetaMedica, CitaMedica, HistorialClinico,
+    HorarioMedico, SerieCitas, MovimientoInventario, ConsultaLenta, PerfilSolicitud, RegistroEliminado,
+    es_cita_superpuesta
+)
+from .carga_inicial import DIRECTORIO_DATOS, ErrorDeCarga, cargar
+from .consultas_lentas import capturar, huella, normalizar_sql, ocultar_parametros, resumen_por_huella
+from .datos_sinteticos import Parametros, digito_verificador, generar_bloque, rut_desde_id, RANGO_RUT_PACIENTES
+from .disponibilidad import cupos_libres, fusionar_intervalos
+from .inventario import StockInsuficiente, registrar_movimiento, recibir_lote, stock_en_fecha
+from .middleware import MetricasMiddleware, PerfiladorMiddleware, PerfilSQL
+from .perfilador import firmar
+from .trazas import leer
+from .rendimiento import comparar, ejecutar, filas_de_muestra, percentil, rutas, sembrar, solicitudes
+from .sql import ContadorSQL, plantilla_sql
+from .serializers import CitaMedicaSerializer
+from .trafico import ESCENARIOS, ErrorDeTrafico, Estadisticas, simular
+from .views import PacienteViewSet
+
+
+# ============================================================================
+# DATOS DE PRUEBA COMPARTIDOS
+# ============================================================================
+
+class SaludVitalTestCase(TestCase):
+    """Caso base con una especialidad, dos médicos, dos pacientes y un cliente API autenticado"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('tester', password='clave-segura-123')
+        cls.especialidad = Especialidad.objects.create(nombre='Cardiología')
+        cls.medico = Medico.objects.create(
+            rut='11111111-1', nombre='Ana', apellido='Rojas', especialidad=cls.especialidad
+        )
+        cls.otro_medico = Medico.objects.create(
+            rut='22222222-2', nombre='Luis', apellido='Soto', especialidad=cls.especialidad
+        )
+        cls.paciente = Paciente.objects.create(
+            rut='33333333-3', nombre='Juan', apellido='Pérez', fecha_nacimiento=date(1980, 5, 1)
+        )
+        cls.otro_paciente = Paciente.objects.create(
+            rut='44444444-4', nombre='María', apellido='Díaz', fecha_nacimiento=date(1990, 1, 1)
+        )
+        cls.medicamento = Medicamento.objects.create(
+            nombre='Paracetamol', stock=100, precio_unitario=Decimal('1500.00'),
+            fecha_vencimiento=date.today() + timedelta(days=365)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def crear_consultas(self, cantidad, medico=None, paciente=None, desde=None):
+        """Crea `cantidad` consultas espaciadas un día hacia atrás desde `desde`"""
+        desde = desde or timezone.now()
+        return ConsultaMedica.objects.bulk_create([
+            ConsultaMedica(
+                paciente=paciente or (self.paciente if i % 2 == 0 else self.otro_paciente),
+                medico=medico or self.medico,
+                fecha_consulta=desde - timedelta(days=i),
+                motivo=f'Control {i}',
+                diagnostico='Estable' if i % 3 == 0 else '',
+            )
+            for i in range(cantidad)
+        ])
+
+
+# ============================================================================
+# CONSULTAS ANIDADAS DE MÉDICOS Y PACIENTES
+# ============================================================================
+
+class ConsultasAnidadasTests(SaludVitalTestCase):
+
+    def test_consultas_medico_paginadas_con_resumen(self):
+        self.crear_consultas(45)
+        self.crear_consultas(3, medico=self.otro_medico)
+
+        response = self.client.get(f'/api/medicos/{self.medico.pk}/consultas/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 45)
+        self.assertEqual(len(response.data['results']), 20)
+        self.assertEqual(response.data['resumen']['total'], 45)
+        self.assertEqual(response.data['resumen']['ultimos_30_dias'], 30)
+        self.assertEqual(response.data['resumen']['con_diagnostico'], 15)
+        self.assertEqual(response.data['resumen']['pacientes_distintos'], 2)
+        self.assertEqual(response.data['results'][0]['especialidad_nombre'], 'Cardiología')
+
+    def test_consultas_medico_filtradas_por_fecha(self):
+        self.crear_consultas(10)
+        hoy = timezone.localdate()
+
+        response = self.client.get(
+            f'/api/medicos/{self.medico.pk}/consultas/',
+            {'fecha_desde': hoy - timedelta(days=2), 'fecha_hasta': hoy},
+        )
+
+        self.assertEqual(response.data['count'], 3)
+
+    def test_consultas_paciente_no_crecen_en_queries(self):
+        self.crear_consultas(40, paciente=self.paciente)
+
+        # get_object + count de paginación + resumen + página
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/pacientes/{self.paciente.pk}/consultas/')
+
+        self.assertEqual(response.data['count'], 40)
+        self.assertEqual(response.data['results'][0]['paciente_nombre'], 'Juan Pérez')
+
+    def test_detalle_html_de_consulta_lee_solo_el_historial_reciente(self):
+        actual, *anteriores = self.crear_consultas(40, paciente=self.paciente)
+        web = Client()
+        web.force_login(self.usuario)
+
+        response = web.get(f'/consultas/{actual.pk}/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_consultas_paciente'], 40)
+        self.assertEqual([c.pk for c in response.context['consultas_paciente']], [c.pk for c in anteriores[:5]])
+
+
+# ============================================================================
+# ÁRBOL DE CONSULTA: TRATAMIENTOS → RECETAS → MEDICAMENTO
+# ============================================================================
+
+class ArbolConsultaTests(SaludVitalTestCase):
+
+    def crear_arbol(self, tratamientos=3, recetas=4):
+        consulta = self.crear_consultas(1)[0]
+        for i in range(tratamientos):
+            tratamiento = Tratamiento.objects.create(
+                consulta=consulta, descripcion=f'Tratamiento {i}',
+                fecha_inicio=date.today(), fecha_fin=date.today() + timedelta(days=10),
+            )
+            for j in range(recetas):
+                medicamento = Medicamento.objects.create(
+                    nombre=f'Med {i}-{j}', stock=50, precio_unitario=Decimal('100.00'),
+                    fecha_vencimiento=date.today() + timedelta(days=100),
+                )
+                RecetaMedica.objects.create(
+                    tratamiento=tratamiento, medicamento=medicamento,
+                    cantidad=2, frecuencia='Cada 8 horas', duracion='7 días',
+                )
+        return consulta
+
+    def test_detalle_consulta_incluye_arbol_en_consultas_constantes(self):
+        consulta = self.crear_arbol()
+
+        # consulta, tratamientos, recetas y medicamentos con su stock vigente
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/consultas/{consulta.pk}/')
+
+        self.assertEqual(response.status_code, 200)
+        tratamientos = response.data['tratamientos']
+        self.assertEqual(len(tratamientos), 3)
+        self.assertEqual(len(tratamientos[0]['recetas']), 4)
+        receta = tratamientos[0]['recetas'][0]
+        self.assertEqual(receta['paciente_nombre'], consulta.paciente.nombre_completo)
+        self.assertEqual(receta['medicamento_detalle']['precio_unitario'], '100.00')
+        self.assertEqual(receta['costo_total'], '200.00')
+
+    def test_detalle_tratamiento_incluye_recetas(self):
+        consulta = self.crear_arbol(tratamientos=1, recetas=5)
+        tratamiento = consulta.tratamientos.get()
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/tratamientos/{tratamiento.pk}/')
+
+        self.assertEqual(len(response.data['recetas']), 5)
+
+
+# ============================================================================
+# FICHA COMPLETA DEL PACIENTE
+# ============================================================================
+
+class FichaPacienteTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/pacientes/{self.paciente.pk}/ficha/'
+        HistorialClinico.objects.create(paciente=self.paciente, grupo_sanguineo='O+')
+        ahora = timezone.now()
+        for dias in (-3, -2, 2, 5):
+            CitaMedica.objects.create(
+                paciente=self.paciente, medico=self.medico, fecha_hora_cita=ahora + timedelta(days=dias)
+            )
+        for consulta in self.crear_consultas(4, paciente=self.paciente):
+            tratamiento = Tratamiento.objects.create(
+                consulta=consulta, descripcion='Reposo',
+                fecha_inicio=date.today(), fecha_fin=date.today() + timedelta(days=5),
+            )
+            RecetaMedica.objects.create(
+                tratamiento=tratamiento, medicamento=self.medicamento,
+                cantidad=1, frecuencia='Cada 12 horas', duracion='5 días',
+            )
+
+    def test_ficha_en_consultas_fijas_y_cacheada(self):
+        # paciente+historial, citas próximas, citas pasadas, consultas, tratamientos, recetas, medicamentos
+        with self.assertNumQueries(7):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['historial_clinico']['grupo_sanguineo'], 'O+')
+        self.assertEqual(len(response.data['citas_proximas']), 2)
+        self.assertEqual(len(response.data['citas_pasadas']), 2)
+        self.assertEqual(len(response.data['consultas_recientes']), 4)
+        self.assertEqual(len(response.data['tratamientos_activos']), 4)
+        self.assertEqual(len(response.data['tratamientos_activos'][0]['recetas']), 1)
+
+        # Con la ficha en caché solo se busca el paciente (get_object y sus permisos)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    def test_ficha_en_cache_aplica_los_permisos_de_objeto(self):
+        class SinPermisoDeObjeto(BasePermission):
+            def has_object_permission(self, request, view, obj):
+                return False
+
+        self.client.get(self.url)
+        permisos = [*PacienteViewSet.permission_classes, SinPermisoDeObjeto]
+        with mock.patch.object(PacienteViewSet, 'permission_classes', permisos):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_ficha_se_invalida_al_cambiar_registros_relacionados(self):
+        self.client.get(self.url)
+        tratamiento = Tratamiento.objects.filter(consulta__paciente=self.paciente).first()
+        RecetaMedica.objects.create(
+            tratamiento=tratamiento, medicamento=self.medicamento,
+            cantidad=3, frecuencia='Cada 8 horas', duracion='3 días',
+        )
+
+        response = self.client.get(self.url)
+
+        recetas = sum(len(t['recetas']) for t in response.data['tratamientos_activos'])
+        self.assertEqual(recetas, 5)
+
+    def test_ficha_paciente_inexistente(self):
+        response = self.client.get('/api/pacientes/999999/ficha/')
+        self.assertEqual(response.status_code, 404)
+
+
+# ============================================================================
+# RECUPERACIÓN POR LOTE DE IDS
+# ============================================================================
+
+class RecuperacionPorIdsTests(SaludVitalTestCase):
+
+    def test_ids_en_query_string_respeta_orden_y_reporta_faltantes(self):
+        ids = [self.otro_paciente.pk, 999999, self.paciente.pk]
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/pacientes/', {'ids': ','.join(map(str, ids))})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p['id'] for p in response.data['results']], [self.otro_paciente.pk, self.paciente.pk])
+        self.assertEqual(response.data['no_encontrados'], [999999])
+
+    def test_lote_por_post_usa_joins_del_viewset(self):
+        consultas = self.crear_consultas(30)
+        ids = [c.pk for c in reversed(consultas)]
+
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/consultas/lote/', {'ids': ids}, format='json')
+
+        self.assertEqual([c['id'] for c in response.data['results']], ids)
+        self.assertEqual(response.data['results'][0]['especialidad_nombre'], 'Cardiología')
+
+    def test_ids_invalidos(self):
+        response = self.client.get('/api/medicamentos/', {'ids': '1,abc'})
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/medicamentos/lote/', {'ids': '1,2'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+# ============================================================================
+# SINCRONIZACIÓN INCREMENTAL
+# ============================================================================
+
+@mock.patch('salud_vital.sync.SYNC_MARGEN', timedelta(0))
+class SincronizacionTests(SaludVitalTestCase):
+
+    def sincronizar(self, token=None, **params):
+        if token:
+            params['since'] = token
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_sincronizacion_completa_por_lotes_reanudable(self):
+        data = self.sincronizar(limite=1)
+        self.assertTrue(data['hay_mas'])
+        self.assertEqual(len(data['cambios']['medicos']), 1)
+
+        data = self.sincronizar(data['token'], limite=1)
+        self.assertEqual(len(data['cambios']['medicos']), 1)
+        self.assertEqual(len(data['cambios']['especialidades']), 0)
+
+        data = self.sincronizar(data['token'], limite=1)
+        self.assertFalse(data['hay_mas'])
+        self.assertEqual(data['cambios']['medicos'], [])
+
+    def test_solo_entrega_lo_modificado_y_los_eliminados(self):
+        token = self.sincronizar()['token']
+        self.medicamento.stock = 5
+        self.medicamento.save()
+        paciente_id = self.otro_paciente.pk
+        self.otro_paciente.delete()
+
+        data = self.sincronizar(token)
+
+        self.assertEqual([m['id'] for m in data['cambios']['medicamentos']], [self.medicamento.pk])
+        self.assertEqual(data['cambios']['pacientes'], [])
+        self.assertEqual(data['eliminados'][0]['modelo'], 'pacientes')
+        self.assertEqual(data['eliminados'][0]['id'], paciente_id)
+        self.assertEqual(self.sincronizar(data['token'])['eliminados'], [])
+
+    def test_token_invalido(self):
+        response = self.client.get('/api/sync/', {'since': 'manipulado'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_token_anterior_a_la_retencion_pide_sincronizar_de_nuevo(self):
+        hace_31_dias = int((timezone.now() - timedelta(days=31)).timestamp())
+        with mock.patch.object(signing.TimestampSigner, 'timestamp', return_value=signing.b62_encode(hace_31_dias)):
+            token = self.sincronizar()['token']
+
+        response = self.client.get('/api/sync/', {'since': token})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('vencido', str(response.data['since']))
+        self.assertTrue(self.sincronizar()['cambios']['pacientes'])
+
+    def test_purge_tombstones_elimina_solo_los_fuera_de_la_retencion(self):
+        antiguo, reciente = self.paciente.pk, self.otro_paciente.pk
+        self.paciente.delete()
+        self.otro_paciente.delete()
+        RegistroEliminado.objects.filter(objeto_id=antiguo).update(eliminado_en=timezone.now() - timedelta(days=31))
+
+        call_command('purge_tombstones', stdout=StringIO())
+
+        self.assertEqual(list(RegistroEliminado.objects.values_list('objeto_id', flat=True)), [reciente])
+
+
+# ============================================================================
+# LOTE DE SOLICITUDES
+# ============================================================================
+
+class LoteSolicitudesTests(SaludVitalTestCase):
+
+    def test_ejecuta_sub_solicitudes_en_orden(self):
+        self.crear_consultas(2)
+        response = self.client.post('/api/batch/', {'solicitudes': [
+            {'id': 'hoy', 'url': '/api/consultas/hoy/'},
+            {'id': 'stock', 'url': '/api/medicamentos/stock_bajo/'},
+            {'id': 'paciente', 'url': f'/api/pacientes/?ids={self.paciente.pk}'},
+            {'id': 'inexistente', 'url': '/api/pacientes/999999/'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        respuestas = {r['id']: r for r in response.data['respuestas']}
+        self.assertEqual(list(respuestas), ['hoy', 'stock', 'paciente', 'inexistente'])
+        self.assertEqual(respuestas['hoy']['status'], 200)
+        self.assertEqual(respuestas['stock']['body'], [])
+        self.assertEqual(respuestas['paciente']['body']['results'][0]['id'], self.paciente.pk)
+        self.assertEqual(respuestas['inexistente']['status'], 404)
+
+    def test_rechaza_metodos_distintos_de_get_y_recursion(self):
+        response = self.client.post('/api/batch/', {'solicitudes': [
+            {'url': '/api/pacientes/', 'method': 'DELETE'},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/batch/', {'solicitudes': [{'url': '/api/batch/'}]}, format='json')
+        self.assertEqual(response.data['respuestas'][0]['status'], 400)
+
+    def test_rechaza_rutas_que_no_son_viewsets(self):
+        response = self.client.post('/api/batch/', {'solicitudes': [
+            {'id': 'async', 'url': '/api/async/consultas/hoy/'},
+            {'id': 'raiz', 'url': '/api/'},
+            {'id': 'hoy', 'url': '/api/consultas/hoy/'},
+        ]}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.data['respuestas']], [400, 400, 200])
+
+    def test_requiere_autenticacion(self):
+        self.client.force_authenticate(None)
+        response = self.client.post('/api/batch/', {'solicitudes': [{'url': '/api/pacientes/'}]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+# ============================================================================
+# ENDPOINTS ASÍNCRONOS (ASGI)
+# ============================================================================
+
+class EndpointsAsincronosTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.async_client.force_login(self.usuario)
+
+    async def test_consultas_hoy_async_equivale_a_la_api(self):
+        await ConsultaMedica.objects.acreate(
+            paciente=self.paciente, medico=self.medico, fecha_consulta=timezone.now(), motivo='Control'
+        )
+
+        response = await self.async_client.get('/api/async/consultas/hoy/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(response.json()[0]['paciente_nombre'], 'Juan Pérez')
+
+    async def test_dashboard_async(self):
+        response = await self.async_client.get('/api/async/dashboard/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_medicos'], 2)
+        self.assertEqual(response.json()['total_pacientes'], 2)
+
+    def test_dashboard_async_hace_lo_mismo_que_el_sincrono(self):
+        self.crear_consultas(3)
+        cliente = Client()
+        cliente.force_login(self.usuario)
+
+        # sesión, usuario, los cinco conteos en una consulta, recientes y especialidades
+        with self.assertNumQueries(5):
+            asincrono = cliente.get('/api/async/dashboard/')
+        sincrono = self.client.get('/api/dashboard/')
+
+        self.assertEqual(asincrono.json(), sincrono.json())
+        self.assertEqual(sincrono.json()['consultas_hoy'], 1)
+        self.assertEqual(len(sincrono.json()['consultas_recientes']), 3)
+
+    async def test_requiere_sesion(self):
+        await self.async_client.alogout()
+        response = await self.async_client.get('/api/async/medicamentos/stock_bajo/')
+        self.assertEqual(response.status_code, 403)
+
+
+# ============================================================================
+# DISPONIBILIDAD DE CUPOS
+# ============================================================================
+
+class DisponibilidadTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Lunes de la próxima semana, de 09:00 a 11:00 en cupos de 30 minutos
+        hoy = timezone.localdate()
+        self.lunes = hoy + timedelta(days=7 - hoy.weekday())
+        for medico in (self.medico, self.otro_medico):
+            HorarioMedico.objects.create(
+                medico=medico, dia_semana=0, hora_inicio=time(9), hora_fin=time(11), duracion_cupo_minutos=30
+            )
+
+    def a_las(self, hora, minuto=0):
+        return timezone.make_aware(datetime.combine(self.lunes, time(hora, minuto)))
+
+    def disponibilidad(self, url):
+        response = self.client.get(url, {'desde': self.lunes, 'hasta': self.lunes})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_barrido_descarta_cupos_solapados(self):
+        ventanas = [(self.a_las(9), self.a_las(11), timedelta(minutes=30))]
+        ocupados = fusionar_intervalos([
+            (self.a_las(9, 15), self.a_las(9, 45)),
+            (self.a_las(9, 30), self.a_las(9, 40)),
+        ])
+
+        libres = cupos_libres(ventanas, ocupados)
+
+        self.assertEqual([inicio for inicio, _ in libres], [self.a_las(10), self.a_las(10, 30)])
+
+    def test_barrido_no_repite_cupos_de_ventanas_superpuestas(self):
+        media_hora = timedelta(minutes=30)
+        ventanas = [(self.a_las(9), self.a_las(10), media_hora), (self.a_las(9, 30), self.a_las(11), media_hora)]
+
+        libres = cupos_libres(ventanas, fusionar_intervalos([(self.a_las(10), self.a_las(10, 30))]))
+
+        self.assertEqual([inicio for inicio, _ in libres], [self.a_las(9), self.a_las(9, 30), self.a_las(10, 30)])
+
+    def test_rechaza_horarios_superpuestos_del_mismo_medico_y_dia(self):
+        horario = HorarioMedico.objects.get(medico=self.medico)
+        nuevo = {'medico': self.medico.pk, 'dia_semana': 0, 'hora_inicio': '10:30', 'hora_fin': '12:00'}
+
+        superpuesto = self.client.post('/api/horarios/', nuevo)
+        contiguo = self.client.post('/api/horarios/', {**nuevo, 'hora_inicio': '11:00'})
+        otro_dia = self.client.post('/api/horarios/', {**nuevo, 'dia_semana': 1})
+        mismo_bloque = self.client.patch(f'/api/horarios/{horario.pk}/', {'hora_fin': '10:45'})
+
+        self.assertEqual(superpuesto.status_code, 400)
+        self.assertEqual(
+            [contiguo.status_code, otro_dia.status_code, mismo_bloque.status_code], [201, 201, 200]
+        )
+        with self.assertRaises(DjangoValidationError):
+            HorarioMedico(medico=self.medico, dia_semana=0, hora_inicio=time(8), hora_fin=time(9, 30)).full_clean()
+
+    def test_formulario_de_cita_muestra_error_de_duracion(self):
+        response = self.client.post('/citas/crear/', {
+            'paciente': self.paciente.pk, 'medico': self.medico.pk,
+            'fecha_hora_cita': timezone.localtime(self.a_las(9)).strftime('%Y-%m-%dT%H:%M'),
+            'duracion_minutos': 0, 'estado': 'Programada',
+        })
+
+        error = response.context['form'].errors['duracion_minutos'][0]
+        self.assertContains(response, '<div class="text-red-600 text-sm mt-1">', count=1)
+        self.assertContains(response, error, count=2)
+
+    def test_disponibilidad_medico_ignora_citas_canceladas(self):
+        CitaMedica.objects.create(paciente=self.paciente, medico=self.medico, fecha_hora_cita=self.a_las(9))
+        CitaMedica.objects.create(
+            paciente=self.paciente, medico=self.medico, fecha_hora_cita=self.a_las(10), estado='Cancelada'
+        )
+
+        data = self.disponibilidad(f'/api/medicos/{self.medico.pk}/disponibilidad/')
+
+        self.assertEqual(
+            [cupo['inicio'] for cupo in data['cupos']],
+            [self.a_las(9, 30), self.a_las(10), self.a_las(10, 30)],
+        )
+
+    def test_disponibilidad_en_cache_hasta_que_cambia_una_cita(self):
+        url = f'/api/medicos/{self.medico.pk}/disponibilidad/'
+        self.assertEqual(len(self.disponibilidad(url)['cupos']), 4)
+
+        # get_object únicamente: los cupos salen del caché
+        with self.assertNumQueries(1):
+            self.disponibilidad(url)
+
+        CitaMedica.objects.create(
+            paciente=self.paciente, medico=self.medico, fecha_hora_cita=self.a_las(10), duracion_minutos=60
+        )
+        self.assertEqual(len(self.disponibilidad(url)['cupos']), 2)
+
+    def test_disponibilidad_especialidad_en_consultas_fijas(self):
+        CitaMedica.objects.create(paciente=self.paciente, medico=self.otro_medico, fecha_hora_cita=self.a_las(9))
+
+        # especialidad + médicos + horarios + citas
+        with self.assertNumQueries(4):
+            data = self.disponibilidad(f'/api/especialidades/{self.especialidad.pk}/disponibilidad/')
+
+        cupos = {m['medico']: len(m['cupos']) for m in data['medicos']}
+        self.assertEqual(cupos, {self.medico.pk: 4, self.otro_medico.pk: 3})
+
+    def test_rango_invalido(self):
+        response = self.client.get(
+            f'/api/medicos/{self.medico.pk}/disponibilidad/', {'desde': self.lunes, 'hasta': self.lunes + timedelta(days=40)}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+# ============================================================================
+# AGENDA SEMANAL Y MENSUAL
+# ============================================================================
+
+class AgendaTests(SaludVitalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        hoy = date.today()
+        cls.lunes = hoy - timedelta(days=hoy.weekday()) + timedelta(days=7)
+        for dia, hora, estado, medico in [
+            (0, 9, 'Programada', cls.medico),
+            (0, 10, 'Confirmada', cls.medico),
+            (0, 11, 'Cancelada', cls.medico),
+            (2, 9, 'Programada', cls.medico),
+            (0, 9, 'Programada', cls.otro_medico),
+            (7, 9, 'Programada', cls.medico),
+        ]:
+            CitaMedica.objects.create(
+                paciente=cls.paciente, medico=medico, estado=estado,
+                fecha_hora_cita=timezone.make_aware(datetime.combine(cls.lunes + timedelta(days=dia), time(hora))),
+            )
+
+    def agenda(self, url, etag=None, **params):
+        encabezados = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, {'fecha': self.lunes, **params}, **encabezados)
+
+    def test_agenda_semanal_del_medico(self):
+        # get_object + conteo agregado + detalle del día
+        with self.assertNumQueries(3):
+            response = self.agenda(f'/api/medicos/{self.medico.pk}/agenda/')
+
+        self.assertEqual(response.status_code, 200)
+        dias = response.data['dias']
+        self.assertEqual([d['total'] for d in dias], [3, 0, 1, 0, 0, 0, 0])
+        self.assertEqual(dias[0]['por_estado'], {'Programada': 1, 'Confirmada': 1, 'Cancelada': 1, 'Realizada': 0})
+        self.assertEqual(len(response.data['citas']), 3)
+        self.assertIn('ETag', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+    def test_agenda_mensual_y_dia_visible(self):
+        dia = self.lunes + timedelta(days=2)
+        response = self.agenda(f'/api/medicos/{self.medico.pk}/agenda/', vista='mes', dia=dia)
+
+        self.assertEqual(len(response.data['dias']), calendar.monthrange(self.lunes.year, self.lunes.month)[1])
+        self.assertEqual([c['fecha_hora_cita'][:10] for c in response.data['citas']], [dia.isoformat()])
+
+    def test_agenda_de_la_especialidad(self):
+        response = self.agenda(f'/api/especialidades/{self.especialidad.pk}/agenda/')
+
+        self.assertEqual(response.data['dias'][0]['total'], 4)
+        self.assertEqual(len(response.data['citas']), 4)
+
+    def test_revalidacion_sin_cambios_no_consulta_citas(self):
+        url = f'/api/medicos/{self.medico.pk}/agenda/'
+        etag = self.agenda(url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.agenda(url, etag=etag)
+        self.assertEqual(response.status_code, 304)
+
+        CitaMedica.objects.filter(medico=self.medico, estado='Programada').first().save()
+        response = self.agenda(url, etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_editar_paciente_medico_o_especialidad_cambia_el_etag(self):
+        url = f'/api/especialidades/{self.especialidad.pk}/agenda/'
+        for registro, campo, valor, mostrado in [
+            (self.paciente, 'nombre', 'Juana', 'paciente_nombre'),
+            (self.otro_medico, 'apellido', 'Vera', 'medico_nombre'),
+            (self.especialidad, 'nombre', 'Cardiología Adultos', 'especialidad_nombre'),
+        ]:
+            with self.subTest(campo=mostrado):
+                etag = self.agenda(url, dia=self.lunes)['ETag']
+                setattr(registro, campo, valor)
+                registro.save()
+
+                response = self.agenda(url, etag=etag, dia=self.lunes)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(any(valor in cita[mostrado] for cita in response.data['citas']))
+
+    def test_dia_fuera_del_rango_visible(self):
+        response = self.agenda(f'/api/medicos/{self.medico.pk}/agenda/', dia=self.lunes + timedelta(days=10))
+        self.assertEqual(response.status_code, 400)
+
+
+# ============================================================================
+# PREVENCIÓN DE CITAS SUPERPUESTAS
+# ============================================================================
+
+class CitasSuperpuestasTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.inicio = timezone.make_aware(datetime.combine(date.today() + timedelta(days=7), time(10)))
+
+    def crear_cita(self, minutos=0, **kwargs):
+        datos = {'paciente': self.paciente, 'medico': self.medico,
+                 'fecha_hora_cita': self.inicio + timedelta(minutes=minutos)}
+        datos.update(kwargs)
+        return CitaMedica.objects.create(**datos)
+
+    def test_base_de_datos_rechaza_citas_solapadas(self):
+        self.crear_cita()
+        with self.assertRaises(IntegrityError) as error, transaction.atomic():
+            self.crear_cita(15, paciente=self.otro_paciente)
+        self.assertTrue(es_cita_superpuesta(error.exception))
+
+    def test_permite_citas_contiguas_canceladas_y_de_otro_medico(self):
+        self.crear_cita()
+        self.crear_cita(30)
+        self.crear_cita(0, estado='Cancelada')
+        self.crear_cita(0, medico=self.otro_medico)
+        self.assertEqual(CitaMedica.objects.count(), 4)
+
+    def test_reactivar_cita_cancelada_sobre_horario_ocupado(self):
+        self.crear_cita()
+        cancelada = self.crear_cita(10, estado='Cancelada')
+        cancelada.estado = 'Programada'
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            cancelada.save()
+
+    def test_formulario_muestra_error_de_superposicion(self):
+        self.crear_cita()
+        response = self.client.post('/citas/crear/', {
+            'paciente': self.otro_paciente.pk, 'medico': self.medico.pk,
+            'fecha_hora_cita': timezone.localtime(self.inicio).strftime('%Y-%m-%dT%H:%M'),
+            'duracion_minutos': 30, 'estado': 'Programada',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('fecha_hora_cita', response.context['form'].errors)
+        self.assertEqual(CitaMedica.objects.count(), 1)
+
+    def test_serializador_traduce_superposicion(self):
+        self.crear_cita()
+        serializer = CitaMedicaSerializer(data={
+            'paciente': self.otro_paciente.pk, 'medico': self.medico.pk,
+            'fecha_hora_cita': self.inicio + timedelta(minutes=20),
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        with self.assertRaises(ValidationError) as error:
+            serializer.save()
+        self.assertIn('fecha_hora_cita', error.exception.detail)
+
+
+
+# ============================================================================
+# SERIES DE CITAS RECURRENTES
+# ============================================================================
+
+class SeriesCitasTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        hoy = date.today()
+        self.lunes = hoy - timedelta(days=hoy.weekday()) + timedelta(days=7)
+
+    def a_las(self, dia, hora):
+        return timezone.make_aware(datetime.combine(dia, time(hora)))
+
+    def crear_serie(self, **datos):
+        return self.client.post('/api/series/', {
+            'paciente': self.paciente.pk, 'medico': self.medico.pk,
+            'dias_semana': [0, 2, 4], 'hora': '08:00', 'duracion_minutos': 60,
+            'fecha_inicio': self.lunes, 'fecha_fin': self.lunes + timedelta(weeks=4, days=-1),
+            **datos,
+        }, format='json')
+
+    def test_crea_todas_las_ocurrencias_en_consultas_fijas(self):
+        # paciente y médico (validación) + serie + conflictos + un solo INSERT de
+        # todas las citas, más los dos pares de savepoints de las transacciones
+        with self.assertNumQueries(9):
+            response = self.crear_serie()
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['citas_vigentes'], 12)
+        citas = CitaMedica.objects.filter(serie_id=response.data['id']).order_by('fecha_hora_cita')
+        self.assertEqual(citas.count(), 12)
+        self.assertEqual(citas[0].fecha_hora_fin - citas[0].fecha_hora_cita, timedelta(hours=1))
+
+    def test_intervalo_cada_dos_semanas(self):
+        response = self.crear_serie(dias_semana=[1], intervalo_semanas=2)
+        self.assertEqual(response.data['citas_vigentes'], 2)
+
+    def test_conflictos_rechazan_la_serie_completa(self):
+        CitaMedica.objects.create(
+            paciente=self.otro_paciente, medico=self.medico, fecha_hora_cita=self.a_las(self.lunes + timedelta(days=2), 8)
+        )
+
+        response = self.crear_serie()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['conflictos']), 1)
+        self.assertFalse(SerieCitas.objects.exists())
+        self.assertEqual(CitaMedica.objects.count(), 1)
+
+    def test_omitir_conflictos(self):
+        CitaMedica.objects.create(
+            paciente=self.otro_paciente, medico=self.medico, fecha_hora_cita=self.a_las(self.lunes, 8)
+        )
+
+        response = self.crear_serie(omitir_conflictos=True)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['citas_vigentes'], 11)
+        self.assertEqual(len(response.data['conflictos_omitidos']), 1)
+
+    def test_cancelar_esta_y_las_siguientes(self):
+        serie_id = self.crear_serie().data['id']
+
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                f'/api/series/{serie_id}/cancelar/', {'desde': self.lunes + timedelta(weeks=2)}, format='json'
+            )
+
+        self.assertEqual(response.data['canceladas'], 6)
+        self.assertEqual(CitaMedica.objects.filter(serie_id=serie_id, estado='Cancelada').count(), 6)
+
+    def test_reprogramar_esta_y_las_siguientes(self):
+        serie_id = self.crear_serie().data['id']
+        desde = self.lunes + timedelta(weeks=3)
+
+        response = self.client.post(
+            f'/api/series/{serie_id}/reprogramar/',
+            {'desde': desde, 'hora': '09:30', 'medico': self.otro_medico.pk}, format='json'
+        )
+
+        self.assertEqual(response.data['actualizadas'], 3)
+        movida = CitaMedica.objects.get(serie_id=serie_id, fecha_hora_cita__date=desde)
+        self.assertEqual(timezone.localtime(movida.fecha_hora_cita).time(), time(9, 30))
+        self.assertEqual(timezone.localtime(movida.fecha_hora_fin).time(), time(10, 30))
+        self.assertEqual(movida.medico, self.otro_medico)
+
+    def test_reprogramar_dos_veces_parte_del_horario_vigente(self):
+        serie_id = self.crear_serie().data['id']
+        desde = self.lunes + timedelta(weeks=3)
+
+        for hora in ('09:00', '09:30'):
+            response = self.client.post(
+                f'/api/series/{serie_id}/reprogramar/', {'desde': desde, 'hora': hora}, format='json'
+            )
+            self.assertEqual(response.data['actualizadas'], 3)
+
+        movida = CitaMedica.objects.get(serie_id=serie_id, fecha_hora_cita__date=desde)
+        self.assertEqual(timezone.localtime(movida.fecha_hora_cita).time(), time(9, 30))
+        self.assertEqual(SerieCitas.objects.get(pk=serie_id).hora, time(9, 30))
+
+    def test_reprogramar_con_conflicto_no_modifica_nada(self):
+        serie_id = self.crear_serie().data['id']
+        desde = self.lunes + timedelta(weeks=3)
+        CitaMedica.objects.create(paciente=self.otro_paciente, medico=self.medico, fecha_hora_cita=self.a_las(desde, 9))
+
+        response = self.client.post(
+            f'/api/series/{serie_id}/reprogramar/', {'desde': desde, 'duracion_minutos': 90}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CitaMedica.objects.filter(serie_id=serie_id, duracion_minutos=90).exists())
+
+
+
+# ============================================================================
+# OPERACIONES MASIVAS SOBRE CITAS
+# ============================================================================
+
+class OperacionesMasivasCitasTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.manana = timezone.localdate() + timedelta(days=1)
+
+    def cita(self, dia, hora, medico=None, **kwargs):
+        return CitaMedica.objects.create(
+            paciente=self.paciente, medico=medico or self.medico,
+            fecha_hora_cita=timezone.make_aware(datetime.combine(dia, time(hora))), **kwargs
+        )
+
+    def test_confirmar_citas_de_manana(self):
+        self.cita(self.manana, 9)
+        self.cita(self.manana, 10, medico=self.otro_medico)
+        self.cita(self.manana, 11, estado='Cancelada')
+        pasado_manana = self.cita(self.manana + timedelta(days=1), 9)
+
+        response = self.client.post(
+            f'/api/citas/cambiar_estado/?fecha_desde={self.manana}&fecha_hasta={self.manana}',
+            {'estado': 'Confirmada'}, format='json'
+        )
+
+        self.assertEqual(response.data, {'actualizadas': 2, 'omitidas': 1})
+        self.assertEqual(CitaMedica.objects.filter(estado='Confirmada').count(), 2)
+        pasado_manana.refresh_from_db()
+        self.assertEqual(pasado_manana.estado, 'Programada')
+
+    def test_cambiar_estado_exige_filtro(self):
+        self.cita(self.manana, 9)
+        response = self.client.post('/api/citas/cambiar_estado/', {'estado': 'Cancelada'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CitaMedica.objects.filter(estado='Cancelada').exists())
+
+    def test_reactivar_canceladas_en_horario_ocupado(self):
+        self.cita(self.manana, 9, estado='Cancelada')
+        self.cita(self.manana, 9)
+        response = self.client.post(
+            '/api/citas/cambiar_estado/?estado=Cancelada', {'estado': 'Programada'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def crear_horario_completo(self, medico):
+        HorarioMedico.objects.bulk_create([
+            HorarioMedico(medico=medico, dia_semana=dia, hora_inicio=time(8), hora_fin=time(18))
+            for dia in range(7)
+        ])
+
+    def test_reasignar_citas_futuras(self):
+        self.crear_horario_completo(self.otro_medico)
+        self.cita(self.manana, 9)
+        self.cita(self.manana, 15)
+        self.cita(self.manana, 16, estado='Realizada')
+        pasada = self.cita(timezone.localdate() - timedelta(days=1), 9)
+
+        response = self.client.post('/api/citas/reasignar/', {
+            'medico_origen': self.medico.pk, 'medico_destino': self.otro_medico.pk,
+        }, format='json')
+
+        self.assertEqual(response.data, {'reasignadas': 2})
+        self.assertEqual(CitaMedica.objects.filter(medico=self.otro_medico).count(), 2)
+        pasada.refresh_from_db()
+        self.assertEqual(pasada.medico, self.medico)
+
+    def test_reasignar_con_choque_no_mueve_nada(self):
+        self.crear_horario_completo(self.otro_medico)
+        self.cita(self.manana, 9)
+        self.cita(self.manana, 10)
+        CitaMedica.objects.create(
+            paciente=self.otro_paciente, medico=self.otro_medico,
+            fecha_hora_cita=timezone.make_aware(datetime.combine(self.manana, time(10, 15)))
+        )
+
+        response = self.client.post('/api/citas/reasignar/', {
+            'medico_origen': self.medico.pk, 'medico_destino': self.otro_medico.pk,
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['conflictos']), 1)
+        self.assertEqual(CitaMedica.objects.filter(medico=self.medico).count(), 2)
+
+    def test_reasignar_respeta_horario_del_destino(self):
+        HorarioMedico.objects.create(
+            medico=self.otro_medico, dia_semana=self.manana.weekday(), hora_inicio=time(8), hora_fin=time(12)
+        )
+        self.cita(self.manana, 9)
+        self.cita(self.manana, 14)
+        datos = {'medico_origen': self.medico.pk, 'medico_destino': self.otro_medico.pk}
+
+        response = self.client.post('/api/citas/reasignar/', datos, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['fuera_de_horario']), 1)
+
+        response = self.client.post('/api/citas/reasignar/', {**datos, 'ignorar_horario': True}, format='json')
+        self.assertEqual(response.data, {'reasignadas': 2})
+
+    def test_crud_de_citas_traduce_superposicion(self):
+        self.cita(self.manana, 9)
+        response = self.client.post('/api/citas/', {
+            'paciente': self.otro_paciente.pk, 'medico': self.medico.pk,
+            'fecha_hora_cita': timezone.make_aware(datetime.combine(self.manana, time(9, 10))),
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fecha_hora_cita', response.data)
+
+
+# ============================================================================
+# INVENTARIO Y LIBRO DE MOVIMIENTOS
+# ============================================================================
+
+class InventarioTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        consulta = self.crear_consultas(1)[0]
+        self.tratamiento = Tratamiento.objects.create(
+            consulta=consulta, descripcion='Analgesia',
+            fecha_inicio=date.today(), fecha_fin=date.today() + timedelta(days=5),
+        )
+
+    def recetar(self, cantidad, medicamento=None):
+        return RecetaMedica.objects.create(
+            tratamiento=self.tratamiento, medicamento=medicamento or self.medicamento,
+            cantidad=cantidad, frecuencia='Cada 8 horas', duracion='5 días',
+        )
+
+    def stock(self, medicamento=None):
+        return Medicamento.objects.values_list('stock', flat=True).get(pk=(medicamento or self.medicamento).pk)
+
+    def test_receta_descuenta_stock_y_registra_dispensacion(self):
+        receta = self.recetar(30)
+
+        self.assertEqual(self.stock(), 70)
+        movimiento = self.medicamento.movimientos.first()
+        self.assertEqual(
+            (movimiento.tipo, movimiento.cantidad, movimiento.stock_resultante, movimiento.receta_id),
+            ('Dispensación', -30, 70, receta.pk),
+        )
+
+    def test_stock_insuficiente_rechaza_la_receta_sin_cambios(self):
+        with self.assertRaises(StockInsuficiente):
+            self.recetar(101)
+
+        response = self.client.post('/api/recetas/', {
+            'tratamiento': self.tratamiento.pk, 'medicamento': self.medicamento.pk,
+            'cantidad': 150, 'frecuencia': 'Cada 8 horas', 'duracion': '5 días',
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cantidad', response.data)
+        self.assertEqual(self.stock(), 100)
+        self.assertFalse(RecetaMedica.objects.exists())
+        self.assertEqual(self.medicamento.movimientos.count(), 1)
+
+    def test_editar_o_eliminar_receta_mueve_solo_la_diferencia(self):
+        otro = Medicamento.objects.create(
+            nombre='Ibuprofeno', stock=20, precio_unitario=Decimal('900.00'),
+            fecha_vencimiento=date.today() + timedelta(days=365),
+        )
+        receta = self.recetar(10)
+        receta.cantidad = 4
+        receta.save()
+        self.assertEqual(self.stock(), 96)
+
+        receta.medicamento = otro
+        receta.save()
+        self.assertEqual((self.stock(), self.stock(otro)), (100, 16))
+
+        receta.delete()
+        self.assertEqual(self.stock(otro), 20)
+        self.assertEqual(
+            list(self.medicamento.movimientos.order_by('id').values_list('tipo', 'cantidad')),
+            [('Ingreso', 100), ('Dispensación', -10), ('Devolución', 6), ('Devolución', 4)],
+        )
+
+    def test_guardar_medicamento_desactualizado_no_pisa_el_stock(self):
+        desactualizado = Medicamento.objects.get(pk=self.medicamento.pk)
+        self.recetar(25)
+
+        desactualizado.nombre = 'Paracetamol 500 mg'
+        desactualizado.save()
+        response = self.client.patch(f'/api/medicamentos/{self.medicamento.pk}/', {'stock': 999}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stock(), 75)
+
+    def test_registrar_ingresos_y_ajustes(self):
+        url = f'/api/medicamentos/{self.medicamento.pk}/movimientos/'
+        lote = self.medicamento.lotes.get().pk
+        response = self.client.post(url, {'tipo': 'Ingreso', 'cantidad': 50, 'lote': lote, 'observacion': 'Compra'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['stock_resultante'], 150)
+
+        self.assertEqual(self.client.post(url, {'tipo': 'Dispensación', 'cantidad': -1, 'lote': lote}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'tipo': 'Ajuste', 'cantidad': -5}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'tipo': 'Ajuste', 'cantidad': -151, 'lote': lote}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(url, {'tipo': 'Ajuste', 'cantidad': -5, 'lote': lote}, format='json').status_code, 201)
+
+        response = self.client.get(url)
+        self.assertEqual([m['stock_resultante'] for m in response.data['results']], [145, 150, 100])
+
+    def test_stock_en_fecha_usa_el_ultimo_movimiento_del_dia(self):
+        hace_una_semana = timezone.now() - timedelta(days=7)
+        with mock.patch('django.utils.timezone.now', return_value=hace_una_semana):
+            MovimientoInventario.objects.filter(medicamento=self.medicamento).delete()
+            MovimientoInventario.objects.create(
+                medicamento=self.medicamento, tipo='Ingreso', cantidad=100, stock_resultante=100,
+            )
+        self.recetar(40)
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/medicamentos/stock_en_fecha/', {'fecha': (date.today() - timedelta(days=3)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [{'medicamento': self.medicamento.pk, 'nombre': 'Paracetamol', 'stock': 100}])
+
+        response = self.client.get('/api/medicamentos/stock_en_fecha/', {'fecha': date.today().isoformat()})
+        self.assertEqual(response.data['results'][0]['stock'], 60)
+        response = self.client.get('/api/medicamentos/stock_en_fecha/', {'fecha': (date.today() - timedelta(days=30)).isoformat()})
+        self.assertEqual(response.data['results'][0]['stock'], 0)
+        self.assertEqual(self.client.get('/api/medicamentos/stock_en_fecha/').status_code, 400)
+
+    def test_el_libro_es_de_solo_insercion(self):
+        movimiento = self.medicamento.movimientos.first()
+        with self.assertRaises(ValueError):
+            movimiento.save()
+        with self.assertRaises(Exception), transaction.atomic():
+            MovimientoInventario.objects.filter(pk=movimiento.pk).update(cantidad=1)
+        self.assertEqual(MovimientoInventario.objects.get(pk=movimiento.pk).cantidad, 100)
+
+    def test_eliminar_tratamiento_devuelve_stock_y_medicamento_elimina_su_libro(self):
+        self.recetar(5)
+        self.tratamiento.delete()
+        self.assertEqual(self.stock(), 100)
+
+        self.medicamento.delete()
+        self.assertFalse(MovimientoInventario.objects.exists())
+
+
+# ============================================================================
+# LOTES DE MEDICAMENTO (FEFO)
+# ============================================================================
+
+class LotesMedicamentoTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        consulta = self.crear_consultas(1)[0]
+        self.tratamiento = Tratamiento.objects.create(
+            consulta=consulta, descripcion='Analgesia',
+            fecha_inicio=date.today(), fecha_fin=date.today() + timedelta(days=5),
+        )
+        self.lote_inicial = self.medicamento.lotes.get()
+        self.lote_proximo = recibir_lote(self.medicamento.pk, 5, date.today() + timedelta(days=20), codigo='B-20')
+        self.lote_vencido = recibir_lote(self.medicamento.pk, 50, date.today() - timedelta(days=1), codigo='C-VENC')
+
+    def recetar(self, cantidad):
+        return RecetaMedica.objects.create(
+            tratamiento=self.tratamiento, medicamento=self.medicamento,
+            cantidad=cantidad, frecuencia='Cada 8 horas', duracion='5 días',
+        )
+
+    def cantidades(self):
+        return dict(self.medicamento.lotes.values_list('codigo', 'cantidad'))
+
+    def test_stock_y_vencimiento_son_agregados_de_los_lotes(self):
+        self.medicamento.refresh_from_db()
+        self.assertEqual(self.medicamento.stock, 155)
+        self.assertEqual(self.medicamento.fecha_vencimiento, self.lote_vencido.fecha_vencimiento)
+        self.assertTrue(self.medicamento.proximo_vencimiento)
+
+        # Descartar el lote vencido deja como próximo vencimiento el del lote B
+        registrar_movimiento(self.medicamento.pk, -50, 'Ajuste', lote=self.lote_vencido, observacion='Descarte')
+        self.medicamento.refresh_from_db()
+        self.assertEqual((self.medicamento.stock, self.medicamento.fecha_vencimiento), (105, self.lote_proximo.fecha_vencimiento))
+
+    def test_dispensacion_fefo_omite_lotes_vencidos(self):
+        receta = self.recetar(8)
+
+        self.assertEqual(self.cantidades(), {'': 97, 'B-20': 0, 'C-VENC': 50})
+        self.assertEqual(
+            list(MovimientoInventario.objects.filter(receta=receta).order_by('id').values_list('lote__codigo', 'cantidad', 'stock_resultante')),
+            [('B-20', -5, 150), ('', -3, 147)],
+        )
+
+    def test_dispensacion_es_una_consulta_bloqueante_por_lotes(self):
+        # Savepoint, UPDATE del stock, UPDATE FEFO de los lotes, vencimiento e INSERT del libro
+        with self.assertNumQueries(6):
+            registrar_movimiento(self.medicamento.pk, -8, 'Dispensación')
+
+    def test_sin_lotes_vigentes_suficientes_no_se_dispensa(self):
+        # El stock (155) alcanza, pero solo 105 unidades están en lotes vigentes
+        with self.assertRaises(StockInsuficiente):
+            self.recetar(120)
+        self.medicamento.refresh_from_db()
+        self.assertEqual(self.medicamento.stock, 155)
+        self.assertEqual(self.cantidades(), {'': 100, 'B-20': 5, 'C-VENC': 50})
+
+    def test_stock_vigente_y_alertas_omiten_lotes_vencidos(self):
+        # Un lote vencido de 50 y uno vigente de 4
+        medicamento = Medicamento.objects.create(
+            nombre='Amoxicilina', stock=50, precio_unitario=Decimal('800.00'),
+            fecha_vencimiento=date.today() - timedelta(days=3),
+        )
+        recibir_lote(medicamento.pk, 4, date.today() + timedelta(days=90), codigo='V-90')
+
+        response = self.client.get(f'/api/medicamentos/{medicamento.pk}/')
+        self.assertEqual((response.data['stock'], response.data['stock_vigente']), (54, 4))
+        self.assertEqual(response.data['vencimiento_vigente'], (date.today() + timedelta(days=90)).isoformat())
+        self.assertTrue(response.data['stock_bajo'])
+        self.assertFalse(response.data['proximo_vencimiento'])
+        self.assertIn('Amoxicilina', [m['nombre'] for m in self.client.get('/api/medicamentos/stock_bajo/').data])
+        self.assertNotIn('Amoxicilina', [m['nombre'] for m in self.client.get('/api/medicamentos/proximos_vencimiento/').data])
+
+        # La verificación del stock rechaza lo que supera los lotes vigentes sin tocar nada
+        with self.assertRaisesMessage(StockInsuficiente, 'Stock insuficiente para entregar 5 unidades.'):
+            registrar_movimiento(medicamento.pk, -5, 'Dispensación')
+        registrar_movimiento(medicamento.pk, -4, 'Dispensación')
+        medicamento = Medicamento.objects.con_stock_vigente().get(pk=medicamento.pk)
+        self.assertEqual((medicamento.stock, medicamento.stock_vigente), (50, 0))
+
+    def test_devolucion_vuelve_a_los_lotes_de_origen(self):
+        receta = self.recetar(8)
+        receta.cantidad = 2
+        receta.save()
+        self.assertEqual(self.cantidades(), {'': 100, 'B-20': 3, 'C-VENC': 50})
+
+        receta.delete()
+        self.assertEqual(self.cantidades(), {'': 100, 'B-20': 5, 'C-VENC': 50})
+
+    def test_api_de_lotes_y_alertas_de_vencimiento(self):
+        url = f'/api/medicamentos/{self.medicamento.pk}/lotes/'
+        response = self.client.post(url, {'codigo': 'D-10', 'cantidad': 7, 'fecha_vencimiento': (date.today() + timedelta(days=10)).isoformat()}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.client.post(url, {'cantidad': 0, 'fecha_vencimiento': date.today().isoformat()}, format='json').status_code, 400)
+
+        response = self.client.get(url)
+        self.assertEqual([lote['codigo'] for lote in response.data], ['C-VENC', 'D-10', 'B-20', ''])
+
+        response = self.client.get('/api/medicamentos/lotes_por_vencer/', {'dias': 15})
+        self.assertEqual([(lote['codigo'], lote['medicamento_nombre']) for lote in response.data], [('C-VENC', 'Paracetamol'), ('D-10', 'Paracetamol')])
+
+        response = self.client.get('/api/medicamentos/proximos_vencimiento/')
+        self.assertEqual([m['nombre'] for m in response.data], ['Paracetamol'])
+        self.assertEqual(
+            self.client.patch(f'/api/medicamentos/{self.medicamento.pk}/', {'stock': 1, 'fecha_vencimiento': '2099-01-01'}, format='json').data['stock'],
+            162,
+        )
+
+
+# ============================================================================
+# REPORTES DE COSTOS DE RECETAS
+# ============================================================================
+
+class CostosRecetasTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        consulta, otra_consulta = self.crear_consultas(2)
+        otra_consulta.medico = self.otro_medico
+        otra_consulta.save()
+        self.tratamiento = Tratamiento.objects.create(
+            consulta=consulta, descripcion='Analgesia',
+            fecha_inicio=date.today(), fecha_fin=date.today() + timedelta(days=5),
+        )
+        self.otro_tratamiento = Tratamiento.objects.create(
+            consulta=otra_consulta, descripcion='Control',
+            fecha_inicio=date.today(), fecha_fin=date.today() + timedelta(days=5),
+        )
+
+    def recetar(self, cantidad, tratamiento=None):
+        return RecetaMedica.objects.create(
+            tratamiento=tratamiento or self.tratamiento, medicamento=self.medicamento,
+            cantidad=cantidad, frecuencia='Cada 8 horas', duracion='5 días',
+        )
+
+    def test_costo_usa_el_precio_al_prescribir(self):
+        receta = self.recetar(2)
+        self.medicamento.precio_unitario = Decimal('2000.00')
+        self.medicamento.save()
+
+        receta.refresh_from_db()
+        self.assertEqual((receta.precio_unitario, receta.costo_total), (Decimal('1500.00'), Decimal('3000.00')))
+        self.assertEqual(self.recetar(1).precio_unitario, Decimal('2000.00'))
+
+        receta.cantidad = 3
+        receta.save()
+        receta.refresh_from_db()
+        self.assertEqual(receta.costo_total, Decimal('4500.00'))
+
+    def test_reporte_de_costos_por_agrupacion(self):
+        self.recetar(2)
+        self.recetar(4)
+        self.recetar(1, tratamiento=self.otro_tratamiento)
+
+        # Conteo de la paginación y un único GROUP BY
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/recetas/costos/', {'por': 'medico'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(fila['medico'], fila['recetas'], fila['unidades'], fila['costo']) for fila in response.data['results']],
+            [(self.medico.pk, 2, 6, Decimal('9000.00')), (self.otro_medico.pk, 1, 1, Decimal('1500.00'))],
+        )
+
+        response = self.client.get('/api/recetas/costos/', {'por': 'paciente'})
+        self.assertEqual([fila['rut'] for fila in response.data['results']], ['33333333-3', '44444444-4'])
+        response = self.client.get('/api/recetas/costos/', {'por': 'tratamiento'})
+        self.assertEqual([fila['descripcion'] for fila in response.data['results']], ['Analgesia', 'Control'])
+
+        response = self.client.get('/api/recetas/costos/', {'por': 'mes', 'desde': date.today().isoformat()})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['costo'], Decimal('10500.00'))
+        response = self.client.get('/api/recetas/costos/', {'por': 'mes', 'hasta': (date.today() - timedelta(days=1)).isoformat()})
+        self.assertEqual(response.data['results'], [])
+
+        self.assertEqual(self.client.get('/api/recetas/costos/', {'por': 'año'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/recetas/costos/', {'por': 'mes', 'desde': 'ayer'}).status_code, 400)
+
+
+# ============================================================================
+# DATOS SINTÉTICOS PARA PRUEBAS DE CARGA
+# ============================================================================
+
+class DatosSinteticosTests(SaludVitalTestCase):
+
+    def parametros(self, semilla=1):
+        return Parametros(
+            semilla=semilla, total_pacientes=30, tamano_bloque=10, consultas_por_paciente=5,
+            desde=date(2025, 1, 1), hasta=date(2026, 1, 1), zona_horaria=timezone.get_current_timezone(),
+            base_paciente=1, base_historial=1, base_consulta=1, base_tratamiento=1, base_receta=1,
+            medicos=((self.medico.pk, 1.0), (self.otro_medico.pk, 2.0)),
+            medicamentos=((self.medicamento.pk, self.medicamento.precio_unitario, 1.0),),
+        )
+
+    def test_rut_con_digito_verificador_y_unico_por_id(self):
+        self.assertEqual(digito_verificador(12345678), '5')
+        self.assertEqual(digito_verificador(11111111), '1')
+        ruts = {rut_desde_id(indice, RANGO_RUT_PACIENTES) for indice in range(1, 5001)}
+        self.assertEqual(len(ruts), 5000)
+        for rut in list(ruts)[:50]:
+            numero, digito = rut.split('-')
+            self.assertEqual(digito_verificador(int(numero)), digito)
+
+    def test_bloques_reproducibles_y_con_rangos_de_ids_propios(self):
+        parametros = self.parametros()
+        self.assertEqual(generar_bloque(1, parametros), generar_bloque(1, parametros))
+        self.assertNotEqual(generar_bloque(1, parametros), generar_bloque(1, self.parametros(semilla=2)))
+
+        bloques = [generar_bloque(bloque, parametros) for bloque in range(parametros.bloques)]
+        for tabla in ('paciente', 'consulta', 'tratamiento', 'receta'):
+            ids = [fila[0] for filas in bloques for fila in filas[tabla]]
+            self.assertEqual(len(ids), len(set(ids)), tabla)
+        self.assertEqual(sum(len(filas['paciente']) for filas in bloques), 30)
+
+    def test_comando_carga_los_datos_con_copy(self):
+        call_command(
+            'generate_data', escala=0.0002, workers=0, bloque=50, semilla=3,
+            hasta=date(2026, 6, 30), stdout=StringIO(),
+        )
+
+        self.assertEqual(Paciente.objects.count(), 2 + 200)
+        consultas = ConsultaMedica.objects.filter(paciente__rut__in=Paciente.objects.exclude(pk__in=[self.paciente.pk, self.otro_paciente.pk]).values('rut'))
+        self.assertGreater(consultas.count(), 200)
+        receta = RecetaMedica.objects.select_related('medicamento').first()
+        self.assertEqual(receta.costo_total, receta.cantidad * receta.precio_unitario)
+        self.assertFalse(ConsultaMedica.objects.filter(fecha_consulta__date__gt=date(2026, 6, 30)).exists())
+        # Cada receta generada tiene su dispensación, el stock es la suma del libro
+        # y cada stock resultante es el saldo del libro hasta ese movimiento
+        self.assertEqual(
+            MovimientoInventario.objects.filter(tipo='Dispensación').count(),
+            RecetaMedica.objects.count(),
+        )
+        for medicamento in Medicamento.objects.all():
+            saldo, libro = 0, medicamento.movimientos.order_by('creado_en', 'id')
+            for movimiento in libro:
+                saldo += movimiento.cantidad
+                self.assertEqual(movimiento.stock_resultante, saldo, movimiento)
+            self.assertEqual(medicamento.stock, saldo, medicamento)
+            self.assertEqual(
+                medicamento.stock,
+                medicamento.lotes.aggregate(total=Sum('cantidad'))['total'],
+            )
+        self.assertEqual(stock_en_fecha(timezone.localdate()), {
+            medicamento_id: stock for medicamento_id, stock in Medicamento.objects.values_list('id', 'stock')
+        })
+        # Las secuencias quedan después de los ids asignados por bloque
+        Paciente.objects.create(rut='99999999-9', nombre='Nuevo', apellido='Paciente', fecha_nacimiento=date(2000, 1, 1))
+
+
+# ============================================================================
+# CARGA DE DATOS INICIALES
+# ============================================================================
+
+class DatosInicialesTests(SaludVitalTestCase):
+
+    def test_carga_reemplaza_los_datos_con_un_insert_por_modelo(self):
+        with self.assertNumQueries(25):
+            cargados = cargar('v1')
+
+        self.assertEqual(cargados['pacientes'], 3)
+        self.assertFalse(Paciente.objects.filter(rut='33333333-3', nombre='Paciente').exists())
+        self.assertEqual(Medico.objects.get(rut='12345678-9').especialidad.nombre, 'Cardiología')
+
+        # Lo que harían save() y las señales: precio congelado, lote, saldo inicial y dispensación
+        receta = RecetaMedica.objects.get(medicamento__nombre='Paracetamol')
+        self.assertEqual(receta.costo_total, Decimal('45000.00'))
+        paracetamol = receta.medicamento
+        self.assertEqual(paracetamol.stock, 70)
+        self.assertEqual(paracetamol.fecha_vencimiento, date.today() + timedelta(days=365))
+        self.assertEqual(list(paracetamol.lotes.values_list('cantidad', flat=True)), [70])
+        self.assertEqual(
+            list(paracetamol.movimientos.order_by('id').values_list('tipo', 'cantidad', 'stock_resultante', 'receta')),
+            [('Ingreso', 100, 100, None), ('Dispensación', -30, 70, receta.pk)],
+        )
+        self.assertEqual(stock_en_fecha(date.today())[paracetamol.pk], 70)
+
+        # Los ids y secuencias se reinician en cada carga
+        primera = list(Paciente.objects.order_by('id').values_list('id', 'rut'))
+        cargar('v1')
+        self.assertEqual(list(Paciente.objects.order_by('id').values_list('id', 'rut')), primera)
+        Paciente.objects.create(rut='99999999-9', nombre='Nuevo', apellido='Paciente', fecha_nacimiento=date(2000, 1, 1))
+
+    def test_archivos_invalidos_no_modifican_nada(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        shutil.copytree(DIRECTORIO_DATOS / 'v1', f'{directorio}/v1')
+        shutil.copytree(DIRECTORIO_DATOS / 'v1', f'{directorio}/v2')
+        with open(f'{directorio}/v2/medicos.csv', 'a', encoding='utf-8') as archivo:
+            archivo.write('45678901-2,Ana,Soto,,Dermatología\n')
+
+        with self.assertRaisesMessage(ErrorDeCarga, 'especialidad "Dermatología" no existe'):
+            cargar(directorio=directorio)
+        self.assertTrue(Paciente.objects.filter(pk=self.paciente.pk).exists())
+
+        with self.assertRaisesMessage(CommandError, 'La versión v3 no existe'):
+            call_command('load_initial_data', version_datos='v3', directorio=directorio, stdout=StringIO())
+        call_command('load_initial_data', version_datos='v1', directorio=directorio, stdout=StringIO())
+        self.assertEqual(Medico.objects.count(), 3)
+
+
+# ============================================================================
+# BENCHMARK DE RUTAS
+# ============================================================================
+
+class BenchmarkRutasTests(SaludVitalTestCase):
+
+    def test_catalogo_cubre_todas_las_rutas_con_nombre(self):
+        call_command('load_initial_data', stdout=StringIO())
+        solicitudes_, omitidas = solicitudes(filas_de_muestra())
+
+        # Sin citas ni series no se pueden armar sus rutas de detalle
+        self.assertIn('citamedica-detail', omitidas)
+        self.assertIn('seriecitas-cancelar', omitidas)
+        nombres = {solicitud.nombre for solicitud in solicitudes_}
+        self.assertEqual(nombres | set(omitidas), set(rutas()))
+        self.assertIn('dashboard', nombres)
+        self.assertIn('medicamento-stock-en-fecha', nombres)
+
+        por_nombre = {solicitud.nombre: solicitud for solicitud in solicitudes_}
+        self.assertEqual(por_nombre['pacientes_delete'].metodo, 'POST')
+        self.assertTrue(por_nombre['pacientes_delete'].modifica)
+        self.assertEqual(por_nombre['paciente-lote'].cuerpo, {'ids': [3, 2]})
+        self.assertFalse(por_nombre['batch-list'].modifica)
+
+    def test_comparar_detecta_regresiones_de_latencia_y_consultas(self):
+        self.assertEqual(percentil([5, 1, 4, 2, 3], 50), 3)
+        self.assertEqual(percentil(list(range(1, 101)), 95), 95)
+
+        def resultado(**rutas_):
+            return {'escalas': {'pequena': {'rutas': {
+                nombre: {'p95_ms': p95, 'consultas': consultas} for nombre, (p95, consultas) in rutas_.items()
+            }}}}
+
+        base = resultado(dashboard=(10.0, 5), rapida=(0.5, 2), lenta=(100.0, 3))
+        actual = resultado(dashboard=(11.0, 5), rapida=(1.2, 2), lenta=(130.0, 4), nueva=(999.0, 99))
+        self.assertEqual(
+            [(ruta, detalle.split()[0]) for _, ruta, detalle in comparar(base, actual, umbral=0.2, minimo_ms=1.0)],
+            [('lenta', 'p95'), ('lenta', 'consultas')],
+        )
+
+
+# ============================================================================
+# PRESUPUESTO DE CONSULTAS SQL POR RUTA
+# ============================================================================
+
+class PresupuestoConsultasTests(TestCase):
+    """Cada vista HTML y acción de la API ejecuta pocas consultas SQL y no más
+    al crecer los datos (y con ellos las filas de cada página): un N+1 nuevo
+    en una plantilla o serializador hace fallar la ruta"""
+
+    # Consultas por omisión de cada ruta; las que necesitan más se declaran aparte
+    PRESUPUESTO = 8
+    PRESUPUESTOS = {
+        'sync-list': 13,
+        'recetas_delete': 12,
+        'citamedica-reasignar': 9,
+    }
+    # Eliminan en cascada: cada fila eliminada deja su tombstone y cada receta
+    # devuelve su stock, así que las consultas crecen con lo eliminado
+    PROPORCIONALES_A_LO_ELIMINADO = {'pacientes_delete', 'consultas_delete', 'tratamientos_delete'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('presupuesto', 'presupuesto@example.com', 'clave-segura-123')
+        cls.sembrar(semilla=1)
+
+    @staticmethod
+    def sembrar(semilla):
+        sembrar(0.00001, semilla, bloque=10, consultas_por_paciente=3, semanas=2, stdout=StringIO())
+
+    def medir(self):
+        """{ruta: (contador SQL, código de estado)} de una solicitud a cada ruta"""
+        cliente = Client(raise_request_exception=False)
+        cliente.force_login(self.usuario)
+        lista, omitidas = solicitudes(filas_de_muestra())
+        self.assertEqual(omitidas, {})
+        medidas = {}
+        for solicitud in lista:
+            contador = ContadorSQL()
+            with transaction.atomic():
+                with connection.execute_wrapper(contador):
+                    respuesta = ejecutar(cliente, solicitud)
+                transaction.set_rollback(True)
+            medidas[solicitud.nombre] = (contador, respuesta.status_code)
+        return medidas
+
+    def detalle(self, contador):
+        return '\n'.join(f'  {veces:>4} x {plantilla}' for plantilla, veces in contador.por_plantilla())
+
+    def test_consultas_acotadas_y_sin_crecer_con_los_datos(self):
+        pocos = self.medir()
+        self.sembrar(semilla=2)
+        self.sembrar(semilla=3)
+        muchos = self.medir()
+        self.assertEqual(set(muchos), set(rutas()))
+
+        for nombre, (contador, estado) in muchos.items():
+            with self.subTest(ruta=nombre):
+                self.assertLess(estado, 500)
+                if nombre in self.PROPORCIONALES_A_LO_ELIMINADO:
+                    continue
+                antes = len(pocos[nombre][0])
+                presupuesto = self.PRESUPUESTOS.get(nombre, self.PRESUPUESTO)
+                self.assertLessEqual(
+                    len(contador), presupuesto,
+                    f'{nombre}: {len(contador)} consultas (presupuesto {presupuesto}, {antes} con menos datos)\n'
+                    f'{self.detalle(contador)}',
+                )
+                self.assertLessEqual(
+                    len(contador), antes,
+                    f'{nombre}: {antes} -> {len(contador)} consultas al crecer los datos\n{self.detalle(contador)}',
+                )
+
+    def test_plantilla_ignora_el_largo_de_las_listas_de_parametros(self):
+        self.assertEqual(
+            plantilla_sql('SELECT * FROM t WHERE id IN (%s, %s, %s)'),
+            plantilla_sql('SELECT * FROM t WHERE id IN (%s, %s)'),
+        )
+        self.assertEqual(
+            plantilla_sql('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s)'), 'INSERT INTO t (a, b) VALUES (%s...), ...',
+        )
+        contador = ContadorSQL()
+        with connection.execute_wrapper(contador):
+            for ids in ([1, 2], [1, 2, 3], [1, 2, 3, 4]):
+                list(Paciente.objects.filter(pk__in=ids))
+        self.assertEqual(len(contador.por_plantilla()), 1)
+
+
+# ============================================================================
+# PERFIL SQL POR SOLICITUD
+# ============================================================================
+
+class PerfilSQLTests(SaludVitalTestCase):
+
+    @override_settings(PERFIL_SQL=True)
+    def test_informa_consultas_en_server_timing_y_log(self):
+        with self.assertLogs('salud_vital.perfil_sql', 'INFO') as logs:
+            response = self.client.get('/api/pacientes/')
+
+        self.assertEqual(response.status_code, 200)
+        metricas = [metrica.split(';')[0] for metrica in response['Server-Timing'].split(', ')]
+        self.assertEqual(metricas[:3], ['db', 'app', 'total'])
+        datos = logs.records[0].perfil_sql
+        self.assertEqual(datos['vista'], 'paciente-list')
+        self.assertEqual(datos['estado'], 200)
+        self.assertIn(f'desc="{datos["consultas"]} consultas"', response['Server-Timing'])
+
+    def test_detecta_duplicadas_y_plantillas_repetidas(self):
+        perfil = PerfilSQL()
+        with connection.execute_wrapper(perfil):
+            for _ in range(2):
+                for paciente in (self.paciente, self.otro_paciente):
+                    Paciente.objects.get(pk=paciente.pk)
+            Medico.objects.count()
+
+        self.assertEqual(len(perfil), 5)
+        self.assertEqual(perfil.duplicadas, 2)
+        sospechas = perfil.sospechas_n_mas_1(umbral=4)
+        self.assertEqual(len(sospechas), 1)
+        self.assertIn('FROM "pacientes"', sospechas[0][0])
+        self.assertEqual(sospechas[0][1], 4)
+
+    def test_desactivado_no_agrega_encabezado(self):
+        response = self.client.get('/api/pacientes/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+
+# ============================================================================
+# CONSULTAS LENTAS
+# ============================================================================
+
+@override_settings(CONSULTAS_LENTAS_UMBRAL_MS=0.001, CONSULTAS_LENTAS_EN_SEGUNDO_PLANO=False)
+class ConsultasLentasTests(SaludVitalTestCase):
+
+    def test_normaliza_sql_y_oculta_datos_personales(self):
+        self.assertEqual(
+            normalizar_sql("SELECT * FROM pacientes\n WHERE rut = '1-9' AND id IN (%s, %s, %s) LIMIT 21"),
+            'SELECT * FROM pacientes WHERE rut = ? AND id IN (%s...) LIMIT ?',
+        )
+        self.assertEqual(
+            huella(normalizar_sql("SELECT 1 FROM t1 WHERE a = 'x'")),
+            huella(normalizar_sql("SELECT 2 FROM t1 WHERE a = 'yy'")),
+        )
+        self.assertEqual(
+            ocultar_parametros(['%Pérez%', 7, None, date(1980, 5, 1), Decimal('1.5'), {'rut': '1-9'}]),
+            ['<texto:7>', 7, None, '<date>', 1.5, {'rut': '<texto:3>'}],
+        )
+
+    def test_guarda_consultas_lentas_con_plan_y_agrupa_por_huella(self):
+        for _ in range(2):
+            self.client.get('/api/pacientes/', {'search': 'Pérez'})
+
+        capturas = ConsultaLenta.objects.filter(vista='paciente-list', sql__contains='FROM "pacientes"')
+        self.assertTrue(capturas.exists())
+        for captura in capturas:
+            self.assertNotIn('Pérez', str(captura.parametros))
+            self.assertIn('actual time', captura.plan)
+            self.assertIn('Buffers', captura.plan)
+
+        grupo = resumen_por_huella().get(huella=capturas[0].huella)
+        self.assertEqual(grupo['veces'], 2)
+        self.assertLessEqual(grupo['p50_ms'], grupo['p95_ms'])
+        self.assertEqual(grupo['plan'], capturas[0].plan)
+
+    def test_plan_y_error_sin_valores_de_los_parametros(self):
+        rut = '12.345.678-9'
+        captura = capturar(
+            f'SELECT * FROM {Paciente._meta.db_table} WHERE rut ILIKE %s AND id > %s', [f'%{rut}%', 424242],
+            'paciente-list', 0.5,
+        )
+        fallida = capturar(
+            f'SELECT * FROM {Paciente._meta.db_table} WHERE fecha_nacimiento = %s', [rut], 'paciente-list', 0.5
+        )
+
+        self.assertIn('Filter:', captura.plan)
+        self.assertIn('Rows Removed by Filter', captura.plan)
+        self.assertTrue(fallida.plan.startswith('Sin plan:'))
+        for plan in (captura.plan, fallida.plan):
+            self.assertNotIn(rut, plan)
+            self.assertNotIn('424242', plan)
+
+    @override_settings(CONSULTAS_LENTAS_MAXIMO=3)
+    def test_tabla_acotada_y_admin_por_huella(self):
+        for _ in range(3):
+            self.client.get('/api/pacientes/')
+        self.assertEqual(ConsultaLenta.objects.count(), 3)
+
+        admin = User.objects.create_superuser('admin-lentas', password='clave-segura-123')
+        cliente = Client()
+        cliente.force_login(admin)
+        response = cliente.get('/admin/salud_vital/consultalenta/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'p95 ms')
+        captura = ConsultaLenta.objects.first()
+        response = cliente.get('/admin/salud_vital/consultalenta/', {'huella': captura.huella})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, captura.vista)
+
+
+# ============================================================================
+# MÉTRICAS PROMETHEUS
+# ============================================================================
+
+class MetricasTests(SaludVitalTestCase):
+
+    def muestra(self, nombre, **etiquetas):
+        return REGISTRY.get_sample_value(nombre, etiquetas) or 0
+
+    def test_metricas_de_solicitudes_cache_y_dominio(self):
+        ConsultaMedica.objects.create(
+            paciente=self.paciente, medico=self.medico, fecha_consulta=timezone.now(), motivo='Control'
+        )
+        registrar_movimiento(self.medicamento.pk, -95, 'Ajuste')
+        lista = {'vista': 'paciente-list', 'metodo': 'GET'}
+        solicitudes_antes = self.muestra('salud_vital_solicitud_segundos_count', **lista)
+        consultas_antes = self.muestra('salud_vital_solicitud_consultas_sql_sum', **lista)
+        fallos_antes = self.muestra('salud_vital_cache_total', recurso='ficha', resultado='fallo')
+        aciertos_antes = self.muestra('salud_vital_cache_total', recurso='ficha', resultado='acierto')
+
+        self.client.get('/api/pacientes/')
+        for _ in range(2):
+            self.client.get(f'/api/pacientes/{self.paciente.pk}/ficha/')
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertEqual(self.muestra('salud_vital_solicitud_segundos_count', **lista), solicitudes_antes + 1)
+        self.assertGreater(self.muestra('salud_vital_solicitud_consultas_sql_sum', **lista), consultas_antes)
+        self.assertEqual(self.muestra('salud_vital_cache_total', recurso='ficha', resultado='fallo'), fallos_antes + 1)
+        self.assertEqual(self.muestra('salud_vital_cache_total', recurso='ficha', resultado='acierto'), aciertos_antes + 1)
+        contenido = response.content.decode()
+        self.assertIn('salud_vital_solicitud_sql_segundos_bucket{le="0.001",metodo="GET",vista="paciente-list"}', contenido)
+        self.assertIn('salud_vital_consultas_hoy 1.0', contenido)
+        self.assertIn('salud_vital_medicamentos_stock_bajo 1.0', contenido)
+
+    async def test_solicitudes_async_sin_pasar_por_un_hilo(self):
+        async def vista(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(MetricasMiddleware(vista)))
+        await self.async_client.aforce_login(self.usuario)
+        dashboard = {'vista': 'async_dashboard', 'metodo': 'GET'}
+        solicitudes_antes = self.muestra('salud_vital_solicitud_segundos_count', **dashboard)
+        consultas_antes = self.muestra('salud_vital_solicitud_consultas_sql_sum', **dashboard)
+
+        response = await self.async_client.get('/api/async/dashboard/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.muestra('salud_vital_solicitud_segundos_count', **dashboard), solicitudes_antes + 1)
+        # sesión, usuario, conteos, recientes y especialidades, en el hilo del ORM async
+        self.assertEqual(self.muestra('salud_vital_solicitud_consultas_sql_sum', **dashboard), consultas_antes + 5)
+
+    def test_rutas_inexistentes_no_crean_series_nuevas(self):
+        self.client.get('/no-existe/')
+        self.client.generic('PROPFIND', '/api/pacientes/')
+
+        self.assertGreater(self.muestra('salud_vital_solicitud_segundos_count', vista='<sin_ruta>', metodo='GET'), 0)
+        self.assertGreater(self.muestra('salud_vital_solicitud_segundos_count', vista='paciente-list', metodo='OTRO'), 0)
+
+
+# ============================================================================
+# PERFILADOR BAJO DEMANDA
+# ============================================================================
+
+class PerfiladorTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        self.enterContext(override_settings(PERFILADOR_DIRECTORIO=directorio, PERFILADOR_INTERVALO_MS=0.1))
+        self.staff = User.objects.create_user('perfilador', password='clave-segura-123', is_staff=True)
+        self.web = Client()
+        self.web.force_login(self.staff)
+
+    def test_perfila_con_firma_del_usuario_del_personal(self):
+        self.crear_consultas(30)
+
+        response = self.web.get(f'/medicos/{self.medico.pk}/', HTTP_X_PERFILAR=firmar(self.staff))
+
+        self.assertEqual(response.status_code, 200)
+        perfil = PerfilSolicitud.objects.get(pk=response['X-Perfil'])
+        self.assertEqual((perfil.vista, perfil.estado, perfil.usuario), ('medicos_detail', 200, self.staff))
+        self.assertGreater(perfil.muestras, 0)
+        pilas = (Path(settings.PERFILADOR_DIRECTORIO) / perfil.archivo).read_text().splitlines()
+        self.assertEqual(sum(int(linea.rsplit(' ', 1)[1]) for linea in pilas), perfil.muestras)
+        self.assertTrue(any('medicos_detail (views.py' in linea for linea in pilas))
+        self.assertFalse(any(linea.startswith('__call__ (middleware.py') for linea in pilas))
+
+    def test_sin_firma_valida_no_perfila(self):
+        otro_staff = User.objects.create_user('otro', is_staff=True)
+        sin_permiso = Client()
+        sin_permiso.force_login(self.usuario)
+
+        respuestas = [
+            self.web.get('/pacientes/'),
+            self.web.get('/pacientes/', {'perfilar': firmar(otro_staff)}),
+            self.web.get('/pacientes/', HTTP_X_PERFILAR=firmar(self.staff) + 'x'),
+            sin_permiso.get('/pacientes/', HTTP_X_PERFILAR=firmar(self.usuario)),
+        ]
+
+        self.assertEqual([r.status_code for r in respuestas], [200] * 4)
+        self.assertFalse(any('X-Perfil' in r for r in respuestas))
+        self.assertFalse(PerfilSolicitud.objects.exists())
+
+    async def test_perfila_solicitudes_async_sin_pasar_por_un_hilo(self):
+        async def vista(request):
+            return HttpResponse()
+
+        self.assertTrue(iscoroutinefunction(PerfiladorMiddleware(vista)))
+        await self.async_client.aforce_login(self.staff)
+
+        sin_firma = await self.async_client.get('/api/async/dashboard/')
+        response = await self.async_client.get('/api/async/dashboard/', headers={'X-Perfilar': firmar(self.staff)})
+
+        self.assertNotIn('X-Perfil', sin_firma)
+        self.assertEqual(response.status_code, 200)
+        perfil = await PerfilSolicitud.objects.select_related('usuario').aget(pk=response['X-Perfil'])
+        self.assertEqual((perfil.vista, perfil.estado, perfil.usuario), ('async_dashboard', 200, self.staff))
+
+    def test_admin_muestra_firma_descarga_y_elimina_perfiles(self):
+        admin = User.objects.create_superuser('admin-perfiles', password='clave-segura-123')
+        self.web.force_login(admin)
+        firma = firmar(admin)
+        perfil = PerfilSolicitud.objects.get(pk=self.web.get('/', {'perfilar': firma})['X-Perfil'])
+        archivo = Path(settings.PERFILADOR_DIRECTORIO) / perfil.archivo
+
+        listado = self.web.get('/admin/salud_vital/perfilsolicitud/')
+        self.assertContains(listado, firma.split(':')[0])
+        self.assertContains(listado, f'/admin/salud_vital/perfilsolicitud/{perfil.pk}/descargar/')
+        descarga = self.web.get(f'/admin/salud_vital/perfilsolicitud/{perfil.pk}/descargar/')
+        self.assertEqual(descarga.status_code, 200)
+        self.assertEqual(b''.join(descarga.streaming_content), archivo.read_bytes())
+
+        self.web.post(f'/admin/salud_vital/perfilsolicitud/{perfil.pk}/delete/', {'post': 'yes'})
+        self.assertFalse(PerfilSolicitud.objects.exists())
+        self.assertFalse(archivo.exists())
+
+
+# ============================================================================
+# TRAZAS DE SOLICITUDES
+# ============================================================================
+
+class TrazasTests(SaludVitalTestCase):
+
+    def setUp(self):
+        super().setUp()
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio)
+        self.archivo = f'{directorio}/trazas.jsonl'
+        self.enterContext(override_settings(TRAZAS=True, TRAZAS_ARCHIVO=self.archivo))
+
+    def tramos(self):
+        """{spanId: (nombre, padre, atributos)} de todas las trazas exportadas"""
+        return {span_id: (nombre, padre, atributos) for _, span_id, padre, nombre, _, _, atributos in leer(self.archivo)}
+
+    def test_tramos_anidados_de_vista_serializadores_y_sql(self):
+        consulta = self.crear_consultas(1)[0]
+        tratamiento = Tratamiento.objects.create(
+            consulta=consulta, descripcion='Analgesia', fecha_inicio=date.today(), fecha_fin=date.today()
+        )
+        for _ in range(2):
+            RecetaMedica.objects.create(
+                tratamiento=tratamiento, medicamento=self.medicamento,
+                cantidad=1, frecuencia='Cada 8 horas', duracion='5 días',
+            )
+
+        self.assertEqual(self.client.get('/api/recetas/').status_code, 200)
+
+        tramos = self.tramos()
+        por_nombre = {}
+        for span_id, (nombre, padre, atributos) in tramos.items():
+            por_nombre.setdefault(nombre, []).append((span_id, padre, atributos))
+        [(raiz, sin_padre, atributos)] = por_nombre['GET recetamedica-list']
+        self.assertIsNone(sin_padre)
+        self.assertEqual((atributos['http.route'], atributos['http.status_code']), ('api/recetas/$', '200'))
+        [(vista, padre, _)] = por_nombre['vista recetamedica-list']
+        self.assertEqual(padre, raiz)
+        self.assertEqual(len(por_nombre['RecetaMedicaSerializer.to_representation']), 2)
+        self.assertEqual(len(por_nombre['RecetaMedicaSerializer.paciente_nombre']), 2)
+        for _, padre, atributos in por_nombre['RecetaMedicaSerializer.paciente_nombre']:
+            self.assertEqual(tramos[padre][0], 'RecetaMedicaSerializer.to_representation')
+            self.assertEqual(atributos['source'], 'tratamiento.consulta.paciente.nombre_completo')
+        self.assertTrue(por_nombre['sql'])
+        self.assertTrue(all(atributos['db.statement'] for _, _, atributos in por_nombre['sql']))
+
+    def test_render_por_plantilla_y_reporte(self):
+        self.client.get('/pacientes/')
+        self.client.get('/api/pacientes/')
+
+        nombres = {nombre for nombre, _, _ in self.tramos().values()}
+        self.assertTrue({'GET pacientes_list', 'render pacientes/list.html', 'render base.html'} <= nombres)
+
+        salida = StringIO()
+        call_command('trace_report', '--ruta', 'pacientes_list', stdout=salida)
+        self.assertIn('1 trazas', salida.getvalue())
+        self.assertIn('render pacientes/list.html', salida.getvalue())
+        self.assertNotIn('paciente-list', salida.getvalue())
+
+
+# ============================================================================
+# SIMULACIÓN DE TRÁFICO
+# ============================================================================
+
+class SimulacionTraficoTests(LiveServerTestCase):
+    """Generador de tráfico contra un servidor HTTP real (el de LiveServerTestCase)"""
+
+    def setUp(self):
+        User.objects.create_user('recepcion', password='clave-segura-123', is_staff=True)
+        especialidad = Especialidad.objects.create(nombre='Medicina General')
+        Medico.objects.create(rut='11111111-1', nombre='Ana', apellido='Rojas', especialidad=especialidad)
+        Paciente.objects.create(rut='33333333-3', nombre='Juan', apellido='Pérez', fecha_nacimiento=date(1980, 5, 1))
+
+    def simular(self, clave='clave-segura-123', **opciones):
+        return asyncio.run(simular(self.live_server_url, 'recepcion', clave, usuarios=2, pausa=0, semilla=1, **opciones))
+
+    def test_cada_escenario_se_mide_por_ruta_sin_errores(self):
+        rutas_por_escenario = {
+            'admision': {'pacientes_list', 'paciente-list', 'paciente-ficha'},
+            'consultas': {'consultas_create'},
+            'dashboard': {'dashboard'},
+            'sondeo_hoy': {'consultamedica-hoy'},
+        }
+        for escenario, rutas_ in rutas_por_escenario.items():
+            with self.subTest(escenario=escenario):
+                pesos = {nombre: int(nombre == escenario) for nombre in ESCENARIOS}
+                resumen = self.simular(iteraciones=1, pesos=pesos).resumen()
+                self.assertEqual(set(resumen), rutas_)
+                self.assertEqual(sum(ruta['errores'] for ruta in resumen.values()), 0, resumen)
+        # Una ráfaga de tres consultas por cada usuario virtual
+        self.assertEqual(ConsultaMedica.objects.count(), 6)
+
+    def test_login_rechazado_y_errores_por_ruta(self):
+        with self.assertRaises(ErrorDeTrafico):
+            self.simular(clave='otra-clave', iteraciones=1)
+
+        estadisticas = Estadisticas()
+        estadisticas.registrar('dashboard', 0.004, 200)
+        estadisticas.registrar('dashboard', 0.030, 500)
+        estadisticas.registrar('consultas_create', 0.020, 200, esperado=302)
+        estadisticas.registrar('consultas_create', 12.0)
+        resumen = estadisticas.resumen()
+        self.assertEqual(resumen['dashboard']['tasa_error'], 0.5)
+        self.assertEqual(resumen['dashboard']['histograma']['<=5'], 1)
+        self.assertEqual(resumen['dashboard']['histograma']['<=50'], 1)
+        self.assertEqual(resumen['consultas_create']['errores'], 2)
+        self.assertEqual(resumen['consultas_create']['estados'], {'200': 1, 'sin respuesta': 1})
+        self.assertEqual(resumen['consultas_create']['histograma']['>10000'], 1)
+
+
+# ============================================================================
+# RESERVAS Y RECETAS CONCURRENTES
+# ============================================================================
+
+class ReservasConcurrentesTests(TransactionTestCase):
+    """Varias recepcionistas reservando el mismo cupo al mismo tiempo"""
+
+    RESERVAS_SIMULTANEAS = 8
+
+    def setUp(self):
+        especialidad = Especialidad.objects.create(nombre='Nefrología')
+        self.medico = Medico.objects.create(rut='55555555-5', nombre='Eva', apellido='Mora', especialidad=especialidad)
+        self.pacientes = [
+            Paciente.objects.create(rut=f'6000000{i}-{i}', nombre='P', apellido=str(i), fecha_nacimiento=date(1970, 1, 1))
+            for i in range(self.RESERVAS_SIMULTANEAS)
+        ]
+        self.inicio = timezone.make_aware(datetime.combine(date.today() + timedelta(days=3), time(9)))
+
+    def test_solo_una_reserva_concurrente_gana(self):
+        barrera = threading.Barrier(self.RESERVAS_SIMULTANEAS)
+        resultados = []
+
+        def reservar(paciente, desfase):
+            try:
+                barrera.wait()
+                with transaction.atomic():
+                    CitaMedica.objects.create(
+                        paciente=paciente, medico=self.medico,
+                        fecha_hora_cita=self.inicio + timedelta(minutes=desfase),
+                    )
+                resultados.append('ok')
+            except IntegrityError as error:
+                resultados.append('superpuesta' if es_cita_superpuesta(error) else repr(error))
+            finally:
+                connection.close()
+
+        # Todas las reservas se solapan entre sí (desfases de 0 a 21 minutos sobre 30)
+        hilos = [
+            threading.Thread(target=reservar, args=(paciente, i * 3))
+            for i, paciente in enumerate(self.pacientes)
+        ]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(sorted(resultados), ['ok'] + ['superpuesta'] * (self.RESERVAS_SIMULTANEAS - 1))
+        self.assertEqual(CitaMedica.objects.filter(medico=self.medico).count(), 1)
+
+
+class RecetasConcurrentesTests(TransactionTestCase):
+    """Muchas recetas simultáneas sobre un medicamento con poco stock"""
+
+    RECETAS_SIMULTANEAS = 20
+    STOCK_INICIAL = 10
+
+    def setUp(self):
+        especialidad = Especialidad.objects.create(nombre='Medicina General')
+        medico = Medico.objects.create(rut='77777777-7', nombre='Rosa', apellido='Vega', especialidad=especialidad)
+        paciente = Paciente.objects.create(rut='88888888-8', nombre='Tomás', apellido='Leal', fecha_nacimiento=date(1985, 3, 3))
+        consulta = ConsultaMedica.objects.create(paciente=paciente, medico=medico, fecha_consulta=timezone.now(), motivo='Dolor')
+        self.tratamiento = Tratamiento.objects.create(
+            consulta=consulta, descripcion='Analgesia',
+            fecha_inicio=date.today(), fecha_fin=date.today() + timedelta(days=3),
+        )
+        self.medicamento = Medicamento.objects.create(
+            nombre='Ketoprofeno', stock=self.STOCK_INICIAL, precio_unitario=Decimal('2000.00'),
+            fecha_vencimiento=date.today() + timedelta(days=365),
+        )
+
+    def test_stock_nunca_pierde_actualizaciones_ni_queda_negativo(self):
+        barrera = threading.Barrier(self.RECETAS_SIMULTANEAS)
+        resultados = []
+
+        def recetar():
+            try:
+                barrera.wait()
+                RecetaMedica.objects.create(
+                    tratamiento=self.tratamiento, medicamento=self.medicamento,
+                    cantidad=1, frecuencia='Cada 12 horas', duracion='1 día',
+                )
+                resultados.append('ok')
+            except StockInsuficiente:
+                resultados.append('sin stock')
+            except Exception as error:
+                resultados.append(repr(error))
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=recetar) for _ in range(self.RECETAS_SIMULTANEAS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(
+            sorted(resultados),
+            ['ok'] * self.STOCK_INICIAL + ['sin stock'] * (self.RECETAS_SIMULTANEAS - self.STOCK_INICIAL),
+        )
+        self.medicamento.refresh_from_db()
+        self.assertEqual(self.medicamento.stock, 0)
+        self.assertEqual(RecetaMedica.objects.count(), self.STOCK_INICIAL)
+
+        # Cada dispensación dejó un stock resultante distinto: 9, 8, ..., 0
+        dispensaciones = self.medicamento.movimientos.filter(tipo='Dispensación')
+        self.assertEqual(
+            sorted(dispensaciones.values_list('stock_resultante', flat=True)),
+            list(range(self.STOCK_INICIAL)),
+        )
@@ -0,0 +1,409 @@
+# ============================================================================
+# SIMULACIÓN DE TRÁFICO HTTP - SALUD VITAL
+# ============================================================================
+# Reproduce el tráfico habitual de la clínica contra un servidor en ejecución
+# (runserver o cualquier servidor WSGI/ASGI) para dimensionar el hardware.
+# Cada usuario virtual es una tarea asyncio que inicia sesión por el
+# formulario de login (autenticación de sesión, como el personal) y repite
+# escenarios elegidos al azar según su peso: búsquedas de admisión, ráfagas
+# de registro de consultas, refrescos del dashboard y sondeo de las consultas
+# del día.
+#
+# El cliente HTTP/1.1 es mínimo y usa solo asyncio.open_connection: una
+# conexión persistente y un conjunto de cookies por usuario virtual, sin
+# dependencias ni servicios externos. Cada solicitud se registra con el nombre
+# de su ruta para informar rendimiento, errores e histograma de latencias.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import asyncio
+import contextlib
+import json
+import random
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.urls import reverse
+
+from .rendimiento import percentil
+
+
+# Límites superiores (ms) de los intervalos del histograma de latencias
+HISTOGRAMA_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Páginas de pacientes de la API que se leen para elegir a quién buscar
+PAGINAS_CATALOGO = 5
+
+# Fallas de red o de protocolo que cuentan como solicitud sin respuesta
+FALLAS_DE_CONEXION = (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError)
+
+
+class ErrorDeTrafico(Exception):
+    """La simulación no puede empezar (login rechazado, servidor sin pacientes o médicos, etc.)"""
+
+
+@dataclass
+class Respuesta:
+    estado: int
+    encabezados: dict
+    cuerpo: bytes
+
+    def json(self):
+        return json.loads(self.cuerpo)
+
+
+# ============================================================================
+# CLIENTE HTTP
+# ============================================================================
+
+class ClienteHTTP:
+    """Cliente HTTP/1.1 con una conexión persistente y las cookies de una sesión"""
+
+    def __init__(self, url_base, tiempo_maximo=30.0):
+        partes = urlsplit(url_base)
+        self.https = partes.scheme == 'https'
+        self.host = partes.hostname
+        self.puerto = partes.port or (443 if self.https else 80)
+        self.origen = f'{partes.scheme}://{partes.netloc}'
+        self.tiempo_maximo = tiempo_maximo
+        self.cookies = {}
+        self.lector = self.escritor = None
+
+    async def cerrar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+            with contextlib.suppress(OSError):
+                await self.escritor.wait_closed()
+        self.lector = self.escritor = None
+
+    async def solicitar(self, metodo, ruta, datos=None, encabezados=None):
+        """Envía la solicitud (`datos` como formulario) y lee la respuesta completa.
+
+        Si el servidor cerró la conexión persistente mientras estaba inactiva,
+        se reintenta una vez con una conexión nueva.
+        """
+        cuerpo = urlencode(datos).encode() if datos is not None else b''
+        extra = dict(encabezados or {})
+        if datos is not None:
+            extra['Content-Type'] = 'application/x-www-form-urlencoded'
+        reutilizada = self.escritor is not None
+        try:
+            return await asyncio.wait_for(self.intercambiar(metodo, ruta, cuerpo, extra), self.tiempo_maximo)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            await self.cerrar()
+            if not reutilizada:
+                raise
+            return await asyncio.wait_for(self.intercambiar(metodo, ruta, cuerpo, extra), self.tiempo_maximo)
+        except BaseException:
+            # Respuesta a medio leer o tiempo agotado: la conexión queda inservible
+            await self.cerrar()
+            raise
+
+    async def intercambiar(self, metodo, ruta, cuerpo, extra):
+        if self.escritor is None:
+            self.lector, self.escritor = await asyncio.open_connection(self.host, self.puerto, ssl=self.https or None)
+        lineas = [
+            f'{metodo} {ruta} HTTP/1.1', f'Host: {self.host}:{self.puerto}', 'Connection: keep-alive',
+            f'Content-Length: {len(cuerpo)}',
+        ]
+        if self.cookies:
+            lineas.append('Cookie: ' + '; '.join(f'{nombre}={valor}' for nombre, valor in self.cookies.items()))
+        lineas += [f'{nombre}: {valor}' for nombre, valor in extra.items()]
+        self.escritor.write(('\r\n'.join(lineas) + '\r\n\r\n').encode('latin-1') + cuerpo)
+        await self.escritor.drain()
+
+        version, estado, *_ = (await self.lector.readuntil(b'\r\n')).decode('latin-1').split()
+        encabezados = {}
+        while (linea := await self.lector.readuntil(b'\r\n')) != b'\r\n':
+            nombre, _, valor = linea.decode('latin-1').partition(':')
+            nombre, valor = nombre.strip().lower(), valor.strip()
+            if nombre == 'set-cookie':
+                self.guardar_cookie(valor)
+            encabezados[nombre] = valor
+        respuesta = Respuesta(int(estado), encabezados, await self.leer_cuerpo(metodo, int(estado), encabezados))
+
+        conexion = encabezados.get('connection', '').lower()
+        if conexion == 'close' or (version == 'HTTP/1.0' and conexion != 'keep-alive'):
+            await self.cerrar()
+        return respuesta
+
+    async def leer_cuerpo(self, metodo, estado, encabezados):
+        if metodo == 'HEAD' or estado in (204, 304) or estado < 200:
+            return b''
+        if 'chunked' in encabezados.get('transfer-encoding', '').lower():
+            partes = []
+            while tamano := int((await self.lector.readuntil(b'\r\n')).split(b';')[0], 16):
+                partes.append(await self.lector.readexactly(tamano))
+                await self.lector.readexactly(2)
+            # Encabezados finales opcionales hasta la línea vacía
+            while await self.lector.readuntil(b'\r\n') != b'\r\n':
+                pass
+            return b''.join(partes)
+        if 'content-length' in encabezados:
+            return await self.lector.readexactly(int(encabezados['content-length']))
+        # Sin largo declarado el cuerpo termina cuando el servidor cierra la conexión
+        cuerpo = await self.lector.read()
+        await self.cerrar()
+        return cuerpo
+
+    def guardar_cookie(self, encabezado):
+        try:
+            cookie = SimpleCookie(encabezado)
+        except CookieError:
+            return
+        for nombre, morsel in cookie.items():
+            # Django elimina una cookie enviándola vacía con max-age=0
+            if morsel['max-age'] == '0' or not morsel.value:
+                self.cookies.pop(nombre, None)
+            else:
+                self.cookies[nombre] = morsel.value
+
+
+# ============================================================================
+# ESTADÍSTICAS POR RUTA
+# ============================================================================
+
+def histograma(latencias_ms):
+    """Solicitudes por intervalo de latencia {'<=5': n, ..., '>10000': n}"""
+    conteo = Counter()
+    for latencia in latencias_ms:
+        limite = next((limite for limite in HISTOGRAMA_MS if latencia <= limite), None)
+        conteo[f'<={limite}' if limite else f'>{HISTOGRAMA_MS[-1]}'] += 1
+    return {intervalo: conteo[intervalo] for intervalo in [*(f'<={limite}' for limite in HISTOGRAMA_MS), f'>{HISTOGRAMA_MS[-1]}']}
+
+
+class Estadisticas:
+    """Latencias, códigos de estado y errores de las solicitudes, por nombre de ruta"""
+
+    def __init__(self):
+        self.latencias = defaultdict(list)
+        self.estados = defaultdict(Counter)
+        self.errores = Counter()
+        self.inicio = time.perf_counter()
+        self.fin = None
+
+    def registrar(self, ruta, segundos, estado=None, esperado=None):
+        """Registra una solicitud; `estado` None significa que no hubo respuesta.
+
+        Es error no obtener respuesta, un estado 4xx/5xx o, si se indica
+        `esperado`, cualquier otro estado (p. ej. un formulario que no redirige).
+        """
+        self.latencias[ruta].append(segundos * 1000)
+        self.estados[ruta][estado or 'sin respuesta'] += 1
+        if estado is None or estado >= 400 or (esperado is not None and estado != esperado):
+            self.errores[ruta] += 1
+
+    @property
+    def duracion(self):
+        return (self.fin or time.perf_counter()) - self.inicio
+
+    def resumen(self):
+        """{ruta: rendimiento, tasa de error, percentiles (ms), estados e histograma}"""
+        duracion = self.duracion
+        return {
+            ruta: {
+                'solicitudes': len(latencias),
+                'por_segundo': round(len(latencias) / duracion, 2),
+                'errores': self.errores[ruta],
+                'tasa_error': round(self.errores[ruta] / len(latencias), 4),
+                'p50_ms': round(percentil(latencias, 50), 1),
+                'p95_ms': round(percentil(latencias, 95), 1),
+                'p99_ms': round(percentil(latencias, 99), 1),
+                'max_ms': round(max(latencias), 1),
+                'estados': {str(estado): cantidad for estado, cantidad in sorted(self.estados[ruta].items(), key=str)},
+                'histograma': histograma(latencias),
+            }
+            for ruta, latencias in sorted(self.latencias.items())
+        }
+
+
+# ============================================================================
+# USUARIOS VIRTUALES
+# ============================================================================
+
+@dataclass
+class Catalogo:
+    """Pacientes ({id, apellido, rut}) y médicos (ids) que usan los escenarios"""
+    pacientes: list
+    medicos: list
+
+
+class UsuarioVirtual:
+    """Una sesión del personal: su cliente HTTP, su azar y dónde registrar las mediciones"""
+
+    def __init__(self, url_base, estadisticas, rng, pausa=1.0, tiempo_maximo=30.0):
+        self.cliente = ClienteHTTP(url_base, tiempo_maximo)
+        self.estadisticas = estadisticas
+        self.rng = rng
+        self.pausa = pausa
+        self.catalogo = None
+
+    async def solicitar(self, ruta, metodo='GET', kwargs=None, parametros=None, datos=None, esperado=None):
+        """Solicita la ruta con nombre `ruta` y registra su latencia (None si no hubo respuesta)"""
+        url = reverse(ruta, kwargs=kwargs)
+        if parametros:
+            url = f'{url}?{urlencode(parametros)}'
+        encabezados = {}
+        if metodo != 'GET':
+            # CSRF: el token de la cookie y, en HTTPS, un Referer del mismo origen
+            datos = {**(datos or {}), 'csrfmiddlewaretoken': self.cliente.cookies.get(settings.CSRF_COOKIE_NAME, '')}
+            encabezados['Referer'] = f'{self.cliente.origen}{url}'
+        inicio = time.perf_counter()
+        try:
+            respuesta = await self.cliente.solicitar(metodo, url, datos, encabezados)
+        except FALLAS_DE_CONEXION:
+            self.estadisticas.registrar(ruta, time.perf_counter() - inicio)
+            return None
+        self.estadisticas.registrar(ruta, time.perf_counter() - inicio, respuesta.estado, esperado)
+        return respuesta
+
+    async def pausar(self):
+        """Tiempo de espera del usuario, exponencial con media `pausa` segundos"""
+        await asyncio.sleep(self.rng.expovariate(1 / self.pausa) if self.pausa > 0 else 0)
+
+    async def iniciar_sesion(self, usuario, clave):
+        if await self.solicitar('admin:login') is None:
+            raise ErrorDeTrafico(f'El servidor {self.cliente.origen} no responde.')
+        respuesta = await self.solicitar(
+            'admin:login', 'POST', datos={'username': usuario, 'password': clave, 'next': '/'}, esperado=302,
+        )
+        if respuesta is None or respuesta.estado != 302 or settings.SESSION_COOKIE_NAME not in self.cliente.cookies:
+            raise ErrorDeTrafico(
+                f'El servidor rechazó el inicio de sesión de "{usuario}" '
+                f'({respuesta.estado if respuesta else "sin respuesta"}); debe ser un usuario del personal (is_staff).'
+            )
+
+
+async def cargar_catalogo(usuario):
+    """Lee de la API algunas páginas de pacientes y los médicos activos"""
+    pacientes = []
+    primera = await usuario.solicitar('paciente-list')
+    if primera is None or primera.estado != 200:
+        raise ErrorDeTrafico('No se pudo leer la lista de pacientes de la API.')
+    datos = primera.json()
+    paginas = max(1, -(-datos['count'] // max(1, len(datos['results']))))
+    pacientes += datos['results']
+    for pagina in usuario.rng.sample(range(2, paginas + 1), min(PAGINAS_CATALOGO - 1, paginas - 1)):
+        respuesta = await usuario.solicitar('paciente-list', parametros={'page': pagina})
+        if respuesta is not None and respuesta.estado == 200:
+            pacientes += respuesta.json()['results']
+    medicos = await usuario.solicitar('medico-list')
+    medicos = [
+        medico['id'] for medico in medicos.json()['results'] if medico['activo']
+    ] if medicos is not None and medicos.estado == 200 else []
+    if not pacientes or not medicos:
+        raise ErrorDeTrafico('El servidor no tiene pacientes o médicos activos; cargue datos antes de la prueba.')
+    return Catalogo(
+        pacientes=[{'id': paciente['id'], 'apellido': paciente['apellido'], 'rut': paciente['rut']} for paciente in pacientes],
+        medicos=medicos,
+    )
+
+
+# ============================================================================
+# ESCENARIOS
+# ============================================================================
+
+async def busqueda_admision(usuario):
+    """Admisión matinal: busca al paciente por apellido o RUT y abre su ficha"""
+    paciente = usuario.rng.choice(usuario.catalogo.pacientes)
+    termino = paciente['apellido'][:4] if usuario.rng.random() < 0.7 else paciente['rut'][:6]
+    await usuario.solicitar('pacientes_list', parametros={'search': termino})
+    await usuario.pausar()
+    await usuario.solicitar('paciente-list', parametros={'search': termino})
+    await usuario.solicitar('paciente-ficha', kwargs={'pk': paciente['id']})
+
+
+async def rafaga_consultas(usuario, cantidad=3):
+    """Fin de un bloque de atención: abre el formulario y registra varias consultas seguidas"""
+    await usuario.solicitar('consultas_create')
+    for _ in range(cantidad):
+        await usuario.solicitar('consultas_create', 'POST', datos={
+            'paciente': usuario.rng.choice(usuario.catalogo.pacientes)['id'],
+            'medico': usuario.rng.choice(usuario.catalogo.medicos),
+            'fecha_consulta': datetime.now().strftime('%Y-%m-%dT%H:%M'),
+            'motivo': 'Control (prueba de carga)',
+            'diagnostico': '',
+        }, esperado=302)
+
+
+async def refresco_dashboard(usuario):
+    """Recepción recarga el dashboard"""
+    await usuario.solicitar('dashboard')
+
+
+async def sondeo_consultas_hoy(usuario, veces=3):
+    """Pantalla de sala de espera que consulta periódicamente las consultas del día"""
+    for _ in range(veces):
+        await usuario.solicitar('consultamedica-hoy')
+        await usuario.pausar()
+
+
+# Escenarios y su peso relativo por omisión en el tráfico
+ESCENARIOS = {
+    'admision': busqueda_admision,
+    'consultas': rafaga_consultas,
+    'dashboard': refresco_dashboard,
+    'sondeo_hoy': sondeo_consultas_hoy,
+}
+PESOS = {
+    'admision': 40,
+    'consultas': 10,
+    'dashboard': 20,
+    'sondeo_hoy': 30,
+}
+
+
+# ============================================================================
+# SIMULACIÓN
+# ============================================================================
+
+async def simular(url_base, usuario, clave, usuarios=10, duracion=60.0, iteraciones=None, pesos=None,
+                  pausa=1.0, rampa=0.0, semilla=None, tiempo_maximo=30.0):
+    """Ejecuta la simulación y retorna sus Estadisticas.
+
+    Cada usuario virtual inicia sesión y repite escenarios hasta agotar
+    `duracion` segundos o `iteraciones` escenarios. Los usuarios arrancan
+    escalonados a lo largo de `rampa` segundos. El login y la lectura del
+    catálogo no se incluyen en las estadísticas.
+    """
+    pesos = {**PESOS, **(pesos or {})}
+    desconocidos = set(pesos) - set(ESCENARIOS)
+    if desconocidos:
+        raise ErrorDeTrafico(f'Escenarios desconocidos: {", ".join(sorted(desconocidos))}.')
+    if usuarios < 1 or sum(pesos.values()) <= 0 or min(pesos.values()) < 0:
+        raise ErrorDeTrafico('Se necesita al menos un usuario y pesos no negativos con suma positiva.')
+
+    rng = random.Random(semilla)
+    preparacion = Estadisticas()
+    virtuales = [
+        UsuarioVirtual(url_base, preparacion, random.Random(rng.random()), pausa, tiempo_maximo)
+        for _ in range(usuarios)
+    ]
+    try:
+        await asyncio.gather(*(virtual.iniciar_sesion(usuario, clave) for virtual in virtuales))
+        catalogo = await cargar_catalogo(virtuales[0])
+        estadisticas = Estadisticas()
+        for virtual in virtuales:
+            virtual.catalogo, virtual.estadisticas = catalogo, estadisticas
+        nombres, ponderaciones = list(pesos), list(pesos.values())
+        limite = time.perf_counter() + duracion
+
+        async def recorrer(indice, virtual):
+            await asyncio.sleep(rampa * indice / usuarios)
+            hechas = 0
+            while time.perf_counter() < limite and (iteraciones is None or hechas < iteraciones):
+                await ESCENARIOS[virtual.rng.choices(nombres, ponderaciones)[0]](virtual)
+                hechas += 1
+                await virtual.pausar()
+
+        await asyncio.gather(*(recorrer(indice, virtual) for indice, virtual in enumerate(virtuales)))
+        estadisticas.fin = time.perf_counter()
+        return estadisticas
+    finally:
+        await asyncio.gather(*(virtual.cliente.cerrar() for virtual in virtuales))
@@ -0,0 +1,226 @@
+# ============================================================================
+# TRAZAS DE SOLICITUDES - SALUD VITAL
+# ============================================================================
+# Tramos (spans) anidados con la duración de cada fase de una solicitud:
+#   solicitud (middleware completo) > vista > serializadores, plantillas y SQL
+#
+# TrazasMiddleware abre el tramo raíz y registra cada consulta SQL;
+# TramoVistaMiddleware, último de la lista, mide la vista con su render, de
+# modo que la diferencia con la raíz es el tiempo del resto del middleware.
+# instrumentar() envuelve to_representation de los serializadores DRF, los
+# campos que recorren relaciones (source='tratamiento.consulta.paciente...')
+# o usan métodos, y el render de cada plantilla Django.
+#
+# Al terminar la solicitud la traza se agrega como una línea JSON en
+# TRAZAS_ARCHIVO, con el formato OTLP/JSON de OpenTelemetry (el que leen el
+# receptor otlpjsonfile del collector y Jaeger): no requiere un collector.
+# `python manage.py trace_report` resume el archivo sin herramientas externas.
+
+# ============================================================================
+# IMPORTACIONES NECESARIAS
+# ============================================================================
+import json
+import random
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+
+# Tramo abierto en el contexto actual (hilo o tarea asyncio)
+_actual = ContextVar('salud_vital_tramo', default=None)
+_candado_archivo = threading.Lock()
+
+# Largo máximo del SQL guardado en cada tramo
+LARGO_SQL = 2000
+
+# Tipos de tramo de OTLP
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+
+class Tramo:
+    """Intervalo con nombre dentro de una traza; `atributos` admite texto y números"""
+    __slots__ = ('traza', 'id', 'padre', 'nombre', 'atributos', 'inicio', 'fin', 'tipo')
+
+    def __init__(self, traza, nombre, padre=None, atributos=None, tipo=SPAN_KIND_INTERNAL):
+        self.traza = traza
+        self.id = secrets.token_hex(8)
+        self.padre = padre
+        self.nombre = nombre
+        self.atributos = atributos or {}
+        self.tipo = tipo
+        self.inicio = time.time_ns()
+        self.fin = None
+        traza.tramos.append(self)
+
+
+class Traza:
+    def __init__(self):
+        self.id = secrets.token_hex(16)
+        self.tramos = []
+
+
+def activa():
+    """Hay una traza en curso en este contexto"""
+    return _actual.get() is not None
+
+
+@contextmanager
+def tramo(nombre, **atributos):
+    """Tramo hijo del actual; sin traza en curso no registra nada"""
+    padre = _actual.get()
+    if padre is None:
+        yield None
+        return
+    nuevo = Tramo(padre.traza, nombre, padre.id, atributos)
+    token = _actual.set(nuevo)
+    try:
+        yield nuevo
+    finally:
+        nuevo.fin = time.time_ns()
+        _actual.reset(token)
+
+
+@contextmanager
+def traza(nombre, **atributos):
+    """Abre una traza nueva con su tramo raíz y la exporta al cerrarla"""
+    raiz = Tramo(Traza(), nombre, atributos=atributos, tipo=SPAN_KIND_SERVER)
+    token = _actual.set(raiz)
+    try:
+        yield raiz
+    finally:
+        raiz.fin = time.time_ns()
+        _actual.reset(token)
+        exportar(raiz.traza)
+
+
+def muestrear():
+    """Decide si se traza una solicitud según TRAZAS_MUESTREO (fracción entre 0 y 1)"""
+    return random.random() < getattr(settings, 'TRAZAS_MUESTREO', 1.0)
+
+
+# ============================================================================
+# EXPORTACIÓN OTLP/JSON
+# ============================================================================
+
+def valor_otlp(valor):
+    if isinstance(valor, bool):
+        return {'boolValue': valor}
+    if isinstance(valor, int):
+        return {'intValue': str(valor)}
+    if isinstance(valor, float):
+        return {'doubleValue': valor}
+    return {'stringValue': str(valor)}
+
+
+def tramo_otlp(tramo_, traza_id):
+    datos = {
+        'traceId': traza_id,
+        'spanId': tramo_.id,
+        'name': tramo_.nombre,
+        'kind': tramo_.tipo,
+        'startTimeUnixNano': str(tramo_.inicio),
+        'endTimeUnixNano': str(tramo_.fin or tramo_.inicio),
+        'attributes': [{'key': clave, 'value': valor_otlp(valor)} for clave, valor in tramo_.atributos.items()],
+    }
+    if tramo_.padre:
+        datos['parentSpanId'] = tramo_.padre
+    return datos
+
+
+def a_otlp(traza_):
+    """Traza como un ExportTraceServiceRequest de OTLP/JSON"""
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': 'salud-vital'}}]},
+        'scopeSpans': [{
+            'scope': {'name': __name__},
+            'spans': [tramo_otlp(tramo_, traza_.id) for tramo_ in traza_.tramos],
+        }],
+    }]}
+
+
+def exportar(traza_):
+    """Agrega la traza como una línea a TRAZAS_ARCHIVO (una sola escritura en modo append)"""
+    linea = json.dumps(a_otlp(traza_), ensure_ascii=False, separators=(',', ':')) + '\n'
+    with _candado_archivo, open(settings.TRAZAS_ARCHIVO, 'a', encoding='utf-8') as archivo:
+        archivo.write(linea)
+
+
+def leer(ruta):
+    """Tramos de un archivo exportado: (traceId, spanId, parentSpanId, nombre, inicio, fin, atributos)"""
+    with open(ruta, encoding='utf-8') as archivo:
+        for linea in archivo:
+            for recurso in json.loads(linea)['resourceSpans']:
+                for alcance in recurso['scopeSpans']:
+                    for span in alcance['spans']:
+                        yield (
+                            span['traceId'], span['spanId'], span.get('parentSpanId'), span['name'],
+                            int(span['startTimeUnixNano']), int(span['endTimeUnixNano']),
+                            {a['key']: next(iter(a['value'].values())) for a in span.get('attributes', [])},
+                        )
+
+
+# ============================================================================
+# INSTRUMENTACIÓN DE DRF Y PLANTILLAS
+# ============================================================================
+
+_instrumentado = False
+
+
+def envolver(funcion, nombrar):
+    """Ejecuta `funcion` dentro de un tramo llamado nombrar(self) si hay una traza en curso"""
+    @wraps(funcion)
+    def envuelta(self, *args, **kwargs):
+        if _actual.get() is None:
+            return funcion(self, *args, **kwargs)
+        with tramo(nombrar(self)):
+            return funcion(self, *args, **kwargs)
+    return envuelta
+
+
+def nombre_de_campo(campo):
+    return f'{type(campo.parent).__name__}.{campo.field_name}'
+
+
+def instrumentar():
+    """Envuelve una sola vez serializadores, campos relacionales y render de plantillas"""
+    global _instrumentado
+    if _instrumentado:
+        return
+    _instrumentado = True
+
+    from django.template.base import Template
+    from rest_framework import fields, serializers
+
+    serializers.Serializer.to_representation = envolver(
+        serializers.Serializer.to_representation, lambda s: f'{type(s).__name__}.to_representation'
+    )
+    # Los campos con source de varios niveles recorren relaciones y pueden
+    # disparar una consulta por fila; los demás no se miden para no llenar la traza
+    obtener_atributo = fields.Field.get_attribute
+
+    @wraps(obtener_atributo)
+    def get_attribute(self, instance):
+        if _actual.get() is None or len(self.source_attrs) < 2:
+            return obtener_atributo(self, instance)
+        with tramo(nombre_de_campo(self), source='.'.join(self.source_attrs)):
+            return obtener_atributo(self, instance)
+
+    fields.Field.get_attribute = get_attribute
+    fields.SerializerMethodField.to_representation = envolver(
+        fields.SerializerMethodField.to_representation, nombre_de_campo
+    )
+    Template._render = envolver(Template._render, lambda t: f'render {t.name or "<cadena>"}')
+
+
+def registrar_sql(execute, sql, params, many, context):
+    """Envoltorio de ejecución (connection.execute_wrapper) con un tramo por consulta"""
+    if _actual.get() is None:
+        return execute(sql, params, many, context)
+    with tramo('sql', **{'db.system': 'postgresql', 'db.statement': sql[:LARGO_SQL]}):
+        return execute(sql, params, many, context)
@@ -10,6 +10,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
+from . import async_views
 
 # ============================================================================
 # CONFIGURACIÓN DEL ROUTER PARA API REST
@@ -19,11 +20,17 @@ from . import views
 router = DefaultRouter()
 router.register(r'especialidades', views.EspecialidadViewSet)
 router.register(r'medicos', views.MedicoViewSet)
+router.register(r'horarios', views.HorarioMedicoViewSet)
 router.register(r'pacientes', views.PacienteViewSet)
+router.register(r'citas', views.CitaMedicaViewSet)
+router.register(r'series', views.SerieCitasViewSet)
 router.register(r'consultas', views.ConsultaMedicaViewSet)
 router.register(r'tratamientos', views.TratamientoViewSet)
 router.register(r'medicamentos', views.MedicamentoViewSet)
 router.register(r'recetas', views.RecetaMedicaViewSet)
+router.register(r'sync', views.SincronizacionViewSet, basename='sync')
+router.register(r'dashboard', views.DashboardViewSet, basename='dashboard')
+router.register(r'batch', views.LoteSolicitudesViewSet, basename='batch')
 
 # ============================================================================
 # PATRONES DE URL PRINCIPALES
@@ -37,6 +44,20 @@ urlpatterns = [
     # Incluye todas las rutas generadas automáticamente por el router
     path('api/', include(router.urls)),
     
+    # ========================================================================
+    # ENDPOINTS ASÍNCRONOS DE SOLO LECTURA (ASGI)
+    # ========================================================================
+    # Versiones async de los endpoints de lectura más consultados
+    path('api/async/consultas/hoy/', async_views.consultas_hoy, name='async_consultas_hoy'),
+    path('api/async/medicamentos/stock_bajo/', async_views.medicamentos_stock_bajo, name='async_medicamentos_stock_bajo'),
+    path('api/async/dashboard/', async_views.dashboard, name='async_dashboard'),
+    
+    # ========================================================================
+    # MÉTRICAS PROMETHEUS
+    # ========================================================================
+    # Latencia, SQL y caché por ruta, más indicadores de la clínica
+    path('metrics', views.metricas, name='metricas'),
+    
     # ========================================================================
     # DASHBOARD PRINCIPAL
     # ========================================================================
@@ -3,8 +3,10 @@
 # ============================================================================
 # Importaciones de Django REST Framework para crear APIs RESTful
 # Incluye viewsets, filtros, decoradores y respuestas
-from rest_framework import viewsets, filters, status
+from rest_framework import viewsets, mixins, filters, status
+from rest_framework.authentication import BaseAuthentication
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
 # Importaciones para filtrado avanzado con django-filter
@@ -12,27 +14,32 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django_filters import rest_framework as django_filters
 
 # Importaciones de Django core para modelos, fechas y utilidades
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from datetime import datetime, timedelta
 
 # Importaciones para vistas basadas en plantillas HTML
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
-from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
+from django.db.models import Q, Count, Prefetch, ProtectedError
+from django.http import HttpResponse, JsonResponse, HttpRequest, QueryDict, Http404
+from django.urls import resolve
+from urllib.parse import urlsplit
+from django.views.decorators.http import require_GET, require_http_methods
+from asgiref.sync import iscoroutinefunction
 
 # Importaciones para formularios Django
 from django.forms import ModelForm
 from django import forms
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
 from datetime import date, datetime, timedelta
 
 # Importaciones de modelos locales del sistema de salud
 from .models import (
     Especialidad, Medico, Paciente, ConsultaMedica, 
-    Tratamiento, Medicamento, RecetaMedica, CitaMedica, HistorialClinico
+    Tratamiento, Medicamento, RecetaMedica, CitaMedica, HistorialClinico,
+    HorarioMedico, SerieCitas, LoteMedicamento, MovimientoInventario, es_cita_superpuesta, MENSAJE_CITA_SUPERPUESTA
 )
 
 # Importaciones de serializadores para la API REST
@@ -40,9 +47,43 @@ from .serializers import (
     EspecialidadSerializer, MedicoSerializer, PacienteSerializer,
     ConsultaMedicaSerializer, TratamientoSerializer, MedicamentoSerializer,
     RecetaMedicaSerializer, MedicoDetalleSerializer, PacienteDetalleSerializer,
-    ConsultaMedicaDetalleSerializer, TratamientoDetalleSerializer
+    ConsultaMedicaDetalleSerializer, TratamientoDetalleSerializer,
+    FichaPacienteSerializer, HorarioMedicoSerializer, CitaMedicaSerializer,
+    SerieCitasSerializer, SerieDesdeSerializer, ReprogramarSerieSerializer,
+    CambiarEstadoCitasSerializer, ReasignarCitasSerializer, LoteMedicamentoSerializer,
+    MovimientoInventarioSerializer
 )
 
+# Caché de respuestas con invalidación por señales (ver signals.py)
+from .cache import obtener_ficha, guardar_ficha
+
+# Motor de disponibilidad de cupos por médico
+from .disponibilidad import disponibilidad_en_cache, MAX_DIAS_DISPONIBILIDAD
+
+# Series de citas recurrentes (esta y las siguientes)
+from .series import cancelar_desde, reprogramar_desde, CitasEnConflicto
+
+# Confirmación, cancelación y reasignación masiva de citas
+from .operaciones_citas import cambiar_estado, reasignar, CitasFueraDeHorario
+
+# Movimientos de stock y libro de inventario
+from .inventario import registrar_movimiento, recibir_lote, stock_en_fecha, StockInsuficiente
+
+# Reportes de costos agregados en la base de datos
+from .reportes import AGRUPACIONES, costos_por
+
+# Agenda semanal y mensual con conteos por día
+from .agenda import VISTAS, rango_de_vista, etag_agenda, conteo_por_dia, citas_del_dia
+
+# Sincronización incremental para clientes sin conexión
+from .sync import obtener_cambios, TokenInvalido, LIMITE_POR_DEFECTO, LIMITE_MAXIMO
+
+# Métricas de la aplicación en formato Prometheus
+from .metricas import exponer
+
+# Estadísticas del dashboard compartidas con su versión async
+from . import dashboard as datos_dashboard
+
 
 # ============================================================================
 # FILTROS PERSONALIZADOS PARA LA API REST
@@ -96,6 +137,47 @@ class ConsultaMedicaFilter(django_filters.FilterSet):
         fields = ['paciente', 'medico', 'especialidad', 'fecha_desde', 'fecha_hasta']
 
 
+class ConsultaAnidadaFilter(django_filters.FilterSet):
+    """Filtro para las consultas anidadas de un médico o paciente por rango de fechas y texto"""
+    fecha_desde = django_filters.DateFilter(method='filter_fecha_desde')
+    fecha_hasta = django_filters.DateFilter(method='filter_fecha_hasta')
+    motivo = django_filters.CharFilter(field_name='motivo', lookup_expr='icontains')
+    diagnostico = django_filters.CharFilter(field_name='diagnostico', lookup_expr='icontains')
+
+    class Meta:
+        model = ConsultaMedica
+        fields = ['fecha_desde', 'fecha_hasta', 'motivo', 'diagnostico']
+
+    def filter_fecha_desde(self, queryset, name, value):
+        # Se compara contra el inicio del día para aprovechar el índice de fecha_consulta
+        inicio = timezone.make_aware(datetime.combine(value, datetime.min.time()))
+        return queryset.filter(fecha_consulta__gte=inicio)
+
+    def filter_fecha_hasta(self, queryset, name, value):
+        # Rango semiabierto: incluye el día completo indicado en fecha_hasta
+        fin = timezone.make_aware(datetime.combine(value + timedelta(days=1), datetime.min.time()))
+        return queryset.filter(fecha_consulta__lt=fin)
+
+
+class CitaMedicaFilter(django_filters.FilterSet):
+    """Filtro de citas por médico, paciente, especialidad, estado, serie y rango de fechas"""
+    especialidad = django_filters.NumberFilter(field_name='medico__especialidad')
+    fecha_desde = django_filters.DateFilter(method='filter_fecha_desde')
+    fecha_hasta = django_filters.DateFilter(method='filter_fecha_hasta')
+
+    class Meta:
+        model = CitaMedica
+        fields = ['medico', 'paciente', 'especialidad', 'estado', 'serie', 'fecha_desde', 'fecha_hasta']
+
+    def filter_fecha_desde(self, queryset, name, value):
+        inicio = timezone.make_aware(datetime.combine(value, datetime.min.time()))
+        return queryset.filter(fecha_hora_cita__gte=inicio)
+
+    def filter_fecha_hasta(self, queryset, name, value):
+        fin = timezone.make_aware(datetime.combine(value + timedelta(days=1), datetime.min.time()))
+        return queryset.filter(fecha_hora_cita__lt=fin)
+
+
 class MedicamentoFilter(django_filters.FilterSet):
     """Filtro para búsqueda de medicamentos con alertas de stock bajo y próximo vencimiento"""
     nombre = django_filters.CharFilter(field_name='nombre', lookup_expr='icontains')
@@ -106,17 +188,20 @@ class MedicamentoFilter(django_filters.FilterSet):
         model = Medicamento
         fields = ['nombre', 'stock_bajo', 'proximo_vencimiento']
     
+    # Ambos filtros usan las anotaciones de Medicamento.objects.con_stock_vigente()
     def filter_stock_bajo(self, queryset, name, value):
         if value:
-            return queryset.filter(stock__lte=10)
-        return queryset.filter(stock__gt=10)
+            return queryset.filter(stock_vigente__lte=10)
+        return queryset.filter(stock_vigente__gt=10)
     
     def filter_proximo_vencimiento(self, queryset, name, value):
         from datetime import date, timedelta
         fecha_limite = date.today() + timedelta(days=30)
+        # vencimiento_vigente es el próximo vencimiento entre los lotes no vencidos con existencias
+        por_vencer = Q(vencimiento_vigente__lte=fecha_limite)
         if value:
-            return queryset.filter(fecha_vencimiento__lte=fecha_limite)
-        return queryset.filter(fecha_vencimiento__gt=fecha_limite)
+            return queryset.filter(por_vencer)
+        return queryset.exclude(por_vencer)
 
 
 # ============================================================================
@@ -125,7 +210,212 @@ class MedicamentoFilter(django_filters.FilterSet):
 # Estos viewsets proporcionan endpoints CRUD completos para cada modelo
 # Incluyen funcionalidades de filtrado, búsqueda, ordenamiento y acciones personalizadas
 
-class EspecialidadViewSet(viewsets.ModelViewSet):
+def prefetch_recetas():
+    """Prefetch de recetas con su medicamento y su stock vigente.
+
+    Django asigna cada receta a su tratamiento padre al hacer el prefetch, por lo
+    que `receta.tratamiento.consulta.paciente` no genera consultas adicionales.
+    El medicamento se trae en una consulta aparte (no por JOIN) para incluir las
+    anotaciones de con_stock_vigente() que usa MedicamentoSerializer.
+    """
+    return Prefetch('recetas', queryset=RecetaMedica.objects.prefetch_related(
+        Prefetch('medicamento', queryset=Medicamento.objects.con_stock_vigente())
+    ))
+
+
+def prefetch_arbol_consulta():
+    """Prefetch del árbol consulta → tratamientos → recetas → medicamento (tres consultas)"""
+    return Prefetch(
+        'tratamientos',
+        queryset=Tratamiento.objects.prefetch_related(prefetch_recetas()),
+    )
+
+
+# Cantidad máxima de citas pasadas y consultas incluidas en la ficha del paciente
+FICHA_LIMITE_HISTORICO = 50
+
+
+def ficha_paciente_queryset():
+    """Queryset de pacientes con todo lo que necesita FichaPacienteSerializer.
+
+    Historial por JOIN y citas próximas, citas pasadas y consultas recientes por
+    Prefetch, de modo que la ficha usa un número fijo de consultas SQL.
+    """
+    ahora = timezone.now()
+    citas = CitaMedica.objects.select_related('medico', 'medico__especialidad')
+    return Paciente.objects.select_related('historial_clinico').prefetch_related(
+        Prefetch(
+            'citas',
+            queryset=citas.filter(fecha_hora_cita__gte=ahora).order_by('fecha_hora_cita'),
+            to_attr='citas_proximas',
+        ),
+        Prefetch(
+            'citas',
+            queryset=citas.filter(fecha_hora_cita__lt=ahora).order_by('-fecha_hora_cita')[:FICHA_LIMITE_HISTORICO],
+            to_attr='citas_pasadas',
+        ),
+        Prefetch(
+            'consultas',
+            queryset=ConsultaMedica.objects.select_related(
+                'medico', 'medico__especialidad'
+            ).order_by('-fecha_consulta')[:FICHA_LIMITE_HISTORICO],
+            to_attr='consultas_recientes',
+        ),
+    )
+
+
+class RecuperacionPorIdsMixin:
+    """Mixin para recuperar varios registros por id en una sola consulta.
+
+    `GET ?ids=1,2,3` sobre el listado o `POST lote/` con `{"ids": [...]}` para
+    listas largas. Usa el queryset del viewset (con sus JOIN), un único
+    `id IN (...)`, sin paginación ni COUNT, y devuelve los resultados en el
+    orden solicitado junto con los ids no encontrados.
+    """
+    max_ids_por_lote = 500
+
+    def list(self, request, *args, **kwargs):
+        if 'ids' in request.query_params:
+            return self.recuperar_por_ids(request.query_params['ids'].split(','))
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=['post'])
+    def lote(self, request):
+        """Recuperar registros por una lista de ids enviada en el cuerpo"""
+        ids = request.data.get('ids') if hasattr(request.data, 'get') else None
+        if not isinstance(ids, list):
+            raise ValidationError({'ids': 'Debe enviar una lista de ids.'})
+        return self.recuperar_por_ids(ids)
+
+    def recuperar_por_ids(self, valores):
+        ids = self.parsear_ids(valores)
+        encontrados = self.get_queryset().filter(pk__in=ids).in_bulk()
+        serializer = self.get_serializer([encontrados[pk] for pk in ids if pk in encontrados], many=True)
+        return Response({
+            'results': serializer.data,
+            'no_encontrados': [pk for pk in ids if pk not in encontrados],
+        })
+
+    def parsear_ids(self, valores):
+        """Convierte los ids a enteros sin duplicados, conservando el orden"""
+        ids = []
+        for valor in valores:
+            if isinstance(valor, str):
+                valor = valor.strip()
+                if not valor:
+                    continue
+            try:
+                pk = int(valor)
+            except (TypeError, ValueError):
+                raise ValidationError({'ids': f'Id inválido: {valor}'})
+            if pk not in ids:
+                ids.append(pk)
+        if len(ids) > self.max_ids_por_lote:
+            raise ValidationError({'ids': f'Máximo {self.max_ids_por_lote} ids por solicitud.'})
+        return ids
+
+
+def rango_de_fechas(request, dias_por_defecto=7, max_dias=MAX_DIAS_DISPONIBILIDAD):
+    """Lee `desde`/`hasta` (AAAA-MM-DD) de la query string con valores por defecto y tope"""
+    try:
+        desde = date.fromisoformat(request.query_params['desde']) if 'desde' in request.query_params else timezone.localdate()
+        hasta = date.fromisoformat(request.query_params['hasta']) if 'hasta' in request.query_params else desde + timedelta(days=dias_por_defecto - 1)
+    except ValueError:
+        raise ValidationError({'detail': 'Las fechas deben tener formato AAAA-MM-DD.'})
+    if hasta < desde:
+        raise ValidationError({'hasta': 'Debe ser igual o posterior a desde.'})
+    if (hasta - desde).days >= max_dias:
+        raise ValidationError({'hasta': f'El rango no puede superar {max_dias} días.'})
+    return desde, hasta
+
+
+def serializar_cupos(cupos):
+    return [{'inicio': inicio, 'fin': fin} for inicio, fin in cupos]
+
+
+def parametros_agenda(request):
+    """Lee `vista` (semana/mes), `fecha` de referencia y `dia` visible de la query string"""
+    vista = request.query_params.get('vista', 'semana')
+    if vista not in VISTAS:
+        raise ValidationError({'vista': f'Debe ser una de: {", ".join(VISTAS)}.'})
+    try:
+        fecha = date.fromisoformat(request.query_params['fecha']) if 'fecha' in request.query_params else timezone.localdate()
+        dia = date.fromisoformat(request.query_params['dia']) if 'dia' in request.query_params else fecha
+    except ValueError:
+        raise ValidationError({'detail': 'Las fechas deben tener formato AAAA-MM-DD.'})
+    desde, hasta = rango_de_vista(vista, fecha)
+    if not desde <= dia <= hasta:
+        raise ValidationError({'dia': 'Debe estar dentro del rango visible.'})
+    return vista, desde, hasta, dia
+
+
+def responder_agenda(request, medico_ids, **encabezado):
+    """Respuesta de agenda con conteo por día y detalle del día visible.
+
+    Si el ETag del cliente coincide se responde 304 sin consultar las citas;
+    `no-cache` obliga al navegador a revalidar siempre, que es barato.
+    """
+    vista, desde, hasta, dia = parametros_agenda(request)
+    etag = etag_agenda(medico_ids, vista, desde, dia)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = Response({
+            **encabezado,
+            'vista': vista,
+            'desde': desde,
+            'hasta': hasta,
+            'dia': dia,
+            'dias': conteo_por_dia(medico_ids, desde, hasta),
+            'citas': CitaMedicaSerializer(citas_del_dia(medico_ids, dia), many=True).data,
+        })
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConsultasAnidadasMixin:
+    """Mixin para las acciones anidadas de consultas de médicos y pacientes.
+
+    Pagina con la paginación del viewset, filtra por fechas y texto, resuelve
+    paciente, médico y especialidad en un solo JOIN proyectando solo las columnas
+    que usa ConsultaMedicaSerializer, e incluye un resumen agregado.
+    """
+    consultas_campos = (
+        'id', 'paciente', 'medico', 'cita', 'fecha_consulta', 'motivo', 'diagnostico',
+        'created_at', 'updated_at',
+        'paciente__nombre', 'paciente__apellido',
+        'medico__nombre', 'medico__apellido', 'medico__especialidad__nombre',
+    )
+
+    def listar_consultas(self, request, consultas):
+        consultas = ConsultaAnidadaFilter(request.query_params, queryset=consultas, request=request).qs
+
+        # Resumen calculado en una sola consulta agregada sobre el conjunto filtrado
+        hace_30_dias = timezone.now() - timedelta(days=30)
+        resumen = consultas.order_by().aggregate(
+            total=Count('id'),
+            ultimos_30_dias=Count('id', filter=Q(fecha_consulta__gte=hace_30_dias)),
+            con_diagnostico=Count('id', filter=Q(diagnostico__isnull=False) & ~Q(diagnostico='')),
+            pacientes_distintos=Count('paciente', distinct=True),
+            medicos_distintos=Count('medico', distinct=True),
+        )
+
+        consultas = consultas.select_related(
+            'paciente', 'medico', 'medico__especialidad'
+        ).only(*self.consultas_campos).order_by('-fecha_consulta', '-id')
+
+        page = self.paginate_queryset(consultas)
+        if page is not None:
+            serializer = ConsultaMedicaSerializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+            response.data['resumen'] = resumen
+            return response
+
+        serializer = ConsultaMedicaSerializer(consultas, many=True)
+        return Response({'resumen': resumen, 'results': serializer.data})
+
+
+class EspecialidadViewSet(RecuperacionPorIdsMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar especialidades médicas a través de la API REST"""
     queryset = Especialidad.objects.all()
     serializer_class = EspecialidadSerializer
@@ -134,8 +424,32 @@ class EspecialidadViewSet(viewsets.ModelViewSet):
     ordering_fields = ['nombre', 'created_at']
     ordering = ['nombre']
 
+    @action(detail=True, methods=['get'])
+    def disponibilidad(self, request, pk=None):
+        """Cupos libres de los médicos activos de la especialidad entre `desde` y `hasta`"""
+        especialidad = self.get_object()
+        desde, hasta = rango_de_fechas(request)
+        medicos = list(especialidad.medicos.filter(activo=True).only('id', 'nombre', 'apellido', 'especialidad'))
+        cupos = disponibilidad_en_cache([medico.pk for medico in medicos], desde, hasta)
+        return Response({
+            'especialidad': especialidad.pk,
+            'desde': desde,
+            'hasta': hasta,
+            'medicos': [
+                {'medico': medico.pk, 'medico_nombre': medico.nombre_completo, 'cupos': serializar_cupos(cupos[medico.pk])}
+                for medico in medicos
+            ],
+        })
+
+    @action(detail=True, methods=['get'])
+    def agenda(self, request, pk=None):
+        """Agenda semanal o mensual de todos los médicos de la especialidad"""
+        especialidad = self.get_object()
+        medico_ids = list(especialidad.medicos.values_list('id', flat=True))
+        return responder_agenda(request, medico_ids, especialidad=especialidad.pk)
+
 
-class MedicoViewSet(viewsets.ModelViewSet):
+class MedicoViewSet(RecuperacionPorIdsMixin, ConsultasAnidadasMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar médicos con filtrado por especialidad y acciones personalizadas"""
     queryset = Medico.objects.select_related('especialidad')
     serializer_class = MedicoSerializer
@@ -152,14 +466,26 @@ class MedicoViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def consultas(self, request, pk=None):
-        """Obtener consultas de un médico específico"""
+        """Obtener consultas paginadas de un médico, filtrables por fecha_desde/fecha_hasta"""
         medico = self.get_object()
-        consultas = medico.consultas_realizadas.all()
-        serializer = ConsultaMedicaSerializer(consultas, many=True)
-        return Response(serializer.data)
+        return self.listar_consultas(request, ConsultaMedica.objects.filter(medico=medico))
 
+    @action(detail=True, methods=['get'])
+    def disponibilidad(self, request, pk=None):
+        """Cupos libres del médico entre `desde` y `hasta` según su horario y sus citas"""
+        medico = self.get_object()
+        desde, hasta = rango_de_fechas(request)
+        cupos = disponibilidad_en_cache([medico.pk], desde, hasta)[medico.pk]
+        return Response({'medico': medico.pk, 'desde': desde, 'hasta': hasta, 'cupos': serializar_cupos(cupos)})
 
-class PacienteViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def agenda(self, request, pk=None):
+        """Agenda semanal o mensual del médico: citas por día y estado y detalle de `dia`"""
+        medico = self.get_object()
+        return responder_agenda(request, [medico.pk], medico=medico.pk)
+
+
+class PacienteViewSet(RecuperacionPorIdsMixin, ConsultasAnidadasMixin, viewsets.ModelViewSet):
     """ViewSet para gestionar pacientes con filtrado por edad y datos personales"""
     queryset = Paciente.objects.all()
     serializer_class = PacienteSerializer
@@ -169,6 +495,15 @@ class PacienteViewSet(viewsets.ModelViewSet):
     ordering_fields = ['nombre', 'apellido', 'fecha_nacimiento', 'created_at']
     ordering = ['apellido', 'nombre']
     
+    # Ficha en caché de la solicitud en curso (ver `ficha`)
+    ficha_cacheada = None
+
+    def get_queryset(self):
+        # Con la ficha en caché basta el paciente solo para get_object
+        if self.action == 'ficha' and self.ficha_cacheada is None:
+            return ficha_paciente_queryset()
+        return super().get_queryset()
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return PacienteDetalleSerializer
@@ -176,14 +511,134 @@ class PacienteViewSet(viewsets.ModelViewSet):
     
     @action(detail=True, methods=['get'])
     def consultas(self, request, pk=None):
-        """Obtener consultas de un paciente específico"""
+        """Obtener consultas paginadas de un paciente, filtrables por fecha_desde/fecha_hasta"""
         paciente = self.get_object()
-        consultas = paciente.consultas.all()
-        serializer = ConsultaMedicaSerializer(consultas, many=True)
-        return Response(serializer.data)
+        return self.listar_consultas(request, ConsultaMedica.objects.filter(paciente=paciente))
 
+    @action(detail=True, methods=['get'])
+    def ficha(self, request, pk=None):
+        """Ficha completa del paciente: historial, citas, consultas y tratamientos activos.
+
+        La respuesta serializada queda en caché por paciente y se invalida cuando
+        cambia cualquiera de sus registros relacionados. get_object corre siempre,
+        también con la ficha en caché, para aplicar los filtros y los permisos.
+        """
+        self.ficha_cacheada = data = obtener_ficha(pk)
+        paciente = self.get_object()
+        if data is None:
+            tratamientos_activos = Tratamiento.objects.filter(
+                consulta__paciente=paciente, fecha_fin__gte=date.today()
+            ).select_related(
+                'consulta', 'consulta__medico'
+            ).prefetch_related(prefetch_recetas()).order_by('-fecha_inicio')
+            # El paciente ya está cargado: evita volver a consultarlo por cada tratamiento
+            for tratamiento in tratamientos_activos:
+                tratamiento.consulta.paciente = paciente
+            serializer = FichaPacienteSerializer(
+                paciente, context={'request': request, 'tratamientos_activos': tratamientos_activos}
+            )
+            data = serializer.data
+            guardar_ficha(paciente.pk, data)
+        return Response(data)
+
+
+class HorarioMedicoViewSet(RecuperacionPorIdsMixin, viewsets.ModelViewSet):
+    """ViewSet para gestionar la plantilla semanal de atención de los médicos"""
+    queryset = HorarioMedico.objects.select_related('medico')
+    serializer_class = HorarioMedicoSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['medico', 'dia_semana']
+    ordering_fields = ['dia_semana', 'hora_inicio']
+    ordering = ['medico', 'dia_semana', 'hora_inicio']
+
+
+class CitaMedicaViewSet(RecuperacionPorIdsMixin, viewsets.ModelViewSet):
+    """ViewSet de citas médicas con operaciones masivas de estado y reasignación.
+
+    La restricción de citas superpuestas se traduce en errores de validación
+    (ver CitaMedicaSerializer).
+    """
+    queryset = CitaMedica.objects.select_related('paciente', 'medico', 'medico__especialidad')
+    serializer_class = CitaMedicaSerializer
+    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filterset_class = CitaMedicaFilter
+    search_fields = ['paciente__nombre', 'paciente__apellido', 'medico__nombre', 'medico__apellido', 'motivo']
+    ordering_fields = ['fecha_hora_cita', 'created_at']
+    ordering = ['-fecha_hora_cita']
+
+    @action(detail=False, methods=['post'])
+    def cambiar_estado(self, request):
+        """Cambia el estado de todas las citas que coinciden con los filtros de la query string.
+
+        Ej.: `POST /api/citas/cambiar_estado/?fecha_desde=2025-03-10&fecha_hasta=2025-03-10`
+        con `{"estado": "Confirmada"}` confirma las citas de ese día.
+        """
+        filtros = set(CitaMedicaFilter.base_filters) | {'search'}
+        if not filtros & request.query_params.keys():
+            raise ValidationError({'detail': 'Debe indicar al menos un filtro para la operación masiva.'})
+        parametros = CambiarEstadoCitasSerializer(data=request.data)
+        parametros.is_valid(raise_exception=True)
+        try:
+            actualizadas, omitidas = cambiar_estado(
+                self.filter_queryset(self.get_queryset()), parametros.validated_data['estado']
+            )
+        except CitasEnConflicto:
+            raise ValidationError({'detail': 'Alguna cita reactivada choca con otra cita del médico.'})
+        return Response({'actualizadas': actualizadas, 'omitidas': omitidas})
+
+    @action(detail=False, methods=['post'])
+    def reasignar(self, request):
+        """Mueve las citas abiertas de un médico a otro desde una fecha (por defecto, ahora)"""
+        parametros = ReasignarCitasSerializer(data=request.data)
+        parametros.is_valid(raise_exception=True)
+        try:
+            reasignadas = reasignar(**parametros.validated_data)
+        except CitasEnConflicto as error:
+            raise ValidationError({'conflictos': error.fechas})
+        except CitasFueraDeHorario as error:
+            raise ValidationError({'fuera_de_horario': error.fechas})
+        return Response({'reasignadas': reasignadas})
+
+
+class SerieCitasViewSet(RecuperacionPorIdsMixin, mixins.CreateModelMixin, mixins.ListModelMixin,
+                        mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """ViewSet de series de citas recurrentes.
+
+    Crear una serie genera todas sus citas; las series no se editan ni eliminan
+    directamente, se cancelan o reprograman "desde" una fecha.
+    """
+    queryset = SerieCitas.objects.select_related('paciente', 'medico').annotate(
+        citas_vigentes=Count('citas', filter=~Q(citas__estado='Cancelada'))
+    )
+    serializer_class = SerieCitasSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['paciente', 'medico']
+    ordering_fields = ['fecha_inicio', 'created_at']
+    ordering = ['-fecha_inicio']
 
-class ConsultaMedicaViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['post'])
+    def cancelar(self, request, pk=None):
+        """Cancela esta y las siguientes citas abiertas de la serie"""
+        serie = self.get_object()
+        parametros = SerieDesdeSerializer(data=request.data)
+        parametros.is_valid(raise_exception=True)
+        canceladas = cancelar_desde(serie, parametros.validated_data['desde'])
+        return Response({'serie': serie.pk, 'canceladas': canceladas})
+
+    @action(detail=True, methods=['post'])
+    def reprogramar(self, request, pk=None):
+        """Cambia hora, duración o médico de esta y las siguientes citas abiertas"""
+        serie = self.get_object()
+        parametros = ReprogramarSerieSerializer(data=request.data)
+        parametros.is_valid(raise_exception=True)
+        try:
+            actualizadas = reprogramar_desde(serie, **parametros.validated_data)
+        except CitasEnConflicto:
+            raise ValidationError({'detail': 'El nuevo horario choca con otras citas del médico.'})
+        return Response({'serie': serie.pk, 'actualizadas': actualizadas})
+
+
+class ConsultaMedicaViewSet(RecuperacionPorIdsMixin, viewsets.ModelViewSet):
     queryset = ConsultaMedica.objects.select_related('paciente', 'medico', 'medico__especialidad')
     serializer_class = ConsultaMedicaSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -192,6 +647,13 @@ class ConsultaMedicaViewSet(viewsets.ModelViewSet):
     ordering_fields = ['fecha_consulta', 'created_at']
     ordering = ['-fecha_consulta']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            # El detalle incluye el árbol completo de tratamientos y recetas
+            queryset = queryset.prefetch_related(prefetch_arbol_consulta())
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return ConsultaMedicaDetalleSerializer
@@ -200,13 +662,14 @@ class ConsultaMedicaViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def hoy(self, request):
         """Obtener consultas de hoy"""
-        hoy = datetime.now().date()
-        consultas = self.queryset.filter(fecha_consulta__date=hoy)
+        # Rango del día local (no __date) para usar el índice de fecha, como la versión async
+        inicio, fin = datos_dashboard.rango_del_dia(timezone.localdate())
+        consultas = self.queryset.filter(fecha_consulta__gte=inicio, fecha_consulta__lt=fin).order_by('-fecha_consulta')
         serializer = self.get_serializer(consultas, many=True)
         return Response(serializer.data)
 
 
-class TratamientoViewSet(viewsets.ModelViewSet):
+class TratamientoViewSet(RecuperacionPorIdsMixin, viewsets.ModelViewSet):
     queryset = Tratamiento.objects.select_related('consulta', 'consulta__paciente', 'consulta__medico')
     serializer_class = TratamientoSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -214,6 +677,12 @@ class TratamientoViewSet(viewsets.ModelViewSet):
     ordering_fields = ['fecha_inicio', 'fecha_fin', 'created_at']
     ordering = ['-fecha_inicio']
     
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(prefetch_recetas())
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return TratamientoDetalleSerializer
@@ -230,42 +699,236 @@ class TratamientoViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
 
-class MedicamentoViewSet(viewsets.ModelViewSet):
-    queryset = Medicamento.objects.all()
+class MedicamentoViewSet(RecuperacionPorIdsMixin, viewsets.ModelViewSet):
+    # Stock y vencimiento de los lotes no vencidos, para las alertas y el serializador
+    queryset = Medicamento.objects.con_stock_vigente()
     serializer_class = MedicamentoSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_class = MedicamentoFilter
     search_fields = ['nombre', 'descripcion']
-    ordering_fields = ['nombre', 'stock', 'precio_unitario', 'fecha_vencimiento', 'created_at']
+    ordering_fields = ['nombre', 'stock', 'stock_vigente', 'precio_unitario', 'fecha_vencimiento', 'created_at']
     ordering = ['nombre']
     
     @action(detail=False, methods=['get'])
     def stock_bajo(self, request):
-        """Obtener medicamentos con stock bajo"""
-        medicamentos = self.queryset.filter(stock__lte=10)
+        """Obtener medicamentos con stock bajo en lotes no vencidos"""
+        medicamentos = self.queryset.filter(stock_vigente__lte=10)
         serializer = self.get_serializer(medicamentos, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
     def proximos_vencimiento(self, request):
-        """Obtener medicamentos próximos a vencer"""
+        """Obtener medicamentos cuyo próximo lote no vencido vence en 30 días o menos"""
         from datetime import date, timedelta
         fecha_limite = date.today() + timedelta(days=30)
-        medicamentos = self.queryset.filter(fecha_vencimiento__lte=fecha_limite)
+        medicamentos = self.queryset.filter(vencimiento_vigente__lte=fecha_limite)
         serializer = self.get_serializer(medicamentos, many=True)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get', 'post'])
+    def lotes(self, request, pk=None):
+        """Lotes con existencias en orden FEFO (GET) o recepción de un lote nuevo (POST)"""
+        medicamento = self.get_object()
+        if request.method == 'POST':
+            serializer = LoteMedicamentoSerializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            lote = recibir_lote(medicamento.pk, **serializer.validated_data)
+            return Response(LoteMedicamentoSerializer(lote).data, status=status.HTTP_201_CREATED)
+
+        lotes = medicamento.lotes.filter(cantidad__gt=0).order_by('fecha_vencimiento', 'id')
+        return Response(LoteMedicamentoSerializer(lotes, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def lotes_por_vencer(self, request):
+        """Lotes con existencias que vencen dentro de `dias` (30 por defecto), con su medicamento"""
+        try:
+            dias = int(request.query_params.get('dias', 30))
+        except ValueError:
+            raise ValidationError({'dias': 'Debe ser un número entero.'})
+        lotes = (
+            LoteMedicamento.objects
+            .filter(cantidad__gt=0, fecha_vencimiento__lte=date.today() + timedelta(days=dias))
+            .select_related('medicamento')
+            .order_by('fecha_vencimiento', 'id')
+        )
+        return Response([
+            {**LoteMedicamentoSerializer(lote).data, 'medicamento_nombre': lote.medicamento.nombre}
+            for lote in lotes
+        ])
+
+    @action(detail=True, methods=['get', 'post'])
+    def movimientos(self, request, pk=None):
+        """Libro de inventario del medicamento (GET) o ingreso o ajuste sobre un lote (POST)"""
+        medicamento = self.get_object()
+        if request.method == 'POST':
+            serializer = MovimientoInventarioSerializer(data=request.data, context={'medicamento': medicamento})
+            serializer.is_valid(raise_exception=True)
+            try:
+                movimiento, = registrar_movimiento(medicamento.pk, **serializer.validated_data)
+            except StockInsuficiente as error:
+                raise ValidationError({'cantidad': str(error)})
+            return Response(MovimientoInventarioSerializer(movimiento).data, status=status.HTTP_201_CREATED)
+
+        page = self.paginate_queryset(medicamento.movimientos.all())
+        return self.get_paginated_response(MovimientoInventarioSerializer(page, many=True).data)
+
+    @action(detail=False, methods=['get'])
+    def stock_en_fecha(self, request):
+        """Stock de los medicamentos (filtrados) al cierre de `fecha` (AAAA-MM-DD)"""
+        try:
+            fecha = date.fromisoformat(request.query_params.get('fecha', ''))
+        except ValueError:
+            raise ValidationError({'fecha': 'Debe indicar una fecha con formato AAAA-MM-DD.'})
+        medicamentos = self.filter_queryset(self.get_queryset()).values_list('id', 'nombre')
+        stock = stock_en_fecha(fecha, medicamentos=[pk for pk, _ in medicamentos])
+        return Response({
+            'fecha': fecha,
+            'results': [
+                {'medicamento': pk, 'nombre': nombre, 'stock': stock.get(pk, 0)}
+                for pk, nombre in medicamentos
+            ],
+        })
 
-class RecetaMedicaViewSet(viewsets.ModelViewSet):
+
+class RecetaMedicaViewSet(RecuperacionPorIdsMixin, viewsets.ModelViewSet):
     queryset = RecetaMedica.objects.select_related(
         'tratamiento', 'tratamiento__consulta', 'tratamiento__consulta__paciente', 'medicamento'
     )
     serializer_class = RecetaMedicaSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['tratamiento__consulta__paciente__nombre', 'medicamento__nombre']
-    ordering_fields = ['created_at', 'cantidad', 'frecuencia']
+    ordering_fields = ['created_at', 'cantidad', 'frecuencia', 'costo_total']
     ordering = ['-created_at']
 
+    @action(detail=False, methods=['get'])
+    def costos(self, request):
+        """Costo de las recetas agrupado `por` tratamiento, paciente, médico o mes (`desde`/`hasta` opcionales)"""
+        agrupacion = request.query_params.get('por')
+        if agrupacion not in AGRUPACIONES:
+            raise ValidationError({'por': f'Debe ser uno de: {", ".join(AGRUPACIONES)}.'})
+        fechas = {}
+        for parametro in ('desde', 'hasta'):
+            valor = request.query_params.get(parametro)
+            try:
+                fechas[parametro] = date.fromisoformat(valor) if valor else None
+            except ValueError:
+                raise ValidationError({parametro: 'Debe ser una fecha con formato AAAA-MM-DD.'})
+
+        page = self.paginate_queryset(costos_por(agrupacion, **fechas))
+        return self.get_paginated_response(page)
+
+
+class SincronizacionViewSet(viewsets.ViewSet):
+    """Sincronización incremental: `GET /api/sync/?since=<token>&limite=<n>`.
+
+    Devuelve las filas creadas o modificadas de cada colección y las
+    eliminaciones desde el token, en lotes. El cliente guarda el `token`
+    recibido y repite la llamada mientras `hay_mas` sea verdadero.
+    """
+
+    def list(self, request):
+        try:
+            limite = min(int(request.query_params.get('limite', LIMITE_POR_DEFECTO)), LIMITE_MAXIMO)
+        except ValueError:
+            raise ValidationError({'limite': 'Debe ser un número entero.'})
+        if limite < 1:
+            raise ValidationError({'limite': 'Debe ser mayor a 0.'})
+        try:
+            return Response(obtener_cambios(request.query_params.get('since'), limite))
+        except TokenInvalido as e:
+            raise ValidationError({'since': str(e)})
+
+
+class AutenticacionDelLote(BaseAuthentication):
+    """Autentica una sub-solicitud del lote con el usuario y la credencial que ya
+    verificó la solicitud principal, sin repetir sus autenticadores"""
+
+    def authenticate(self, request):
+        sub = request._request
+        if not sub.user.is_authenticated:
+            return None
+        return sub.user, sub.auth
+
+
+class DashboardViewSet(viewsets.ViewSet):
+    """Estadísticas del dashboard en JSON: `GET /api/dashboard/`.
+
+    Mismo cuerpo y mismas consultas que /api/async/dashboard/ (ver dashboard.py).
+    """
+
+    def list(self, request):
+        return Response(datos_dashboard.datos(
+            datos_dashboard.totales(),
+            datos_dashboard.consultas_recientes(),
+            datos_dashboard.especialidades_stats(),
+        ))
+
+
+class LoteSolicitudesViewSet(viewsets.ViewSet):
+    """Ejecuta varias llamadas GET a la API en un solo viaje: `POST /api/batch/`.
+
+    Cuerpo: `{"solicitudes": [{"id": "hoy", "url": "/api/consultas/hoy/"}, ...]}`.
+    Cada sub-solicitud se resuelve contra el router y se ejecuta en el mismo
+    proceso, reutilizando la autenticación ya verificada y la conexión a la
+    base de datos de la solicitud principal. Solo se admiten rutas de los
+    viewsets de la API (no las vistas async ni otras vistas de Django). Las
+    respuestas se devuelven en el mismo orden con su código de estado y cuerpo.
+    """
+    max_solicitudes = 20
+    # Encabezados de la solicitud original que se copian a cada sub-solicitud
+    meta_compartida = ('SERVER_NAME', 'SERVER_PORT', 'HTTP_HOST', 'HTTP_ACCEPT_LANGUAGE', 'REMOTE_ADDR', 'wsgi.url_scheme')
+
+    def create(self, request):
+        solicitudes = request.data.get('solicitudes') if hasattr(request.data, 'get') else None
+        if not isinstance(solicitudes, list) or not solicitudes:
+            raise ValidationError({'solicitudes': 'Debe enviar una lista de sub-solicitudes.'})
+        if len(solicitudes) > self.max_solicitudes:
+            raise ValidationError({'solicitudes': f'Máximo {self.max_solicitudes} sub-solicitudes por lote.'})
+
+        respuestas = []
+        for indice, solicitud in enumerate(solicitudes):
+            if not isinstance(solicitud, dict) or not isinstance(solicitud.get('url'), str):
+                raise ValidationError({'solicitudes': f'La sub-solicitud {indice} debe incluir "url".'})
+            if solicitud.get('method', 'GET').upper() != 'GET':
+                raise ValidationError({'solicitudes': f'La sub-solicitud {indice}: solo se admite GET.'})
+            status_code, body = self.ejecutar(request, solicitud['url'])
+            respuestas.append({'id': solicitud.get('id', indice), 'status': status_code, 'body': body})
+
+        return Response({'respuestas': respuestas})
+
+    def ejecutar(self, request, url):
+        """Resuelve y ejecuta una sub-solicitud GET, devolviendo (status, cuerpo)"""
+        partes = urlsplit(url)
+        if not partes.path.startswith('/api/') or partes.path.startswith(request.path):
+            return status.HTTP_400_BAD_REQUEST, {'detail': 'URL no permitida en un lote.'}
+        try:
+            match = resolve(partes.path)
+        except Http404:
+            return status.HTTP_404_NOT_FOUND, {'detail': 'No encontrado.'}
+
+        vista = match.func
+        viewset = getattr(vista, 'cls', None)
+        if iscoroutinefunction(vista) or viewset is None or not issubclass(viewset, viewsets.ViewSetMixin):
+            return status.HTTP_400_BAD_REQUEST, {'detail': 'Solo se admiten rutas de los viewsets de la API en un lote.'}
+
+        sub = HttpRequest()
+        sub.method = 'GET'
+        sub.path = sub.path_info = partes.path
+        sub.META = {clave: request.META[clave] for clave in self.meta_compartida if clave in request.META}
+        sub.META.update({'REQUEST_METHOD': 'GET', 'PATH_INFO': partes.path, 'QUERY_STRING': partes.query})
+        sub.GET = QueryDict(partes.query)
+        sub.resolver_match = match
+        sub.user = request.user
+        sub.auth = request.auth
+
+        # El viewset se reconstruye con AutenticacionDelLote: los permisos se
+        # verifican igual, pero sin repetir, p. ej., el hash de BasicAuthentication
+        vista = viewset.as_view(vista.actions, **{**vista.initkwargs, 'authentication_classes': [AutenticacionDelLote]})
+        response = vista(sub, *match.args, **match.kwargs)
+        if hasattr(response, 'data'):
+            return response.status_code, response.data
+        return response.status_code, response.content.decode(response.charset or 'utf-8')
+
 
 # ============================================================================
 # FORMULARIOS PARA VISTAS BASADAS EN PLANTILLAS HTML
@@ -416,6 +1079,11 @@ class TratamientoForm(forms.ModelForm):
             }),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Cada opción se muestra con el nombre del paciente (str de la consulta)
+        self.fields['consulta'].queryset = ConsultaMedica.objects.select_related('paciente')
+
 class MedicamentoForm(forms.ModelForm):
     class Meta:
         model = Medicamento
@@ -447,6 +1115,14 @@ class MedicamentoForm(forms.ModelForm):
             }),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Stock y vencimiento definen el primer lote al crear; después cambian con
+        # movimientos de inventario
+        if self.instance.pk:
+            for campo in Medicamento.CAMPOS_DE_LOTES:
+                self.fields[campo].disabled = True
+
 class RecetaMedicaForm(forms.ModelForm):
     class Meta:
         model = RecetaMedica
@@ -475,6 +1151,11 @@ class RecetaMedicaForm(forms.ModelForm):
             }),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Cada opción se muestra con el nombre del paciente (str del tratamiento)
+        self.fields['tratamiento'].queryset = Tratamiento.objects.select_related('consulta__paciente')
+
 
 # ============================================================================
 # VISTAS BASADAS EN PLANTILLAS HTML
@@ -482,6 +1163,15 @@ class RecetaMedicaForm(forms.ModelForm):
 # Estas vistas manejan la interfaz web del sistema, proporcionando páginas HTML
 # completas con funcionalidades CRUD, paginación, búsqueda y filtrado
 
+def registros_protegidos(error):
+    """Tipos de registro que impiden una eliminación (ProtectedError).
+
+    No usa str(error), que convierte a texto cada fila protegida: una o más
+    consultas SQL por fila cuando su __str__ sigue claves foráneas.
+    """
+    return ', '.join(sorted({str(objeto._meta.verbose_name_plural).lower() for objeto in error.protected_objects}))
+
+
 # ============================================================================
 # DASHBOARD PRINCIPAL
 # ============================================================================
@@ -618,6 +1308,8 @@ def especialidades_delete(request, pk):
     try:
         especialidad.delete()
         messages.success(request, f'Especialidad "{nombre}" eliminada exitosamente.')
+    except ProtectedError as e:
+        messages.error(request, f'No se puede eliminar la especialidad porque tiene registros asociados ({registros_protegidos(e)}).')
     except Exception as e:
         messages.error(request, f'Error al eliminar la especialidad: {str(e)}')
     
@@ -644,7 +1336,7 @@ def pacientes_list(request):
             Q(rut__icontains=search)
         )
     
-    pacientes = pacientes.order_by('apellido', 'nombre')
+    pacientes = pacientes.annotate(total_consultas=Count('consultas')).order_by('apellido', 'nombre')
     
     paginator = Paginator(pacientes, 15)
     page_number = request.GET.get('page')
@@ -788,7 +1480,7 @@ def medicos_list(request):
     if especialidad:
         medicos = medicos.filter(especialidad_id=especialidad)
     
-    medicos = medicos.order_by('apellido', 'nombre')
+    medicos = medicos.annotate(total_consultas=Count('consultas_realizadas')).order_by('apellido', 'nombre')
     
     paginator = Paginator(medicos, 15)
     page_number = request.GET.get('page')
@@ -826,14 +1518,19 @@ def medicos_create(request):
 
 def medicos_detail(request, pk):
     """Detalle de médico"""
-    medico = get_object_or_404(Medico, pk=pk)
+    medico = get_object_or_404(Medico.objects.select_related('especialidad'), pk=pk)
+    # Solo las últimas consultas: un médico puede acumular miles
     consultas = medico.consultas_realizadas.select_related(
         'paciente'
-    ).order_by('-fecha_consulta')
+    ).order_by('-fecha_consulta')[:5]
+    totales = medico.consultas_realizadas.aggregate(
+        total_consultas=Count('id'), total_pacientes=Count('paciente', distinct=True)
+    )
     
     context = {
         'medico': medico,
         'consultas': consultas,
+        **totales,
     }
     
     return render(request, 'medicos/detail.html', context)
@@ -869,6 +1566,8 @@ def medicos_delete(request, pk):
     try:
         medico.delete()
         messages.success(request, f'Médico "{nombre}" eliminado exitosamente.')
+    except ProtectedError as e:
+        messages.error(request, f'No se puede eliminar el médico porque tiene registros asociados ({registros_protegidos(e)}).')
     except Exception as e:
         messages.error(request, f'Error al eliminar el médico: {str(e)}')
     
@@ -950,10 +1649,19 @@ def consultas_create(request):
 
 def consultas_detail(request, pk):
     """Detalle de consulta médica"""
-    consulta = get_object_or_404(ConsultaMedica, pk=pk)
+    consulta = get_object_or_404(
+        ConsultaMedica.objects.select_related('paciente', 'medico', 'medico__especialidad'), pk=pk
+    )
+    # Solo las últimas consultas del paciente (sin la actual) y el total por separado
+    consultas_paciente = consulta.paciente.consultas.select_related(
+        'medico__especialidad'
+    ).exclude(pk=consulta.pk).order_by('-fecha_consulta')[:5]
+    totales = consulta.paciente.consultas.aggregate(total_consultas_paciente=Count('id'))
     
     context = {
         'consulta': consulta,
+        'consultas_paciente': consultas_paciente,
+        **totales,
     }
     
     return render(request, 'consultas/detail.html', context)
@@ -1008,7 +1716,9 @@ def tratamientos_list(request):
     fecha_desde = request.GET.get('fecha_desde', '')
     fecha_hasta = request.GET.get('fecha_hasta', '')
     
-    tratamientos = Tratamiento.objects.all().order_by('-fecha_inicio')
+    tratamientos = Tratamiento.objects.select_related(
+        'consulta', 'consulta__paciente', 'consulta__medico'
+    ).order_by('-fecha_inicio')
     
     if search_query:
         tratamientos = tratamientos.filter(
@@ -1030,7 +1740,7 @@ def tratamientos_list(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
-    consultas = ConsultaMedica.objects.all()
+    consultas = ConsultaMedica.objects.select_related('paciente').order_by('-fecha_consulta')
     
     context = {
         'page_obj': page_obj,
@@ -1063,7 +1773,9 @@ def tratamientos_create(request):
 
 def tratamientos_detail(request, pk):
     """Detalle de tratamiento"""
-    tratamiento = get_object_or_404(Tratamiento, pk=pk)
+    tratamiento = get_object_or_404(
+        Tratamiento.objects.select_related('consulta__paciente', 'consulta__medico__especialidad'), pk=pk
+    )
     
     context = {
         'tratamiento': tratamiento,
@@ -1120,7 +1832,7 @@ def medicamentos_list(request):
     stock_bajo = request.GET.get('stock_bajo', '')
     proximo_vencimiento = request.GET.get('proximo_vencimiento', '')
     
-    medicamentos = Medicamento.objects.all()
+    medicamentos = Medicamento.objects.con_stock_vigente()
     
     if search:
         medicamentos = medicamentos.filter(
@@ -1129,12 +1841,12 @@ def medicamentos_list(request):
         )
     
     if stock_bajo:
-        medicamentos = medicamentos.filter(stock__lte=10)
+        medicamentos = medicamentos.filter(stock_vigente__lte=10)
     
     if proximo_vencimiento:
         from datetime import date, timedelta
         fecha_limite = date.today() + timedelta(days=30)
-        medicamentos = medicamentos.filter(fecha_vencimiento__lte=fecha_limite)
+        medicamentos = medicamentos.filter(vencimiento_vigente__lte=fecha_limite)
     
     medicamentos = medicamentos.order_by('nombre')
     
@@ -1175,7 +1887,7 @@ def medicamentos_create(request):
 
 def medicamentos_detail(request, pk):
     """Detalle de medicamento"""
-    medicamento = get_object_or_404(Medicamento, pk=pk)
+    medicamento = get_object_or_404(Medicamento.objects.con_stock_vigente(), pk=pk)
     
     context = {
         'medicamento': medicamento,
@@ -1214,6 +1926,8 @@ def medicamentos_delete(request, pk):
     try:
         medicamento.delete()
         messages.success(request, f'Medicamento "{nombre}" eliminado exitosamente.')
+    except ProtectedError as e:
+        messages.error(request, f'No se puede eliminar el medicamento porque tiene registros asociados ({registros_protegidos(e)}).')
     except Exception as e:
         messages.error(request, f'Error al eliminar el medicamento: {str(e)}')
     
@@ -1294,9 +2008,12 @@ def recetas_create(request):
     if request.method == 'POST':
         form = RecetaMedicaForm(request.POST)
         if form.is_valid():
-            receta = form.save()
-            messages.success(request, f'Receta médica creada exitosamente.')
-            return redirect('recetas_detail', pk=receta.pk)
+            try:
+                receta = form.save()
+                messages.success(request, f'Receta médica creada exitosamente.')
+                return redirect('recetas_detail', pk=receta.pk)
+            except StockInsuficiente as e:
+                form.add_error('cantidad', str(e))
     else:
         form = RecetaMedicaForm()
     
@@ -1309,7 +2026,11 @@ def recetas_create(request):
 
 def recetas_detail(request, pk):
     """Detalle de receta médica"""
-    receta = get_object_or_404(RecetaMedica, pk=pk)
+    receta = get_object_or_404(
+        RecetaMedica.objects.select_related(
+            'medicamento', 'tratamiento__consulta__paciente', 'tratamiento__consulta__medico__especialidad'
+        ), pk=pk
+    )
     
     context = {
         'receta': receta,
@@ -1325,9 +2046,12 @@ def recetas_edit(request, pk):
     if request.method == 'POST':
         form = RecetaMedicaForm(request.POST, instance=receta)
         if form.is_valid():
-            form.save()
-            messages.success(request, f'Receta médica actualizada exitosamente.')
-            return redirect('recetas_detail', pk=receta.pk)
+            try:
+                form.save()
+                messages.success(request, f'Receta médica actualizada exitosamente.')
+                return redirect('recetas_detail', pk=receta.pk)
+            except StockInsuficiente as e:
+                form.add_error('cantidad', str(e))
     else:
         form = RecetaMedicaForm(instance=receta)
     
@@ -1358,7 +2082,7 @@ def recetas_delete(request, pk):
 class CitaForm(forms.ModelForm):
     class Meta:
         model = CitaMedica
-        fields = ['paciente', 'medico', 'fecha_hora_cita', 'estado', 'motivo', 'observaciones']
+        fields = ['paciente', 'medico', 'fecha_hora_cita', 'duracion_minutos', 'estado', 'motivo', 'observaciones']
         widgets = {
             'paciente': forms.Select(attrs={
                 'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary-500 focus:border-primary-500 transition-colors duration-200',
@@ -1373,6 +2097,11 @@ class CitaForm(forms.ModelForm):
                 'type': 'datetime-local',
                 'required': True
             }),
+            'duracion_minutos': forms.NumberInput(attrs={
+                'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary-500 focus:border-primary-500 transition-colors duration-200',
+                'min': 5,
+                'step': 5
+            }),
             'estado': forms.Select(attrs={
                 'class': 'w-full px-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary-500 focus:border-primary-500 transition-colors duration-200'
             }),
@@ -1447,9 +2176,17 @@ def citas_create(request):
         form = CitaForm(request.POST)
         if form.is_valid():
             try:
-                cita = form.save()
+                # La restricción de exclusión puede rechazar el INSERT/UPDATE si otra
+                # cita del médico ocupó el horario; se aísla en su propia transacción
+                with transaction.atomic():
+                    cita = form.save()
                 messages.success(request, f'Cita médica creada exitosamente para {cita.paciente.nombre_completo}.')
                 return redirect('citas_detail', pk=cita.pk)
+            except IntegrityError as e:
+                if es_cita_superpuesta(e):
+                    form.add_error('fecha_hora_cita', MENSAJE_CITA_SUPERPUESTA)
+                else:
+                    messages.error(request, f'Error al crear la cita: {str(e)}')
             except Exception as e:
                 messages.error(request, f'Error al crear la cita: {str(e)}')
     else:
@@ -1470,9 +2207,17 @@ def citas_edit(request, pk):
         form = CitaForm(request.POST, instance=cita)
         if form.is_valid():
             try:
-                cita = form.save()
+                # La restricción de exclusión puede rechazar el INSERT/UPDATE si otra
+                # cita del médico ocupó el horario; se aísla en su propia transacción
+                with transaction.atomic():
+                    cita = form.save()
                 messages.success(request, f'Cita médica actualizada exitosamente.')
                 return redirect('citas_detail', pk=cita.pk)
+            except IntegrityError as e:
+                if es_cita_superpuesta(e):
+                    form.add_error('fecha_hora_cita', MENSAJE_CITA_SUPERPUESTA)
+                else:
+                    messages.error(request, f'Error al actualizar la cita: {str(e)}')
             except Exception as e:
                 messages.error(request, f'Error al actualizar la cita: {str(e)}')
     else:
@@ -1707,3 +2452,14 @@ def historiales_delete(request, pk):
         messages.error(request, f'Error al eliminar el historial: {str(e)}')
     
     return redirect('historiales_list')
+
+
+# ============================================================================
+# MÉTRICAS PROMETHEUS
+# ============================================================================
+
+@require_GET
+def metricas(request):
+    """Métricas en formato de texto Prometheus (sumadas entre workers en modo multiproceso)"""
+    contenido, content_type = exponer()
+    return HttpResponse(contenido, content_type=content_type)
@@ -75,14 +75,20 @@ INSTALLED_APPS = [
 # ============================================================================
 # Lista de middleware que procesa las peticiones HTTP en orden
 MIDDLEWARE = [
-    'corsheaders.middleware.CorsMiddleware',           # Manejo de CORS (debe ir primero)
+    'salud_vital.middleware.TrazasMiddleware',         # Traza de la solicitud (solo con TRAZAS)
+    'corsheaders.middleware.CorsMiddleware',           # Manejo de CORS (antes del resto)
+    'salud_vital.middleware.MetricasMiddleware',       # Métricas Prometheus de /metrics
+    'salud_vital.middleware.PerfilSQLMiddleware',      # Perfil SQL por solicitud (solo con PERFIL_SQL)
+    'salud_vital.middleware.ConsultasLentasMiddleware',  # Captura de consultas lentas (solo con umbral)
     'django.middleware.security.SecurityMiddleware',   # Configuraciones de seguridad
     'django.contrib.sessions.middleware.SessionMiddleware',  # Manejo de sesiones
     'django.middleware.common.CommonMiddleware',       # Funcionalidades comunes
     'django.middleware.csrf.CsrfViewMiddleware',       # Protección CSRF
     'django.contrib.auth.middleware.AuthenticationMiddleware',  # Autenticación
+    'salud_vital.middleware.PerfiladorMiddleware',     # Perfil bajo demanda (firma del personal)
     'django.contrib.messages.middleware.MessageMiddleware',     # Sistema de mensajes
     'django.middleware.clickjacking.XFrameOptionsMiddleware',   # Protección clickjacking
+    'salud_vital.middleware.TramoVistaMiddleware',     # Tramo de la vista (debe ir último)
 ]
 
 # ============================================================================
@@ -149,6 +155,77 @@ DATABASES = {
 }
 
 
+# ============================================================================
+# CONFIGURACIÓN DE CACHÉ
+# ============================================================================
+# Caché en memoria local por defecto; en producción con varios workers debe
+# apuntarse a un backend compartido (p. ej. Redis o Memcached) vía .env
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='salud-vital'),
+    }
+}
+
+# Tiempo de vida (segundos) de la ficha completa del paciente en caché
+FICHA_CACHE_TIMEOUT = config('FICHA_CACHE_TIMEOUT', default=900, cast=int)
+
+
+# ============================================================================
+# DIAGNÓSTICO DE RENDIMIENTO
+# ============================================================================
+# Histogramas de latencia y SQL por ruta para /metrics (formato Prometheus).
+# Con varios workers se debe definir PROMETHEUS_MULTIPROC_DIR (ver README)
+METRICAS = config('METRICAS', default=True, cast=bool)
+
+# Perfil SQL de cada solicitud en el encabezado Server-Timing y en el logger
+# salud_vital.perfil_sql; desactivado no agrega costo alguno
+PERFIL_SQL = config('PERFIL_SQL', default=False, cast=bool)
+# Ejecuciones de una misma plantilla SQL desde las que se sospecha un N+1
+PERFIL_SQL_UMBRAL_N1 = config('PERFIL_SQL_UMBRAL_N1', default=5, cast=int)
+
+# Perfilador bajo demanda: las solicitudes del personal con la firma que
+# muestra el admin (Perfiles de Solicitud) se perfilan por muestreo y sus pilas
+# se guardan en PERFILADOR_DIRECTORIO
+PERFILADOR = config('PERFILADOR', default=True, cast=bool)
+PERFILADOR_DIRECTORIO = config('PERFILADOR_DIRECTORIO', default=str(BASE_DIR / 'perfiles'))
+# Intervalo de muestreo (ms) y vigencia de la firma (segundos)
+PERFILADOR_INTERVALO_MS = config('PERFILADOR_INTERVALO_MS', default=1, cast=float)
+PERFILADOR_VIGENCIA = config('PERFILADOR_VIGENCIA', default=3600, cast=int)
+
+# Trazas de cada solicitud (middleware, vista, serializadores, plantillas y
+# SQL) agregadas en formato OTLP/JSON, una línea por solicitud, a TRAZAS_ARCHIVO;
+# TRAZAS_MUESTREO es la fracción de solicitudes que se trazan
+TRAZAS = config('TRAZAS', default=False, cast=bool)
+TRAZAS_ARCHIVO = config('TRAZAS_ARCHIVO', default=str(BASE_DIR / 'trazas.jsonl'))
+TRAZAS_MUESTREO = config('TRAZAS_MUESTREO', default=1.0, cast=float)
+
+# Días que se conservan los tombstones de /api/sync/ (purge_tombstones); los
+# tokens más antiguos se rechazan y el cliente sincroniza desde cero
+SYNC_RETENCION_DIAS = config('SYNC_RETENCION_DIAS', default=30, cast=int)
+
+# Consultas de una solicitud más lentas que este umbral (ms) se guardan con su
+# plan EXPLAIN (ANALYZE, BUFFERS) en la tabla consultas_lentas; 0 desactiva
+CONSULTAS_LENTAS_UMBRAL_MS = config('CONSULTAS_LENTAS_UMBRAL_MS', default=0, cast=float)
+# Filas que conserva la tabla (se eliminan las más antiguas)
+CONSULTAS_LENTAS_MAXIMO = config('CONSULTAS_LENTAS_MAXIMO', default=5000, cast=int)
+# El plan se obtiene en un hilo aparte para no demorar la respuesta
+CONSULTAS_LENTAS_EN_SEGUNDO_PLANO = True
+
+# Los diagnósticos se escriben en la consola (una línea por evento)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'salud_vital.perfil_sql': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+        'salud_vital.consultas_lentas': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+
 # ============================================================================
 # VALIDADORES DE CONTRASEÑAS
 # ============================================================================